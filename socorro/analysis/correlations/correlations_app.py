@@ -3,8 +3,6 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import datetime
-import os
-import tempfile
 
 import ujson as json
 
@@ -15,8 +13,12 @@ from socorro.app.fetch_transform_save_app import (
     FetchTransformSaveWithSeparateNewCrashSourceApp
 )
 
+from socorro.lib.converters import change_default
 from socorro.lib.datetimeutil import UTC
-from socorro.external.crashstorage_base import CrashIDNotFound
+from socorro.external.crashstorage_base import (
+    CachingCrashStorage,
+    CrashIDNotFound,
+)
 from socorro.external.postgresql.products import ProductVersions
 from socorro.processor.processor_2015 import rule_sets_from_string
 from socorro.external.boto.crashstorage import BotoS3CrashStorage
@@ -200,15 +202,13 @@ class CorrelationsApp(FetchTransformSaveWithSeparateNewCrashSourceApp):
 
 
 #==============================================================================
-class LocallyCachedBotoS3CrashStorage(BotoS3CrashStorage):  # pragma: no cover
-    """This class is dedicated only for local development, but checked in.
-    Never enabled by default and has no test coverage.
-
-    When you attempt to run correlations repeatedly on your laptop,
+class LocallyCachedBotoS3CrashStorage(CachingCrashStorage):
+    """When you attempt to run correlations repeatedly on your laptop,
     you have to download lots and lots of processed crashes from S3.
     That's fine once but if you need to re-run it again, you'll have
-    to download the same stuff again. It's faster then to just use
-    this class instead of the default BotoS3CrashStorage class.
+    to download the same stuff again.  This class is a CachingCrashStorage
+    in front of the default BotoS3CrashStorage class that keeps them on the
+    local disk.
 
     To enable this class instead, set:
 
@@ -217,31 +217,9 @@ class LocallyCachedBotoS3CrashStorage(BotoS3CrashStorage):  # pragma: no cover
 
     in your call to `socorro correlations ...`
     """
-
-    def __init__(self, *args, **kwargs):
-        super(LocallyCachedBotoS3CrashStorage, self).__init__(
-            *args, **kwargs
-        )
-        self.temp_dir = os.path.join(
-            tempfile.gettempdir(),
-            'locally_downloaded_processed_crashes'
-        )
-        if not os.path.isdir(self.temp_dir):
-            os.mkdir(self.temp_dir)
-
-    def get_unredacted_processed(self, crash_id):
-        file_path = os.path.join(self.temp_dir, '{}.json'.format(crash_id))
-        try:
-            with open(file_path, 'r') as f:
-                return json.load(f)
-        except IOError:
-            crash = (
-                super(LocallyCachedBotoS3CrashStorage, self)
-                .get_unredacted_processed(crash_id)
-            )
-            with open(file_path, 'w') as f:
-                json.dump(crash, f)
-            self.config.logger.debug(
-                'Cache MISS downloading {}'.format(crash_id)
-            )
-            return crash
+    required_config = Namespace()
+    required_config.wrapped_crashstore = change_default(
+        CachingCrashStorage,
+        'wrapped_crashstore',
+        BotoS3CrashStorage
+    )
@@ -351,6 +351,22 @@ class FetchTransformSaveApp(App):
             )
             raise
 
+    #--------------------------------------------------------------------------
+    def _setup_worker_process(self):
+        """task managers that run their workers in separate processes call
+        this once at the start of each worker process.  The source and
+        destination inherited from the main process share its network
+        connections, so each worker instantiates its own.  The base class
+        version is called explicitly: a separate 'new_crash_source' belongs
+        to the main process alone."""
+        FetchTransformSaveApp._setup_source_and_destination(self)
+
+    #--------------------------------------------------------------------------
+    def _close_worker_process(self):
+        """the counterpart of '_setup_worker_process', called once as each
+        worker process ends."""
+        FetchTransformSaveApp.close(self)
+
     #--------------------------------------------------------------------------
     def _setup_task_manager(self):
         """instantiate the threaded task manager to run the producer/consumer
@@ -369,7 +385,9 @@ class FetchTransformSaveApp(App):
             self.config.producer_consumer.producer_consumer_class(
                 self.config.producer_consumer,
                 job_source_iterator=self.source_iterator,
-                task_func=self.transform
+                task_func=self.transform,
+                worker_setup_func=self._setup_worker_process,
+                worker_teardown_func=self._close_worker_process
             )
         self.config.executor_identity = self.task_manager.executor_identity
 
@@ -53,6 +53,8 @@ class ApplicationDefaultsProxy(object):
             #'crontabber': 'socorro.cron.crontabber_app.CronTabberApp',
             'middleware': 'socorro.middleware.middleware_app.MiddlewareApp',
             'processor': 'socorro.processor.processor_app.ProcessorApp',
+            'processor_benchmark':
+                'socorro.processor.benchmark_app.ProcessorBenchmarkApp',
             'fetch': 'socorro.external.fetch_app.FetchApp',
             'copy_processed':
                 'socorro.collector.crashmover_app.ProcessedCrashCopierApp',
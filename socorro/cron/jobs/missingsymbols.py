@@ -65,16 +65,25 @@ class MissingSymbolsCronApp(BaseCronApp):
             ))
             rows += 1
         s3 = self.config.boto_class(self.config)
-        conn = s3._connect()
         self.config.logger.info(
             'Writing {} missing symbols rows to a file in {}'.format(
                 format(rows, ','),
                 self.config.bucket_name
             )
         )
-        bucket = s3._get_or_create_bucket(conn, self.config.bucket_name)
-        key_object = bucket.new_key('latest.csv')
-        key_object.set_contents_from_string(buf.getvalue())
+        try:
+            # the connection is checked out of the pool of the connection
+            # context for the upload
+            with s3() as boto_connection:
+                conn = boto_connection._connect()
+                bucket = boto_connection._get_or_create_bucket(
+                    conn,
+                    self.config.bucket_name
+                )
+                key_object = bucket.new_key('latest.csv')
+                key_object.set_contents_from_string(buf.getvalue())
+        finally:
+            s3.close()
         self.config.logger.info(
             'Generated {} ({} bytes, {:.2f} Mb)'.format(
                 key_object.generate_url(expires_in=0, query_auth=False),
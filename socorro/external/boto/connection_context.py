@@ -6,6 +6,10 @@ import json
 import socket
 import datetime
 import contextlib
+import threading
+import weakref
+from functools import partial
+from multiprocessing.pool import ThreadPool
 
 import boto
 import boto.s3.connection
@@ -14,6 +18,7 @@ import boto.exception
 from configman import Namespace, RequiredConfig, class_converter
 from configman.converters import str_to_boolean
 
+from socorro.lib.connection_pool import ConnectionPool
 from socorro.lib.converters import change_default
 from socorro.lib.ooid import dateFromOoid
 
@@ -117,6 +122,18 @@ class SimpleDatePrefixKeyBuilder(KeyBuilderBase):
         return keys
 
 
+# returned by the threads of the fetch_many pool that found no free connection
+_NOT_FETCHED = object()
+
+
+#==============================================================================
+class S3ConnectionPool(ConnectionPool):
+    """a bounded pool of boto connections shared by the threads of a
+    process"""
+
+    metrics_prefix = 'boto.pool'
+
+
 #==============================================================================
 class ConnectionContextBase(RequiredConfig):
 
@@ -160,6 +177,43 @@ class ConnectionContextBase(RequiredConfig):
         reference_value_from='resource.boto',
         likely_to_be_changed=True,
     )
+    required_config.add_option(
+        'maximum_concurrent_fetches',
+        doc='the maximum number of objects that fetch_many gets at the same '
+            'time, each over a connection of its own',
+        default=4,
+        reference_value_from='resource.boto',
+    )
+    required_config.add_option(
+        'maximum_connections',
+        doc='the maximum number of connections in the pool shared by the '
+            'threads of the process (0 for no limit).  A thread waits for a '
+            'connection when all of them are in use.',
+        default=10,
+        reference_value_from='resource.boto',
+    )
+    required_config.add_option(
+        'maximum_connection_idle_seconds',
+        doc='pooled connections idle for longer than this are closed rather '
+            'than reused (0 to keep them forever)',
+        default=300,
+        reference_value_from='resource.boto',
+    )
+    required_config.add_option(
+        'connection_health_check_seconds',
+        doc='pooled connections idle for longer than this are checked with a '
+            'HEAD request on the bucket before they are reused (0 for no '
+            'health checks)',
+        default=60,
+        reference_value_from='resource.boto',
+    )
+    required_config.add_option(
+        'metrics_class',
+        default='socorro.external.metrics_base.MetricsBase',
+        doc='the class that implements metrics for the connection pool',
+        from_string_converter=class_converter,
+        reference_value_from='resource.boto',
+    )
 
     operational_exceptions = (
         socket.timeout,
@@ -194,16 +248,57 @@ class ConnectionContextBase(RequiredConfig):
         )
         self.keybuilder = config.keybuilder_class()
 
-        self._bucket_cache = {}
+        # a mapping of connection to a mapping of bucket name to bucket, a
+        # bucket may only be used with the connection that it came from
+        self._bucket_cache = weakref.WeakKeyDictionary()
+
+        metrics_class = config.get('metrics_class')
+        self._pool = S3ConnectionPool(
+            self._new_connection,
+            maximum_connections=config.get('maximum_connections', 0),
+            maximum_idle_seconds=config.get(
+                'maximum_connection_idle_seconds',
+                0
+            ),
+            health_check_seconds=config.get(
+                'connection_health_check_seconds',
+                0
+            ),
+            health_check=self._check_connection,
+            metrics=metrics_class(config) if metrics_class else None,
+            logger=config.get('logger'),
+        )
+        # the connection that each thread has checked out of the pool for
+        # the duration of a transaction
+        self._checked_out = threading.local()
+
+        # the threads of the fetch_many pool check their connections out of
+        # the shared pool for each fetch
+        self._fetch_pool = None
+        self._fetch_pool_lock = threading.Lock()
+
+    #--------------------------------------------------------------------------
+    def _new_connection(self):
+        return self._connect_to_endpoint(**self._get_credentials())
+
+    #--------------------------------------------------------------------------
+    def _check_connection(self, connection):
+        connection.head_bucket(self.config.bucket_name)
 
     #--------------------------------------------------------------------------
     def _connect(self):
+        """return the connection checked out of the pool by the current
+        transaction.  Outside of a transaction, a single connection kept by
+        this object is returned."""
+        checked_out = self._checked_out
+        if getattr(checked_out, 'active', False):
+            if checked_out.connection is None:
+                checked_out.connection = self._pool.checkout()
+            return checked_out.connection
         try:
             return self.connection
         except AttributeError:
-            self.connection = self._connect_to_endpoint(
-                **self._get_credentials()
-            )
+            self.connection = self._new_connection()
             return self.connection
 
     #--------------------------------------------------------------------------
@@ -219,21 +314,30 @@ class ConnectionContextBase(RequiredConfig):
         """
         return self.keybuilder.build_keys(prefix, name_of_thing, id)
 
+    #--------------------------------------------------------------------------
+    def _buckets_of(self, conn):
+        try:
+            return self._bucket_cache[conn]
+        except KeyError:
+            return self._bucket_cache.setdefault(conn, {})
+
     #--------------------------------------------------------------------------
     def _get_bucket(self, conn, bucket_name):
+        buckets = self._buckets_of(conn)
         try:
-            return self._bucket_cache[bucket_name]
+            return buckets[bucket_name]
         except KeyError:
-            self._bucket_cache[bucket_name] = conn.get_bucket(bucket_name)
-            return self._bucket_cache[bucket_name]
+            buckets[bucket_name] = conn.get_bucket(bucket_name)
+            return buckets[bucket_name]
 
     #--------------------------------------------------------------------------
     def _get_or_create_bucket(self, conn, bucket_name):
         try:
             return self._get_bucket(conn, bucket_name)
         except self.ResponseError:
-            self._bucket_cache[bucket_name] = conn.create_bucket(bucket_name)
-            return self._bucket_cache[bucket_name]
+            buckets = self._buckets_of(conn)
+            buckets[bucket_name] = conn.create_bucket(bucket_name)
+            return buckets[bucket_name]
 
     #--------------------------------------------------------------------------
     def submit(self, id, name_of_thing, thing):
@@ -257,12 +361,99 @@ class ConnectionContextBase(RequiredConfig):
         """
         conn = self._connect()
         bucket = self._get_bucket(conn, self.config.bucket_name)
+        return self._fetch_from_bucket(bucket, id, name_of_thing)
+
+    #--------------------------------------------------------------------------
+    def fetch_range(self, id, name_of_thing, start, end):
+        """retrieve the bytes from 'start' to 'end', inclusive, of something
+        from boto.  Fewer bytes are returned if the thing ends sooner."""
+        conn = self._connect()
+        bucket = self._get_bucket(conn, self.config.bucket_name)
+        return self._fetch_from_bucket(
+            bucket,
+            id,
+            name_of_thing,
+            headers={'Range': 'bytes=%d-%d' % (start, end)}
+        )
+
+    #--------------------------------------------------------------------------
+    def fetch_many(self, id, names_of_things):
+        """retrieve several things from boto at the same time.  Returns a
+        mapping of the names of the things to their contents.  If any one of
+        them cannot be found, KeyNotFound is raised."""
+        if (
+            len(names_of_things) < 2
+            or self.config.get('maximum_concurrent_fetches', 1) < 2
+        ):
+            return dict(
+                (a_name, self.fetch(id, a_name))
+                for a_name in names_of_things
+            )
+        all_contents = self._get_fetch_pool().map(
+            partial(self._fetch_in_pool_thread, id),
+            names_of_things
+        )
+        # the things that found no free connection in the pool are fetched
+        # by this thread, with the connection of its own transaction
+        return dict(
+            (
+                a_name,
+                self.fetch(id, a_name) if contents is _NOT_FETCHED
+                else contents
+            )
+            for a_name, contents in zip(names_of_things, all_contents)
+        )
 
+    #--------------------------------------------------------------------------
+    def _get_fetch_pool(self):
+        with self._fetch_pool_lock:
+            if self._fetch_pool is None:
+                self._fetch_pool = ThreadPool(
+                    self.config.maximum_concurrent_fetches
+                )
+            return self._fetch_pool
+
+    #--------------------------------------------------------------------------
+    def _fetch_in_pool_thread(self, id, name_of_thing):
+        """fetch with a connection checked out of the shared pool.  The
+        transaction waiting on this thread may hold the last connection of
+        the pool, so rather than wait for one, _NOT_FETCHED is returned when
+        none is free."""
+        connection = self._pool.checkout(wait=False)
+        if connection is None:
+            return _NOT_FETCHED
+        reusable = True
+        try:
+            bucket = self._get_bucket(connection, self.config.bucket_name)
+            return self._fetch_from_bucket(bucket, id, name_of_thing)
+        except self.ResponseError:
+            raise
+        except BaseException:
+            # the state of the connection is unknown
+            reusable = False
+            raise
+        finally:
+            if reusable:
+                self._pool.checkin(connection)
+            else:
+                self._pool.discard(connection)
+
+    #--------------------------------------------------------------------------
+    def _fetch_from_bucket(self, bucket, id, name_of_thing, headers=None):
+        """try each of the possible keys for the thing with a single GET,
+        moving on to the next key when the GET finds nothing"""
         all_keys = self.build_keys(self.config.prefix, name_of_thing, id)
         for key in all_keys:
-            key_object = bucket.get_key(key)
-            if key_object is not None:
+            # without validation, there is no HEAD request to check that the
+            # key exists, the GET itself reveals that
+            key_object = bucket.get_key(key, validate=False)
+            try:
+                if headers:
+                    return key_object.get_contents_as_string(headers=headers)
                 return key_object.get_contents_as_string()
+            except boto.exception.StorageResponseError, x:
+                if x.status != 404:
+                    raise
 
         # None of the keys worked, so raise an error
         raise KeyNotFound(
@@ -298,7 +489,35 @@ class ConnectionContextBase(RequiredConfig):
     #--------------------------------------------------------------------------
     @contextlib.contextmanager
     def __call__(self):
-        yield self
+        """the context of a transaction.  The first '_connect' within it
+        checks a connection out of the pool, the connection goes back to the
+        pool at the end of the transaction.  A connection that saw an
+        exception other than a response from S3 is discarded instead."""
+        checked_out = self._checked_out
+        if getattr(checked_out, 'active', False):
+            # a nested transaction shares the connection of the outer one
+            yield self
+            return
+        checked_out.active = True
+        checked_out.connection = None
+        reusable = True
+        try:
+            yield self
+        except self.ResponseError:
+            raise
+        except BaseException:
+            # the state of the connection is unknown
+            reusable = False
+            raise
+        finally:
+            connection = checked_out.connection
+            checked_out.connection = None
+            checked_out.active = False
+            if connection is not None:
+                if reusable:
+                    self._pool.checkin(connection)
+                else:
+                    self._pool.discard(connection)
 
     #--------------------------------------------------------------------------
     def in_transaction(self, dummy):
@@ -308,12 +527,23 @@ class ConnectionContextBase(RequiredConfig):
 
     #--------------------------------------------------------------------------
     def force_reconnect(self):
+        # the pooled connection of the failed transaction has already been
+        # discarded at the end of the transaction
         try:
             del self.connection
         except AttributeError:
             # already deleted, ignorable
             pass
 
+    #--------------------------------------------------------------------------
+    def close(self):
+        with self._fetch_pool_lock:
+            if self._fetch_pool is not None:
+                self._fetch_pool.close()
+                self._fetch_pool.join()
+                self._fetch_pool = None
+        self._pool.close()
+
 
 #==============================================================================
 class S3ConnectionContext(ConnectionContextBase):
@@ -371,26 +601,23 @@ class RegionalS3ConnectionContext(S3ConnectionContext):
         self._connect_to_endpoint = boto.s3.connect_to_region
 
     #--------------------------------------------------------------------------
-    def _connect(self):
-        try:
-            return self.connection
-        except AttributeError:
-            self.connection = self._connect_to_endpoint(
-                self._region,
-                **self._get_credentials()
-            )
-            return self.connection
+    def _new_connection(self):
+        return self._connect_to_endpoint(
+            self._region,
+            **self._get_credentials()
+        )
 
     #--------------------------------------------------------------------------
     def _get_or_create_bucket(self, conn, bucket_name):
         try:
             return self._get_bucket(conn, bucket_name)
         except self.ResponseError:
-            self._bucket_cache[bucket_name] = conn.create_bucket(
+            buckets = self._buckets_of(conn)
+            buckets[bucket_name] = conn.create_bucket(
                 bucket_name,
                 location=self._region,
             )
-            return self._bucket_cache[bucket_name]
+            return buckets[bucket_name]
 
 
 class HostPortS3ConnectionContext(S3ConnectionContext):
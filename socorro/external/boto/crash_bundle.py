@@ -0,0 +1,119 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""A crash bundle packs the raw crash and all of its dumps into a single
+object so that saving or reading a whole crash takes one request.
+
+The layout of a bundle is:
+    4 bytes  - the magic 'SCB1'
+    4 bytes  - the length of the header as a big endian unsigned integer
+    header   - a JSON mapping of the form:
+                   {
+                       "raw_crash": [offset, length],
+                       "dumps": [[dump_name, offset, length], ...]
+                   }
+    the raw crash as JSON
+    the dumps, one after the other
+
+The offsets are from the end of the header, so once the header is known a
+single dump can be read on its own with a byte range request."""
+
+import json
+import struct
+from collections import OrderedDict
+
+
+BUNDLE_MAGIC = 'SCB1'
+
+_prefix_struct = struct.Struct('>4sI')
+
+# the number of bytes before the header
+PREFIX_LENGTH = _prefix_struct.size
+
+
+#==============================================================================
+class CrashBundleError(Exception):
+    pass
+
+
+#------------------------------------------------------------------------------
+def pack_crash_bundle(raw_crash_as_string, dumps):
+    """returns a bundle as a string.
+
+    parameters:
+        raw_crash_as_string - the raw crash already encoded as JSON
+        dumps - a mapping of dump names to the contents of the dumps"""
+    dump_names = list(dumps.keys())
+    offset = len(raw_crash_as_string)
+    dumps_index = []
+    for a_name in dump_names:
+        dumps_index.append([a_name, offset, len(dumps[a_name])])
+        offset += len(dumps[a_name])
+    header_as_string = json.dumps({
+        'raw_crash': [0, len(raw_crash_as_string)],
+        'dumps': dumps_index,
+    })
+    parts = [
+        _prefix_struct.pack(BUNDLE_MAGIC, len(header_as_string)),
+        header_as_string,
+        raw_crash_as_string,
+    ]
+    parts.extend(dumps[a_name] for a_name in dump_names)
+    return ''.join(parts)
+
+
+#------------------------------------------------------------------------------
+def header_length_from_prefix(bundle_prefix):
+    """returns the number of bytes from the start of a bundle to the end of
+    its header, given at least the first PREFIX_LENGTH bytes of the
+    bundle"""
+    if len(bundle_prefix) < PREFIX_LENGTH:
+        raise CrashBundleError('the bundle is truncated')
+    magic, header_length = _prefix_struct.unpack(
+        bundle_prefix[:PREFIX_LENGTH]
+    )
+    if magic != BUNDLE_MAGIC:
+        raise CrashBundleError('not a crash bundle')
+    return PREFIX_LENGTH + header_length
+
+
+#------------------------------------------------------------------------------
+def read_bundle_index(bundle_prefix):
+    """returns the index of a bundle from its first bytes, which must include
+    the whole header.  The index is a tuple of the (offset, length) of the
+    raw crash and an OrderedDict of dump names to their (offset, length).
+    The offsets in the index are from the start of the bundle."""
+    header_end = header_length_from_prefix(bundle_prefix)
+    if len(bundle_prefix) < header_end:
+        raise CrashBundleError('the bundle header is truncated')
+    try:
+        header = json.loads(bundle_prefix[PREFIX_LENGTH:header_end])
+        raw_crash_offset, raw_crash_length = header['raw_crash']
+        dumps_index = OrderedDict(
+            (a_name, (header_end + offset, length))
+            for a_name, offset, length in header['dumps']
+        )
+    except (ValueError, KeyError, TypeError), x:
+        raise CrashBundleError('the bundle header is corrupt: %s' % x)
+    return (header_end + raw_crash_offset, raw_crash_length), dumps_index
+
+
+#------------------------------------------------------------------------------
+def unpack_crash_bundle(bundle):
+    """returns a tuple of the raw crash as a JSON string and an OrderedDict of
+    dump names to the contents of the dumps"""
+    (offset, length), dumps_index = read_bundle_index(bundle)
+    raw_crash_as_string = _slice(bundle, offset, length)
+    dumps = OrderedDict(
+        (a_name, _slice(bundle, a_dump_offset, a_dump_length))
+        for a_name, (a_dump_offset, a_dump_length) in dumps_index.iteritems()
+    )
+    return raw_crash_as_string, dumps
+
+
+#------------------------------------------------------------------------------
+def _slice(bundle, offset, length):
+    if offset + length > len(bundle):
+        raise CrashBundleError('the bundle is truncated')
+    return bundle[offset:offset + length]
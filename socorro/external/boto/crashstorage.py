@@ -3,7 +3,10 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/
 
 import json
+import threading
 import time
+from collections import OrderedDict
+from functools import partial
 
 import json_schema_reducer
 from socorro.lib.converters import change_default
@@ -17,9 +20,22 @@ from socorro.external.crashstorage_base import (
     MemoryDumpsMapping,
 )
 from socorro.external.boto.connection_context import (
+    KeyNotFound,
     SimpleDatePrefixKeyBuilder
 )
+from socorro.external.boto.crash_bundle import (
+    CrashBundleError,
+    header_length_from_prefix,
+    pack_crash_bundle,
+    read_bundle_index,
+    unpack_crash_bundle,
+)
 from socorro.external.es.super_search_fields import SuperSearchFields
+from socorro.lib.compression import (
+    compress,
+    compression_stats,
+    decompress,
+)
 from socorro.schemas import CRASH_REPORT_JSON_SCHEMA
 
 
@@ -69,11 +85,69 @@ class BotoCrashStorage(CrashStorageBase):
         default='.dump',
         reference_value_from='resource.boto',
     )
+    required_config.add_option(
+        'dumps_in_memory',
+        doc='give dumps to the processor as anonymous memory files rather '
+            'than writing them to the temporary_file_system_storage_path',
+        default=False,
+        reference_value_from='resource.boto',
+    )
+    required_config.add_option(
+        'maximum_dumps_in_memory_bytes',
+        doc='when the dumps held in memory files exceed this total, further '
+            'dumps are written to the temporary_file_system_storage_path',
+        default=512 * 1024 * 1024,
+        reference_value_from='resource.boto',
+    )
     required_config.add_option(
         'json_object_hook',
         default='socorro.lib.util.DotDict',
         from_string_converter=class_converter,
     )
+    required_config.add_option(
+        'metrics_class',
+        default='socorro.external.metrics_base.MetricsBase',
+        doc='the class that implements metrics for the time taken to fetch '
+            'crashes',
+        from_string_converter=class_converter,
+        reference_value_from='resource.boto',
+    )
+    required_config.add_option(
+        'processed_crash_compression',
+        doc="the compression of saved processed crashes: 'none', 'gzip' or "
+            "'zlib'.  Processed crashes are decompressed as they are read "
+            "whatever this is set to.",
+        default='none',
+        reference_value_from='resource.boto',
+    )
+    required_config.add_option(
+        'processed_crash_compression_level',
+        doc='the compression level of processed crashes from 1 (fastest) to '
+            '9 (smallest)',
+        default=6,
+        reference_value_from='resource.boto',
+    )
+    required_config.add_option(
+        'save_crash_bundles',
+        doc='save each raw crash with its dumps as a single crash bundle '
+            'object rather than one object per part',
+        default=False,
+        reference_value_from='resource.boto',
+    )
+    required_config.add_option(
+        'read_crash_bundles',
+        doc='look for a crash bundle object before the objects of the parts '
+            'of a raw crash',
+        default=False,
+        reference_value_from='resource.boto',
+    )
+    required_config.add_option(
+        'crash_bundle_prefix_bytes',
+        doc='the number of bytes read from the start of a crash bundle to '
+            'get its header and, usually, the raw crash in one request',
+        default=64 * 1024,
+        reference_value_from='resource.boto',
+    )
 
     def is_operational_exception(self, x):
         if "not found, no value returned" in str(x):
@@ -110,6 +184,17 @@ class BotoCrashStorage(CrashStorageBase):
             self.connection_source,
             quit_check_callback
         )
+        # the total size of the dumps currently held in memory files
+        self._dumps_in_memory_bytes = 0
+        self._dumps_in_memory_lock = threading.Lock()
+        metrics_class = config.get('metrics_class')
+        self.metrics = metrics_class(config) if metrics_class else None
+
+    def _capture_fetch_time(self, name, start_time):
+        if self.metrics is not None:
+            self.metrics.capture_stats({
+                'boto.%s' % name: int((time.time() - start_time) * 1000)
+            })
 
     @staticmethod
     def do_save_raw_crash(boto_connection, raw_crash, dumps, crash_id):
@@ -141,11 +226,61 @@ class BotoCrashStorage(CrashStorageBase):
                 dump_name = 'dump'
             boto_connection.submit(crash_id, dump_name, dump)
 
+    @staticmethod
+    def do_save_crash_bundle(boto_connection, raw_crash, dumps, crash_id):
+        if dumps is None:
+            dumps = MemoryDumpsMapping()
+        dumps = dumps.as_memory_dumps_mapping()
+        # the dumps are stored under the names that get_raw_dumps returns
+        bundled_dumps = OrderedDict(
+            (
+                'dump' if dump_name in (None, '', 'upload_file_minidump')
+                else dump_name,
+                dump
+            )
+            for dump_name, dump in dumps.iteritems()
+        )
+        boto_connection.submit(
+            crash_id,
+            "crash_bundle",
+            pack_crash_bundle(
+                boto_connection._convert_mapping_to_string(raw_crash),
+                bundled_dumps
+            )
+        )
+
     def save_raw_crash(self, raw_crash, dumps, crash_id):
-        self.transaction(self.do_save_raw_crash, raw_crash, dumps, crash_id)
+        if self.config.get('save_crash_bundles', False):
+            self.transaction(
+                self.do_save_crash_bundle,
+                raw_crash,
+                dumps,
+                crash_id
+            )
+        else:
+            self.transaction(
+                self.do_save_raw_crash,
+                raw_crash,
+                dumps,
+                crash_id
+            )
 
-    @staticmethod
-    def _do_save_processed(boto_connection, processed_crash):
+    def _compress_processed(self, processed_crash_as_string):
+        method = self.config.get('processed_crash_compression', 'none')
+        if method == 'none':
+            return processed_crash_as_string
+        level = self.config.processed_crash_compression_level
+        compressed = compress(processed_crash_as_string, method, level)
+        if self.metrics is not None:
+            self.metrics.capture_stats(compression_stats(
+                'boto.processed_crash',
+                len(processed_crash_as_string),
+                len(compressed),
+                level
+            ))
+        return compressed
+
+    def _do_save_processed(self, boto_connection, processed_crash):
         crash_id = processed_crash['uuid']
         processed_crash_as_string = boto_connection._convert_mapping_to_string(
             processed_crash
@@ -153,7 +288,7 @@ class BotoCrashStorage(CrashStorageBase):
         boto_connection.submit(
             crash_id,
             "processed_crash",
-            processed_crash_as_string
+            self._compress_processed(processed_crash_as_string)
         )
 
     def save_processed(self, processed_crash):
@@ -193,12 +328,91 @@ class BotoCrashStorage(CrashStorageBase):
                 '%s not found: %s' % (crash_id, x)
             )
 
+    def _fetch_bundle_prefix(self, boto_connection, crash_id):
+        """returns the first bytes of the crash bundle, at least up to the
+        end of its header"""
+        bundle_prefix = boto_connection.fetch_range(
+            crash_id,
+            "crash_bundle",
+            0,
+            self.config.get('crash_bundle_prefix_bytes', 64 * 1024) - 1
+        )
+        header_end = header_length_from_prefix(bundle_prefix)
+        if len(bundle_prefix) < header_end:
+            bundle_prefix += boto_connection.fetch_range(
+                crash_id,
+                "crash_bundle",
+                len(bundle_prefix),
+                header_end - 1
+            )
+        return bundle_prefix
+
+    @staticmethod
+    def _fetch_bundle_part(
+        boto_connection,
+        crash_id,
+        bundle_prefix,
+        offset,
+        length
+    ):
+        """returns a part of a crash bundle, from the bytes already read if
+        it is within them"""
+        if offset + length <= len(bundle_prefix):
+            return bundle_prefix[offset:offset + length]
+        return boto_connection.fetch_range(
+            crash_id,
+            "crash_bundle",
+            offset,
+            offset + length - 1
+        )
+
+    def do_get_raw_crash_from_bundle(
+        self,
+        boto_connection,
+        crash_id,
+        json_object_hook
+    ):
+        try:
+            bundle_prefix = self._fetch_bundle_prefix(
+                boto_connection,
+                crash_id
+            )
+            (offset, length), dumps_index = read_bundle_index(bundle_prefix)
+        except KeyNotFound:
+            # the crash was not saved as a bundle
+            return self.do_get_raw_crash(
+                boto_connection,
+                crash_id,
+                json_object_hook
+            )
+        except CrashBundleError, x:
+            raise CrashIDNotFound(
+                '%s not readable: %s' % (crash_id, x)
+            )
+        return json.loads(
+            self._fetch_bundle_part(
+                boto_connection,
+                crash_id,
+                bundle_prefix,
+                offset,
+                length
+            ),
+            object_hook=json_object_hook
+        )
+
     def get_raw_crash(self, crash_id):
-        return self.transaction_for_get(
-            self.do_get_raw_crash,
+        start_time = time.time()
+        if self.config.get('read_crash_bundles', False):
+            do_get_raw_crash = self.do_get_raw_crash_from_bundle
+        else:
+            do_get_raw_crash = self.do_get_raw_crash
+        raw_crash = self.transaction_for_get(
+            do_get_raw_crash,
             crash_id,
             self.config.json_object_hook
         )
+        self._capture_fetch_time('get_raw_crash', start_time)
+        return raw_crash
 
     @staticmethod
     def do_get_raw_dump(boto_connection, crash_id, name=None):
@@ -212,7 +426,48 @@ class BotoCrashStorage(CrashStorageBase):
                 '%s not found: %s' % (crash_id, x)
             )
 
+    def do_get_raw_dump_from_bundle(
+        self,
+        boto_connection,
+        crash_id,
+        name=None
+    ):
+        try:
+            bundle_prefix = self._fetch_bundle_prefix(
+                boto_connection,
+                crash_id
+            )
+            x, dumps_index = read_bundle_index(bundle_prefix)
+        except KeyNotFound:
+            # the crash was not saved as a bundle
+            return self.do_get_raw_dump(boto_connection, crash_id, name)
+        except CrashBundleError, x:
+            raise CrashIDNotFound(
+                '%s not readable: %s' % (crash_id, x)
+            )
+        if name in (None, '', 'upload_file_minidump'):
+            name = 'dump'
+        try:
+            offset, length = dumps_index[name]
+        except KeyError:
+            raise CrashIDNotFound(
+                '%s not found: the crash has no dump %r' % (crash_id, name)
+            )
+        return self._fetch_bundle_part(
+            boto_connection,
+            crash_id,
+            bundle_prefix,
+            offset,
+            length
+        )
+
     def get_raw_dump(self, crash_id, name=None):
+        if self.config.get('read_crash_bundles', False):
+            return self.transaction_for_get(
+                self.do_get_raw_dump_from_bundle,
+                crash_id,
+                name
+            )
         return self.transaction_for_get(self.do_get_raw_dump, crash_id, name)
 
     @staticmethod
@@ -225,28 +480,58 @@ class BotoCrashStorage(CrashStorageBase):
             dump_names = boto_connection._convert_string_to_list(
                 dump_names_as_string
             )
+            dump_names = [
+                'dump' if dump_name in (None, '', 'upload_file_minidump')
+                else dump_name
+                for dump_name in dump_names
+            ]
             # when we fetch the dumps, they are by default in memory, so we'll
             # put them into a MemoryDumpMapping.
-            dumps = MemoryDumpsMapping()
-            for dump_name in dump_names:
-                if dump_name in (None, '', 'upload_file_minidump'):
-                    dump_name = 'dump'
-                dumps[dump_name] = boto_connection.fetch(
-                    crash_id,
-                    dump_name
-                )
-            return dumps
+            return MemoryDumpsMapping(
+                boto_connection.fetch_many(crash_id, dump_names)
+            )
         except boto_connection.ResponseError, x:
             raise CrashIDNotFound(
                 '%s not found: %s' % (crash_id, x)
             )
 
+    def do_get_raw_dumps_from_bundle(self, boto_connection, crash_id):
+        try:
+            # the whole bundle in one request
+            bundle = boto_connection.fetch(crash_id, "crash_bundle")
+            x, dumps = unpack_crash_bundle(bundle)
+        except KeyNotFound:
+            # the crash was not saved as a bundle
+            return self.do_get_raw_dumps(boto_connection, crash_id)
+        except CrashBundleError, x:
+            raise CrashIDNotFound(
+                '%s not readable: %s' % (crash_id, x)
+            )
+        return MemoryDumpsMapping(dumps)
+
     def get_raw_dumps(self, crash_id):
         """this returns a MemoryDumpsMapping"""
-        return self.transaction_for_get(self.do_get_raw_dumps, crash_id)
+        start_time = time.time()
+        if self.config.get('read_crash_bundles', False):
+            do_get_raw_dumps = self.do_get_raw_dumps_from_bundle
+        else:
+            do_get_raw_dumps = self.do_get_raw_dumps
+        dumps = self.transaction_for_get(do_get_raw_dumps, crash_id)
+        self._capture_fetch_time('get_raw_dumps', start_time)
+        return dumps
 
     def get_raw_dumps_as_files(self, crash_id):
+        """this returns a FileDumpsMapping.  If 'dumps_in_memory' is set and
+        there is room, it is a MemoryBackedFileDumpsMapping that must be
+        closed to release its memory."""
         in_memory_dumps = self.get_raw_dumps(crash_id)
+        if self.config.dumps_in_memory:
+            memory_backed_dumps = self._as_memory_backed_file_dumps_mapping(
+                crash_id,
+                in_memory_dumps
+            )
+            if memory_backed_dumps is not None:
+                return memory_backed_dumps
         # convert our native memory dump mapping into a file dump mapping.
         return in_memory_dumps.as_file_dumps_mapping(
             crash_id,
@@ -254,6 +539,42 @@ class BotoCrashStorage(CrashStorageBase):
             self.config.dump_file_suffix
         )
 
+    def _as_memory_backed_file_dumps_mapping(self, crash_id, in_memory_dumps):
+        """returns None if the dumps won't fit within the byte quota or the
+        system cannot create memory files"""
+        dumps_size = sum(len(x) for x in in_memory_dumps.itervalues())
+        with self._dumps_in_memory_lock:
+            if (
+                self._dumps_in_memory_bytes + dumps_size
+                > self.config.maximum_dumps_in_memory_bytes
+            ):
+                return None
+            self._dumps_in_memory_bytes += dumps_size
+        try:
+            memory_backed_dumps = (
+                in_memory_dumps.as_memory_backed_file_dumps_mapping(
+                    crash_id,
+                    self.config.dump_file_suffix
+                )
+            )
+        except OSError:
+            self.config.logger.warning(
+                'unable to hold the dumps of %s in memory',
+                crash_id,
+                exc_info=True
+            )
+            self._release_dumps_in_memory(dumps_size)
+            return None
+        memory_backed_dumps.close_callback = partial(
+            self._release_dumps_in_memory,
+            dumps_size
+        )
+        return memory_backed_dumps
+
+    def _release_dumps_in_memory(self, dumps_size):
+        with self._dumps_in_memory_lock:
+            self._dumps_in_memory_bytes -= dumps_size
+
     @staticmethod
     def _do_get_unredacted_processed(
         boto_connection,
@@ -261,9 +582,8 @@ class BotoCrashStorage(CrashStorageBase):
         json_object_hook,
     ):
         try:
-            processed_crash_as_string = boto_connection.fetch(
-                crash_id,
-                "processed_crash"
+            processed_crash_as_string = decompress(
+                boto_connection.fetch(crash_id, "processed_crash")
             )
             return json.loads(
                 processed_crash_as_string,
@@ -281,6 +601,13 @@ class BotoCrashStorage(CrashStorageBase):
             self.config.json_object_hook,
         )
 
+    def close(self):
+        try:
+            self.connection_source.close()
+        except AttributeError:
+            # a resource_class without a close
+            pass
+
 
 class BotoS3CrashStorage(BotoCrashStorage):
     required_config = Namespace()
@@ -291,6 +618,107 @@ class BotoS3CrashStorage(BotoCrashStorage):
     )
 
 
+#------------------------------------------------------------------------------
+def _compile_reducer(schema):
+    """returns a function equivalent to calling
+    'json_schema_reducer.make_reduced_dict' with the schema, with the walk of
+    the schema done once, here, rather than for every call"""
+    required = set(schema.get('required', []))
+    properties = [
+        (
+            key,
+            _compile_reducer(prop) if prop.get('type') == 'object' else None,
+            key in required,
+        )
+        for key, prop in schema['properties'].items()
+    ]
+
+    def reduce_dict(original):
+        if not isinstance(original, dict):
+            original = json_schema_reducer.dictify(original)
+        reduced = {}
+        for key, reducer, is_required in properties:
+            if key in original:
+                value = original[key]
+                reduced[key] = reducer(value) if reducer else value
+            elif is_required and reducer is None:
+                raise json_schema_reducer.ValidationError(key)
+        return reduced
+
+    return reduce_dict
+
+
+#------------------------------------------------------------------------------
+def compile_crash_report_projection(schema, all_fields):
+    """returns a function of a raw crash and a processed crash that returns
+    the crash report of the two reduced to the schema.
+
+    The keys of the raw and processed crashes are renamed as the
+    SuperSearch fields say, the keys of the processed crash winning over
+    those of the raw crash, and only what the schema has room for is kept.
+    The result is the same as renaming every key of both crashes into a new
+    mapping and giving it to 'json_schema_reducer.make_reduced_dict', but
+    only the keys of the schema are looked up.
+
+    parameters:
+        schema - a JSON Schema of an object, like CRASH_REPORT_JSON_SCHEMA
+        all_fields - the SuperSearch fields, as returned by
+                     SuperSearchFields.get"""
+    renames = {'raw_crash': {}, 'processed_crash': {}}
+    for a_field in all_fields.values():
+        if a_field['namespace'] in renames:
+            renames[a_field['namespace']][a_field['in_database_name']] = (
+                a_field['name']
+            )
+
+    def sources_of(key, namespace):
+        """the keys of a crash that are renamed to 'key'"""
+        rename_map = renames[namespace]
+        sources = sorted(
+            in_database_name
+            for in_database_name, name in rename_map.items()
+            if name == key
+        )
+        if key not in rename_map:
+            sources.append(key)
+        return tuple(sources)
+
+    required = set(schema.get('required', []))
+    properties = [
+        (
+            key,
+            sources_of(key, 'processed_crash'),
+            sources_of(key, 'raw_crash'),
+            _compile_reducer(prop) if prop.get('type') == 'object' else None,
+            key in required,
+        )
+        for key, prop in schema['properties'].items()
+    ]
+
+    def project(raw_crash, processed_crash):
+        crash_report = {}
+        for (
+            key, processed_sources, raw_sources, reducer, is_required
+        ) in properties:
+            for a_crash, sources in (
+                (processed_crash, processed_sources),
+                (raw_crash, raw_sources),
+            ):
+                found = [x for x in sources if x in a_crash]
+                if found:
+                    value = a_crash[found[0]]
+                    break
+            else:
+                if is_required and reducer is None:
+                    raise json_schema_reducer.ValidationError(key)
+                continue
+            crash_report[key] = reducer(value) if reducer else value
+        return crash_report
+
+    return project
+
+
+#==============================================================================
 class TelemetryBotoS3CrashStorage(BotoS3CrashStorage):
     """S3 crash storage class for sending a subset of the processed crash
     but reduced to only include the files in the processed crash
@@ -335,6 +763,18 @@ class TelemetryBotoS3CrashStorage(BotoS3CrashStorage):
         self._all_fields_timestamp = time.time()
         return self._all_fields
 
+    def _get_projection(self):
+        """returns the function that turns a raw and processed crash into a
+        crash report, compiled again only when the fields are refreshed"""
+        all_fields = self._get_all_fields()
+        if getattr(self, '_projection_fields', None) is not all_fields:
+            self._projection = compile_crash_report_projection(
+                CRASH_REPORT_JSON_SCHEMA,
+                all_fields
+            )
+            self._projection_fields = all_fields
+        return self._projection
+
     def save_raw_and_processed(
         self,
         raw_crash,
@@ -342,38 +782,7 @@ class TelemetryBotoS3CrashStorage(BotoS3CrashStorage):
         processed_crash,
         crash_id
     ):
-        all_fields = self._get_all_fields()
-        crash_report = {}
-
-        # TODO Opportunity of optimization;
-        # We could inspect CRASH_REPORT_JSON_SCHEMA and get a list
-        # of all (recursive) keys that are in there and use that
-        # to limit the two following loops to not bother
-        # filling up `crash_report` with keys that will never be
-        # needed.
-
-        # Rename fields in raw_crash.
-        raw_fields_map = dict(
-            (x['in_database_name'], x['name'])
-            for x in all_fields.values()
-            if x['namespace'] == 'raw_crash'
-        )
-        for key, val in raw_crash.items():
-            crash_report[raw_fields_map.get(key, key)] = val
-
-        # Rename fields in processed_crash.
-        processed_fields_map = dict(
-            (x['in_database_name'], x['name'])
-            for x in all_fields.values()
-            if x['namespace'] == 'processed_crash'
-        )
-        for key, val in processed_crash.items():
-            crash_report[processed_fields_map.get(key, key)] = val
-
-        # Validate crash_report.
-        crash_report = json_schema_reducer.make_reduced_dict(
-            CRASH_REPORT_JSON_SCHEMA, crash_report
-        )
+        crash_report = self._get_projection()(raw_crash, processed_crash)
         self.save_processed(crash_report)
 
     @staticmethod
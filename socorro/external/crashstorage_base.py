@@ -10,8 +10,18 @@ import copy
 import sys
 import os
 import collections
+import ctypes
 import datetime
-
+import errno
+import json
+import tempfile
+import threading
+import time
+from multiprocessing import TimeoutError
+from multiprocessing.pool import ThreadPool
+
+from socorro.lib.datetimeutil import JsonDTEncoder
+from socorro.lib.disk_cache import DiskLRUCache
 from socorro.lib.util import DotDict as SocorroDotDict
 
 from configman import Namespace, RequiredConfig
@@ -39,6 +49,30 @@ def socorrodotdict_to_dict(sdotdict):
     return _dictify(sdotdict)
 
 
+#------------------------------------------------------------------------------
+# the close-on-exec flag for memfd_create(2), from <linux/memfd.h>
+MFD_CLOEXEC = 1
+_libc_memfd_create = None
+
+
+#------------------------------------------------------------------------------
+def memfd_create(name):
+    """create an anonymous file that lives only in memory and return its
+    file descriptor.  Raises OSError if the system offers no memfd_create(2).
+    """
+    global _libc_memfd_create
+    if _libc_memfd_create is None:
+        try:
+            _libc_memfd_create = ctypes.CDLL(None, use_errno=True).memfd_create
+        except (OSError, AttributeError):
+            raise OSError(errno.ENOSYS, 'memfd_create is not available')
+    fd = _libc_memfd_create(name, MFD_CLOEXEC)
+    if fd < 0:
+        an_errno = ctypes.get_errno()
+        raise OSError(an_errno, os.strerror(an_errno))
+    return fd
+
+
 #==============================================================================
 class MemoryDumpsMapping(dict):
     """there has been a bifurcation in the crash storage data throughout the
@@ -80,6 +114,34 @@ class MemoryDumpsMapping(dict):
                 f.write(a_dump)
         return name_to_pathname_mapping
 
+    #--------------------------------------------------------------------------
+    def as_memory_backed_file_dumps_mapping(self, crash_id, dump_file_suffix):
+        """convert this MemoryDumpMapping into a FileDumpsMapping without
+        touching the file system.  Each dump is copied once into an anonymous
+        memory file.  Any process may open it with the pathname
+        '/proc/<pid>/fd/<fd>' until the 'close' method of the returned mapping
+        is called.  Raises OSError if the system does not support it."""
+        name_to_pathname_mapping = MemoryBackedFileDumpsMapping()
+        try:
+            for a_dump_name, a_dump in self.iteritems():
+                if a_dump_name in (None, '', 'dump'):
+                    a_dump_name = 'upload_file_minidump'
+                fd = memfd_create(
+                    "%s.%s%s" % (crash_id, a_dump_name, dump_file_suffix)
+                )
+                name_to_pathname_mapping.file_descriptors.append(fd)
+                offset = 0
+                while offset < len(a_dump):
+                    offset += os.write(fd, buffer(a_dump, offset))
+                name_to_pathname_mapping[a_dump_name] = '/proc/%d/fd/%d' % (
+                    os.getpid(),
+                    fd
+                )
+        except Exception:
+            name_to_pathname_mapping.close()
+            raise
+        return name_to_pathname_mapping
+
     #--------------------------------------------------------------------------
     def as_memory_dumps_mapping(self):
         """this is alrady a MemoryDumpMapping so we can just return self
@@ -132,6 +194,32 @@ class FileDumpsMapping(dict):
         return in_memory_dumps
 
 
+#==============================================================================
+class MemoryBackedFileDumpsMapping(FileDumpsMapping):
+    """a FileDumpsMapping where the files are anonymous memory files rather
+    than files on a file system.  The memory is not released until the
+    'close' method is called."""
+
+    #--------------------------------------------------------------------------
+    def __init__(self, *args, **kwargs):
+        super(MemoryBackedFileDumpsMapping, self).__init__(*args, **kwargs)
+        self.file_descriptors = []
+        # an optional function to be called once the memory is released
+        self.close_callback = None
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        while self.file_descriptors:
+            try:
+                os.close(self.file_descriptors.pop())
+            except OSError:
+                # already closed
+                pass
+        if self.close_callback is not None:
+            a_callback, self.close_callback = self.close_callback, None
+            a_callback()
+
+
 #==============================================================================
 class Redactor(RequiredConfig):
     """This class is the implementation of a functor for in situ redacting
@@ -495,6 +583,11 @@ class PolyStorageError(Exception, collections.MutableSequence):
         self.exceptions.__setitem__(index, value)
 
 
+#==============================================================================
+class PolyStorageTimeout(Exception):
+    """a subordinate store did not finish a save before its deadline"""
+
+
 #==============================================================================
 class PolyCrashStorage(CrashStorageBase):
     """a crashstorage implementation that encapsulates a collection of other
@@ -511,6 +604,16 @@ class PolyCrashStorage(CrashStorageBase):
     requirements within the class 'store' will be isolated within the local
     namespace.  That allows multiple instances of the same storageclass to
     avoid name collisions.
+
+    With 'concurrent_saves' set, the save operations are given to all the
+    subordinate stores at once, each store having a thread pool of its own
+    shared by all the threads using this instance.  A store that has not
+    finished before its deadline, counted from the start of its save, is
+    reported as a PolyStorageTimeout within the PolyStorageError, though it
+    goes on to finish its save in the background.  A store that already has
+    as many saves running as it has threads is not given more: they fail at
+    once with a PolyStorageTimeout, so that a hung store cannot hold up the
+    others.  Stores that mutate crashes are given copies of their own.
     """
     required_config = Namespace()
     required_config.add_option(
@@ -525,6 +628,32 @@ class PolyCrashStorage(CrashStorageBase):
       ),
       likely_to_be_changed=True,
     )
+    required_config.add_option(
+      'concurrent_saves',
+      doc='save to all the subordinate stores at the same time rather than '
+          'one after another',
+      default=False,
+    )
+    required_config.add_option(
+      'number_of_save_threads',
+      doc='the number of threads that save to each subordinate store when '
+          'concurrent_saves is set, which is also the number of its saves '
+          'that may be running at once',
+      default=8,
+    )
+    required_config.add_option(
+      'save_timeout',
+      doc='the number of seconds that a subordinate store is given to finish '
+          'a save when concurrent_saves is set',
+      default=60.0,
+    )
+    required_config.add_option(
+      'store_save_timeouts',
+      doc='a comma delimited list of storage namespace=seconds pairs that '
+          'override the save_timeout for individual stores '
+          '(example: storage1=5, storage3=30)',
+      default='',
+    )
 
     #--------------------------------------------------------------------------
     def __init__(self, config, quit_check_callback=None):
@@ -551,6 +680,155 @@ class PolyCrashStorage(CrashStorageBase):
                                       config[a_namespace],
                                       quit_check_callback
                                  )
+        self.save_timeouts = dict(
+            (a_namespace, float(config.get('save_timeout', 60.0)))
+            for a_namespace in self.storage_namespaces
+        )
+        for a_pair in config.get('store_save_timeouts', '').split(','):
+            if not a_pair.strip():
+                continue
+            a_namespace, seconds = a_pair.split('=')
+            self.save_timeouts[a_namespace.strip()] = float(seconds)
+        self._save_pools = {}
+        self._saves_in_flight = dict(
+            (a_namespace, 0) for a_namespace in self.storage_namespaces
+        )
+        self._save_pool_lock = threading.Lock()
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _is_mutator(a_store):
+        actual_store = getattr(a_store, 'wrapped_object', a_store)
+        return (
+            hasattr(actual_store, 'is_mutator') and actual_store.is_mutator()
+        )
+
+    #--------------------------------------------------------------------------
+    def _start_save(self, a_namespace):
+        """returns the thread pool of the store to give a save to, or None
+        if all of its threads are still busy with earlier saves"""
+        with self._save_pool_lock:
+            number_of_threads = self.config.number_of_save_threads
+            if self._saves_in_flight[a_namespace] >= number_of_threads:
+                return None
+            self._saves_in_flight[a_namespace] += 1
+            if a_namespace not in self._save_pools:
+                self._save_pools[a_namespace] = ThreadPool(number_of_threads)
+            return self._save_pools[a_namespace]
+
+    #--------------------------------------------------------------------------
+    def _save_to_store(
+        self,
+        a_namespace,
+        a_store,
+        method_name,
+        args,
+        crash_id,
+        start_times
+    ):
+        """run in a thread of the pool of the store, returns the exc_info
+        of a failure or None.  The time the save started is appended to
+        'start_times'."""
+        start_times.append(time.time())
+        try:
+            getattr(a_store, method_name)(*args)
+        except Exception:
+            store_class = getattr(
+                a_store, 'wrapped_object', a_store.__class__
+            )
+            self.logger.error(
+                '%r failed (crash id: %s)',
+                store_class,
+                crash_id,
+                exc_info=True
+            )
+            return sys.exc_info()
+        finally:
+            with self._save_pool_lock:
+                self._saves_in_flight[a_namespace] -= 1
+        return None
+
+    #--------------------------------------------------------------------------
+    def _save_concurrently(self, method_name, args_for_store, crash_id):
+        """give a save to all the subordinate stores at once and wait for
+        each of them until its deadline.
+
+        parameters:
+            method_name - the name of the save method of the stores
+            args_for_store - a function that accepts a store and returns the
+                             tuple of arguments for its save method
+            crash_id - the id of the crash for the log"""
+        self.quit_check()
+        storage_exception = PolyStorageError()
+        pending = []
+        for a_namespace, a_store in self.stores.iteritems():
+            pool = self._start_save(a_namespace)
+            if pool is None:
+                self.logger.error(
+                    '%s is still busy with earlier saves, %s not saved',
+                    a_namespace,
+                    crash_id
+                )
+                try:
+                    raise PolyStorageTimeout(
+                        '%s %s is still busy with earlier saves, %s not '
+                        'saved' % (a_namespace, method_name, crash_id)
+                    )
+                except PolyStorageTimeout:
+                    storage_exception.gather_current_exception()
+                continue
+            start_times = []
+            pending.append((
+                a_namespace,
+                pool.apply_async(
+                    self._save_to_store,
+                    (
+                        a_namespace,
+                        a_store,
+                        method_name,
+                        args_for_store(a_store),
+                        crash_id,
+                        start_times
+                    )
+                ),
+                start_times,
+                time.time()
+            ))
+        for a_namespace, a_result, start_times, submitted in pending:
+            while not a_result.ready():
+                # the clock starts when the save does, there is a free
+                # thread for it so it is not kept waiting long
+                started = start_times[0] if start_times else submitted
+                remaining = (
+                    started + self.save_timeouts[a_namespace] - time.time()
+                )
+                if remaining <= 0:
+                    break
+                a_result.wait(remaining)
+            try:
+                exc_info = a_result.get(0)
+            except TimeoutError:
+                self.logger.error(
+                    '%s did not finish saving %s within %s seconds',
+                    a_namespace,
+                    crash_id,
+                    self.save_timeouts[a_namespace]
+                )
+                try:
+                    raise PolyStorageTimeout(
+                        '%s %s timed out saving %s' % (
+                            a_namespace,
+                            method_name,
+                            crash_id
+                        )
+                    )
+                except PolyStorageTimeout:
+                    storage_exception.gather_current_exception()
+                continue
+            if exc_info is not None:
+                storage_exception.exceptions.append(exc_info)
+        if storage_exception.has_exceptions():
+            raise storage_exception
 
     #--------------------------------------------------------------------------
     def close(self):
@@ -564,6 +842,13 @@ class PolyCrashStorage(CrashStorageBase):
           PolyStorageError - an exception container holding a list of the
                              exceptions raised by the subordinate storage
                              systems"""
+        with self._save_pool_lock:
+            save_pools = self._save_pools.values()
+            self._save_pools = {}
+        for a_save_pool in save_pools:
+            # let the saves already given to the pool finish
+            a_save_pool.close()
+            a_save_pool.join()
         storage_exception = PolyStorageError()
         for a_store in self.stores.itervalues():
             try:
@@ -584,6 +869,19 @@ class PolyCrashStorage(CrashStorageBase):
             raw_crash - the meta data mapping
             dumps - a mapping of dump name keys to dump binary values
             crash_id - the id of the crash to use"""
+        if self.config.get('concurrent_saves', False):
+            raw_crash_as_dict = socorrodotdict_to_dict(raw_crash)
+
+            def args_for_store(a_store):
+                if self._is_mutator(a_store):
+                    return (
+                        SocorroDotDict(copy.deepcopy(raw_crash_as_dict)),
+                        dumps,
+                        crash_id
+                    )
+                return (raw_crash, dumps, crash_id)
+            self._save_concurrently('save_raw_crash', args_for_store, crash_id)
+            return
         storage_exception = PolyStorageError()
         for a_store in self.stores.itervalues():
             self.quit_check()
@@ -603,6 +901,21 @@ class PolyCrashStorage(CrashStorageBase):
 
         parameters:
             processed_crash - a mapping containing the processed crash"""
+        if self.config.get('concurrent_saves', False):
+            processed_crash_as_dict = socorrodotdict_to_dict(processed_crash)
+
+            def args_for_store(a_store):
+                if self._is_mutator(a_store):
+                    return (
+                        SocorroDotDict(copy.deepcopy(processed_crash_as_dict)),
+                    )
+                return (processed_crash,)
+            self._save_concurrently(
+                'save_processed',
+                args_for_store,
+                processed_crash.get('uuid')
+            )
+            return
         storage_exception = PolyStorageError()
         for a_store in self.stores.itervalues():
             self.quit_check()
@@ -626,12 +939,31 @@ class PolyCrashStorage(CrashStorageBase):
         # dict which we can more easily copy.deepcopy() operate on.
         processed_crash_as_dict = socorrodotdict_to_dict(processed_crash)
 
+        if self.config.get('concurrent_saves', False):
+            # the stores save at the same time, so a mutating store must not
+            # even touch the raw crash that the others are reading
+            raw_crash_as_dict = socorrodotdict_to_dict(raw_crash)
+
+            def args_for_store(a_store):
+                if self._is_mutator(a_store):
+                    return (
+                        SocorroDotDict(copy.deepcopy(raw_crash_as_dict)),
+                        dump,
+                        SocorroDotDict(copy.deepcopy(processed_crash_as_dict)),
+                        crash_id
+                    )
+                return (raw_crash, dump, processed_crash, crash_id)
+            self._save_concurrently(
+                'save_raw_and_processed',
+                args_for_store,
+                crash_id
+            )
+            return
+
         for a_store in self.stores.itervalues():
             self.quit_check()
             try:
-                actual_store = getattr(a_store, 'wrapped_object', a_store)
-
-                if hasattr(actual_store, 'is_mutator') and actual_store.is_mutator():
+                if self._is_mutator(a_store):
                     # We do this because `a_store.save_raw_and_processed`
                     # expects the processed crash to be a DotDict but
                     # you can't deepcopy those, so we deepcopy the
@@ -1293,3 +1625,215 @@ class BenchmarkingCrashStorage(CrashStorageBase):
             self.tag,
             end_time - start_time
         )
+
+
+#==============================================================================
+class CachingCrashStorage(CrashStorageBase):
+    """a read through cache on local disk in front of another crash store.
+
+    Raw crashes, dumps and processed crashes fetched from the wrapped store
+    are kept in a least recently used cache of files bounded by their total
+    size, so that jobs that read the same crashes again, like reprocessing or
+    correlations, do not fetch them again from a remote store.  Threads that
+    fetch the same crash at the same time share a single fetch.  Saving or
+    removing a crash goes to the wrapped store and drops the crash from the
+    cache."""
+    required_config = Namespace()
+    required_config.add_option(
+        name="wrapped_crashstore",
+        doc="the crash store whose crashes are cached",
+        default='',
+        from_string_converter=class_converter
+    )
+    required_config.add_option(
+        name='cache_directory',
+        doc='the local directory of the files of the cache, it should not be '
+            'shared by processes running at the same time',
+        default=os.path.join(tempfile.gettempdir(), 'socorro_crash_cache'),
+    )
+    required_config.add_option(
+        name='maximum_cache_bytes',
+        doc='the limit of the total size of the cached crashes, the least '
+            'recently used are removed beyond it',
+        default=1024 * 1024 * 1024,
+    )
+    required_config.add_option(
+        name='temporary_file_system_storage_path',
+        doc='a local filesystem path where dumps are written when they are '
+            'fetched as files',
+        default='/home/socorro/temp',
+    )
+    required_config.add_option(
+        name='dump_file_suffix',
+        doc='the suffix used to identify a dump file (for use in temp files)',
+        default='.dump',
+    )
+    required_config.add_option(
+        name='metrics_class',
+        default='socorro.external.metrics_base.MetricsBase',
+        doc='the class that implements metrics for the cache',
+        from_string_converter=class_converter,
+    )
+
+    #--------------------------------------------------------------------------
+    def __init__(self, config, quit_check_callback=None):
+        super(CachingCrashStorage, self).__init__(
+            config,
+            quit_check_callback
+        )
+        self.wrapped_crashstore = config.wrapped_crashstore(
+            config,
+            quit_check_callback
+        )
+        metrics_class = config.get('metrics_class')
+        self.cache = DiskLRUCache(
+            config.cache_directory,
+            config.maximum_cache_bytes,
+            metrics=metrics_class(config) if metrics_class else None,
+            metrics_prefix='crashstorage.cache',
+            logger=self.logger,
+        )
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _key(crash_id, kind, name=''):
+        return '%s/%s/%s' % (crash_id, kind, name)
+
+    #--------------------------------------------------------------------------
+    def _forget(self, crash_id):
+        """drop everything cached about a crash"""
+        dump_names = self.cache.peek(self._key(crash_id, 'dump_names'))
+        if dump_names is not None:
+            for a_name in json.loads(dump_names):
+                self.cache.discard(self._key(crash_id, 'dump', a_name))
+        # the default dump may have been fetched on its own
+        self.cache.discard(
+            self._key(crash_id, 'dump', 'upload_file_minidump')
+        )
+        for a_kind in ('raw_crash', 'dump_names', 'processed_crash'):
+            self.cache.discard(self._key(crash_id, a_kind))
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        self.wrapped_crashstore.close()
+
+    #--------------------------------------------------------------------------
+    def save_raw_crash(self, raw_crash, dumps, crash_id):
+        self.wrapped_crashstore.save_raw_crash(raw_crash, dumps, crash_id)
+        self._forget(crash_id)
+
+    #--------------------------------------------------------------------------
+    def save_processed(self, processed_crash):
+        self.wrapped_crashstore.save_processed(processed_crash)
+        self.cache.discard(
+            self._key(processed_crash['uuid'], 'processed_crash')
+        )
+
+    #--------------------------------------------------------------------------
+    def save_raw_and_processed(self, raw_crash, dumps, processed_crash,
+                               crash_id):
+        self.wrapped_crashstore.save_raw_and_processed(
+            raw_crash,
+            dumps,
+            processed_crash,
+            crash_id
+        )
+        self._forget(crash_id)
+
+    #--------------------------------------------------------------------------
+    def get_raw_crash(self, crash_id):
+        raw_crash_as_string = self.cache.get(
+            self._key(crash_id, 'raw_crash'),
+            lambda key: json.dumps(
+                self.wrapped_crashstore.get_raw_crash(crash_id),
+                cls=JsonDTEncoder
+            )
+        )
+        return json.loads(raw_crash_as_string, object_hook=SocorroDotDict)
+
+    #--------------------------------------------------------------------------
+    def get_raw_dump(self, crash_id, name=None):
+        if name in (None, '', 'dump'):
+            name = 'upload_file_minidump'
+        if name != 'upload_file_minidump':
+            # the other dumps are cached with their names so that they can
+            # be found again to be dropped
+            try:
+                return self.get_raw_dumps(crash_id)[name]
+            except KeyError:
+                raise CrashIDNotFound('%s has no dump %s' % (crash_id, name))
+        return self._get_dump(crash_id, name)
+
+    #--------------------------------------------------------------------------
+    def _get_dump(self, crash_id, name):
+        return self.cache.get(
+            self._key(crash_id, 'dump', name),
+            lambda key: self.wrapped_crashstore.get_raw_dump(crash_id, name)
+        )
+
+    #--------------------------------------------------------------------------
+    def get_raw_dumps(self, crash_id):
+        fetched_dumps = {}
+
+        def fetch_dump_names(key):
+            # all the dumps come in one fetch, they are cached along with
+            # their names unless the crash is saved in the meantime
+            generation = self.cache.generation()
+            dumps = self.wrapped_crashstore.get_raw_dumps(crash_id)
+            fetched_dumps.update(dumps.as_memory_dumps_mapping())
+            for a_name, a_dump in fetched_dumps.iteritems():
+                self.cache.put(
+                    self._key(crash_id, 'dump', a_name),
+                    a_dump,
+                    generation
+                )
+            return json.dumps(fetched_dumps.keys())
+
+        names = json.loads(
+            self.cache.get(self._key(crash_id, 'dump_names'), fetch_dump_names)
+        )
+        return MemoryDumpsMapping(
+            (
+                a_name,
+                fetched_dumps[a_name] if a_name in fetched_dumps
+                else self._get_dump(crash_id, a_name)
+            )
+            for a_name in names
+        )
+
+    #--------------------------------------------------------------------------
+    def get_raw_dumps_as_files(self, crash_id):
+        return self.get_raw_dumps(crash_id).as_file_dumps_mapping(
+            crash_id,
+            self.config.temporary_file_system_storage_path,
+            self.config.dump_file_suffix
+        )
+
+    #--------------------------------------------------------------------------
+    def get_unredacted_processed(self, crash_id):
+        processed_crash_as_string = self.cache.get(
+            self._key(crash_id, 'processed_crash'),
+            lambda key: json.dumps(
+                self.wrapped_crashstore.get_unredacted_processed(crash_id),
+                cls=JsonDTEncoder
+            )
+        )
+        return json.loads(
+            processed_crash_as_string,
+            object_hook=SocorroDotDict
+        )
+
+    #--------------------------------------------------------------------------
+    def remove(self, crash_id):
+        self._forget(crash_id)
+        self.wrapped_crashstore.remove(crash_id)
+
+    #--------------------------------------------------------------------------
+    def new_crashes(self):
+        return self.wrapped_crashstore.new_crashes()
+
+    #--------------------------------------------------------------------------
+    def cache_stats(self):
+        """returns a mapping of the cache counters suitable for a metrics
+        'capture_stats' call"""
+        return self.cache.stats('crashstorage.cache')
@@ -0,0 +1,268 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""The BulkIndexer accumulates documents and sends them to Elasticsearch with
+the bulk API.  A batch is sent when it holds enough documents, enough bytes
+or when its oldest document has waited long enough.
+
+Elasticsearch answers a bulk request with the outcome of each document, so
+only the documents that failed are dealt with: those that can be fixed are
+fixed and sent again, those rejected because the cluster is busy are sent
+again after a delay and the others are logged and dropped.  A request that
+fails as a whole is retried after increasing delays before its documents
+are given up on."""
+
+import json
+import time
+
+from elasticsearch.serializer import JSONSerializer
+
+
+# the statuses of the documents that the cluster was too busy to index
+RETRIABLE_STATUSES = (429, 503)
+
+
+#==============================================================================
+class _PendingDocument(object):
+    """a document waiting in a batch, along with its bulk API lines"""
+
+    #--------------------------------------------------------------------------
+    def __init__(self, action, serializer):
+        self.action = action
+        self.serializer = serializer
+        self.attempts = 0
+        self.serialize()
+
+    #--------------------------------------------------------------------------
+    def serialize(self):
+        header = json.dumps({
+            'index': {
+                '_index': self.action['_index'],
+                '_type': self.action['_type'],
+                '_id': self.action['_id'],
+            }
+        })
+        self.lines = '%s\n%s\n' % (
+            header,
+            self.serializer.dumps(self.action['_source'])
+        )
+
+    #--------------------------------------------------------------------------
+    @property
+    def crash_id(self):
+        return self.action['_id']
+
+
+#==============================================================================
+class BulkIndexer(object):
+    """sends documents to Elasticsearch in batches.
+
+    parameters:
+        es_context - the ConnectionContext to Elasticsearch
+        fix_document - a function called with the source of a document and
+                       the error Elasticsearch reported for it.  It returns
+                       True if it changed the document so that indexing it
+                       again may succeed.
+        maximum_items - the number of documents that makes a batch due
+        maximum_bytes - the size of the bulk request that makes a batch due
+        maximum_latency - the seconds the oldest document of a batch waits
+                          before the batch is due
+        backoff_delays - the seconds to wait before each retry of a failed
+                         request or of busy documents
+        maximum_attempts - the number of times a document is sent before it
+                           is given up on
+        metrics - an object with a 'capture_stats' method
+    """
+
+    #--------------------------------------------------------------------------
+    def __init__(
+        self,
+        es_context,
+        logger,
+        fix_document=None,
+        maximum_items=500,
+        maximum_bytes=10 * 1024 * 1024,
+        maximum_latency=5.0,
+        backoff_delays=(1, 5, 10, 30, 60),
+        maximum_attempts=5,
+        metrics=None,
+    ):
+        self.es_context = es_context
+        self.logger = logger
+        self.fix_document = fix_document
+        self.maximum_items = maximum_items
+        self.maximum_bytes = maximum_bytes
+        self.maximum_latency = maximum_latency
+        self.backoff_delays = backoff_delays
+        self.maximum_attempts = maximum_attempts
+        self.metrics = metrics
+        self.serializer = JSONSerializer()
+        self._pending = []
+        self._pending_bytes = 0
+        self._oldest = None
+
+    #--------------------------------------------------------------------------
+    def _clock(self):
+        return time.time()
+
+    #--------------------------------------------------------------------------
+    def _sleep(self, seconds):
+        time.sleep(seconds)
+
+    #--------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._pending)
+
+    #--------------------------------------------------------------------------
+    def add(self, action):
+        """add a document, in the form of a bulk helper action with the
+        '_index', '_type', '_id' and '_source' keys, to the batch"""
+        document = _PendingDocument(action, self.serializer)
+        if not self._pending:
+            self._oldest = self._clock()
+        self._pending.append(document)
+        self._pending_bytes += len(document.lines)
+
+    #--------------------------------------------------------------------------
+    def seconds_until_due(self):
+        """returns the seconds until the batch is due because of its latency
+        or None if the batch is empty"""
+        if not self._pending:
+            return None
+        return max(0, self._oldest + self.maximum_latency - self._clock())
+
+    #--------------------------------------------------------------------------
+    def is_due(self):
+        return bool(self._pending) and (
+            len(self._pending) >= self.maximum_items or
+            self._pending_bytes >= self.maximum_bytes or
+            self.seconds_until_due() == 0
+        )
+
+    #--------------------------------------------------------------------------
+    def flush(self):
+        """send the batch, retrying as needed.  Returns the number of
+        documents that could not be indexed."""
+        if not self._pending:
+            return 0
+        documents = self._pending
+        batch_bytes = self._pending_bytes
+        oldest = self._oldest
+        self._pending = []
+        self._pending_bytes = 0
+        self._oldest = None
+
+        batch_size = len(documents)
+        retried = 0
+        failed = 0
+        request_seconds = 0.0
+        delays = iter(self.backoff_delays)
+        while documents:
+            start = self._clock()
+            try:
+                with self.es_context() as es:
+                    response = es.bulk(
+                        body=''.join(x.lines for x in documents)
+                    )
+            except Exception, x:
+                request_seconds += self._clock() - start
+                delay = next(delays, None)
+                if delay is None:
+                    for a_document in documents:
+                        self.logger.critical(
+                            'Submission to Elasticsearch failed for %s (%s)',
+                            a_document.crash_id,
+                            x
+                        )
+                    failed += len(documents)
+                    break
+                self.logger.warning(
+                    'bulk request to Elasticsearch failed, retrying in %s '
+                    'seconds (%s)',
+                    delay,
+                    x,
+                    exc_info=True
+                )
+                self._sleep(delay)
+                continue
+            request_seconds += self._clock() - start
+
+            documents, busy, number_failed = self._check_response(
+                documents,
+                response
+            )
+            failed += number_failed
+            retried += len(documents)
+            if busy and documents:
+                delay = next(delays, None)
+                if delay is None:
+                    for a_document in documents:
+                        self.logger.critical(
+                            'Submission to Elasticsearch failed for %s '
+                            '(the cluster is too busy)',
+                            a_document.crash_id
+                        )
+                    failed += len(documents)
+                    break
+                self._sleep(delay)
+
+        if self.metrics is not None:
+            self.metrics.capture_stats({
+                'es.bulk.batch_size': batch_size,
+                'es.bulk.batch_bytes': batch_bytes,
+                'es.bulk.request_time': int(request_seconds * 1000),
+                'es.bulk.indexing_latency': int(
+                    (self._clock() - oldest) * 1000
+                ),
+                'es.bulk.retried_items': retried,
+                'es.bulk.failed_items': failed,
+            })
+        return failed
+
+    #--------------------------------------------------------------------------
+    def _check_response(self, documents, response):
+        """returns a tuple of the documents to send again, whether some of
+        them were refused because the cluster was busy and the number of
+        documents that were given up on"""
+        if not response.get('errors', True):
+            return [], False, 0
+        retry = []
+        busy = False
+        failed = 0
+        for a_document, an_item in zip(documents, response['items']):
+            outcome = an_item.values()[0]
+            status = outcome.get('status', 200)
+            if status < 300 and 'error' not in outcome:
+                continue
+            a_document.attempts += 1
+            error = str(outcome.get('error', ''))
+            if a_document.attempts >= self.maximum_attempts:
+                pass
+            elif status in RETRIABLE_STATUSES:
+                busy = True
+                retry.append(a_document)
+                continue
+            elif self._fix(a_document, error):
+                retry.append(a_document)
+                continue
+            self.logger.critical(
+                'Submission to Elasticsearch failed for %s (%s)',
+                a_document.crash_id,
+                error
+            )
+            failed += 1
+        return retry, busy, failed
+
+    #--------------------------------------------------------------------------
+    def _fix(self, document, error):
+        if self.fix_document is None:
+            return False
+        try:
+            fixed = self.fix_document(document.action['_source'], error)
+        except (KeyError, TypeError):
+            # the field to remove is not where the error says it is
+            return False
+        if fixed:
+            document.serialize()
+        return fixed
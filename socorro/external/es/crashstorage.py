@@ -4,15 +4,20 @@
 
 import re
 from threading import Thread
-from Queue import Queue
+from Queue import Queue, Empty
 from contextlib import contextmanager
 
 import elasticsearch
 from configman import Namespace
 from configman.converters import class_converter, list_converter
 
+from socorro.database.transaction_executor import string_to_list_of_ints
 from socorro.external.crashstorage_base import CrashStorageBase
-from socorro.external.es.index_creator import IndexCreator
+from socorro.external.es.bulk_indexer import BulkIndexer
+from socorro.external.es.index_registry import (
+    IndexRegistry,
+    get_index_registry,
+)
 from socorro.lib.converters import change_default
 from socorro.lib.datetimeutil import string_to_datetime
 from socorro.external.crashstorage_base import Redactor
@@ -38,10 +43,21 @@ class ESCrashStorage(CrashStorageBase):
         from_string_converter=class_converter,
         reference_value_from='resource.elasticsearch',
     )
-
-    # This cache reduces attempts to create indices, thus lowering overhead
-    # each time a document is indexed.
-    indices_cache = set()
+    required_config.elasticsearch.index_creation_interval = change_default(
+        IndexRegistry,
+        'elasticsearch.index_creation_interval',
+        3600
+    )
+    required_config.elasticsearch.index_creation_days_ahead = change_default(
+        IndexRegistry,
+        'elasticsearch.index_creation_days_ahead',
+        1
+    )
+    required_config.elasticsearch.index_reload_seconds = change_default(
+        IndexRegistry,
+        'elasticsearch.index_reload_seconds',
+        60
+    )
 
     # These regex will catch field names from Elasticsearch exceptions. They
     # have been tested with Elasticsearch 1.4.
@@ -68,6 +84,10 @@ class ESCrashStorage(CrashStorageBase):
             quit_check_callback
         )
 
+        # The registry of existing indices is shared with the other crash
+        # stores of this process, only unknown indices need to be created.
+        self.index_registry = get_index_registry(self.config)
+
     #--------------------------------------------------------------------------
     def get_index_for_crash(self, crash_date):
         """Return the submission URL for a crash; based on the submission URL
@@ -125,6 +145,58 @@ class ESCrashStorage(CrashStorageBase):
                 # not there? we don't care
                 pass
 
+    #--------------------------------------------------------------------------
+    def remove_field_named_in_error(self, crash_document, error):
+        """Remove from a crash document the field that an Elasticsearch
+        indexing error blames, and note its name in the `removed_fields` of
+        the document. Return the name of the removed field, or None if the
+        error does not name a field that can be removed.
+        """
+        field_name = None
+
+        if 'MaxBytesLengthExceededException' in error:
+            # This is caused by a string that is way too long for
+            # Elasticsearch.
+            matches = self.field_name_string_error_re.findall(error)
+            if matches:
+                field_name = matches[0]
+        elif 'NumberFormatException' in error:
+            # This is caused by a number that is either too big for
+            # Elasticsearch or just not a number.
+            matches = self.field_name_number_error_re.findall(error)
+            if matches:
+                field_name = matches[0]
+
+        if not field_name:
+            return None
+
+        if field_name.endswith('.full'):
+            # Remove the `.full` at the end, that is a special mapping
+            # construct that is not part of the real field name.
+            field_name = field_name.rstrip('.full')
+
+        # Now remove that field from the document before trying again.
+        field_path = field_name.split('.')
+        parent = crash_document
+        for i, field in enumerate(field_path):
+            if i == len(field_path) - 1:
+                # This is the last level, so `field` contains the name
+                # of the field that we want to remove from `parent`.
+                del parent[field]
+            else:
+                parent = parent[field]
+
+        # Add a note in the document that a field has been removed.
+        if crash_document.get('removed_fields'):
+            crash_document['removed_fields'] = '{} {}'.format(
+                crash_document['removed_fields'],
+                field_name
+            )
+        else:
+            crash_document['removed_fields'] = field_name
+
+        return field_name
+
     #--------------------------------------------------------------------------
     def _submit_crash_to_elasticsearch(self, connection, crash_document):
         """Submit a crash report to elasticsearch.
@@ -140,10 +212,8 @@ class ESCrashStorage(CrashStorageBase):
         es_doctype = self.config.elasticsearch.elasticsearch_doctype
         crash_id = crash_document['crash_id']
 
-        # Attempt to create the index; it's OK if it already exists.
-        if es_index not in self.indices_cache:
-            index_creator = IndexCreator(config=self.config)
-            index_creator.create_socorro_index(es_index)
+        # Create the index unless it is known to exist already.
+        self.index_registry.ensure_index(es_index)
 
         # Submit the crash for indexing.
         # Don't retry more than 5 times. That is to avoid infinite loops in
@@ -159,21 +229,10 @@ class ESCrashStorage(CrashStorageBase):
                 )
                 break
             except elasticsearch.exceptions.TransportError as e:
-                field_name = None
-
-                if 'MaxBytesLengthExceededException' in e.error:
-                    # This is caused by a string that is way too long for
-                    # Elasticsearch.
-                    matches = self.field_name_string_error_re.findall(e.error)
-                    if matches:
-                        field_name = matches[0]
-                elif 'NumberFormatException' in e.error:
-                    # This is caused by a number that is either too big for
-                    # Elasticsearch or just not a number.
-                    matches = self.field_name_number_error_re.findall(e.error)
-                    if matches:
-                        field_name = matches[0]
-
+                field_name = self.remove_field_named_in_error(
+                    crash_document,
+                    e.error
+                )
                 if not field_name:
                     # We are unable to parse which field to remove, we cannot
                     # try to fix the document. Let it raise.
@@ -184,31 +243,6 @@ class ESCrashStorage(CrashStorageBase):
                         exc_info=True
                     )
                     raise
-
-                if field_name.endswith('.full'):
-                    # Remove the `.full` at the end, that is a special mapping
-                    # construct that is not part of the real field name.
-                    field_name = field_name.rstrip('.full')
-
-                # Now remove that field from the document before trying again.
-                field_path = field_name.split('.')
-                parent = crash_document
-                for i, field in enumerate(field_path):
-                    if i == len(field_path) - 1:
-                        # This is the last level, so `field` contains the name
-                        # of the field that we want to remove from `parent`.
-                        del parent[field]
-                    else:
-                        parent = parent[field]
-
-                # Add a note in the document that a field has been removed.
-                if crash_document.get('removed_fields'):
-                    crash_document['removed_fields'] = '{} {}'.format(
-                        crash_document['removed_fields'],
-                        field_name
-                    )
-                else:
-                    crash_document['removed_fields'] = field_name
             except elasticsearch.exceptions.ElasticsearchException as e:
                 self.config.logger.critical(
                     'Submission to Elasticsearch failed for %s (%s)',
@@ -388,6 +422,33 @@ def _create_bulk_load_crashstore(base_class):
             default=512,
             doc='the maximum size of the internal queue'
         )
+        required_config.add_option(
+            'bulk_load_maximum_bytes',
+            default=10 * 1024 * 1024,
+            doc='the size in bytes of a bulk request that triggers a flush to '
+                'ES'
+        )
+        required_config.add_option(
+            'bulk_load_maximum_latency',
+            default=5.0,
+            doc='the seconds a crash waits in the internal queue before it '
+                'triggers a flush to ES'
+        )
+        required_config.add_option(
+            'bulk_load_backoff_delays',
+            default='1, 5, 10, 30, 60',
+            doc='the seconds to wait before each retry of a failed bulk '
+                'request',
+            from_string_converter=string_to_list_of_ints
+        )
+        required_config.add_option(
+            'metrics_class',
+            default='socorro.external.metrics_base.MetricsBase',
+            doc='the class that implements metrics for the queue depth, '
+                'batch size and indexing latency of bulk loads',
+            from_string_converter=class_converter,
+            reference_value_from='resource.elasticsearch',
+        )
 
         #----------------------------------------------------------------------
         def __init__(self, config, quit_check_callback=None):
@@ -408,6 +469,24 @@ def _create_bulk_load_crashstore(base_class):
                 QueueContextSource(self.task_queue),
                 quit_check_callback
             )
+            metrics_class = config.get('metrics_class')
+            self.metrics = metrics_class(config) if metrics_class else None
+            self.bulk_indexer = BulkIndexer(
+                self.es_context,
+                config.logger,
+                fix_document=self.remove_field_named_in_error,
+                maximum_items=config.items_per_bulk_load,
+                maximum_bytes=config.get(
+                    'bulk_load_maximum_bytes',
+                    10 * 1024 * 1024
+                ),
+                maximum_latency=config.get('bulk_load_maximum_latency', 5.0),
+                backoff_delays=config.get(
+                    'bulk_load_backoff_delays',
+                    [1, 5, 10, 30, 60]
+                ),
+                metrics=self.metrics,
+            )
             self.done = False
             self.consuming_thread.start()
 
@@ -426,10 +505,8 @@ def _create_bulk_load_crashstore(base_class):
             es_doctype = self.config.elasticsearch.elasticsearch_doctype
             crash_id = crash_document['crash_id']
 
-            # Attempt to create the index; it's OK if it already exists.
-            if es_index not in self.indices_cache:
-                index_creator = IndexCreator(config=self.config)
-                index_creator.create_socorro_index(es_index)
+            # Create the index unless it is known to exist already.
+            self.index_registry.ensure_index(es_index)
 
             action = {
                 '_index': es_index,
@@ -439,41 +516,51 @@ def _create_bulk_load_crashstore(base_class):
             }
             queue.put(action)
 
-        #----------------------------------------------------------------------
-        def _consumer_iter(self):
-            while True:
-                try:
-                    crash_document = self.task_queue.get()
-                except Exception:
-                    self.config.logger.critical(
-                        "Failure in ES Bulktask_queue",
-                        exc_info=True
-                    )
-                    crash_document = None
-                if crash_document is None:
-                    self.done = True
-                    break
-                yield crash_document  # execute the task
-
         #----------------------------------------------------------------------
         def close(self):
             self.task_queue.put(None)
             self.consuming_thread.join()
 
+        #----------------------------------------------------------------------
+        def _flush(self):
+            try:
+                if self.metrics is not None:
+                    self.metrics.capture_stats({
+                        'es.bulk.queue_depth': self.task_queue.qsize(),
+                    })
+                self.bulk_indexer.flush()
+            except Exception:
+                # the thread must go on with the next batch
+                self.config.logger.critical(
+                    "Failure in ES bulk load",
+                    exc_info=True
+                )
+
         #----------------------------------------------------------------------
         def _consuming_thread_func(self):  # execute the bulk load
-            with self.es_context() as es:
+            while True:
                 try:
-                    elasticsearch.helpers.bulk(
-                        es,
-                        self._consumer_iter(),
-                        chunk_size=self.config.items_per_bulk_load
-                    )
-                except Exception:
-                    self.config.logger.critical(
-                        "Failure in ES elasticsearch.helpers.bulk",
-                        exc_info=True
+                    crash_document = self.task_queue.get(
+                        timeout=self.bulk_indexer.seconds_until_due()
                     )
+                except Empty:
+                    # the oldest crash of the batch has waited long enough
+                    pass
+                else:
+                    if crash_document is None:
+                        break
+                    try:
+                        self.bulk_indexer.add(crash_document)
+                    except Exception:
+                        self.config.logger.critical(
+                            "Failure in ES bulk load of %s",
+                            crash_document.get('_id'),
+                            exc_info=True
+                        )
+                if self.bulk_indexer.is_due():
+                    self._flush()
+            self._flush()
+            self.done = True
 
     return ESBulkClassTemplate
 
@@ -0,0 +1,241 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""The IndexRegistry remembers which crash report indices exist in
+Elasticsearch so that they are not created again before every document that
+is indexed.  One registry is shared by all the users of the same cluster and
+index pattern within a process: the crash storage classes create missing
+indices through it and SuperSearch uses it to skip the indices that do not
+exist.
+
+When the index pattern is dated, a background thread creates the upcoming
+index ahead of time so that the creation, and the fetching of the mapping
+that it requires, does not happen while crashes are being indexed."""
+
+import datetime
+import threading
+import time
+
+from configman import Namespace, RequiredConfig
+from configman.converters import class_converter
+
+from socorro.external.es.index_creator import IndexCreator
+from socorro.lib.datetimeutil import utc_now
+
+
+#==============================================================================
+class IndexRegistry(RequiredConfig):
+    """the set of the indices known to exist in Elasticsearch"""
+
+    required_config = Namespace()
+    required_config.elasticsearch = Namespace()
+    required_config.elasticsearch.add_option(
+        'elasticsearch_class',
+        default='socorro.external.es.connection_context.ConnectionContext',
+        from_string_converter=class_converter,
+        reference_value_from='resource.elasticsearch',
+    )
+    required_config.elasticsearch.add_option(
+        'index_creation_interval',
+        default=3600,
+        doc='the seconds between the checks that create the upcoming '
+            'indices ahead of time and reload the list of indices from '
+            'Elasticsearch (0 to never check)',
+        reference_value_from='resource.elasticsearch',
+    )
+    required_config.elasticsearch.add_option(
+        'index_creation_days_ahead',
+        default=1,
+        doc='the number of days ahead of today to create indices for',
+        reference_value_from='resource.elasticsearch',
+    )
+    required_config.elasticsearch.add_option(
+        'index_reload_seconds',
+        default=60,
+        doc='the minimum seconds between reloads of the list of indices '
+            'from Elasticsearch when an unknown index is looked up',
+        reference_value_from='resource.elasticsearch',
+    )
+
+    #--------------------------------------------------------------------------
+    def __init__(self, config):
+        super(IndexRegistry, self).__init__()
+        self.config = config
+        self.index_creator = IndexCreator(config)
+        self._known_indices = set()
+        self._lock = threading.Lock()
+        self._creation_lock = threading.Lock()
+        self._loaded_at = None
+        self._stop = threading.Event()
+        self._thread = None
+        self.load()
+
+    #--------------------------------------------------------------------------
+    def _option(self, name, default):
+        # the registry is also used by classes that do not declare its
+        # options, they get the defaults
+        return self.config.elasticsearch.get(name, default)
+
+    #--------------------------------------------------------------------------
+    def _clock(self):
+        return time.time()
+
+    #--------------------------------------------------------------------------
+    def load(self):
+        """replace the known indices with the list of indices that exist in
+        Elasticsearch.  If that list cannot be fetched, the known indices are
+        kept as they are."""
+        try:
+            client = self.index_creator.get_index_client()
+            indices = set(client.get_aliases())
+        except Exception, x:
+            self.config.logger.warning(
+                'unable to load the list of Elasticsearch indices: %s',
+                x
+            )
+            return False
+        with self._lock:
+            self._known_indices = indices
+            self._loaded_at = self._clock()
+        return True
+
+    #--------------------------------------------------------------------------
+    def __contains__(self, es_index):
+        return es_index in self._known_indices
+
+    #--------------------------------------------------------------------------
+    def known_indices(self):
+        with self._lock:
+            return sorted(self._known_indices)
+
+    #--------------------------------------------------------------------------
+    def forget(self, es_index):
+        """remove an index that turned out not to exist, like one deleted by
+        the index cleaner"""
+        with self._lock:
+            self._known_indices.discard(es_index)
+
+    #--------------------------------------------------------------------------
+    def split_known(self, indices):
+        """returns a tuple of the list of the indices known to exist and the
+        list of the others.  The list of indices is reloaded first when some
+        are unknown and it has not been reloaded recently, as they may have
+        been created by another process.  Until the list has been loaded
+        once, every index is assumed to exist."""
+        unknown = [x for x in indices if x not in self]
+        if unknown:
+            reload_seconds = self._option('index_reload_seconds', 60)
+            if (
+                self._loaded_at is None or
+                self._clock() - self._loaded_at >= reload_seconds
+            ):
+                self.load()
+            if self._loaded_at is None:
+                return list(indices), []
+        known = [x for x in indices if x in self]
+        unknown = [x for x in indices if x not in self]
+        return known, unknown
+
+    #--------------------------------------------------------------------------
+    def ensure_index(self, es_index):
+        """create the index unless it is known to exist already"""
+        if es_index in self:
+            return
+        with self._creation_lock:
+            # another thread may have created it while this one waited
+            if es_index in self:
+                return
+            self.index_creator.create_socorro_index(es_index)
+            with self._lock:
+                self._known_indices.add(es_index)
+
+    #--------------------------------------------------------------------------
+    def get_index_for_date(self, a_date):
+        return a_date.strftime(self.config.elasticsearch.elasticsearch_index)
+
+    #--------------------------------------------------------------------------
+    def create_upcoming_indices(self):
+        """create the indices of today and of the following days"""
+        today = utc_now()
+        days_ahead = self._option('index_creation_days_ahead', 1)
+        for days in range(days_ahead + 1):
+            es_index = self.get_index_for_date(
+                today + datetime.timedelta(days=days)
+            )
+            try:
+                self.ensure_index(es_index)
+            except Exception, x:
+                self.config.logger.warning(
+                    'unable to create the Elasticsearch index %s: %s',
+                    es_index,
+                    x,
+                    exc_info=True
+                )
+
+    #--------------------------------------------------------------------------
+    def start(self):
+        """start the thread that creates the upcoming indices ahead of time.
+        Nothing is started when the index pattern is not dated or the
+        index_creation_interval is 0."""
+        interval = self._option('index_creation_interval', 0)
+        if (
+            self._thread is not None or
+            not interval or
+            '%' not in (self.config.elasticsearch.elasticsearch_index or '')
+        ):
+            return
+        self._thread = threading.Thread(
+            name='IndexRegistryThread',
+            target=self._index_creation_thread_func,
+            args=(interval,)
+        )
+        self._thread.daemon = True
+        self._thread.start()
+
+    #--------------------------------------------------------------------------
+    def _index_creation_thread_func(self, interval):
+        self.create_upcoming_indices()
+        while not self._stop.wait(interval):
+            self.load()
+            self.create_upcoming_indices()
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+#------------------------------------------------------------------------------
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+#------------------------------------------------------------------------------
+def get_index_registry(config):
+    """returns the registry shared by every user of the same Elasticsearch
+    cluster and index pattern in this process, creating and starting it on
+    first use"""
+    es_config = config.elasticsearch
+    key = (
+        es_config.elasticsearch_class,
+        tuple(es_config.get('elasticsearch_urls', ())),
+        es_config.elasticsearch_index,
+    )
+    with _registries_lock:
+        if key not in _registries:
+            registry = IndexRegistry(config)
+            registry.start()
+            _registries[key] = registry
+        return _registries[key]
+
+
+#------------------------------------------------------------------------------
+def clear_index_registries():
+    """stop and forget all the shared registries"""
+    with _registries_lock:
+        for a_registry in _registries.values():
+            a_registry.close()
+        _registries.clear()
@@ -14,6 +14,7 @@ from socorro.lib import (
     datetimeutil,
 )
 
+from socorro.external.es.index_registry import get_index_registry
 from socorro.middleware.search_common import SearchBase
 
 
@@ -27,6 +28,7 @@ class SuperSearch(SearchBase):
         self.es_context = self.config.elasticsearch.elasticsearch_class(
             self.config.elasticsearch
         )
+        self.index_registry = get_index_registry(self.config)
 
         super(SuperSearch, self).__init__(*args, **kwargs)
 
@@ -431,12 +433,27 @@ class SuperSearch(SearchBase):
 
         errors = []
 
+        # Indices that are known not to exist are left out of the request
+        # and reported as missing without asking elasticsearch first.
+        indices, unknown_indices = self.index_registry.split_known(indices)
+        for missing_index in unknown_indices:
+            errors.append({
+                'type': 'missing_index',
+                'index': missing_index,
+            })
+        if unknown_indices and indices:
+            search = search.index().index(*indices)
+
+        total = 0
+        aggregations = {}
+        shards = None
+
         # We call elasticsearch with a computed list of indices, based on
         # the date range. However, if that list contains indices that do not
         # exist in elasticsearch, an error will be raised. We thus want to
         # remove all failing indices until we either have a valid list, or
         # an empty list in which case we return no result.
-        while True:
+        while indices:
             try:
                 results = search.execute()
                 for hit in results:
@@ -453,6 +470,7 @@ class SuperSearch(SearchBase):
                 break  # Yay! Results!
             except NotFoundError, e:
                 missing_index = re.findall(BAD_INDEX_REGEX, e.error)[0]
+                self.index_registry.forget(missing_index)
                 if missing_index in indices:
                     del indices[indices.index(missing_index)]
                 else:
@@ -3,13 +3,18 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import datetime
+import glob
 import json
+import mmap
 import os
 import gzip
 import shutil
 import stat
+import threading
+import time
+import zlib
 
-from contextlib import contextmanager, closing
+from contextlib import contextmanager
 
 try:
     from cStringIO import StringIO
@@ -23,6 +28,11 @@ from socorro.external.crashstorage_base import (
     FileDumpsMapping,
     MemoryDumpsMapping
 )
+from socorro.lib.compression import (
+    compress,
+    compression_stats,
+    decompress,
+)
 from socorro.lib.ooid import dateFromOoid, depthFromOoid
 from socorro.lib.datetimeutil import utc_now
 from socorro.lib.util import DotDict
@@ -99,6 +109,29 @@ class FSRadixTreeStorage(CrashStorageBase):
         default='.dump',
         reference_value_from='resource.fs',
     )
+    required_config.add_option(
+        'processed_crash_compression',
+        doc="the compression of saved processed crashes: 'none', 'gzip' or "
+            "'zlib'.  Processed crashes are decompressed as they are read "
+            "whatever this is set to.",
+        default='gzip',
+        reference_value_from='resource.fs',
+    )
+    required_config.add_option(
+        'processed_crash_compression_level',
+        doc='the compression level of processed crashes from 1 (fastest) to '
+            '9 (smallest)',
+        default=9,
+        reference_value_from='resource.fs',
+    )
+    required_config.add_option(
+        'metrics_class',
+        default='socorro.external.metrics_base.MetricsBase',
+        doc='the class that implements metrics for the compression of '
+            'processed crashes',
+        from_string_converter=class_converter,
+        reference_value_from='resource.fs',
+    )
     required_config.add_option(
         'dump_field',
         doc='the default dump field',
@@ -120,6 +153,8 @@ class FSRadixTreeStorage(CrashStorageBase):
         except OSError:
             self.logger.info("didn't make directory: %s " %
                 self.config.fs_root)
+        metrics_class = self.config.get('metrics_class')
+        self.metrics = metrics_class(self.config) if metrics_class else None
 
     @staticmethod
     def _cleanup_empty_dirs(base, leaf):
@@ -189,12 +224,22 @@ class FSRadixTreeStorage(CrashStorageBase):
 
     def save_processed(self, processed_crash):
         crash_id = processed_crash['uuid']
-        processed_crash = processed_crash.copy()
-        f = StringIO()
-        with closing(gzip.GzipFile(mode='wb', fileobj=f)) as fz:
-            json.dump(processed_crash, fz, default=dates_to_strings_for_json)
+        processed_crash_as_string = json.dumps(
+            processed_crash,
+            default=dates_to_strings_for_json
+        )
+        method = self.config.get('processed_crash_compression', 'gzip')
+        level = self.config.get('processed_crash_compression_level', 9)
+        compressed = compress(processed_crash_as_string, method, level)
+        if self.metrics is not None and method != 'none':
+            self.metrics.capture_stats(compression_stats(
+                'fs.processed_crash',
+                len(processed_crash_as_string),
+                len(compressed),
+                level
+            ))
         self._save_files(crash_id, {
-            crash_id + self.config.jsonz_file_suffix: f.getvalue()
+            crash_id + self.config.jsonz_file_suffix: compressed
         })
 
     def save_raw_crash(self, raw_crash, dumps, crash_id):
@@ -252,8 +297,8 @@ class FSRadixTreeStorage(CrashStorageBase):
         ])
         if not os.path.exists(pathname):
             raise CrashIDNotFound
-        with closing(gzip.GzipFile(pathname, 'rb')) as f:
-            return json.load(f, object_hook=DotDict)
+        with open(pathname, 'rb') as f:
+            return json.loads(decompress(f.read()), object_hook=DotDict)
 
     def remove(self, crash_id):
         parent_dir = self._get_radixed_parent_directory(crash_id)
@@ -317,6 +362,17 @@ class FSDatedRadixTreeStorage(FSRadixTreeStorage):
 
     This storage class is suitable for use as raw crash storage, as it supports
     the ``new_crashes`` method.
+
+    With ``new_crash_journal``, each saved crash is also appended to a journal
+    kept in its date directory, a line with the crash_id and its slot.
+    ``new_crashes`` reads the journals from the offset where it stopped on its
+    previous pass, so that its work is proportional to the number of new
+    crashes rather than to the size of the tree.  The whole dated tree is
+    still scanned on the first pass and every ``journal_full_scan_interval``
+    seconds to find the crashes missing from the journals, like those saved
+    before the journals existed or by collectors that do not keep them, so
+    the journal should only be turned on once all the collectors writing to
+    the tree keep it.
     """
 
     required_config = Namespace()
@@ -333,11 +389,48 @@ class FSDatedRadixTreeStorage(FSRadixTreeStorage):
         default=4,
         reference_value_from='resource.fs',
     )
+    required_config.add_option(
+        'new_crash_journal',
+        doc='whether to keep a journal of the saved crashes in each date '
+            'directory and find new crashes by reading the journals rather '
+            'than by scanning the dated tree on every pass; all the '
+            'collectors writing to the tree must keep it',
+        default=False,
+        reference_value_from='resource.fs',
+    )
+    required_config.add_option(
+        'journal_file_name',
+        doc='the name of the journal file in each date directory, the offset '
+            'up to which it has been read is kept next to it',
+        default='new_crashes.journal',
+        reference_value_from='resource.fs',
+    )
+    required_config.add_option(
+        'journal_full_scan_interval',
+        doc='the seconds between the full scans of the dated tree that find '
+            'the crashes missing from the journals (0 to scan only on the '
+            'first pass)',
+        default=3600,
+        reference_value_from='resource.fs',
+    )
 
     # This is just a constant for len(self._current_slot()).
     SLOT_DEPTH = 2
     DIR_DEPTH = 2
 
+    # the number of journal entries read between saves of the offset
+    JOURNAL_OFFSET_SAVE_INTERVAL = 100
+
+    # whether the journal lists every crash saved in the tree, the legacy
+    # storage also finds crashes in the webhead slots that it does not list
+    JOURNAL_LISTS_ALL_CRASHES = True
+
+    def __init__(self, *args, **kwargs):
+        super(FSDatedRadixTreeStorage, self).__init__(*args, **kwargs)
+        # the time of the last full scan of the dated tree, None to have the
+        # next pass start with one
+        self._last_full_scan = None
+
     def _get_current_date(self):
         date = utc_now()
         return "%02d%02d%02d" % (date.year, date.month, date.day)
@@ -418,6 +511,45 @@ class FSDatedRadixTreeStorage(FSRadixTreeStorage):
                 self._create_name_to_date_symlink(crash_id, slot)
             except OSError as exc:
                 self.logger.info('failed to create symlink: %s', str(exc))
+                return
+            if self._journal_in_use():
+                self._append_to_journal(crash_id, slot)
+
+    def _journal_in_use(self):
+        return (
+            self.JOURNAL_LISTS_ALL_CRASHES and
+            self.config.get('new_crash_journal', False)
+        )
+
+    def _get_journal_path(self, date_root):
+        return os.sep.join([date_root, self.config.journal_file_name])
+
+    def _append_to_journal(self, crash_id, slot):
+        """append the crash to the journal of its date directory.  The line
+        is written with a single write to a file opened for appending, so
+        that the lines of concurrent writers are not mixed up.  A crash that
+        could not be added to the journal is found by the next full scan."""
+        journal_path = self._get_journal_path(
+            os.sep.join(self._get_base(crash_id))
+        )
+        line = '%s %s\n' % (crash_id, os.sep.join(slot))
+        try:
+            fd = os.open(
+                journal_path,
+                os.O_WRONLY | os.O_APPEND | os.O_CREAT,
+                0666 & ~self.config.umask
+            )
+            try:
+                os.write(fd, line)
+            finally:
+                os.close(fd)
+        except OSError:
+            self.logger.warning(
+                'could not add %s to the journal %s',
+                crash_id,
+                journal_path,
+                exc_info=True
+            )
 
     def remove(self, crash_id):
         dated_path = os.path.realpath(
@@ -435,38 +567,209 @@ class FSDatedRadixTreeStorage(FSRadixTreeStorage):
         # Now we actually remove the crash.
         super(FSDatedRadixTreeStorage, self).remove(crash_id)
 
+    def _visit_crash_link(self, namedir, crash_id):
+        """visit the link to a crash found in a slot"""
+        # This is a link, so we can dereference it to find
+        # crashes.
+        if os.path.isfile(
+            os.sep.join([namedir,
+                         crash_id +
+                         self.config.json_file_suffix])):
+            date_root_path = os.sep.join([
+                namedir,
+                self._get_date_root_name(crash_id)
+            ])
+            yield crash_id
+
+            try:
+                os.unlink(date_root_path)
+            except OSError:
+                self.logger.error("could not find a date root in "
+                                  "%s; is crash corrupt?",
+                                  namedir,
+                                  exc_info=True)
+
+            os.unlink(namedir)
+
     def _visit_minute_slot(self, minute_slot_base):
         for crash_id in os.listdir(minute_slot_base):
             namedir = os.sep.join([minute_slot_base, crash_id])
             st_result = os.lstat(namedir)
 
             if stat.S_ISLNK(st_result.st_mode):
-                # This is a link, so we can dereference it to find
-                # crashes.
-                if os.path.isfile(
-                    os.sep.join([namedir,
-                                 crash_id +
-                                 self.config.json_file_suffix])):
-                    date_root_path = os.sep.join([
-                        namedir,
-                        self._get_date_root_name(crash_id)
-                    ])
-                    yield crash_id
+                for x in self._visit_crash_link(namedir, crash_id):
+                    yield x
+
+    def new_crashes(self):
+        """
+        The ``new_crashes`` method returns a generator that visits all new
+        crashes.  With the journals, it starts with a full scan of the dated
+        tree on the first pass and every ``journal_full_scan_interval``
+        seconds, then reads the new entries of the journals.  Without them,
+        every pass is a full scan.
+        """
+        if not self._journal_in_use():
+            return self._scan_new_crashes()
+        return self._read_new_crashes_from_journals()
+
+    def _read_new_crashes_from_journals(self):
+        interval = self.config.get('journal_full_scan_interval', 0)
+        now = time.time()
+        if (
+            self._last_full_scan is None or
+            (interval and now - self._last_full_scan >= interval)
+        ):
+            self._last_full_scan = now
+            for x in self._scan_new_crashes():
+                yield x
 
+        current_slot = self._current_slot()
+        current_date = self._get_current_date()
+        for date in sorted(os.listdir(self.config.fs_root)):
+            date_root = os.sep.join([self.config.fs_root, date])
+            for x in self._read_journal(
+                date_root,
+                date >= current_date and current_slot or None
+            ):
+                yield x
+            if date < current_date:
+                self._remove_finished_journal(date_root)
+
+    def _load_journal_offset(self, journal_path):
+        try:
+            with open(journal_path + '.offset') as offset_file:
+                return int(offset_file.read().strip() or 0)
+        except (IOError, ValueError):
+            return 0
+
+    def _save_journal_offset(self, journal_path, offset):
+        """save the offset with a rename so that it is never seen half
+        written"""
+        offset_path = journal_path + '.offset'
+        try:
+            with open(offset_path + '.tmp', 'w') as offset_file:
+                offset_file.write(str(offset))
+            os.rename(offset_path + '.tmp', offset_path)
+        except (IOError, OSError):
+            self.logger.warning(
+                'could not save the offset of the journal %s',
+                journal_path,
+                exc_info=True
+            )
+
+    def _remove_finished_journal(self, date_root):
+        """remove the journal of a past date once it has been read to its
+        end and nothing else is left in the date directory, then remove the
+        directory, so that the journal does not keep it around"""
+        journal_path = self._get_journal_path(date_root)
+        journal_files = set([
+            self.config.journal_file_name,
+            self.config.journal_file_name + '.offset',
+        ])
+        try:
+            if not set(os.listdir(date_root)) <= journal_files:
+                return
+            if (
+                os.path.exists(journal_path) and
+                self._load_journal_offset(journal_path) !=
+                os.path.getsize(journal_path)
+            ):
+                return
+            for a_file_name in journal_files:
+                try:
+                    os.unlink(os.sep.join([date_root, a_file_name]))
+                except OSError:
+                    # already gone
+                    pass
+            os.rmdir(date_root)
+        except OSError:
+            # a crash was saved into the directory meanwhile, if it missed
+            # the journal it is found by the next full scan
+            pass
+
+    def _read_journal(self, date_root, current_slot):
+        """visit the crashes added to the journal of the date directory since
+        the last pass.  Reading stops at the first crash in the current slot,
+        if any, as the slot is still being filled; it resumes there on the
+        next pass."""
+        journal_path = self._get_journal_path(date_root)
+        try:
+            size = os.path.getsize(journal_path)
+        except OSError:
+            # a date directory without a journal, its crashes are found by
+            # the full scans
+            return
+        offset = self._load_journal_offset(journal_path)
+        if offset > size:
+            # the journal was started over, like in a recycled directory
+            offset = 0
+        if offset == size:
+            return
+
+        start_offset = offset
+        visited_slots = set()
+        entries_since_save = 0
+        try:
+            with open(journal_path) as journal:
+                journal.seek(offset)
+                for line in journal:
+                    if not line.endswith('\n'):
+                        # a line still being written
+                        break
+                    try:
+                        crash_id, slot_path = line.split()
+                    except ValueError:
+                        self.logger.error(
+                            'skipping a malformed line in the journal '
+                            '%s: %r',
+                            journal_path,
+                            line
+                        )
+                        offset += len(line)
+                        continue
+                    slot = slot_path.split(os.sep)
+                    if current_slot is not None and slot >= current_slot:
+                        break
+                    minute_slot_base = os.sep.join(
+                        [date_root, self.config.date_branch_base] + slot
+                    )
+                    namedir = os.sep.join([minute_slot_base, crash_id])
                     try:
-                        os.unlink(date_root_path)
+                        is_link = stat.S_ISLNK(os.lstat(namedir).st_mode)
                     except OSError:
-                        self.logger.error("could not find a date root in "
-                                          "%s; is crash corrupt?",
-                                          namedir,
-                                          exc_info=True)
-
-                    os.unlink(namedir)
+                        # already visited by a full scan or removed
+                        is_link = False
+                    if is_link:
+                        for x in self._visit_crash_link(namedir, crash_id):
+                            yield x
+                    visited_slots.add(minute_slot_base)
+                    offset += len(line)
+                    entries_since_save += 1
+                    if (
+                        entries_since_save >=
+                        self.JOURNAL_OFFSET_SAVE_INTERVAL
+                    ):
+                        self._save_journal_offset(journal_path, offset)
+                        entries_since_save = 0
+        finally:
+            if offset != start_offset:
+                self._save_journal_offset(journal_path, offset)
+
+        for minute_slot_base in visited_slots:
+            # the slots are no longer in use, remove those that are empty
+            for a_directory in (
+                minute_slot_base,
+                os.path.dirname(minute_slot_base)
+            ):
+                try:
+                    os.rmdir(a_directory)
+                except OSError:
+                    # not empty, there are other crashes in it
+                    break
 
-    def new_crashes(self):
+    def _scan_new_crashes(self):
         """
-        The ``new_crashes`` method returns a generator that visits all new
-        crashes like so:
+        A full scan of the dated tree visits all new crashes like so:
 
         * Traverse the date root to find all crashes.
 
@@ -478,7 +781,7 @@ class FSDatedRadixTreeStorage(FSRadixTreeStorage):
           the crash_id.
         """
         current_slot = self._current_slot()
-        current_date = self. _get_current_date()
+        current_date = self._get_current_date()
 
         dates = os.listdir(self.config.fs_root)
         for date in dates:
@@ -553,8 +856,13 @@ class FSLegacyDatedRadixTreeStorage(FSDatedRadixTreeStorage,
        ``FSDatedRadixTreeStorage``, and the order is dependent as it requires
        the MRO to resolve ``remove`` from the ``FSDatedRadixTreeStorage``
        first, over ``FSLegacyRadixTreeStorage``.
+
+    The collectors of this storage may also move the crashes into webhead
+    slots that the journal does not list, so it does not use the journal and
+    scans the whole dated tree on every pass.
     """
     DIR_DEPTH = 1
+    JOURNAL_LISTS_ALL_CRASHES = False
 
     def _get_date_root_name(self, crash_id):
         return crash_id
@@ -567,6 +875,32 @@ class FSLegacyDatedRadixTreeStorage(FSDatedRadixTreeStorage,
                                                                  slot),
                                 crash_id]))
 
+    def _visit_crash_link(self, namedir, crash_id):
+        # This is a link, so we can dereference it to find
+        # crashes.
+        if os.path.isfile(
+            os.sep.join([namedir,
+                         crash_id +
+                         self.config.json_file_suffix])):
+            date_root_path = os.sep.join([
+                namedir,
+                self._get_date_root_name(crash_id)
+            ])
+
+            yield crash_id
+
+            try:
+                os.unlink(date_root_path)
+            except OSError:
+                self.logger.error("could not find a date root in "
+                                  "%s; is crash corrupt?",
+                                  date_root_path,
+                                  exc_info=True)
+        # Bug 971496 - by outdenting this line one level we make sure
+        # that we can delete any orphan symlinks created by duplicate
+        # crash_ids in the file system
+        os.unlink(namedir)
+
     def _visit_minute_slot(self, minute_slot_base):
         for crash_id_or_webhead in os.listdir(minute_slot_base):
             namedir = os.sep.join([minute_slot_base, crash_id_or_webhead])
@@ -574,31 +908,8 @@ class FSLegacyDatedRadixTreeStorage(FSDatedRadixTreeStorage,
 
             if stat.S_ISLNK(st_result.st_mode):
                 crash_id = crash_id_or_webhead
-
-                # This is a link, so we can dereference it to find
-                # crashes.
-                if os.path.isfile(
-                    os.sep.join([namedir,
-                                 crash_id +
-                                 self.config.json_file_suffix])):
-                    date_root_path = os.sep.join([
-                        namedir,
-                        self._get_date_root_name(crash_id)
-                    ])
-
-                    yield crash_id
-
-                    try:
-                        os.unlink(date_root_path)
-                    except OSError:
-                        self.logger.error("could not find a date root in "
-                                          "%s; is crash corrupt?",
-                                          date_root_path,
-                                          exc_info=True)
-                # Bug 971496 - by outdenting this line one level we make sure
-                # that we can delete any orphan symlinks created by duplicate
-                # crash_ids in the file system
-                os.unlink(namedir)
+                for x in self._visit_crash_link(namedir, crash_id):
+                    yield x
 
             elif stat.S_ISDIR(st_result.st_mode):
                 webhead_slot = crash_id_or_webhead
@@ -644,6 +955,345 @@ class FSTemporaryStorage(FSLegacyDatedRadixTreeStorage):
         return [self.config.fs_root, date_formatted]
 
 
+#==============================================================================
+# the archive crash stores keep crashes in shards.  Each shard is a pair of
+# files: the data file holds the records one after the other and the index
+# file has a line per record, the crash_id, the kind of record, its offset
+# and length in the data file and whether it is compressed, separated by
+# tabs.  The kind of record is 'raw_crash', 'processed_crash' or 'dump:'
+# followed by the name of the dump.
+ARCHIVE_DATA_SUFFIX = '.data'
+ARCHIVE_INDEX_SUFFIX = '.index'
+
+
+#------------------------------------------------------------------------------
+def archive_shard_for(crash_id, number_of_shards):
+    """returns the number of the shard of an archive that holds a crash"""
+    return (zlib.crc32(crash_id) & 0xffffffff) % number_of_shards
+
+
+#------------------------------------------------------------------------------
+def archive_shard_paths(archive_name, shard_number):
+    """returns the pathnames of the data and index files of a shard"""
+    base = '%s.%03d' % (archive_name, shard_number)
+    return base + ARCHIVE_DATA_SUFFIX, base + ARCHIVE_INDEX_SUFFIX
+
+
+#==============================================================================
+class _ArchiveShardWriter(object):
+    """appends records to the data and index files of a shard"""
+
+    #--------------------------------------------------------------------------
+    def __init__(self, archive_name, shard_number):
+        data_path, index_path = archive_shard_paths(archive_name, shard_number)
+        self.data_file = open(data_path, 'ab')
+        self.index_file = open(index_path, 'ab')
+        # in append mode, the position is only known once at the end
+        self.data_file.seek(0, os.SEEK_END)
+        self.offset = self.data_file.tell()
+        self.lock = threading.Lock()
+
+    #--------------------------------------------------------------------------
+    def append(self, records):
+        """append a list of (crash_id, kind, data, is_compressed) tuples"""
+        with self.lock:
+            for crash_id, kind, data, is_compressed in records:
+                self.data_file.write(data)
+                self.index_file.write('%s\t%s\t%d\t%d\t%d\n' % (
+                    crash_id,
+                    kind,
+                    self.offset,
+                    len(data),
+                    is_compressed
+                ))
+                self.offset += len(data)
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        with self.lock:
+            self.data_file.close()
+            self.index_file.close()
+
+
+#==============================================================================
+class ArchiveWritingCrashStore(CrashStorageBase):
+    """writes crashes to an indexed archive, a random access replacement of
+    the TarFileWritingCrashStore.  Crashes are spread over the shards of the
+    archive by their crash_id and every record is compressed on its own, so
+    that any of them can be read back without reading the others."""
+    required_config = Namespace()
+    required_config.add_option(
+        name='archive_name',
+        doc='the pathname of the archive, without the shard number and '
+            'suffixes of its files',
+        default=datetime.datetime.now().strftime("%Y%m%d"),
+    )
+    required_config.add_option(
+        name='number_of_shards',
+        doc='the number of shards the crashes are spread over, each can be '
+            'read by a reader of its own',
+        default=1,
+    )
+    required_config.add_option(
+        name='archive_compression',
+        doc="the compression of the records: 'none', 'gzip' or 'zlib'",
+        default='zlib',
+    )
+    required_config.add_option(
+        name='archive_compression_level',
+        doc='the compression level of the records from 1 (fastest) to 9 '
+            '(smallest)',
+        default=6,
+    )
+
+    #--------------------------------------------------------------------------
+    def __init__(self, config, quit_check_callback=None):
+        super(ArchiveWritingCrashStore, self).__init__(
+            config,
+            quit_check_callback
+        )
+        self.shards = [
+            _ArchiveShardWriter(config.archive_name, x)
+            for x in range(config.number_of_shards)
+        ]
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        for a_shard in self.shards:
+            a_shard.close()
+
+    #--------------------------------------------------------------------------
+    def _record(self, crash_id, kind, data):
+        method = self.config.archive_compression
+        if method == 'none':
+            return crash_id, kind, data, 0
+        return (
+            crash_id,
+            kind,
+            compress(data, method, self.config.archive_compression_level),
+            1
+        )
+
+    #--------------------------------------------------------------------------
+    def _append(self, crash_id, records):
+        shard_number = archive_shard_for(crash_id, len(self.shards))
+        self.shards[shard_number].append(records)
+
+    #--------------------------------------------------------------------------
+    def save_raw_crash(self, raw_crash, dumps, crash_id):
+        records = [self._record(crash_id, 'raw_crash', json.dumps(raw_crash))]
+        if dumps is not None:
+            for a_dump_name, a_dump in (
+                dumps.as_memory_dumps_mapping().iteritems()
+            ):
+                if a_dump_name in (None, '', 'dump'):
+                    a_dump_name = 'upload_file_minidump'
+                records.append(
+                    self._record(crash_id, 'dump:%s' % a_dump_name, a_dump)
+                )
+        self._append(crash_id, records)
+
+    #--------------------------------------------------------------------------
+    def save_processed(self, processed_crash):
+        crash_id = processed_crash['uuid']
+        processed_crash_as_string = json.dumps(
+            processed_crash,
+            default=dates_to_strings_for_json
+        )
+        self._append(
+            crash_id,
+            [self._record(crash_id, 'processed_crash',
+                          processed_crash_as_string)]
+        )
+
+
+#==============================================================================
+class ArchiveReadingCrashStore(CrashStorageBase):
+    """reads crashes from an indexed archive.  The indices of the shards are
+    loaded when the store is created and their data files are memory mapped,
+    so fetching a crash by its crash_id takes a lookup and a slice whatever
+    the size of the archive.  The store can be shared by threads.
+
+    A store may be restricted to some of the shards of the archive with the
+    'shard_numbers' option, so that several processes can each go through a
+    part of the archive with 'new_crashes'."""
+    required_config = Namespace()
+    required_config.add_option(
+        name='archive_name',
+        doc='the pathname of the archive, without the shard number and '
+            'suffixes of its files',
+        default='fred',
+    )
+    required_config.add_option(
+        name='shard_numbers',
+        doc='a comma delimited list of the numbers of the shards to read '
+            '(empty for all of them)',
+        default='',
+    )
+    required_config.add_option(
+        name='temporary_file_system_storage_path',
+        doc='a local filesystem path where dumps are written when they are '
+            'fetched as files',
+        default='/home/socorro/temp',
+    )
+    required_config.add_option(
+        name='dump_file_suffix',
+        doc='the suffix used to identify a dump file (for use in temp files)',
+        default='.dump',
+    )
+
+    #--------------------------------------------------------------------------
+    def __init__(self, config, quit_check_callback=None):
+        super(ArchiveReadingCrashStore, self).__init__(
+            config,
+            quit_check_callback
+        )
+        # a mapping of crash_id to a mapping of kind of record to a tuple of
+        # the shard number, offset, length and compression of the record
+        self.index = {}
+        # the crash_ids in the order they were added to each shard
+        self.crash_ids_by_shard = {}
+        # the memory mapped data files by shard number
+        self.data = {}
+        self._data_files = []
+        for a_shard_number in self._find_shard_numbers():
+            self._load_shard(a_shard_number)
+
+    #--------------------------------------------------------------------------
+    def _find_shard_numbers(self):
+        wanted = self.config.get('shard_numbers', '')
+        if isinstance(wanted, basestring):
+            wanted = [int(x) for x in wanted.split(',') if x.strip()]
+        prefix = self.config.archive_name + '.'
+        shard_numbers = []
+        for an_index_path in glob.glob(
+            '%s.*%s' % (self.config.archive_name, ARCHIVE_INDEX_SUFFIX)
+        ):
+            try:
+                a_shard_number = int(
+                    an_index_path[len(prefix):-len(ARCHIVE_INDEX_SUFFIX)]
+                )
+            except ValueError:
+                # not one of our shards
+                continue
+            if not wanted or a_shard_number in wanted:
+                shard_numbers.append(a_shard_number)
+        return sorted(shard_numbers)
+
+    #--------------------------------------------------------------------------
+    def _load_shard(self, shard_number):
+        data_path, index_path = archive_shard_paths(
+            self.config.archive_name,
+            shard_number
+        )
+        data_file = open(data_path, 'rb')
+        self._data_files.append(data_file)
+        data_size = os.fstat(data_file.fileno()).st_size
+        if data_size:
+            self.data[shard_number] = mmap.mmap(
+                data_file.fileno(),
+                0,
+                access=mmap.ACCESS_READ
+            )
+        crash_ids = self.crash_ids_by_shard[shard_number] = []
+        with open(index_path) as index_file:
+            for a_line in index_file:
+                try:
+                    crash_id, kind, offset, length, is_compressed = (
+                        a_line.rstrip('\n').split('\t')
+                    )
+                    offset = int(offset)
+                    length = int(length)
+                except ValueError:
+                    self.logger.warning(
+                        'skipping a malformed line in %s: %r',
+                        index_path,
+                        a_line
+                    )
+                    continue
+                if offset + length > data_size:
+                    # the data of the record were never written out
+                    continue
+                if crash_id not in self.index:
+                    self.index[crash_id] = {}
+                    crash_ids.append(crash_id)
+                # a crash saved again replaces the earlier records
+                self.index[crash_id][kind] = (
+                    shard_number,
+                    offset,
+                    length,
+                    is_compressed == '1'
+                )
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        for a_mapping in self.data.values():
+            a_mapping.close()
+        self.data = {}
+        for a_data_file in self._data_files:
+            a_data_file.close()
+        self._data_files = []
+
+    #--------------------------------------------------------------------------
+    def _get_record(self, crash_id, kind):
+        try:
+            shard_number, offset, length, is_compressed = (
+                self.index[crash_id][kind]
+            )
+        except KeyError:
+            raise CrashIDNotFound(crash_id)
+        data = self.data[shard_number][offset:offset + length]
+        if is_compressed:
+            return decompress(data)
+        return data
+
+    #--------------------------------------------------------------------------
+    def get_raw_crash(self, crash_id):
+        return json.loads(
+            self._get_record(crash_id, 'raw_crash'),
+            object_hook=DotDict
+        )
+
+    #--------------------------------------------------------------------------
+    def get_raw_dump(self, crash_id, name=None):
+        if name in (None, '', 'dump'):
+            name = 'upload_file_minidump'
+        return self._get_record(crash_id, 'dump:%s' % name)
+
+    #--------------------------------------------------------------------------
+    def get_raw_dumps(self, crash_id):
+        if crash_id not in self.index:
+            raise CrashIDNotFound(crash_id)
+        return MemoryDumpsMapping(
+            (kind[len('dump:'):], self._get_record(crash_id, kind))
+            for kind in self.index[crash_id]
+            if kind.startswith('dump:')
+        )
+
+    #--------------------------------------------------------------------------
+    def get_raw_dumps_as_files(self, crash_id):
+        return self.get_raw_dumps(crash_id).as_file_dumps_mapping(
+            crash_id,
+            self.config.temporary_file_system_storage_path,
+            self.config.dump_file_suffix
+        )
+
+    #--------------------------------------------------------------------------
+    def get_unredacted_processed(self, crash_id):
+        return json.loads(
+            self._get_record(crash_id, 'processed_crash'),
+            object_hook=DotDict
+        )
+
+    #--------------------------------------------------------------------------
+    def new_crashes(self):
+        """yields the crash_ids of the shards read by this store, shard by
+        shard, in the order they were archived"""
+        for a_shard_number in sorted(self.crash_ids_by_shard):
+            for crash_id in self.crash_ids_by_shard[a_shard_number]:
+                yield crash_id
+
+
 # more user friendly aliases for commonly used classes
 FSPermanentStorage = FSLegacyRadixTreeStorage
 FSDatedPermanentStorage = FSLegacyDatedRadixTreeStorage
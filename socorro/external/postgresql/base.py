@@ -59,7 +59,7 @@ class PostgreSQLBase(object):
         try:
             yield connection
         finally:
-            connection.close()
+            self.database.close_connection(connection)
 
     def query(self, sql, params=None, error_message=None, connection=None):
         """Return the result of a query executed against PostgreSQL.
@@ -116,7 +116,7 @@ class PostgreSQLBase(object):
                 yield cursor
         finally:
             if connection and fresh_connection:
-                connection.close()
+                self.database.close_connection(connection)
 
     def _execute(
         self, actor_function, sql, error_message, params=None, connection=None
@@ -137,7 +137,7 @@ class PostgreSQLBase(object):
             raise DatabaseError(error_message)
         finally:
             if connection and fresh_connection:
-                connection.close()
+                self.database.close_connection(connection)
         return result
 
     @staticmethod
@@ -5,11 +5,14 @@
 import os
 import socket
 import contextlib
+import threading
 import psycopg2
 import psycopg2.extensions
 from urlparse import urlparse
 
-from configman import RequiredConfig, Namespace
+from configman import RequiredConfig, Namespace, class_converter
+
+from socorro.lib.connection_pool import ConnectionPool, ConnectionPoolTimeout
 
 
 #------------------------------------------------------------------------------
@@ -186,66 +189,258 @@ class ConnectionContext(RequiredConfig):
 
 
 #==============================================================================
-class ConnectionContextPooled(ConnectionContext):  # pragma: no cover
-    """a configman compliant class that pools Postgres database connections"""
+class PostgreSQLConnectionPool(ConnectionPool):
+    """a bounded pool of psycopg2 connections shared by the threads of a
+    process"""
+
+    metrics_prefix = 'postgresql.pool'
+
+
+#------------------------------------------------------------------------------
+# the pools shared by the ConnectionContextPooled instances of the process,
+# one per database, along with the number of their users.  They are keyed by
+# process id as well: a forked process inherits the pools of its parent, whose
+# connections it must neither use nor close.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+#------------------------------------------------------------------------------
+def get_connection_pool(dsn, pool_factory):
+    """returns the pool shared by every user of the database of the dsn in
+    this process, creating it with 'pool_factory' on first use.  Every call
+    must be matched by a call to 'release_connection_pool'."""
+    key = (os.getpid(), dsn)
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = [pool_factory(), 0]
+        _pools[key][1] += 1
+        return _pools[key][0]
+
+
+#------------------------------------------------------------------------------
+def release_connection_pool(dsn):
+    """forget a user of the pool of the database of the dsn, the pool is
+    closed when its last user is gone"""
+    key = (os.getpid(), dsn)
+    with _pools_lock:
+        if key not in _pools:
+            return
+        _pools[key][1] -= 1
+        if _pools[key][1] > 0:
+            return
+        pool = _pools.pop(key)[0]
+    pool.close()
+
+
+#------------------------------------------------------------------------------
+def clear_connection_pools():
+    """close and forget all the shared pools of this process, forget those
+    inherited from a parent process"""
+    pid = os.getpid()
+    with _pools_lock:
+        pools = [
+            pool for (a_pid, dsn), (pool, x) in _pools.items() if a_pid == pid
+        ]
+        _pools.clear()
+    for a_pool in pools:
+        a_pool.close()
+
+
+#==============================================================================
+class ConnectionContextPooled(ConnectionContext):
+    """a configman compliant class that pools Postgres database connections.
+
+    All the instances of this class that connect to the same database within
+    a process share one bounded pool of connections.  A transaction checks a
+    connection out of the pool and checks it back in when it ends.  The
+    connections that failed with an operational error or were left closed
+    are discarded rather than reused and the connections that sat idle for a
+    while are checked with a 'select 1' before they are reused.  The settings
+    of the pool are those of the first instance to connect to the database.
+    """
+    required_config = Namespace()
+    required_config.add_option(
+        name='maximum_connections',
+        default=10,
+        doc='the maximum number of connections to the database in the pool '
+            'shared by the threads of the process (0 for no limit).  A '
+            'thread waits for a connection when all of them are in use.',
+        reference_value_from='resource.postgresql',
+    )
+    required_config.add_option(
+        name='checkout_timeout',
+        default=30,
+        doc='the seconds a thread waits for a connection when all of them '
+            'are in use before giving up (0 to wait forever)',
+        reference_value_from='resource.postgresql',
+    )
+    required_config.add_option(
+        name='maximum_connection_idle_seconds',
+        default=300,
+        doc='pooled connections idle for longer than this are closed rather '
+            'than reused (0 to keep them forever)',
+        reference_value_from='resource.postgresql',
+    )
+    required_config.add_option(
+        name='connection_health_check_seconds',
+        default=10,
+        doc='pooled connections idle for longer than this are checked with '
+            'a "select 1" before they are reused (0 for no health checks)',
+        reference_value_from='resource.postgresql',
+    )
+    required_config.add_option(
+        name='metrics_class',
+        default='socorro.external.metrics_base.MetricsBase',
+        doc='the class that implements metrics for the connection pool',
+        from_string_converter=class_converter,
+        reference_value_from='resource.postgresql',
+    )
+
     #--------------------------------------------------------------------------
     def __init__(self, config, local_config=None):
         super(ConnectionContextPooled, self).__init__(config, local_config)
-        #self.config.logger.debug("PostgresPooled - "
-        #                         "setting up connection pool")
-        self.pool = {}
+        if local_config is None:
+            local_config = config
+        self.local_config = local_config
+        self.operational_exceptions = self.operational_exceptions + (
+            ConnectionPoolTimeout,
+        )
+        self.pool = get_connection_pool(self.dsn, self._new_pool)
+        self._pid = os.getpid()
+        self._closed = False
+
+    #--------------------------------------------------------------------------
+    def _new_pool(self):
+        local_config = self.local_config
+        metrics_class = local_config.get('metrics_class')
+        return PostgreSQLConnectionPool(
+            self._new_connection,
+            maximum_connections=local_config.get('maximum_connections', 0),
+            maximum_idle_seconds=local_config.get(
+                'maximum_connection_idle_seconds',
+                0
+            ),
+            health_check_seconds=local_config.get(
+                'connection_health_check_seconds',
+                0
+            ),
+            health_check=self._check_connection,
+            checkout_timeout=local_config.get('checkout_timeout', 0),
+            metrics=metrics_class(local_config) if metrics_class else None,
+            logger=self.config.get('logger'),
+        )
+
+    #--------------------------------------------------------------------------
+    def _new_connection(self):
+        return super(ConnectionContextPooled, self).connection()
 
     #--------------------------------------------------------------------------
-    def connection(self, name=None):
-        """return a named connection.
+    @staticmethod
+    def _check_connection(connection):
+        cursor = connection.cursor()
+        try:
+            cursor.execute('select 1')
+        finally:
+            cursor.close()
+        connection.rollback()
 
-        This function will return a named connection by either finding one
-        in its pool by the name or creating a new one.  If no name is given,
-        it will use the name of the current executing thread as the name of
-        the connection.
+    #--------------------------------------------------------------------------
+    def connection(self, name_unused=None):
+        """return a connection checked out of the pool.  It must be given
+        back with 'close_connection'.
 
         parameters:
-            name - a name as a string
+            name_unused - connections are no longer named, kept for the
+                          compatibility with the base class
         """
-        if not name:
-            name = self.config.executor_identity()
-        if name in self.pool:
-            #self.config.logger.debug('connection: %s', name)
-            return self.pool[name]
-        self.pool[name] = \
-            super(ConnectionContextPooled, self).connection(name)
-        return self.pool[name]
+        if self._pid != os.getpid():
+            # created before a fork, the pool and its connections belong to
+            # the parent process
+            self.pool = get_connection_pool(self.dsn, self._new_pool)
+            self._pid = os.getpid()
+        return self.pool.checkout()
+
+    #--------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def __call__(self, name=None):
+        """returns a connection checked out of the pool wrapped in a
+        contextmanager.  The connection goes back to the pool at the end of
+        the context unless it failed with an operational error.
+
+        parameters:
+            name - unused, kept for the compatibility with the base class"""
+        connection = self.connection(name)
+        reusable = True
+        try:
+            yield connection
+        except self.operational_exceptions:
+            reusable = False
+            raise
+        except self.conditional_exceptions, x:
+            reusable = not self._is_operational(x)
+            raise
+        finally:
+            self.close_connection(connection, force=not reusable)
+
+    #--------------------------------------------------------------------------
+    def _is_operational(self, exp):
+        try:
+            return self.is_operational_exception(exp)
+        except IndexError:
+            # an exception without a message, the state of the connection is
+            # unknown
+            return True
 
     #--------------------------------------------------------------------------
     def close_connection(self, connection, force=False):
-        """overriding the baseclass function, this routine will decline to
-        close a connection at the end of a transaction context.  This allows
-        for reuse of connections."""
-        if force:
+        """give a connection back to the pool.  Any transaction left open on
+        it is rolled back first.  Closed connections and, when 'force' is
+        True, every connection are discarded rather than reused.
+
+        parameters:
+            connection - the database connection object
+            force - True to close the connection rather than reuse it
+        """
+        if not force and not connection.closed:
             try:
-                (super(ConnectionContextPooled, self)
-                  .close_connection(connection, force))
-            except self.operational_exceptions:
-                self.config.logger.error('PostgresPooled - failed closing')
-            for name, conn in self.pool.iteritems():
-                if conn is connection:
-                    break
-            del self.pool[name]
-        else:
-            pass
+                if (
+                    connection.get_transaction_status() !=
+                    psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                ):
+                    connection.rollback()
+                self.pool.checkin(connection)
+                return
+            except self.operational_exceptions + self.conditional_exceptions:
+                self.config.logger.info(
+                    'PostgresPooled - discarding a connection that failed '
+                    'to roll back',
+                    exc_info=True
+                )
+        self.pool.discard(connection)
+
+    #--------------------------------------------------------------------------
+    def pool_stats(self):
+        """returns a mapping of the usage of the shared pool suitable for a
+        metrics 'capture_stats' call"""
+        return self.pool.stats(PostgreSQLConnectionPool.metrics_prefix)
 
     #--------------------------------------------------------------------------
     def close(self):
-        """close all pooled connections"""
-        self.config.logger.debug("PostgresPooled - "
-                                 "shutting down connection pool")
-        for name, conn in self.pool.iteritems():
-            conn.close()
-            self.config.logger.debug("PostgresPooled - connection %s closed"
-                                     % name)
+        """stop using the shared pool, its connections are closed when its
+        last user is closed"""
+        if self._closed:
+            return
+        self._closed = True
+        if self._pid != os.getpid():
+            # never used since a fork, the pool is the parent's
+            return
+        self.config.logger.debug("PostgresPooled - releasing connection pool")
+        release_connection_pool(self.dsn)
 
     #--------------------------------------------------------------------------
     def force_reconnect(self):
-        name = self.config.executor_identity()
-        if name in self.pool:
-            del self.pool[name]
+        # the connection of a transaction that failed with an operational
+        # error has already been discarded at the end of the transaction,
+        # idle connections that went stale are caught by the health check
+        pass
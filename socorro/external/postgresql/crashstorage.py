@@ -12,8 +12,15 @@
 # PostgreSQLCrashStorage is a more complete crashstore. It saves processed
 # crashes completely as json in the 'processed_crashes' table.
 
+# Both can buffer processed crashes and write them in batches, one statement
+# per weekly partition and table, rather than with several round trips per
+# crash.  A buffered crash is written after save_processed has returned: a
+# batch that cannot be written is logged, it is not reported to the caller.
+
 import datetime
 import json
+import threading
+from collections import OrderedDict
 from psycopg2 import ProgrammingError
 
 from socorro.external.crashstorage_base import (
@@ -24,15 +31,34 @@ from configman import (
     Namespace,
     class_converter
 )
-from socorro.external.postgresql.connection_context import ConnectionContext
+from socorro.external.postgresql.connection_context import (
+    ConnectionContextPooled,
+)
 from socorro.lib.datetimeutil import uuid_to_date, JsonDTEncoder
+from socorro.lib.lru_cache import LRUCache
 from socorro.external.postgresql.dbapi2_util import (
     SQLDidNotReturnSingleValue,
     single_value_sql,
+    execute_query_fetchall,
     execute_no_results
 )
 
 
+#==============================================================================
+class JsonTimestampTzEncoder(json.JSONEncoder):
+    """encodes datetimes for the JSON rows of the batches.  Unlike the
+    JsonDTEncoder, the UTC offset of aware datetimes is kept: PostgreSQL
+    would otherwise read them in the time zone of the session, where
+    psycopg2 passes them with their offset to the statements of a single
+    crash."""
+
+    #--------------------------------------------------------------------------
+    def default(self, obj):
+        if isinstance(obj, datetime.datetime):
+            return obj.isoformat()
+        return json.JSONEncoder.default(self, obj)
+
+
 #==============================================================================
 class PostgreSQLBasicCrashStorage(CrashStorageBase):
     """this implementation of crashstorage saves processed crashes to
@@ -53,10 +79,33 @@ class PostgreSQLBasicCrashStorage(CrashStorageBase):
     )
     required_config.add_option(
         'database_class',
-        default=ConnectionContext,
+        default=ConnectionContextPooled,
         doc='the class responsible for connecting to Postgres',
         reference_value_from='resource.postgresql',
     )
+    required_config.add_option(
+        'processed_crash_batch_size',
+        default=0,
+        doc='the number of processed crashes to buffer before writing them '
+            'with one statement per partition and table (0 to write each '
+            'crash as it is saved).  A buffered crash is written after '
+            'save_processed has returned, a failure to write it is only '
+            'logged, and the crashes still buffered are lost if the process '
+            'dies before closing the crash storage',
+    )
+    required_config.add_option(
+        'processed_crash_flush_interval',
+        default=10,
+        doc='the maximum number of seconds that processed crashes are '
+            'buffered before they are written (0 to write only when the '
+            'buffer is full or the crash storage is closed)',
+    )
+    required_config.add_option(
+        'plugin_id_cache_size',
+        default=1000,
+        doc='the number of plugin ids to remember (0 to look every plugin '
+            'up in the database)',
+    )
 
     _reports_table_mappings = (
         # processed name, reports table name
@@ -111,10 +160,54 @@ class PostgreSQLBasicCrashStorage(CrashStorageBase):
             self.database,
             quit_check_callback=quit_check_callback
         )
+        # the text of the statements formatted for each partition
+        self._sql_cache = {}
+        self._plugin_id_cache = LRUCache(config.get('plugin_id_cache_size', 0))
+
+        # a mapping of table suffix to an OrderedDict of crash_id to the
+        # rows of a buffered processed crash
+        self._batches = {}
+        self._number_buffered = 0
+        self._batch_size = config.get('processed_crash_batch_size', 0)
+        self._buffer_lock = threading.Lock()
+        # a flush is done by only one thread at a time to preserve the order
+        # of the writes
+        self._flush_lock = threading.Lock()
+        self._closing = threading.Event()
+        self._flusher_thread = None
+        flush_interval = config.get('processed_crash_flush_interval', 0)
+        if self._batch_size and flush_interval:
+            self._flusher_thread = threading.Thread(
+                name='PostgreSQLFlusher',
+                target=self._flusher_thread_func,
+                args=(flush_interval,)
+            )
+            self._flusher_thread.daemon = True
+            self._flusher_thread.start()
+
+    #--------------------------------------------------------------------------
+    def _get_sql(self, sql_builder, table_name):
+        """return the text of a statement for a table, building it only the
+        first time it is used for that table"""
+        key = (sql_builder.__name__, table_name)
+        try:
+            return self._sql_cache[key]
+        except KeyError:
+            sql = self._sql_cache[key] = sql_builder(table_name)
+            return sql
 
     #--------------------------------------------------------------------------
     def save_processed(self, processed_crash):
-        self.transaction(self._save_processed_transaction, processed_crash)
+        """with a 'processed_crash_batch_size', the crash is only buffered:
+        it is not in the database when this returns and a failure to write
+        it later is logged rather than raised"""
+        if self._batch_size:
+            self._buffer_processed(processed_crash)
+        else:
+            self.transaction(
+                self._save_processed_transaction,
+                processed_crash
+            )
 
     #--------------------------------------------------------------------------
     def _save_processed_transaction(self, connection, processed_crash):
@@ -148,20 +241,46 @@ class PostgreSQLBasicCrashStorage(CrashStorageBase):
         _save_processed_crash(), but is much simpler seeming because there are
         far fewer columns being passed into the parameterized query.
         """
-        column_list = []
-        placeholder_list = []
-        # create a list of values to go into the reports table
+        crash_id = processed_crash['uuid']
+        reports_table_name = (
+            'reports_%s' % self._table_suffix_for_crash_id(crash_id)
+        )
+        upsert_sql = self._get_sql(
+            self._build_report_upsert_sql,
+            reports_table_name
+        )
+
+        value_list = self._report_values(processed_crash)
+        value_list.append(crash_id)
+        value_list.extend(value_list)
+
+        report_id = single_value_sql(connection, upsert_sql, value_list)
+        return report_id
+
+    #--------------------------------------------------------------------------
+    def _report_values(self, processed_crash):
+        """return the list of values to go into the columns of the reports
+        table, truncated to the size of their column"""
         value_list = []
         for pro_crash_name, report_name, length in (
             self._reports_table_mappings
         ):
-            column_list.append(report_name)
-            placeholder_list.append('%s')
             value = processed_crash[pro_crash_name]
             if isinstance(value, basestring) and length:
-                    value_list.append(value[:length])
+                value_list.append(value[:length])
             else:
                 value_list.append(value)
+        return value_list
+
+    #--------------------------------------------------------------------------
+    def _build_report_upsert_sql(self, reports_table_name):
+        column_list = []
+        placeholder_list = []
+        for pro_crash_name, report_name, length in (
+            self._reports_table_mappings
+        ):
+            column_list.append(report_name)
+            placeholder_list.append('%s')
 
         def print_eq(a, b):
             # Helper for UPDATE SQL clause
@@ -171,11 +290,7 @@ class PostgreSQLBasicCrashStorage(CrashStorageBase):
             # Helper for INSERT SQL clause
             return b + ' as ' + a
 
-        crash_id = processed_crash['uuid']
-        reports_table_name = (
-            'reports_%s' % self._table_suffix_for_crash_id(crash_id)
-        )
-        upsert_sql = """
+        return """
         WITH
         update_report AS (
             UPDATE %(table)s SET
@@ -208,12 +323,6 @@ class PostgreSQLBasicCrashStorage(CrashStorageBase):
             ", ".join(map(print_as, column_list, placeholder_list)),
         }
 
-        value_list.append(crash_id)
-        value_list.extend(value_list)
-
-        report_id = single_value_sql(connection, upsert_sql, value_list)
-        return report_id
-
     #--------------------------------------------------------------------------
     def _save_plugins(self, connection, processed_crash, report_id):
         """ Electrolysis Support - Optional - processed_crash may contain a
@@ -223,38 +332,14 @@ class PostgreSQLBasicCrashStorage(CrashStorageBase):
             plugin - When set to plugin, the jsonDocument MUST calso contain
                      PluginFilename, PluginName, and PluginVersion
         """
-        process_type = processed_crash['process_type']
-        if not process_type:
-            return
-
-        if process_type == "plugin":
-
-            # Bug#543776 We actually will are relaxing the non-null policy...
-            # a null filename, name, and version is OK. We'll use empty strings
-            try:
-                plugin_filename = processed_crash['PluginFilename']
-                plugin_name = processed_crash['PluginName']
-                plugin_version = processed_crash['PluginVersion']
-            except KeyError, x:
-                self.config.logger.error(
-                    'the crash is missing a required field: %s', str(x)
-                )
-                return
-            find_plugin_sql = ('select id from plugins '
-                               'where filename = %s '
-                               'and name = %s')
-            try:
-                plugin_id = single_value_sql(connection,
-                                             find_plugin_sql,
-                                             (plugin_filename,
-                                              plugin_name))
-            except SQLDidNotReturnSingleValue:
-                insert_plugsins_sql = ("insert into plugins (filename, name) "
-                                       "values (%s, %s) returning id")
-                plugin_id = single_value_sql(connection,
-                                             insert_plugsins_sql,
-                                             (plugin_filename,
-                                              plugin_name))
+        plugin = self._plugin_of(processed_crash)
+        if plugin:
+            plugin_filename, plugin_name, plugin_version = plugin
+            plugin_id = self._get_plugin_id(
+                connection,
+                plugin_filename,
+                plugin_name
+            )
             crash_id = processed_crash['uuid']
             table_suffix = self._table_suffix_for_crash_id(crash_id)
             plugin_reports_table_name = 'plugins_reports_%s' % table_suffix
@@ -293,6 +378,274 @@ class PostgreSQLBasicCrashStorage(CrashStorageBase):
                                plugins_reports_insert_sql,
                                values_tuple)
 
+    #--------------------------------------------------------------------------
+    def _plugin_of(self, processed_crash):
+        """return the filename, name and version of the plugin of a crash of
+        a plugin process, or None"""
+        process_type = processed_crash['process_type']
+        if process_type != "plugin":
+            return None
+
+        # Bug#543776 We actually will are relaxing the non-null policy...
+        # a null filename, name, and version is OK. We'll use empty strings
+        try:
+            return (
+                processed_crash['PluginFilename'],
+                processed_crash['PluginName'],
+                processed_crash['PluginVersion'],
+            )
+        except KeyError, x:
+            self.config.logger.error(
+                'the crash is missing a required field: %s', str(x)
+            )
+            return None
+
+    #--------------------------------------------------------------------------
+    def _get_plugin_id(self, connection, plugin_filename, plugin_name):
+        """return the id of a plugin, adding the plugin to the plugins table
+        if it is not there yet"""
+        find_plugin_sql = ('select id from plugins '
+                           'where filename = %s '
+                           'and name = %s')
+
+        def find_plugin_id(key):
+            return single_value_sql(connection, find_plugin_sql, key)
+
+        try:
+            # only the ids found in the table are cached, a new id would be
+            # wrong if the transaction that inserted it was rolled back
+            return self._plugin_id_cache.get(
+                (plugin_filename, plugin_name),
+                find_plugin_id
+            )
+        except SQLDidNotReturnSingleValue:
+            insert_plugsins_sql = ("insert into plugins (filename, name) "
+                                   "values (%s, %s) returning id")
+            return single_value_sql(connection,
+                                    insert_plugsins_sql,
+                                    (plugin_filename,
+                                     plugin_name))
+
+    #--------------------------------------------------------------------------
+    def _batch_entry(self, processed_crash):
+        """return what a batch needs to save a processed crash.  The rows are
+        made as the crash is buffered, so that a crash that cannot be saved
+        is refused by save_processed rather than failing a batch later and
+        so that changes made to the crash afterwards by other crash stores
+        are not saved."""
+        column_list = [
+            report_name for x, report_name, y in self._reports_table_mappings
+        ]
+        report = dict(zip(column_list, self._report_values(processed_crash)))
+        return {
+            'crash_id': processed_crash['uuid'],
+            'date_processed': processed_crash['date_processed'],
+            'report_json': json.dumps(report, cls=JsonTimestampTzEncoder),
+            'plugin': self._plugin_of(processed_crash),
+        }
+
+    #--------------------------------------------------------------------------
+    def _buffer_processed(self, processed_crash):
+        entry = self._batch_entry(processed_crash)
+        crash_id = entry['crash_id']
+        table_suffix = self._table_suffix_for_crash_id(crash_id)
+        with self._buffer_lock:
+            batch = self._batches.setdefault(table_suffix, OrderedDict())
+            # a crash saved again replaces the rows buffered for it
+            if batch.pop(crash_id, None) is None:
+                self._number_buffered += 1
+            batch[crash_id] = entry
+            batch_is_full = self._number_buffered >= self._batch_size
+        if batch_is_full:
+            self.flush()
+
+    #--------------------------------------------------------------------------
+    def flush(self):
+        """write all the buffered processed crashes to the database"""
+        with self._flush_lock:
+            with self._buffer_lock:
+                batches = self._batches
+                self._batches = {}
+                self._number_buffered = 0
+            for table_suffix, batch in sorted(batches.iteritems()):
+                entries = batch.values()
+                try:
+                    self.transaction(
+                        self._save_batch_transaction,
+                        table_suffix,
+                        entries
+                    )
+                    continue
+                except Exception:
+                    self.config.logger.warning(
+                        'writing %d processed crashes to the %s partitions '
+                        'failed, writing them one at a time',
+                        len(entries),
+                        table_suffix,
+                        exc_info=True
+                    )
+                # one bad crash must not cost the others of the batch
+                for an_entry in entries:
+                    try:
+                        self.transaction(
+                            self._save_batch_transaction,
+                            table_suffix,
+                            [an_entry]
+                        )
+                    except Exception:
+                        self.config.logger.error(
+                            'failed to save processed crash %s',
+                            an_entry['crash_id'],
+                            exc_info=True
+                        )
+
+    #--------------------------------------------------------------------------
+    def _flusher_thread_func(self, flush_interval):
+        while not self._closing.wait(flush_interval):
+            self.flush()
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        self._closing.set()
+        if self._flusher_thread is not None:
+            self._flusher_thread.join()
+            self._flusher_thread = None
+        self.flush()
+        super(PostgreSQLBasicCrashStorage, self).close()
+
+    #--------------------------------------------------------------------------
+    def _save_batch_transaction(self, connection, table_suffix, entries):
+        report_ids = self._save_reports_batch(
+            connection,
+            table_suffix,
+            entries
+        )
+        self._save_plugins_batch(
+            connection,
+            table_suffix,
+            entries,
+            report_ids
+        )
+
+    #--------------------------------------------------------------------------
+    def _save_reports_batch(self, connection, table_suffix, entries):
+        """upsert the reports rows of a batch with one statement, return a
+        mapping of crash_id to report id"""
+        upsert_sql = self._get_sql(
+            self._build_reports_batch_upsert_sql,
+            'reports_%s' % table_suffix
+        )
+        rows_json = '[%s]' % ', '.join(x['report_json'] for x in entries)
+        return dict(
+            (crash_id, report_id)
+            for report_id, crash_id in execute_query_fetchall(
+                connection,
+                upsert_sql,
+                (rows_json,)
+            )
+        )
+
+    #--------------------------------------------------------------------------
+    def _build_reports_batch_upsert_sql(self, reports_table_name):
+        # the rows of the batch are passed as a JSON array that
+        # json_populate_recordset turns into rows of the type of the table
+        column_list = [
+            report_name for x, report_name, y in self._reports_table_mappings
+        ]
+        return """
+        WITH
+        new_reports AS (
+            SELECT * FROM json_populate_recordset(
+                NULL::%(table)s,
+                %%s::json
+            )
+        ),
+        update_reports AS (
+            UPDATE %(table)s SET
+                %(joined_update_clause)s
+            FROM new_reports
+            WHERE %(table)s.uuid = new_reports.uuid
+            RETURNING %(table)s.id, %(table)s.uuid
+        ),
+        insert_reports AS (
+            INSERT INTO %(table)s (%(column_list)s)
+            ( SELECT
+                %(column_list)s
+                FROM new_reports
+                WHERE NOT EXISTS (
+                    SELECT uuid from %(table)s
+                    WHERE
+                        %(table)s.uuid = new_reports.uuid
+                    LIMIT 1
+                )
+            )
+            RETURNING id, uuid
+        )
+        SELECT * from update_reports
+        UNION ALL
+        SELECT * from insert_reports
+        """ % {
+            'joined_update_clause': ", ".join(
+                '%s = new_reports.%s' % (x, x) for x in column_list
+            ),
+            'table': reports_table_name,
+            'column_list': ', '.join(column_list),
+        }
+
+    #--------------------------------------------------------------------------
+    def _save_plugins_batch(self, connection, table_suffix, entries,
+                            report_ids):
+        rows = []
+        for an_entry in entries:
+            if not an_entry['plugin']:
+                continue
+            plugin_filename, plugin_name, plugin_version = an_entry['plugin']
+            rows.append({
+                'report_id': report_ids[an_entry['crash_id']],
+                'plugin_id': self._get_plugin_id(
+                    connection,
+                    plugin_filename,
+                    plugin_name
+                ),
+                'date_processed': an_entry['date_processed'],
+                'version': plugin_version,
+            })
+        if not rows:
+            return
+        plugin_reports_table_name = 'plugins_reports_%s' % table_suffix
+        # as for a single crash, the rows of reprocessed crashes are
+        # replaced
+        execute_no_results(
+            connection,
+            self._get_sql(
+                self._build_plugins_reports_batch_delete_sql,
+                plugin_reports_table_name
+            ),
+            ([x['report_id'] for x in rows],)
+        )
+        execute_no_results(
+            connection,
+            self._get_sql(
+                self._build_plugins_reports_batch_insert_sql,
+                plugin_reports_table_name
+            ),
+            (json.dumps(rows, cls=JsonTimestampTzEncoder),)
+        )
+
+    #--------------------------------------------------------------------------
+    def _build_plugins_reports_batch_delete_sql(self, table_name):
+        return 'delete from %s where report_id = ANY(%%s)' % table_name
+
+    #--------------------------------------------------------------------------
+    def _build_plugins_reports_batch_insert_sql(self, table_name):
+        return (
+            'insert into %(table)s '
+            '    (report_id, plugin_id, date_processed, version) '
+            'select report_id, plugin_id, date_processed, version '
+            'from json_populate_recordset(NULL::%(table)s, %%s::json)'
+            % {'table': table_name}
+        )
+
     #--------------------------------------------------------------------------
     @staticmethod
     def _table_suffix_for_crash_id(crash_id):
@@ -376,8 +729,21 @@ class PostgreSQLCrashStorage(PostgreSQLBasicCrashStorage):
         raw_crash_table_name = (
             'raw_crashes_%s' % self._table_suffix_for_crash_id(crash_id)
         )
+        upsert_sql = self._get_sql(
+            self._build_raw_crash_upsert_sql,
+            raw_crash_table_name
+        )
 
-        upsert_sql = """
+        values = {
+            'crash_id': crash_id,
+            'raw_crash': json.dumps(raw_crash),
+            'date_processed': raw_crash["submitted_timestamp"]
+        }
+        execute_no_results(connection, upsert_sql, values)
+
+    #--------------------------------------------------------------------------
+    def _build_raw_crash_upsert_sql(self, raw_crash_table_name):
+        return """
         WITH
         update_raw_crash AS (
             UPDATE %(table)s SET
@@ -406,14 +772,6 @@ class PostgreSQLCrashStorage(PostgreSQLBasicCrashStorage):
         SELECT * from insert_raw_crash
         """ % {'table': raw_crash_table_name}
 
-        values = {
-            'crash_id': crash_id,
-            'raw_crash': json.dumps(raw_crash),
-            'date_processed': raw_crash["submitted_timestamp"]
-        }
-        execute_no_results(connection, upsert_sql, values)
-
-
     #--------------------------------------------------------------------------
     def _save_processed_transaction(self, connection, processed_crash):
         report_id = self._save_processed_report(connection, processed_crash)
@@ -426,7 +784,21 @@ class PostgreSQLCrashStorage(PostgreSQLBasicCrashStorage):
         processed_crashes_table_name = (
             'processed_crashes_%s' % self._table_suffix_for_crash_id(crash_id)
         )
-        upsert_sql = """
+        upsert_sql = self._get_sql(
+            self._build_processed_crash_upsert_sql,
+            processed_crashes_table_name
+        )
+
+        values = {
+            'processed_json': json.dumps(processed_crash, cls=JsonDTEncoder),
+            'date_processed': processed_crash["date_processed"],
+            'uuid': crash_id
+        }
+        execute_no_results(connection, upsert_sql, values)
+
+    #--------------------------------------------------------------------------
+    def _build_processed_crash_upsert_sql(self, processed_crashes_table_name):
+        return """
         WITH
         update_processed_crash AS (
             UPDATE %(table)s SET
@@ -453,11 +825,80 @@ class PostgreSQLCrashStorage(PostgreSQLBasicCrashStorage):
         SELECT * from update_processed_crash
         UNION ALL
         SELECT * from insert_processed_crash
-        """ % {'table': processed_crashes_table_name, 'uuid': crash_id}
+        """ % {'table': processed_crashes_table_name}
 
-        values = {
-            'processed_json': json.dumps(processed_crash, cls=JsonDTEncoder),
-            'date_processed': processed_crash["date_processed"],
-            'uuid': crash_id
-        }
-        execute_no_results(connection, upsert_sql, values)
+    #--------------------------------------------------------------------------
+    def _batch_entry(self, processed_crash):
+        entry = super(PostgreSQLCrashStorage, self)._batch_entry(
+            processed_crash
+        )
+        entry['processed_crash_json'] = (
+            '{"uuid": %s, "date_processed": %s, "processed_crash": %s}' % (
+                json.dumps(entry['crash_id']),
+                json.dumps(
+                    entry['date_processed'],
+                    cls=JsonTimestampTzEncoder
+                ),
+                json.dumps(processed_crash, cls=JsonDTEncoder),
+            )
+        )
+        return entry
+
+    #--------------------------------------------------------------------------
+    def _save_batch_transaction(self, connection, table_suffix, entries):
+        super(PostgreSQLCrashStorage, self)._save_batch_transaction(
+            connection,
+            table_suffix,
+            entries
+        )
+        upsert_sql = self._get_sql(
+            self._build_processed_crashes_batch_upsert_sql,
+            'processed_crashes_%s' % table_suffix
+        )
+        rows_json = '[%s]' % ', '.join(
+            x['processed_crash_json'] for x in entries
+        )
+        execute_no_results(connection, upsert_sql, (rows_json,))
+
+    #--------------------------------------------------------------------------
+    def _build_processed_crashes_batch_upsert_sql(
+        self,
+        processed_crashes_table_name
+    ):
+        return """
+        WITH
+        new_processed_crashes AS (
+            SELECT
+                (a_crash->>'uuid')::uuid AS uuid,
+                a_crash->'processed_crash' AS processed_crash,
+                (a_crash->>'date_processed')::timestamptz AS date_processed
+            FROM json_array_elements(%%s::json) AS a_crash
+        ),
+        update_processed_crashes AS (
+            UPDATE %(table)s SET
+                processed_crash = new_processed_crashes.processed_crash,
+                date_processed = new_processed_crashes.date_processed
+            FROM new_processed_crashes
+            WHERE %(table)s.uuid = new_processed_crashes.uuid
+            RETURNING 1
+        ),
+        insert_processed_crashes AS (
+            INSERT INTO %(table)s (uuid, processed_crash, date_processed)
+            ( SELECT
+                uuid,
+                processed_crash,
+                date_processed
+                FROM new_processed_crashes
+                WHERE NOT EXISTS (
+                    SELECT uuid from %(table)s
+                    WHERE
+                        %(table)s.uuid = new_processed_crashes.uuid
+                    LIMIT 1
+                )
+            )
+            RETURNING 2
+        )
+        SELECT * from update_processed_crashes
+        UNION ALL
+        SELECT * from insert_processed_crashes
+        """ % {'table': processed_crashes_table_name}
@@ -3,6 +3,9 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import pika
+import time
+from collections import deque
+from functools import partial
 from random import randint
 
 from Queue import (
@@ -75,6 +78,54 @@ class RabbitMQCrashStorage(CrashStorageBase):
         doc='percentage of the time that rabbit will try to queue',
         reference_value_from='resource.rabbitmq',
     )
+    required_config.add_option(
+        'push_consumer',
+        default=False,
+        doc='fetch new crashes with basic_consume and a prefetch window '
+            'rather than a basic_get round trip per crash',
+        reference_value_from='resource.rabbitmq',
+    )
+    required_config.add_option(
+        'prefetch_count',
+        default=12,
+        doc='with push_consumer, the number of crashes RabbitMQ sends ahead '
+            'of their acknowledgement.  Size it to the maximum_queue_size '
+            'plus the number_of_threads of the task manager so that every '
+            'thread and queue slot can hold a crash',
+        reference_value_from='resource.rabbitmq',
+    )
+    required_config.add_option(
+        'queue_weights',
+        default='3,2,1',
+        doc='with push_consumer, the relative shares of the crashes taken '
+            'from the priority, standard and reprocessing queues when more '
+            'than one has crashes waiting',
+        reference_value_from='resource.rabbitmq',
+    )
+    required_config.add_option(
+        'consumer_wait_seconds',
+        default=1.0,
+        doc='with push_consumer, the seconds to wait for a crash to arrive '
+            'before ending the iteration of new crashes',
+        reference_value_from='resource.rabbitmq',
+    )
+    required_config.add_option(
+        'consumer_metrics_interval',
+        default=60,
+        doc='with push_consumer, the seconds between reports of the consume '
+            'rate, prefetch occupancy and queue lag to the metrics',
+        reference_value_from='resource.rabbitmq',
+    )
+    required_config.add_option(
+        'metrics_class',
+        default='socorro.external.metrics_base.MetricsBase',
+        doc='the class that implements metrics for the push consumer',
+        from_string_converter=class_converter,
+        reference_value_from='resource.rabbitmq',
+    )
+
+    # the queues consumed from, in the order of the queue_weights option
+    consumer_queues = ('priority', 'standard', 'reprocessing')
 
     #--------------------------------------------------------------------------
     def __init__(self, config, quit_check_callback=None):
@@ -89,6 +140,9 @@ class RabbitMQCrashStorage(CrashStorageBase):
         # We should find a way to time out UUIDs after a certain time.
         self.acknowledgement_token_cache = {}
         self.acknowledgment_queue = Queue()
+        # the connection 'new_crashes' last read crashes from, the
+        # acknowledgements still queued at shutdown are sent on it
+        self._consumer_connection = None
 
         self.rabbitmq = config.rabbitmq_class(config)
         self.transaction = config.transaction_executor_class(
@@ -109,6 +163,22 @@ class RabbitMQCrashStorage(CrashStorageBase):
                 lambda: randint(1, 100) > config.throttle
             )
 
+        if config.get('push_consumer', False):
+            metrics_class = config.get('metrics_class')
+            self.metrics = metrics_class(config) if metrics_class else None
+            self.queue_weights = dict(zip(
+                self.consumer_queues,
+                [int(x) for x in config.queue_weights.split(',')]
+            ))
+            # deliveries by queue, waiting to be yielded by 'new_crashes'
+            self.deliveries = dict((x, deque()) for x in self.consumer_queues)
+            # the standings of the weighted round robin between the queues
+            self._queue_credits = dict((x, 0) for x in self.consumer_queues)
+            # the channel the consumers were registered on
+            self._consumer_channel = None
+            self._consumed = dict((x, 0) for x in self.consumer_queues)
+            self._last_metrics_report = time.time()
+
     #--------------------------------------------------------------------------
     def save_raw_crash(self, raw_crash, dumps, crash_id):
         if self.dont_queue_this_crash():
@@ -155,12 +225,20 @@ class RabbitMQCrashStorage(CrashStorageBase):
     def _basic_get_transaction(self, conn, queue):
         """reorganize the the call to rabbitmq basic_get so that it can be
         used by the transaction retry wrapper."""
+        self._consumer_connection = conn
         things = conn.channel.basic_get(queue=queue)
         return things
 
     #--------------------------------------------------------------------------
     def new_crashes(self):
         """This generator fetches crash_ids from RabbitMQ."""
+        if self.config.get('push_consumer', False):
+            return self._consumed_new_crashes()
+        return self._polled_new_crashes()
+
+    #--------------------------------------------------------------------------
+    def _polled_new_crashes(self):
+        """fetches crash_ids with a basic_get for each"""
 
         # We've set up RabbitMQ to require acknowledgement of processing of a
         # crash_id from this generator.  It is the responsibility of the
@@ -200,10 +278,159 @@ class RabbitMQCrashStorage(CrashStorageBase):
             yield body
             queues.reverse()
 
+    #--------------------------------------------------------------------------
+    def _consumed_new_crashes(self):
+        """fetches crash_ids that RabbitMQ pushes to consumers of the three
+        queues.  RabbitMQ sends up to 'prefetch_count' crashes ahead of their
+        acknowledgement, they wait in per queue buffers until yielded.  The
+        iteration ends when no crash arrived for 'consumer_wait_seconds'."""
+        # as with the polled version, the acknowledgements are sent by this
+        # thread, on the connection the crashes came from
+        self._consume_acknowledgement_queue()
+        while True:
+            # pick up what has arrived since, without waiting
+            self.transaction(self._process_data_events_transaction, 0)
+            queue_key = self._next_queue()
+            if queue_key is None:
+                self.transaction(
+                    self._process_data_events_transaction,
+                    self.config.consumer_wait_seconds
+                )
+                queue_key = self._next_queue()
+            self._consume_acknowledgement_queue()
+            self._report_consumer_metrics()
+            if queue_key is None:
+                # there was nothing in the queues - leave the iterator
+                return
+            method_frame, body = self.deliveries[queue_key].popleft()
+            if self._suppress_duplicate_jobs(body, method_frame):
+                continue
+            self._consumed[queue_key] += 1
+            self.acknowledgement_token_cache[body] = method_frame
+            yield body
+
+    #--------------------------------------------------------------------------
+    def _next_queue(self):
+        """a smooth weighted round robin between the queues with deliveries
+        waiting: each gains its weight in credit, the one with the most is
+        picked and pays for it with the weights of all the contenders.  A
+        queue of weight w among contenders of total weight t is picked w
+        times out of t, and never twice in a row when the others have
+        more credit, so no queue is starved."""
+        contenders = [x for x in self.consumer_queues if self.deliveries[x]]
+        if not contenders:
+            return None
+        for a_queue in contenders:
+            self._queue_credits[a_queue] += self.queue_weights[a_queue]
+        picked = max(contenders, key=lambda x: self._queue_credits[x])
+        self._queue_credits[picked] -= sum(
+            self.queue_weights[x] for x in contenders
+        )
+        return picked
+
+    #--------------------------------------------------------------------------
+    def _queue_name(self, queue_key):
+        return getattr(self.rabbitmq.config, '%s_queue_name' % queue_key)
+
+    #--------------------------------------------------------------------------
+    def _on_delivery(self, queue_key, channel, method_frame, header_frame,
+                     body):
+        self.deliveries[queue_key].append((method_frame, body))
+
+    #--------------------------------------------------------------------------
+    def _register_consumers(self, conn):
+        """set the prefetch window of the channel, shared by its consumers,
+        and start consuming from the three queues"""
+        for a_queue in self.consumer_queues:
+            # the crashes delivered on a former channel are sent again by
+            # RabbitMQ now that that channel is gone
+            self.deliveries[a_queue].clear()
+        conn.channel.basic_qos(
+            prefetch_count=self.config.prefetch_count,
+            all_channels=True
+        )
+        for a_queue in self.consumer_queues:
+            conn.channel.basic_consume(
+                partial(self._on_delivery, a_queue),
+                queue=self._queue_name(a_queue)
+            )
+        self._consumer_channel = conn.channel
+
+    #--------------------------------------------------------------------------
+    def _process_data_events_transaction(self, conn, time_limit):
+        """wait up to 'time_limit' seconds for deliveries to the consumers,
+        registering them first if the connection is a new one"""
+        self._consumer_connection = conn
+        if self._consumer_channel is not conn.channel:
+            self._register_consumers(conn)
+        conn.connection.process_data_events(time_limit=time_limit)
+
+    #--------------------------------------------------------------------------
+    def _queue_lag_transaction(self, conn):
+        """returns the number of crashes waiting in each queue that were not
+        yet delivered"""
+        return dict(
+            (
+                a_queue,
+                conn.channel.queue_declare(
+                    queue=self._queue_name(a_queue),
+                    durable=True,
+                    passive=True
+                ).method.message_count
+            )
+            for a_queue in self.consumer_queues
+        )
+
+    #--------------------------------------------------------------------------
+    def _report_consumer_metrics(self):
+        if self.metrics is None:
+            return
+        now = time.time()
+        elapsed = now - self._last_metrics_report
+        if elapsed < self.config.consumer_metrics_interval:
+            return
+        self._last_metrics_report = now
+        try:
+            lag = self.transaction(self._queue_lag_transaction)
+        except Exception:
+            self.config.logger.warning(
+                'RabbitMQCrashStorage could not measure the queue lag',
+                exc_info=True
+            )
+            lag = {}
+        # the crashes delivered and not yet acknowledged
+        unacknowledged = len(self.acknowledgement_token_cache) + sum(
+            len(x) for x in self.deliveries.values()
+        )
+        stats = {
+            'rabbitmq.consumer.consume_rate':
+                sum(self._consumed.values()) / elapsed,
+            'rabbitmq.consumer.prefetch_occupancy':
+                unacknowledged * 100 / max(self.config.prefetch_count, 1),
+        }
+        for a_queue in self.consumer_queues:
+            stats['rabbitmq.consumer.%s.consumed' % a_queue] = (
+                self._consumed[a_queue]
+            )
+            if a_queue in lag:
+                stats['rabbitmq.consumer.%s.lag' % a_queue] = lag[a_queue]
+            self._consumed[a_queue] = 0
+        self.metrics.capture_stats(stats)
+
     #--------------------------------------------------------------------------
     def ack_crash(self, crash_id):
         self.acknowledgment_queue.put(crash_id)
 
+    #--------------------------------------------------------------------------
+    def close(self):
+        """crashes that finish processing after 'new_crashes' has stopped
+        still have their acknowledgements waiting in the queue.  Send them
+        on the connection the crashes came from before closing it, or
+        RabbitMQ would deliver those crashes again."""
+        if self._consumer_connection is not None:
+            self._consume_acknowledgement_queue(self._consumer_connection)
+        self.rabbitmq.close()
+
     #--------------------------------------------------------------------------
     def _suppress_duplicate_jobs(self, crash_id, acknowledgement_token):
         """if this crash is in the cache, then it is already in progress
@@ -225,11 +452,12 @@ class RabbitMQCrashStorage(CrashStorageBase):
         return False
 
     #--------------------------------------------------------------------------
-    def _consume_acknowledgement_queue(self):
+    def _consume_acknowledgement_queue(self, connection=None):
         """The acknowledgement of the processing of each crash_id yielded
         from the 'new_crashes' method must take place on the same connection
         that the crash_id came from.  The crash_ids are queued in the
-        'acknowledgment_queue'.  That queue is consumed by the QueuingThread"""
+        'acknowledgment_queue'.  That queue is consumed by the QueuingThread,
+        or, at shutdown, by 'close' on the given connection."""
         try:
             while True:
                 crash_id_to_be_acknowledged = \
@@ -243,11 +471,18 @@ class RabbitMQCrashStorage(CrashStorageBase):
                         self.acknowledgement_token_cache[
                             crash_id_to_be_acknowledged
                         ]
-                    self.transaction(
-                        self._transaction_ack_crash,
-                        crash_id_to_be_acknowledged,
-                        acknowledgement_token
-                    )
+                    if connection is None:
+                        self.transaction(
+                            self._transaction_ack_crash,
+                            crash_id_to_be_acknowledged,
+                            acknowledgement_token
+                        )
+                    else:
+                        self._transaction_ack_crash(
+                            connection,
+                            crash_id_to_be_acknowledged,
+                            acknowledgement_token
+                        )
                     del self.acknowledgement_token_cache[
                         crash_id_to_be_acknowledged
                     ]
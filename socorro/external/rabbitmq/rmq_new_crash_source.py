@@ -29,7 +29,7 @@ class RMQNewCrashSource(RequiredConfig):
 
     #--------------------------------------------------------------------------
     def close(self):
-        pass
+        self.crash_store.close()
 
     #--------------------------------------------------------------------------
     def __iter__(self):
@@ -0,0 +1,81 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""compression of the strings that crash storage classes save, such as
+processed crashes.  Compressed strings begin with the magic bytes of their
+format, 'decompress' recognizes them and passes anything else, like the JSON
+saved before compression was turned on, through unchanged."""
+
+import gzip
+import zlib
+from contextlib import closing
+from cStringIO import StringIO
+
+
+# the compression methods that 'compress' accepts
+COMPRESSION_METHODS = ('none', 'gzip', 'zlib')
+
+GZIP_MAGIC = '\x1f\x8b'
+
+
+#------------------------------------------------------------------------------
+def compress(data, method='gzip', level=6):
+    """returns the data compressed with the method at the level, from 1
+    (fastest) to 9 (smallest)"""
+    if method == 'none':
+        return data
+    if method == 'zlib':
+        return zlib.compress(data, level)
+    if method == 'gzip':
+        compressed = StringIO()
+        with closing(
+            gzip.GzipFile(mode='wb', fileobj=compressed, compresslevel=level)
+        ) as gzip_file:
+            gzip_file.write(data)
+        return compressed.getvalue()
+    raise ValueError('unknown compression method: %r' % method)
+
+
+#------------------------------------------------------------------------------
+def is_gzip(data):
+    return data[:2] == GZIP_MAGIC
+
+
+#------------------------------------------------------------------------------
+def is_zlib(data):
+    # the first byte of a zlib stream names the 'deflate' method and the
+    # first two bytes, as a big endian number, are a multiple of 31.  JSON
+    # never starts that way.
+    if len(data) < 2:
+        return False
+    first, second = ord(data[0]), ord(data[1])
+    return first & 0x0f == 8 and (first * 256 + second) % 31 == 0
+
+
+#------------------------------------------------------------------------------
+def decompress(data):
+    """returns the data decompressed if it is recognized as gzip or zlib
+    compressed, otherwise the data as is"""
+    if is_gzip(data):
+        with closing(gzip.GzipFile(mode='rb', fileobj=StringIO(data))) as f:
+            return f.read()
+    if is_zlib(data):
+        return zlib.decompress(data)
+    return data
+
+
+#------------------------------------------------------------------------------
+def compression_stats(prefix, uncompressed_size, compressed_size, level):
+    """returns a mapping of the sizes, savings and level of a compression
+    suitable for a metrics 'capture_stats' call"""
+    if uncompressed_size:
+        savings = 100 - compressed_size * 100 / uncompressed_size
+    else:
+        savings = 0
+    return {
+        '%s.uncompressed_size' % prefix: uncompressed_size,
+        '%s.compressed_size' % prefix: compressed_size,
+        '%s.compression_savings_percent' % prefix: savings,
+        '%s.compression_level' % prefix: level,
+    }
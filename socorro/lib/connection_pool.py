@@ -0,0 +1,277 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""a bounded pool of connections shared by the threads of a process, used by
+the connection contexts of the external resources that are expensive to
+connect to, like S3 and PostgreSQL."""
+
+import threading
+import time
+
+
+#==============================================================================
+class ConnectionPoolTimeout(Exception):
+    """raised when no connection could be checked out of a pool in time"""
+
+
+#==============================================================================
+class ConnectionPool(object):
+    """a bounded pool of connections shared by the threads of a process.
+
+    A thread checks out a connection for the duration of a transaction and
+    checks it back in when done.  The most recently used connection is handed
+    out first so that its HTTP keep-alive connection is still open.
+    Connections that have sat idle for too long are closed and connections
+    that have sat idle for a while are checked with the 'health_check'
+    function before they are reused.  When all the connections are checked
+    out, 'checkout' waits for one to be returned, for at most
+    'checkout_timeout' seconds.
+
+    Every checkout reports the time spent waiting for a connection and every
+    connection created, discarded or evicted is reported to the metrics,
+    under the names that start with 'metrics_prefix'."""
+
+    metrics_prefix = 'pool'
+
+    #--------------------------------------------------------------------------
+    def __init__(
+        self,
+        connection_factory,
+        maximum_connections=0,
+        maximum_idle_seconds=0,
+        health_check_seconds=0,
+        health_check=None,
+        checkout_timeout=0,
+        metrics=None,
+        logger=None,
+    ):
+        """
+        parameters:
+            connection_factory - a function that returns a new connection
+            maximum_connections - the limit of the number of connections, 0
+                                  for no limit
+            maximum_idle_seconds - connections idle longer than this are
+                                   closed rather than reused, 0 to keep them
+                                   forever
+            health_check_seconds - connections idle longer than this are
+                                   given to the health_check before reuse, 0
+                                   for no health checks
+            health_check - a function that accepts a connection and raises an
+                           exception if the connection is no longer usable
+            checkout_timeout - the seconds 'checkout' waits for a connection
+                               before raising ConnectionPoolTimeout, 0 to
+                               wait forever
+            metrics - an optional object with a 'capture_stats' method
+            logger - an optional logger"""
+        self.connection_factory = connection_factory
+        self.maximum_connections = maximum_connections
+        self.maximum_idle_seconds = maximum_idle_seconds
+        self.health_check_seconds = health_check_seconds
+        self.health_check = health_check
+        self.checkout_timeout = checkout_timeout
+        self.metrics = metrics
+        self.logger = logger
+        # a list of (connection, time last checked in) tuples, the most
+        # recently used at the end
+        self._idle = []
+        # the number of connections, both idle and checked out
+        self._number_of_connections = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self._clock = time.time
+        self.created = 0
+        self.discarded = 0
+        self.evicted = 0
+        self.waits = 0
+        self.timeouts = 0
+
+    #--------------------------------------------------------------------------
+    def _capture_stats(self, data_items):
+        if self.metrics is not None:
+            self.metrics.capture_stats(dict(
+                ('%s.%s' % (self.metrics_prefix, key), value)
+                for key, value in data_items.iteritems()
+            ))
+
+    #--------------------------------------------------------------------------
+    def _close_connection(self, connection):
+        try:
+            connection.close()
+        except AttributeError:
+            # not all connections can be closed
+            pass
+        except Exception:
+            if self.logger is not None:
+                self.logger.debug(
+                    'closing a pooled connection failed',
+                    exc_info=True
+                )
+
+    #--------------------------------------------------------------------------
+    def _evict_idle_connections(self, now):
+        """remove the connections idle for too long, the caller must hold the
+        condition.  Returns the list of evicted connections."""
+        evicted = []
+        if self.maximum_idle_seconds:
+            # the least recently used connections are at the front
+            while (
+                self._idle
+                and now - self._idle[0][1] > self.maximum_idle_seconds
+            ):
+                evicted.append(self._idle.pop(0)[0])
+            self._number_of_connections -= len(evicted)
+            self.evicted += len(evicted)
+        return evicted
+
+    #--------------------------------------------------------------------------
+    def _is_healthy(self, connection, idle_seconds):
+        if (
+            self.health_check is None
+            or not self.health_check_seconds
+            or idle_seconds <= self.health_check_seconds
+        ):
+            return True
+        try:
+            self.health_check(connection)
+            return True
+        except Exception:
+            if self.logger is not None:
+                self.logger.info(
+                    'a pooled connection failed its health check',
+                    exc_info=True
+                )
+            return False
+
+    #--------------------------------------------------------------------------
+    def checkout(self, wait=True):
+        """return a connection for the exclusive use of the caller until it
+        is given back with 'checkin' or 'discard'.  With 'wait' False, None
+        is returned at once when all the connections are checked out."""
+        start = self._clock()
+        waited = False
+        timed_out = False
+        unavailable = False
+        while True:
+            with self._condition:
+                while True:
+                    now = self._clock()
+                    evicted = self._evict_idle_connections(now)
+                    if self._idle:
+                        connection, checked_in = self._idle.pop()
+                        break
+                    if (
+                        not self.maximum_connections
+                        or self._number_of_connections
+                        < self.maximum_connections
+                    ):
+                        # reserve the place of the new connection
+                        self._number_of_connections += 1
+                        connection = checked_in = None
+                        break
+                    if not wait:
+                        unavailable = True
+                        break
+                    waited = True
+                    if not self.checkout_timeout:
+                        self._condition.wait()
+                        continue
+                    remaining = start + self.checkout_timeout - now
+                    if remaining <= 0:
+                        self.timeouts += 1
+                        timed_out = True
+                        break
+                    self._condition.wait(remaining)
+            for a_connection in evicted:
+                self._close_connection(a_connection)
+            if evicted:
+                self._capture_stats({'evicted': len(evicted)})
+            if unavailable:
+                return None
+            if timed_out:
+                self._capture_stats({'timeouts': 1})
+                raise ConnectionPoolTimeout(
+                    'no connection available after %s seconds' %
+                    self.checkout_timeout
+                )
+
+            if connection is None:
+                try:
+                    connection = self.connection_factory()
+                except Exception:
+                    with self._condition:
+                        self._number_of_connections -= 1
+                        self._condition.notify()
+                    raise
+                with self._condition:
+                    self.created += 1
+                self._capture_stats({'created': 1})
+                break
+            if self._is_healthy(connection, now - checked_in):
+                break
+            self.discard(connection)
+
+        with self._condition:
+            if waited:
+                self.waits += 1
+            in_use = self._number_of_connections - len(self._idle)
+        self._capture_stats({
+            'wait': int((self._clock() - start) * 1000),
+            'in_use': in_use,
+        })
+        return connection
+
+    #--------------------------------------------------------------------------
+    def checkin(self, connection):
+        """return a connection to the pool for reuse"""
+        with self._condition:
+            if not self._closed:
+                self._idle.append((connection, self._clock()))
+                self._condition.notify()
+                return
+        self.discard(connection)
+
+    #--------------------------------------------------------------------------
+    def discard(self, connection):
+        """close a checked out connection rather than returning it to the
+        pool, its place is taken by a new connection on a later checkout"""
+        with self._condition:
+            self._number_of_connections -= 1
+            self.discarded += 1
+            self._condition.notify()
+        self._close_connection(connection)
+        self._capture_stats({'discarded': 1})
+
+    #--------------------------------------------------------------------------
+    def stats(self, prefix):
+        """returns a mapping of the pool counters suitable for a metrics
+        'capture_stats' call"""
+        with self._condition:
+            return {
+                '%s.size' % prefix: self._number_of_connections,
+                '%s.idle' % prefix: len(self._idle),
+                '%s.created' % prefix: self.created,
+                '%s.discarded' % prefix: self.discarded,
+                '%s.evicted' % prefix: self.evicted,
+                '%s.waits' % prefix: self.waits,
+                '%s.timeouts' % prefix: self.timeouts,
+                '%s.in_use' % prefix: (
+                    self._number_of_connections - len(self._idle)
+                ),
+            }
+
+    #--------------------------------------------------------------------------
+    def __len__(self):
+        return self._number_of_connections
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        """close the idle connections.  Connections still checked out are
+        closed as they are checked in."""
+        with self._condition:
+            self._closed = True
+            idle = [connection for connection, x in self._idle]
+            self._idle = []
+            self._number_of_connections -= len(idle)
+        for a_connection in idle:
+            self._close_connection(a_connection)
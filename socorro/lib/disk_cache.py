@@ -0,0 +1,355 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""a least recently used cache of strings kept in files of a local directory
+and bounded by the total size of the files.  The files outlive the process:
+a cache created on a directory that holds files from a previous run starts
+with them, the least recently modified first in line for eviction."""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+#==============================================================================
+class _Fill(object):
+    """a value being computed by a thread for the others to wait for"""
+
+    #--------------------------------------------------------------------------
+    def __init__(self, generation):
+        self.done = threading.Event()
+        self.value = None
+        self.exception = None
+        # the generation of the cache when the computation started
+        self.generation = generation
+
+
+#==============================================================================
+class DiskLRUCache(object):
+    """a thread safe cache of strings on disk.
+
+    When several threads miss on the same key at the same time, only the
+    first one computes the value, the others wait for it and share the value
+    or the exception.  A value whose key is discarded while it is being
+    computed is not cached, for it may be older than what made the caller
+    discard the key.  Each value is written to a temporary file that is then
+    renamed, so a file of the cache is never seen half written.  The
+    directory should not be shared by processes running at the same time as
+    each keeps the account of the sizes of the files on its own.
+
+    The hits, misses, waits for a value being computed by another thread and
+    evictions are counted and reported to the metrics, under the names that
+    start with 'metrics_prefix'."""
+
+    metrics_prefix = 'disk_cache'
+
+    #--------------------------------------------------------------------------
+    def __init__(
+        self,
+        directory,
+        maximum_bytes,
+        metrics=None,
+        metrics_prefix=None,
+        logger=None,
+    ):
+        """
+        parameters:
+            directory - the directory of the files of the cache, created if
+                        needed
+            maximum_bytes - the limit of the total size of the values.  When
+                            exceeded, the least recently used values are
+                            removed.  A value larger than the limit is never
+                            cached.
+            metrics - an optional object with a 'capture_stats' method
+            metrics_prefix - the start of the names of the metrics, in place
+                             of the class default
+            logger - an optional logger"""
+        self.directory = directory
+        self.maximum_bytes = maximum_bytes
+        self.metrics = metrics
+        if metrics_prefix is not None:
+            self.metrics_prefix = metrics_prefix
+        self.logger = logger
+        # a mapping of file name to size, the least recently used first
+        self._entries = OrderedDict()
+        self._bytes = 0
+        # the values being computed by file name
+        self._fills = {}
+        # the number of discards so far.  While values are being computed,
+        # the mapping of the file names discarded to the generation of their
+        # discard.
+        self._generation = 0
+        self._discarded = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.waits = 0
+        self.evictions = 0
+        try:
+            os.makedirs(directory)
+        except OSError:
+            # probably already created, ignore
+            pass
+        self._load()
+
+    #--------------------------------------------------------------------------
+    def _capture_stats(self, data_items):
+        if self.metrics is not None:
+            self.metrics.capture_stats(dict(
+                ('%s.%s' % (self.metrics_prefix, key), value)
+                for key, value in data_items.iteritems()
+            ))
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _name(key):
+        # keys may hold any character, the names of the files do not
+        return hashlib.sha1(key).hexdigest()
+
+    #--------------------------------------------------------------------------
+    def _path(self, name):
+        # spread the files over 256 subdirectories
+        return os.path.join(self.directory, name[:2], name)
+
+    #--------------------------------------------------------------------------
+    def _load(self):
+        """account for the files left by a previous run"""
+        found = []
+        for dir_path, dir_names, file_names in os.walk(self.directory):
+            for a_file_name in file_names:
+                a_path = os.path.join(dir_path, a_file_name)
+                if a_file_name.endswith('.tmp'):
+                    # left over from a write that was interrupted
+                    self._remove_file(a_path)
+                    continue
+                try:
+                    st_result = os.stat(a_path)
+                except OSError:
+                    continue
+                found.append((st_result.st_mtime, a_file_name,
+                              st_result.st_size))
+        found.sort()
+        with self._lock:
+            for mtime, name, size in found:
+                self._entries[name] = size
+                self._bytes += size
+            evicted = self._evict()
+        self._remove_evicted(evicted)
+
+    #--------------------------------------------------------------------------
+    def _remove_file(self, path):
+        try:
+            os.unlink(path)
+        except OSError:
+            if self.logger is not None:
+                self.logger.debug(
+                    'could not remove %s from the cache',
+                    path,
+                    exc_info=True
+                )
+
+    #--------------------------------------------------------------------------
+    def _evict(self):
+        """remove the least recently used entries until the cache fits, the
+        caller must hold the lock.  Returns the names of the evicted
+        entries."""
+        evicted = []
+        while self._bytes > self.maximum_bytes and self._entries:
+            name, size = self._entries.popitem(last=False)
+            self._bytes -= size
+            evicted.append(name)
+        self.evictions += len(evicted)
+        return evicted
+
+    #--------------------------------------------------------------------------
+    def _remove_evicted(self, evicted):
+        for name in evicted:
+            self._remove_file(self._path(name))
+        if evicted:
+            self._capture_stats({'evictions': len(evicted)})
+
+    #--------------------------------------------------------------------------
+    def _is_stale(self, name, generation):
+        """whether the name was discarded after the generation, the caller
+        must hold the lock"""
+        return (
+            generation is not None
+            and self._discarded.get(name, 0) > generation
+        )
+
+    #--------------------------------------------------------------------------
+    def _store(self, name, value, generation=None):
+        if len(value) > self.maximum_bytes:
+            return
+        path = self._path(name)
+        try:
+            os.makedirs(os.path.dirname(path))
+        except OSError:
+            # probably already created, ignore
+            pass
+        temporary_path = '%s.%s.tmp' % (path, threading.current_thread().ident)
+        try:
+            with open(temporary_path, 'wb') as f:
+                f.write(value)
+            os.rename(temporary_path, path)
+        except (IOError, OSError):
+            # the cache is an optimization, a value that cannot be written is
+            # computed again next time
+            if self.logger is not None:
+                self.logger.warning(
+                    'could not write %s to the cache',
+                    path,
+                    exc_info=True
+                )
+            self._remove_file(temporary_path)
+            return
+        with self._lock:
+            stale = self._is_stale(name, generation)
+            if not stale:
+                self._bytes -= self._entries.pop(name, 0)
+                self._entries[name] = len(value)
+                self._bytes += len(value)
+                evicted = self._evict()
+        if stale:
+            self._remove_file(path)
+            return
+        self._remove_evicted(evicted)
+
+    #--------------------------------------------------------------------------
+    def get(self, key, compute_func):
+        """return the value cached for the key.  On a miss, call
+        'compute_func' with the key to create the value and cache it, unless
+        another thread is already doing so."""
+        name = self._name(key)
+        while True:
+            with self._lock:
+                if name in self._entries:
+                    # move it to the most recently used end
+                    self._entries[name] = self._entries.pop(name)
+                    fill = None
+                else:
+                    fill = self._fills.get(name)
+                    if fill is None:
+                        fill = self._fills[name] = _Fill(self._generation)
+                        self.misses += 1
+                        break
+                    self.waits += 1
+
+            if fill is not None:
+                self._capture_stats({'waits': 1})
+                fill.done.wait()
+                if fill.exception is not None:
+                    raise fill.exception
+                return fill.value
+
+            try:
+                with open(self._path(name), 'rb') as f:
+                    value = f.read()
+            except IOError:
+                # removed since, like by the eviction of another thread
+                self._forget(name)
+                continue
+            with self._lock:
+                self.hits += 1
+            self._capture_stats({'hits': 1})
+            return value
+
+        self._capture_stats({'misses': 1})
+        try:
+            value = compute_func(key)
+            self._store(name, value, fill.generation)
+            fill.value = value
+            return value
+        except BaseException, x:
+            fill.exception = x
+            raise
+        finally:
+            with self._lock:
+                del self._fills[name]
+                self._forget_old_discards()
+            fill.done.set()
+
+    #--------------------------------------------------------------------------
+    def _forget_old_discards(self):
+        """the discards are remembered only as long as a computation that
+        started before them is running, the caller must hold the lock"""
+        if not self._fills:
+            self._discarded.clear()
+            return
+        oldest = min(x.generation for x in self._fills.itervalues())
+        for name, generation in self._discarded.items():
+            if generation <= oldest:
+                del self._discarded[name]
+
+    #--------------------------------------------------------------------------
+    def generation(self):
+        """return the current generation of the cache for a later 'put'.
+        It is meant for a 'compute_func' that caches other values along with
+        its own: a value read from its source after this call is not cached
+        if its key is discarded in the meantime."""
+        with self._lock:
+            return self._generation
+
+    #--------------------------------------------------------------------------
+    def peek(self, key):
+        """return the value cached for the key or None, without counting it
+        as a use"""
+        name = self._name(key)
+        if name not in self._entries:
+            return None
+        try:
+            with open(self._path(name), 'rb') as f:
+                return f.read()
+        except IOError:
+            return None
+
+    #--------------------------------------------------------------------------
+    def put(self, key, value, generation=None):
+        """cache the value for the key, replacing any earlier value.  With
+        a 'generation' from the 'generation' method, the value is not cached
+        if the key was discarded since."""
+        self._store(self._name(key), value, generation)
+
+    #--------------------------------------------------------------------------
+    def _forget(self, name):
+        with self._lock:
+            size = self._entries.pop(name, None)
+            if size is not None:
+                self._bytes -= size
+        return size is not None
+
+    #--------------------------------------------------------------------------
+    def discard(self, key):
+        """remove the value cached for the key, if any.  A value for the
+        key that is being computed is not cached."""
+        name = self._name(key)
+        with self._lock:
+            self._generation += 1
+            if self._fills:
+                self._discarded[name] = self._generation
+        if self._forget(name):
+            self._remove_file(self._path(name))
+
+    #--------------------------------------------------------------------------
+    def stats(self, prefix):
+        """returns a mapping of the cache counters suitable for a metrics
+        'capture_stats' call"""
+        with self._lock:
+            return {
+                '%s.hits' % prefix: self.hits,
+                '%s.misses' % prefix: self.misses,
+                '%s.waits' % prefix: self.waits,
+                '%s.evictions' % prefix: self.evictions,
+                '%s.size' % prefix: len(self._entries),
+                '%s.bytes' % prefix: self._bytes,
+            }
+
+    #--------------------------------------------------------------------------
+    def __contains__(self, key):
+        return self._name(key) in self._entries
+
+    #--------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,154 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""a cache for rules that look up reference data, such as product versions,
+in a database.  Entries expire after a time to live, lookups that find
+nothing are remembered for a shorter time (negative caching), the number of
+entries is bounded and, optionally, the cache is bulk loaded at startup and
+periodically refreshed in a background thread."""
+
+import threading
+import time
+from collections import OrderedDict
+
+from configman import RequiredConfig, Namespace
+
+
+#==============================================================================
+class LookupCache(RequiredConfig):
+    required_config = Namespace()
+    required_config.add_option(
+        'lookup_cache_size',
+        doc='the maximum number of entries in the lookup cache',
+        default=50000,
+    )
+    required_config.add_option(
+        'lookup_cache_ttl',
+        doc='the number of seconds a found value is kept',
+        default=3600,
+    )
+    required_config.add_option(
+        'lookup_cache_negative_ttl',
+        doc='the number of seconds a lookup that found nothing is remembered',
+        default=300,
+    )
+    required_config.add_option(
+        'lookup_cache_refresh_interval',
+        doc='the number of seconds between bulk reloads of the cache in the '
+            'background (0 for no reloads)',
+        default=900,
+    )
+
+    #--------------------------------------------------------------------------
+    def __init__(self, config, lookup_func, preload_func=None):
+        """
+        parameters:
+            config - the configuration of the owning rule
+            lookup_func - a function that accepts a key and returns its value
+                          or None if there is no value
+            preload_func - an optional function returning an iterable of
+                           (key, value) pairs to be loaded in bulk"""
+        super(LookupCache, self).__init__()
+        self.config = config
+        self.lookup_func = lookup_func
+        self.preload_func = preload_func
+        self.hits = 0
+        self.misses = 0
+        # a mapping of key to a tuple of value and expiry time, in least
+        # recently used order
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._clock = time.time
+        self._refresh_thread = None
+        self._stop_refreshing = threading.Event()
+        if preload_func is not None:
+            self.preload()
+            if config.lookup_cache_refresh_interval:
+                self._refresh_thread = threading.Thread(
+                    name='LookupCacheRefresh',
+                    target=self._refresh_thread_func
+                )
+                self._refresh_thread.daemon = True
+                self._refresh_thread.start()
+
+    #--------------------------------------------------------------------------
+    def _store(self, key, value, now):
+        if value is None:
+            expires = now + self.config.lookup_cache_negative_ttl
+        else:
+            expires = now + self.config.lookup_cache_ttl
+        with self._lock:
+            self._cache.pop(key, None)
+            self._cache[key] = (value, expires)
+            while len(self._cache) > self.config.lookup_cache_size:
+                self._cache.popitem(last=False)
+
+    #--------------------------------------------------------------------------
+    def get(self, key):
+        """return the value for the key, looking it up on a miss.  None
+        means that there is no value for the key."""
+        now = self._clock()
+        with self._lock:
+            try:
+                value, expires = self._cache.pop(key)
+            except KeyError:
+                expires = None
+            if expires is not None and expires > now:
+                self.hits += 1
+                # move it to the most recently used end
+                self._cache[key] = (value, expires)
+                return value
+            self.misses += 1
+        value = self.lookup_func(key)
+        self._store(key, value, now)
+        return value
+
+    #--------------------------------------------------------------------------
+    def preload(self):
+        """load the cache in bulk with the results of the preload_func"""
+        now = self._clock()
+        number_loaded = 0
+        for key, value in self.preload_func():
+            self._store(key, value, now)
+            number_loaded += 1
+        self.config.logger.debug(
+            'lookup cache preloaded %d entries',
+            number_loaded
+        )
+
+    #--------------------------------------------------------------------------
+    def _refresh_thread_func(self):
+        while not self._stop_refreshing.wait(
+            self.config.lookup_cache_refresh_interval
+        ):
+            try:
+                self.preload()
+            except Exception:
+                # the entries already in the cache are still good
+                self.config.logger.warning(
+                    'lookup cache refresh failed',
+                    exc_info=True
+                )
+
+    #--------------------------------------------------------------------------
+    def stats(self, prefix):
+        """returns a mapping of the cache counters suitable for a metrics
+        'capture_stats' call"""
+        with self._lock:
+            return {
+                '%s.hits' % prefix: self.hits,
+                '%s.misses' % prefix: self.misses,
+                '%s.size' % prefix: len(self._cache),
+            }
+
+    #--------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._cache)
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        self._stop_refreshing.set()
+        if self._refresh_thread is not None:
+            self._refresh_thread.join()
+            self._refresh_thread = None
@@ -0,0 +1,73 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""a bounded, thread safe, least recently used cache for the results of
+expensive pure functions"""
+
+import threading
+from collections import OrderedDict
+
+
+#==============================================================================
+class LRUCache(object):
+
+    #--------------------------------------------------------------------------
+    def __init__(self, maximum_size):
+        """
+        parameters:
+            maximum_size - the number of entries to keep.  When exceeded, the
+                           least recently used entry is discarded.  Zero
+                           disables the cache."""
+        self.maximum_size = maximum_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    #--------------------------------------------------------------------------
+    def get(self, key, compute_func):
+        """return the value cached for the key.  On a miss, call
+        'compute_func' with the key to create the value and cache it.  The
+        value is computed outside of the lock, so two threads missing on the
+        same key may both compute it."""
+        with self._lock:
+            try:
+                value = self._cache.pop(key)
+            except KeyError:
+                self.misses += 1
+            else:
+                self.hits += 1
+                # move it to the most recently used end
+                self._cache[key] = value
+                return value
+        value = compute_func(key)
+        with self._lock:
+            self._cache[key] = value
+            while len(self._cache) > self.maximum_size:
+                self._cache.popitem(last=False)
+        return value
+
+    #--------------------------------------------------------------------------
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+    #--------------------------------------------------------------------------
+    def stats(self, prefix):
+        """returns a mapping of the cache counters suitable for a metrics
+        'capture_stats' call"""
+        with self._lock:
+            return {
+                '%s.hits' % prefix: self.hits,
+                '%s.misses' % prefix: self.misses,
+                '%s.size' % prefix: len(self._cache),
+            }
+
+    #--------------------------------------------------------------------------
+    def __contains__(self, key):
+        return key in self._cache
+
+    #--------------------------------------------------------------------------
+    def __len__(self):
+        return len(self._cache)
@@ -0,0 +1,222 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""This module defines a producer/consumer system where the consumers are
+separate processes rather than threads.  Just as with the threaded version, a
+single iterator thread in the main process pushes jobs into an internal
+queue.  A flock of worker processes pull the jobs off that queue and do the
+work.  Since each worker is its own process, CPU bound tasks are no longer
+serialized by the GIL of a single interpreter.
+
+Workers are created by forking the main process, so the task function and
+whatever objects it refers to are inherited rather than pickled.  Only the
+args and kwargs of each job cross the process boundary and so they must be
+picklable.  The one exception is the 'finished_func' kwarg: it never leaves
+the main process.  It is withheld from the job and called by a completion
+thread in the main process once a worker reports that it is done with the
+job.  This preserves the guarantee that, for example, RabbitMQ
+acknowledgements are sent on the connection that received the message."""
+
+import itertools
+import multiprocessing
+import os
+import signal
+import threading
+
+from configman import Namespace
+
+from socorro.lib.task_manager import (
+    default_task_func,
+    default_iterator,
+)
+from socorro.lib.threaded_task_manager import ThreadedTaskManager
+
+
+#==============================================================================
+class ProcessPoolTaskManager(ThreadedTaskManager):
+    """Given an iterator over a sequence of job parameters and a function,
+    this class will execute the function in a set of worker processes.
+
+    Resources that hold network connections must not be shared across a
+    fork.  The 'worker_setup_func' is called once at the start of each
+    worker process to give it a chance to build its own, while the
+    'worker_teardown_func' is called once as each worker process ends.
+
+    Tasks that accumulate state in memory across jobs (like the correlations
+    rules) will see that state split amongst the worker processes.  Such
+    applications should stay with the ThreadedTaskManager."""
+    required_config = Namespace()
+    # unlike the threaded version, there is no benefit to running more
+    # workers than there are processor cores unless the task is i/o bound.
+    required_config.add_option(
+      'number_of_processes',
+      default=multiprocessing.cpu_count(),
+      doc='the number of worker processes'
+    )
+
+    #--------------------------------------------------------------------------
+    def __init__(self, config,
+                 job_source_iterator=default_iterator,
+                 task_func=default_task_func,
+                 worker_setup_func=None,
+                 worker_teardown_func=None):
+        """the constructor accepts the function that will serve as the data
+        source iterator and the function that the worker processes will
+        execute on consuming the data.
+
+        parameters:
+            job_source_iterator - an iterator to serve as the source of data.
+                                  See the TaskManager for the acceptable
+                                  forms.
+            task_func - a function that will accept the args and kwargs yielded
+                        by the job_source_iterator
+            worker_setup_func - a function to be called once at the start of
+                                each worker process
+            worker_teardown_func - a function to be called once as each
+                                   worker process ends"""
+        super(ProcessPoolTaskManager, self).__init__(
+            config,
+            job_source_iterator,
+            task_func,
+            worker_setup_func,
+            worker_teardown_func
+        )
+        # the ThreadedTaskManager sized itself by 'number_of_threads', here
+        # the unit of execution is the process
+        self.number_of_threads = config.number_of_processes
+        self.task_queue = multiprocessing.Queue(config.maximum_queue_size)
+        self.completed_queue = multiprocessing.Queue()
+        # finished_funcs waiting for their job to complete, keyed by job_id
+        self.pending_finished_funcs = {}
+        self._job_id_counter = itertools.count()
+
+    #--------------------------------------------------------------------------
+    def start(self):
+        """start the completion thread, the worker processes and then the
+        queuing thread.  This is a non blocking call."""
+        self.logger.debug('start')
+        self.completion_thread = threading.Thread(
+          name="CompletionThread",
+          target=self._completion_thread_func
+        )
+        self.completion_thread.start()
+        for x in range(self.number_of_threads):
+            new_process = multiprocessing.Process(
+                name="WorkerProcess-%d" % x,
+                target=self._worker_process_func
+            )
+            self.thread_list.append(new_process)
+            new_process.start()
+        self.queuing_thread = threading.Thread(
+          name="QueuingThread",
+          target=self._queuing_thread_func
+        )
+        self.queuing_thread.start()
+
+    #--------------------------------------------------------------------------
+    def _queue_job(self, job_params):
+        """the 'finished_func' cannot cross the process boundary, so it is
+        kept in the main process until the completion thread hears that the
+        job is done.  The job itself is queued by id with its remaining
+        args and kwargs.
+
+        parameters:
+            job_params - the (args, kwargs) tuple yielded by the iterator"""
+        try:
+            args, kwargs = job_params
+        except ValueError:
+            args = job_params
+            kwargs = {}
+        kwargs = dict(kwargs)
+        job_id = next(self._job_id_counter)
+        finished_func = kwargs.pop('finished_func', None)
+        if finished_func is not None:
+            self.pending_finished_funcs[job_id] = finished_func
+        self.task_queue.put((job_id, (args, kwargs)))
+
+    #--------------------------------------------------------------------------
+    def _kill_worker_threads(self):
+        """place one death token on the queue for each worker process, wait
+        for the workers to die and then stop the completion thread.
+
+        This is a blocking call."""
+        for x in range(self.number_of_threads):
+            self.task_queue.put((None, None))
+        self.logger.debug("waiting for worker processes to stop")
+        for a_process in self.thread_list:
+            a_process.join()
+        # every worker is gone, nothing more will be reported as completed
+        self.completed_queue.put(None)
+        try:
+            self.completion_thread.join()
+        except AttributeError:
+            # the completion thread was never started
+            pass
+
+    #--------------------------------------------------------------------------
+    def _worker_process_func(self):
+        """This is the main routine of each worker process.  It pulls jobs
+        from the task queue and executes them until it encounters a death
+        token.  Each job's id is reported back to the main process when the
+        job is done, whether it succeeded or not."""
+        # shutdown is orchestrated by the main process through death tokens.
+        # A signal sent to the whole process group must not abort the job
+        # that a worker is in the middle of.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        try:
+            if self.worker_setup_func:
+                self.worker_setup_func()
+            while True:
+                job_id, arguments = self.task_queue.get()
+                if job_id is None:
+                    self.config.logger.info('quits')
+                    break
+                try:
+                    args, kwargs = arguments
+                    self.task_func(*args, **kwargs)
+                except Exception:
+                    self.config.logger.error("Error in processing a job",
+                                             exc_info=True)
+                finally:
+                    self.completed_queue.put(job_id)
+        except Exception:
+            self.config.logger.critical("Failure in task_queue", exc_info=True)
+        finally:
+            if self.worker_teardown_func:
+                try:
+                    self.worker_teardown_func()
+                except Exception:
+                    self.config.logger.error(
+                        "Error in closing the worker process",
+                        exc_info=True
+                    )
+
+    #--------------------------------------------------------------------------
+    def _completion_thread_func(self):
+        """This thread of the main process calls the 'finished_func' of each
+        job as the workers report them as done.  It quits when it encounters
+        a death token, a single None."""
+        while True:
+            job_id = self.completed_queue.get()
+            if job_id is None:
+                break
+            finished_func = self.pending_finished_funcs.pop(job_id, None)
+            if finished_func is None:
+                continue
+            try:
+                finished_func()
+            except Exception:
+                self.config.logger.error(
+                    'Error completing job %s',
+                    job_id,
+                    exc_info=True
+                )
+
+    #--------------------------------------------------------------------------
+    def executor_identity(self):
+        """the thread name alone is no longer unique: every worker process
+        has a MainThread.  Identify the unit of execution by process id and
+        thread name."""
+        return "%s-%s" % (os.getpid(), threading.currentThread().getName())
@@ -0,0 +1,203 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""This module holds the sinks for the per rule timings gathered by a
+TransformRuleSystem.  A TransformRuleSystem only times its rules when one of
+these classes is given as its 'rule_timer_class'.  Each sink is told the
+tag of the rule set, the name of the rule class, the phase ('predicate' or
+'action'), the duration in seconds and the arguments that the rule was
+applied to."""
+
+import signal
+import threading
+
+from configman import RequiredConfig, Namespace
+from configman.converters import class_converter
+
+
+#==============================================================================
+class RuleTimerBase(RequiredConfig):
+    """the base class for rule timing sinks, it discards the timings"""
+    required_config = Namespace()
+
+    #--------------------------------------------------------------------------
+    def __init__(self, config):
+        super(RuleTimerBase, self).__init__()
+        self.config = config
+
+    #--------------------------------------------------------------------------
+    def record(self, rule_set_tag, rule_name, phase, duration, rule_args):
+        pass
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        pass
+
+
+#==============================================================================
+class MetricsRuleTimer(RuleTimerBase):
+    """sends each timing, in milliseconds, to a metrics class such as
+    socorro.external.statsd.metrics.StatsdMetrics"""
+    required_config = Namespace()
+    required_config.add_option(
+        'metrics_class',
+        default='socorro.external.statsd.metrics.StatsdMetrics',
+        doc='the class that implements metrics',
+        from_string_converter=class_converter,
+        reference_value_from='resource.rule_timing',
+    )
+
+    #--------------------------------------------------------------------------
+    def __init__(self, config):
+        super(MetricsRuleTimer, self).__init__(config)
+        self.metrics = config.metrics_class(config)
+
+    #--------------------------------------------------------------------------
+    def record(self, rule_set_tag, rule_name, phase, duration, rule_args):
+        self.metrics.capture_stats({
+            '%s.%s.%s' % (rule_set_tag, rule_name, phase):
+                int(duration * 1000)
+        })
+
+
+#------------------------------------------------------------------------------
+# all the AggregatingRuleTimers in this process, reported together on SIGUSR1
+_aggregating_rule_timers = []
+_aggregating_rule_timers_lock = threading.Lock()
+
+
+#------------------------------------------------------------------------------
+def _report_aggregating_rule_timers(signal_number, frame):
+    with _aggregating_rule_timers_lock:
+        rule_timers = list(_aggregating_rule_timers)
+    for a_rule_timer in rule_timers:
+        a_rule_timer.log_report()
+
+
+#==============================================================================
+class AggregatingRuleTimer(RuleTimerBase):
+    """keeps a count, total, maximum and a histogram of the timings in this
+    process.  Sending the process SIGUSR1 writes them all to the log."""
+    required_config = Namespace()
+    required_config.add_option(
+        'number_of_histogram_buckets',
+        default=16,
+        doc='the number of histogram buckets, each twice as wide as the last,'
+            ' starting with less than 1ms',
+        reference_value_from='resource.rule_timing',
+    )
+
+    #--------------------------------------------------------------------------
+    def __init__(self, config):
+        super(AggregatingRuleTimer, self).__init__(config)
+        # a mapping of (rule_set_tag, rule_name, phase) to a list in the form
+        # [count, total_seconds, maximum_seconds, histogram]
+        self.aggregates = {}
+        self._lock = threading.Lock()
+        with _aggregating_rule_timers_lock:
+            if not _aggregating_rule_timers:
+                try:
+                    signal.signal(
+                        signal.SIGUSR1,
+                        _report_aggregating_rule_timers
+                    )
+                except ValueError:
+                    # signals can only be set from the main thread
+                    config.logger.warning(
+                        'rule timings cannot be reported on SIGUSR1 '
+                        'from this thread'
+                    )
+            _aggregating_rule_timers.append(self)
+
+    #--------------------------------------------------------------------------
+    def _histogram_bucket(self, duration):
+        bucket = 0
+        upper_bound = 0.001
+        while (
+            duration >= upper_bound
+            and bucket < self.config.number_of_histogram_buckets - 1
+        ):
+            bucket += 1
+            upper_bound *= 2
+        return bucket
+
+    #--------------------------------------------------------------------------
+    def record(self, rule_set_tag, rule_name, phase, duration, rule_args):
+        bucket = self._histogram_bucket(duration)
+        key = (rule_set_tag, rule_name, phase)
+        with self._lock:
+            try:
+                aggregate = self.aggregates[key]
+            except KeyError:
+                aggregate = self.aggregates[key] = [
+                    0,
+                    0.0,
+                    0.0,
+                    [0] * self.config.number_of_histogram_buckets
+                ]
+            aggregate[0] += 1
+            aggregate[1] += duration
+            aggregate[2] = max(aggregate[2], duration)
+            aggregate[3][bucket] += 1
+
+    #--------------------------------------------------------------------------
+    def report(self):
+        """returns a list of lines, one per rule and phase, slowest total
+        first"""
+        with self._lock:
+            aggregates = sorted(
+                self.aggregates.iteritems(),
+                key=lambda (key, aggregate): aggregate[1],
+                reverse=True
+            )
+            lines = []
+            for (tag, rule_name, phase), aggregate in aggregates:
+                count, total, maximum, histogram = aggregate
+                lines.append(
+                    '%s %s %s: count=%d total=%.1fms mean=%.3fms max=%.3fms '
+                    'histogram=%s' % (
+                        tag,
+                        rule_name,
+                        phase,
+                        count,
+                        total * 1000,
+                        total * 1000 / count,
+                        maximum * 1000,
+                        histogram,
+                    )
+                )
+        return lines
+
+    #--------------------------------------------------------------------------
+    def log_report(self):
+        for a_line in self.report():
+            self.config.logger.info('rule timing: %s', a_line)
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        with _aggregating_rule_timers_lock:
+            try:
+                _aggregating_rule_timers.remove(self)
+            except ValueError:
+                # already closed
+                pass
+
+
+#==============================================================================
+class ProcessorMetaRuleTimer(RuleTimerBase):
+    """adds the timings, in milliseconds, to the 'rule_timings' mapping of the
+    processor_meta passed to Processor2015 style rules.  Processor2015 saves
+    that mapping with the processed crash."""
+    required_config = Namespace()
+
+    #--------------------------------------------------------------------------
+    def record(self, rule_set_tag, rule_name, phase, duration, rule_args):
+        try:
+            processor_meta = rule_args[3]
+        except IndexError:
+            # not a Processor2015 rule set
+            return
+        rule_timings = processor_meta.setdefault('rule_timings', {})
+        key = '%s.%s' % (rule_name, phase)
+        rule_timings[key] = rule_timings.get(key, 0.0) + duration * 1000
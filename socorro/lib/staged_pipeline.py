@@ -0,0 +1,184 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""This module defines a pipeline of stages.  Each stage is a bounded queue
+served by its own pool of threads.  A job enters the first stage and the
+value returned by each stage's function becomes the input of the next stage.
+Since each stage has its own threads, a slow i/o bound stage does not hold up
+a CPU bound stage: while one crash is being processed, others are being
+fetched and saved.
+
+Every job carries a 'finished_func'.  It is called exactly once as the job
+leaves the pipeline, whether it completed the last stage, was dropped by a
+stage returning None, or failed with an exception."""
+
+import threading
+import time
+import Queue
+
+
+#==============================================================================
+class PipelineJob(object):
+    """the unit of work that moves through the pipeline"""
+
+    #--------------------------------------------------------------------------
+    def __init__(self, job_id, payload, finished_func=(lambda: None)):
+        self.job_id = job_id
+        self.payload = payload
+        self.finished_func = finished_func
+
+
+#==============================================================================
+class Stage(object):
+    """a bounded queue and the pool of threads that serve it"""
+
+    #--------------------------------------------------------------------------
+    def __init__(
+        self,
+        name,
+        stage_func,
+        number_of_threads,
+        maximum_queue_size,
+        logger,
+        metrics=None,
+        metrics_prefix='',
+    ):
+        """
+        parameters:
+            name - the name of the stage used in logging and metrics
+            stage_func - a function accepting the payload of a job and
+                         returning the payload for the next stage.  Returning
+                         None drops the job from the pipeline.
+            number_of_threads - the size of this stage's thread pool
+            maximum_queue_size - the bound on the stage's queue.  When full,
+                                 the previous stage blocks.
+            logger - a logger
+            metrics - an optional object with a 'capture_stats' method
+            metrics_prefix - prepended to the names of the metrics"""
+        self.name = name
+        self.stage_func = stage_func
+        self.number_of_threads = number_of_threads
+        self.logger = logger
+        self.metrics = metrics
+        self.metrics_prefix = metrics_prefix
+        self.queue = Queue.Queue(maximum_queue_size)
+        self.next_stage = None
+        self.thread_list = []
+
+    #--------------------------------------------------------------------------
+    def start(self):
+        for x in range(self.number_of_threads):
+            new_thread = threading.Thread(
+                name='%sStage-%d' % (self.name, x),
+                target=self._stage_thread_func
+            )
+            self.thread_list.append(new_thread)
+            new_thread.start()
+
+    #--------------------------------------------------------------------------
+    def put(self, job):
+        self.queue.put(job)
+
+    #--------------------------------------------------------------------------
+    def stop(self):
+        """place a death token on the queue for each thread and wait for
+        them all to finish.  Jobs already in the queue are completed first.
+        This is a blocking call."""
+        for x in range(len(self.thread_list)):
+            self.queue.put(None)
+        for a_thread in self.thread_list:
+            a_thread.join()
+        self.thread_list = []
+
+    #--------------------------------------------------------------------------
+    def _capture_stats(self, queue_depth, duration):
+        if self.metrics is None:
+            return
+        try:
+            self.metrics.capture_stats({
+                '%s.%s.queue_depth' % (self.metrics_prefix, self.name):
+                    queue_depth,
+                '%s.%s.duration_ms' % (self.metrics_prefix, self.name):
+                    int(duration * 1000),
+            })
+        except Exception:
+            # metrics must never stop the flow of jobs
+            self.logger.error(
+                'metrics kicked up exception',
+                exc_info=True
+            )
+
+    #--------------------------------------------------------------------------
+    def _stage_thread_func(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            queue_depth = self.queue.qsize()
+            start_time = time.time()
+            try:
+                job.payload = self.stage_func(job.payload)
+            except Exception:
+                self.logger.error(
+                    'Error in the %s stage for %s',
+                    self.name,
+                    job.job_id,
+                    exc_info=True
+                )
+                job.payload = None
+            self._capture_stats(queue_depth, time.time() - start_time)
+            if job.payload is not None and self.next_stage is not None:
+                self.next_stage.put(job)
+                continue
+            # the job leaves the pipeline
+            try:
+                job.finished_func()
+            except Exception:
+                self.logger.error(
+                    'Error completing job %s',
+                    job.job_id,
+                    exc_info=True
+                )
+
+
+#==============================================================================
+class StagedPipeline(object):
+    """a sequence of stages linked first to last"""
+
+    #--------------------------------------------------------------------------
+    def __init__(self, stages):
+        """
+        parameters:
+            stages - a sequence of Stage instances in the order that jobs
+                     should flow through them"""
+        self.stages = list(stages)
+        for a_stage, the_next_stage in zip(self.stages, self.stages[1:]):
+            a_stage.next_stage = the_next_stage
+        self.started = False
+        self._start_lock = threading.Lock()
+
+    #--------------------------------------------------------------------------
+    def start(self):
+        with self._start_lock:
+            if self.started:
+                return
+            for a_stage in self.stages:
+                a_stage.start()
+            self.started = True
+
+    #--------------------------------------------------------------------------
+    def submit(self, job_id, payload, finished_func=(lambda: None)):
+        """put a new job into the first stage.  This blocks if the first
+        stage's queue is full.  The stages are started on first use."""
+        if not self.started:
+            self.start()
+        self.stages[0].put(PipelineJob(job_id, payload, finished_func))
+
+    #--------------------------------------------------------------------------
+    def close(self):
+        """stop the stages in order.  Each stage has finished all its work
+        before the next one is told to stop, so nothing is lost."""
+        for a_stage in self.stages:
+            a_stage.stop()
+        self.started = False
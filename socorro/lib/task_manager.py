@@ -70,7 +70,9 @@ class TaskManager(RequiredConfig):
     #--------------------------------------------------------------------------
     def __init__(self, config,
                  job_source_iterator=default_iterator,
-                 task_func=default_task_func):
+                 task_func=default_task_func,
+                 worker_setup_func=None,
+                 worker_teardown_func=None):
         """
         parameters:
             job_source_iterator - an iterator to serve as the source of data.
@@ -84,13 +86,22 @@ class TaskManager(RequiredConfig):
                                   mapping of kwargs.
                                   Ex:  (('a', 17), {'x': 23})
             task_func - a function that will accept the args and kwargs yielded
-                        by the job_source_iterator"""
+                        by the job_source_iterator
+            worker_setup_func - an optional function to be called once at
+                                the start of each worker that runs in its
+                                own process.  Task managers that share one
+                                process amongst their workers ignore it.
+            worker_teardown_func - an optional function to be called once
+                                   as each worker that runs in its own
+                                   process finishes."""
         super(TaskManager, self).__init__()
         self.config = config
         self._pid = os.getpid()
         self.logger = config.logger
         self.job_param_source_iter = job_source_iterator
         self.task_func = task_func
+        self.worker_setup_func = worker_setup_func
+        self.worker_teardown_func = worker_teardown_func
         self.quit = False
         self.logger.debug('TaskManager finished init')
 
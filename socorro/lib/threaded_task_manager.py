@@ -53,7 +53,9 @@ class ThreadedTaskManager(TaskManager):
     #--------------------------------------------------------------------------
     def __init__(self, config,
                  job_source_iterator=default_iterator,
-                 task_func=default_task_func):
+                 task_func=default_task_func,
+                 worker_setup_func=None,
+                 worker_teardown_func=None):
         """the constructor accepts the function that will serve as the data
         source iterator and the function that the threads will execute on
         consuming the data.
@@ -70,11 +72,16 @@ class ThreadedTaskManager(TaskManager):
                                   mapping of kwargs.
                                   Ex:  (('a', 17), {'x': 23})
             task_func - a function that will accept the args and kwargs yielded
-                        by the job_source_iterator"""
+                        by the job_source_iterator
+            worker_setup_func - unused here, all threads share the resources
+                                of this process
+            worker_teardown_func - unused here"""
         super(ThreadedTaskManager, self).__init__(
             config,
             job_source_iterator,
-            task_func
+            task_func,
+            worker_setup_func,
+            worker_teardown_func
         )
         self.thread_list = []  # the thread object storage
         self.number_of_threads = config.number_of_threads
@@ -213,6 +220,15 @@ class ThreadedTaskManager(TaskManager):
         for t in self.thread_list:
             t.join()
 
+    #--------------------------------------------------------------------------
+    def _queue_job(self, job_params):
+        """put a single job into the internal queue for the workers.  This
+        blocks when the queue is full.
+
+        parameters:
+            job_params - the (args, kwargs) tuple yielded by the iterator"""
+        self.task_queue.put((self.task_func, job_params))
+
     #--------------------------------------------------------------------------
     def _queuing_thread_func(self):
         """This is the function responsible for reading the iterator and
@@ -239,7 +255,7 @@ class ThreadedTaskManager(TaskManager):
                     continue
                 self.quit_check()
                 #self.logger.debug("queuing job %s", job_params)
-                self.task_queue.put((self.task_func, job_params))
+                self._queue_job(job_params)
         except Exception:
             self.logger.error('queuing jobs has failed', exc_info=True)
         except KeyboardInterrupt:
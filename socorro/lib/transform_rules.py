@@ -3,13 +3,14 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import re
+import time
 import configman
 import collections
 import inspect
 
 from configman import RequiredConfig, Namespace
 from configman.dotdict import DotDict
-from configman.converters import to_str
+from configman.converters import to_str, class_converter
 
 from socorro.lib.converters import (
     str_to_classes_in_namespaces_converter,
@@ -47,6 +48,15 @@ class Rule(RequiredConfig):
         default=False,
     )
 
+    # a rule may declare conditions that its predicate cannot succeed
+    # without.  Each is a tuple: the name of the argument ('raw_crash',
+    # 'raw_dumps', 'processed_crash' or 'processor_meta'), a key that must be
+    # in it and either None or a sequence of the values that key may have.
+    # A TransformRuleSystem skips the rule without calling its predicate when
+    # any condition is not met.  Rules that declare nothing are always tried.
+    # A rule whose predicate fails rather than returns False on a missing key
+    # must not declare that key: the failure would no longer be reported.
+    dispatch_conditions = ()
 
     #--------------------------------------------------------------------------
     def __init__(self, config=None, quit_check_callback=None):
@@ -145,6 +155,32 @@ class Rule(RequiredConfig):
         else:
             return (False, None)
 
+    #--------------------------------------------------------------------------
+    def _invoke_predicate(self, args, kwargs):
+        return self.predicate(*args, **kwargs)
+
+    #--------------------------------------------------------------------------
+    def _invoke_action(self, args, kwargs):
+        return self.action(*args, **kwargs)
+
+    #--------------------------------------------------------------------------
+    def timed_act(self, *args, **kwargs):
+        """the same as 'act', but it also measures the predicate and action
+
+        returns:
+            a tuple of the result of 'act' and a tuple of the seconds taken by
+            the predicate and by the action.  The action's time is None if it
+            was not run."""
+        start_time = time.time()
+        predicate_result = self._invoke_predicate(args, kwargs)
+        predicate_time = time.time() - start_time
+        if not predicate_result:
+            return (False, None), (predicate_time, None)
+        start_time = time.time()
+        bool_result = self._invoke_action(args, kwargs)
+        action_time = time.time() - start_time
+        return (True, bool_result), (predicate_time, action_time)
+
 
 #==============================================================================
 class TransformRule(Rule):
@@ -262,21 +298,29 @@ class TransformRule(Rule):
                (True, True) - the predicate and action functions succeeded
                (True, False) - the predicate succeeded, but the action function
                                failed"""
-        pred_args = tuple(args) + tuple(self.predicate_args)
-        pred_kwargs = kwargs.copy()
-        pred_kwargs.update(self.predicate_kwargs)
-        if self.function_invocation_proxy(self.predicate,
-                                          pred_args,
-                                          pred_kwargs):
-            act_args = tuple(args) + tuple(self.action_args)
-            act_kwargs = kwargs.copy()
-            act_kwargs.update(self.action_kwargs)
-            bool_result = self.function_invocation_proxy(self.action, act_args,
-                                                         act_kwargs)
+        if self._invoke_predicate(args, kwargs):
+            bool_result = self._invoke_action(args, kwargs)
             return (True, bool_result)
         else:
             return (False, None)
 
+    #--------------------------------------------------------------------------
+    def _invoke_predicate(self, args, kwargs):
+        pred_args = tuple(args) + tuple(self.predicate_args)
+        pred_kwargs = kwargs.copy()
+        pred_kwargs.update(self.predicate_kwargs)
+        return self.function_invocation_proxy(self.predicate,
+                                              pred_args,
+                                              pred_kwargs)
+
+    #--------------------------------------------------------------------------
+    def _invoke_action(self, args, kwargs):
+        act_args = tuple(args) + tuple(self.action_args)
+        act_kwargs = kwargs.copy()
+        act_kwargs.update(self.action_kwargs)
+        return self.function_invocation_proxy(self.action, act_args,
+                                              act_kwargs)
+
     #--------------------------------------------------------------------------
     def __eq__(self, another):
         if isinstance(another, TransformRule):
@@ -303,6 +347,22 @@ class TransformRuleSystem(RequiredConfig):
         doc='should the rules announce what they are doing?',
         default=False,
     )
+    required_config.add_option(
+        'rule_timer_class',
+        doc='a class from socorro.lib.rule_timing to record the time taken '
+            'by each rule (leave empty for no timing)',
+        default=None,
+        from_string_converter=class_converter,
+        reference_value_from='resource.rule_timing',
+    )
+
+    # the positions of the rule arguments named in 'dispatch_conditions'
+    dispatch_argument_positions = {
+        'raw_crash': 0,
+        'raw_dumps': 1,
+        'processed_crash': 2,
+        'processor_meta': 3,
+    }
 
     #--------------------------------------------------------------------------
     def __init__(self, config=None, quit_check=None):
@@ -316,8 +376,15 @@ class TransformRuleSystem(RequiredConfig):
         if 'chatty_rules' not in config:
             config.chatty_rules = False
         self.config = config
+        if config.get('rule_timer_class'):
+            self.rule_timer = config.rule_timer_class(config)
+            self._act_on_rule = self._act_on_rule_with_timing
+        else:
+            # with no timing, rules are applied with no added overhead
+            self.rule_timer = None
+            self._act_on_rule = self._act_on_rule_without_timing
+        self.tag = config.get('tag', '')
         if "rules_list" in config:
-            self.tag = config.tag
             self.act = getattr(self, config.action)
             list_of_rules = config.rules_list.class_list
 
@@ -330,12 +397,100 @@ class TransformRuleSystem(RequiredConfig):
                     self.rules.append(
                         a_rule_class(config)
                     )
+        self._build_dispatch_index()
 
     #--------------------------------------------------------------------------
     def _null_quit_check(self):
         "a no-op method to do nothing if no quit check method has been defined"
         pass
 
+    #--------------------------------------------------------------------------
+    def _build_dispatch_index(self):
+        """gather the 'dispatch_conditions' of the rules into a mapping of
+        the id of each rule that declares conditions to a tuple of its
+        conditions in the form (argument position, key, frozenset of values
+        or None)"""
+        self._dispatch_index = {}
+        for a_rule in self.rules:
+            conditions = getattr(a_rule, 'dispatch_conditions', ())
+            if not conditions:
+                continue
+            self._dispatch_index[id(a_rule)] = tuple(
+                (
+                    self.dispatch_argument_positions[argument_name],
+                    key,
+                    None if values is None else frozenset(values)
+                )
+                for argument_name, key, values in conditions
+            )
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _dispatch_conditions_met(conditions, args):
+        """returns False only if the arguments prove that a condition is not
+        met.  Anything unexpected leaves the decision to the predicate."""
+        for position, key, values in conditions:
+            try:
+                value = args[position][key]
+            except KeyError:
+                return False
+            except (IndexError, TypeError):
+                return True
+            try:
+                if values is not None and value not in values:
+                    return False
+            except TypeError:
+                # an unhashable value
+                return True
+        return True
+
+    #--------------------------------------------------------------------------
+    def _apply_rule(self, a_rule, args, kwargs):
+        try:
+            conditions = self._dispatch_index[id(a_rule)]
+        except KeyError:
+            # rules that declare no conditions are always tried
+            return self._act_on_rule(a_rule, args, kwargs)
+        if not self._dispatch_conditions_met(conditions, args):
+            return (False, None)
+        return self._act_on_rule(a_rule, args, kwargs)
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _act_on_rule_without_timing(a_rule, args, kwargs):
+        return a_rule.act(*args, **kwargs)
+
+    #--------------------------------------------------------------------------
+    def _act_on_rule_with_timing(self, a_rule, args, kwargs):
+        results, (predicate_time, action_time) = a_rule.timed_act(
+            *args,
+            **kwargs
+        )
+        rule_name = a_rule.__class__.__name__
+        try:
+            self.rule_timer.record(
+                self.tag,
+                rule_name,
+                'predicate',
+                predicate_time,
+                args
+            )
+            if action_time is not None:
+                self.rule_timer.record(
+                    self.tag,
+                    rule_name,
+                    'action',
+                    action_time,
+                    args
+                )
+        except Exception:
+            # timing must never stop the rules from being applied
+            self.config.logger.error(
+                'rule timer kicked up exception',
+                exc_info=True
+            )
+        return results
+
     #--------------------------------------------------------------------------
     def load_rules(self, an_iterable):
         """cycle through a collection of Transform rule tuples loading them
@@ -343,6 +498,7 @@ class TransformRuleSystem(RequiredConfig):
         self.rules = [
             TransformRule(*x, config=self.config) for x in an_iterable
         ]
+        self._build_dispatch_index()
 
     #--------------------------------------------------------------------------
     def append_rules(self, an_iterable):
@@ -350,6 +506,7 @@ class TransformRuleSystem(RequiredConfig):
         self.rules.extend(
             TransformRule(*x, config=self.config) for x in an_iterable
         )
+        self._build_dispatch_index()
 
     #--------------------------------------------------------------------------
     def apply_all_rules(self, *args, **kwargs):
@@ -365,7 +522,11 @@ class TransformRuleSystem(RequiredConfig):
                     'apply_all_rules: %s',
                     to_str(x.__class__)
                 )
-            predicate_result, action_result = x.act(*args, **kwargs)
+            predicate_result, action_result = self._apply_rule(
+                x,
+                args,
+                kwargs
+            )
             if self.config.chatty_rules:
                 self.config.logger.debug(
                     '               : pred - %s; act - %s',
@@ -388,7 +549,11 @@ class TransformRuleSystem(RequiredConfig):
                     'apply_until_action_succeeds: %s',
                     to_str(x.__class__)
                 )
-            predicate_result, action_result = x.act(*args, **kwargs)
+            predicate_result, action_result = self._apply_rule(
+                x,
+                args,
+                kwargs
+            )
             if self.config.chatty_rules:
                 self.config.logger.debug(
                     '                           : pred - %s; act - %s',
@@ -413,7 +578,11 @@ class TransformRuleSystem(RequiredConfig):
                     'apply_until_action_fails: %s',
                     to_str(x.__class__)
                 )
-            predicate_result, action_result = x.act(*args, **kwargs)
+            predicate_result, action_result = self._apply_rule(
+                x,
+                args,
+                kwargs
+            )
             if self.config.chatty_rules:
                 self.config.logger.debug(
                     '                        : pred - %s; act - %s',
@@ -439,7 +608,11 @@ class TransformRuleSystem(RequiredConfig):
                     'apply_until_predicate_succeeds: %s',
                     to_str(x.__class__)
                 )
-            predicate_result, action_result = x.act(*args, **kwargs)
+            predicate_result, action_result = self._apply_rule(
+                x,
+                args,
+                kwargs
+            )
             if self.config.chatty_rules:
                 self.config.logger.debug(
                     '                              : pred - %s; act - %s',
@@ -464,7 +637,11 @@ class TransformRuleSystem(RequiredConfig):
                     'apply_until_predicate_fails: %s',
                     to_str(x.__class__)
                 )
-            predicate_result, action_result = x.act(*args, **kwargs)
+            predicate_result, action_result = self._apply_rule(
+                x,
+                args,
+                kwargs
+            )
             if self.config.chatty_rules:
                 self.config.logger.debug(
                     '                           : pred - %s; act - %s',
@@ -477,6 +654,8 @@ class TransformRuleSystem(RequiredConfig):
 
     #--------------------------------------------------------------------------
     def close(self):
+        if self.rule_timer is not None:
+            self.rule_timer.close()
         for a_rule in self.rules:
             try:
                 self.config.logger.debug('trying to close %s', to_str(a_rule.__class__))
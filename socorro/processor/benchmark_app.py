@@ -0,0 +1,345 @@
+#! /usr/bin/env python
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+"""the processor_benchmark app measures the throughput of the processor
+without the rest of the Socorro stack.  It replays a directory of raw crashes
+through a processor algorithm and reports the crashes per second, the time
+spent in each rule set and the peak memory of the process.
+
+The directory holds, for each crash:
+    <crash_id>.json - the raw crash
+    <crash_id>.dump - the minidump (optional)
+    <crash_id>.<dump_name>.dump - additional dumps (optional)
+    <crash_id>.stackwalker.json - the recorded output of the stackwalker for
+                                  the minidump (optional)
+    <crash_id>.<dump_name>.stackwalker.json - the recorded output for an
+                                              additional dump (optional)
+
+The stackwalker binary is never run, the RecordedStackwalkerRule replays the
+recorded output in its place.  A dump without a recorded output would skip the
+frame processing and signature generation that make most of the work of the
+processor, so the app refuses to run unless every dump has one.  Rules that
+need a database are left out of the default rule sets.
+
+The default directory, testcrash/benchmark, holds the test crash of
+testcrash/raw along with a recorded stackwalker output."""
+
+import os
+import resource
+import time
+from collections import OrderedDict
+
+import ujson
+from configman import Namespace
+from configman.converters import class_converter
+
+from socorro.app.socorro_app import App, main
+from socorro.lib.converters import change_default
+from socorro.lib.util import DotDict
+from socorro.processor.breakpad_transform_rules import (
+    BreakpadStackwalkerRule2015
+)
+from socorro.processor.mozilla_processor_2015 import (
+    mozilla_processor_rule_sets
+)
+
+
+#==============================================================================
+class RecordedStackwalkerRule(BreakpadStackwalkerRule2015):
+    """a stand in for the BreakpadStackwalkerRule2015 that, rather than
+    running the stackwalker on a dump, reads the output that the stackwalker
+    once wrote for that dump from the file next to it."""
+    required_config = Namespace()
+    required_config.command_line = change_default(
+        BreakpadStackwalkerRule2015,
+        'command_line',
+        '{dump_file_pathname}'
+    )
+    required_config.add_option(
+        'recorded_output_suffix',
+        doc='the suffix that replaces ".dump" in the pathname of a dump to '
+            'find its recorded stackwalker output',
+        default='.stackwalker.json',
+    )
+
+    #--------------------------------------------------------------------------
+    def _execute_external_process(
+        self,
+        command_line,
+        processor_meta,
+        stdin_data=None
+    ):
+        # the command line is just the pathname of the dump
+        recording_pathname = '%s%s' % (
+            os.path.splitext(command_line)[0],
+            self.config.recorded_output_suffix
+        )
+        try:
+            with open(recording_pathname) as recording:
+                stackwalker_output = self._interpret_external_command_output(
+                    recording,
+                    processor_meta
+                )
+            return_code = 0
+        except IOError:
+            processor_meta.processor_notes.append(
+                'no recorded stackwalker output: %s' % recording_pathname
+            )
+            stackwalker_output = {}
+            return_code = 1
+        return self._interpret_stackwalker_output(
+            stackwalker_output,
+            return_code,
+            command_line,
+            processor_meta
+        )
+
+
+#------------------------------------------------------------------------------
+# the rules that cannot run without a database
+database_rules = (
+    'socorro.processor.mozilla_transform_rules.ProductRewrite',
+    'socorro.processor.mozilla_transform_rules.BetaVersionRule',
+    'socorro.processor.mozilla_transform_rules.OSPrettyVersionRule',
+    'socorro.processor.mozilla_transform_rules.MissingSymbolsRule',
+)
+
+
+#------------------------------------------------------------------------------
+def benchmark_rule_sets(rule_sets=mozilla_processor_rule_sets):
+    """return a copy of the rule sets with the stackwalker replaced by the
+    RecordedStackwalkerRule and without the rules that need a database"""
+    new_rule_sets = []
+    for name, tag, rule_system_class, action, rules_str in rule_sets:
+        rules = []
+        for a_rule in rules_str.split(','):
+            a_rule = a_rule.strip()
+            if not a_rule or a_rule in database_rules:
+                continue
+            if a_rule.endswith('.BreakpadStackwalkerRule2015'):
+                a_rule = 'socorro.processor.benchmark_app.' \
+                    'RecordedStackwalkerRule'
+            rules.append(a_rule)
+        new_rule_sets.append(
+            [name, tag, rule_system_class, action, ', '.join(rules)]
+        )
+    return new_rule_sets
+
+
+#==============================================================================
+class ProcessorBenchmarkApp(App):
+    """replays recorded raw crashes through a processor to measure it"""
+    app_name = 'processor_benchmark'
+    app_version = '1.0'
+    app_description = __doc__
+
+    required_config = Namespace()
+    required_config.add_option(
+        'source_path',
+        doc='the directory of raw crashes, dumps and recorded stackwalker '
+            'output',
+        default='./testcrash/benchmark',
+    )
+    required_config.add_option(
+        'allow_missing_recordings',
+        doc='run even if some dumps have no recorded stackwalker output, '
+            'their crashes are then processed without any stack',
+        default=False,
+    )
+    required_config.add_option(
+        'number_of_passes',
+        doc='the number of times to process every crash in the directory',
+        default=10,
+    )
+    required_config.namespace('processor')
+    required_config.processor.add_option(
+        'processor_class',
+        doc='the class that transforms raw crashes into processed crashes',
+        default='socorro.processor.mozilla_processor_2015'
+        '.MozillaProcessorAlgorithm2015',
+        from_string_converter=class_converter
+    )
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def get_application_defaults():
+        return {
+            'processor.rule_sets': ujson.dumps(benchmark_rule_sets()),
+        }
+
+    #--------------------------------------------------------------------------
+    def _load_crashes(self):
+        """returns a list of (raw_crash, raw_dumps) tuples read from the
+        source_path.  The raw_dumps map the dump names to their pathnames."""
+        source_path = self.config.source_path
+        file_names = sorted(os.listdir(source_path))
+        crashes = []
+        for a_file_name in file_names:
+            crash_id, extension = os.path.splitext(a_file_name)
+            if extension != '.json' or '.' in crash_id:
+                # not a raw crash
+                continue
+            with open(os.path.join(source_path, a_file_name)) as f:
+                raw_crash = DotDict(ujson.load(f))
+            raw_crash.setdefault('uuid', crash_id)
+            raw_dumps = {}
+            for a_dump_file_name in file_names:
+                if (
+                    not a_dump_file_name.startswith(crash_id)
+                    or not a_dump_file_name.endswith('.dump')
+                ):
+                    continue
+                dump_name = a_dump_file_name[len(crash_id):-len('.dump')]
+                if dump_name:
+                    dump_name = dump_name.lstrip('.')
+                else:
+                    dump_name = 'upload_file_minidump'
+                raw_dumps[dump_name] = os.path.join(
+                    source_path,
+                    a_dump_file_name
+                )
+            crashes.append((raw_crash, raw_dumps))
+        return crashes
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _missing_recordings(crashes):
+        """returns the pathnames of the recorded stackwalker outputs that are
+        missing for the dumps of the crashes"""
+        suffix = (
+            RecordedStackwalkerRule.required_config.recorded_output_suffix
+            .default
+        )
+        missing = []
+        for raw_crash, raw_dumps in crashes:
+            for a_dump_pathname in sorted(raw_dumps.values()):
+                recording_pathname = '%s%s' % (
+                    os.path.splitext(a_dump_pathname)[0],
+                    suffix
+                )
+                if not os.path.exists(recording_pathname):
+                    missing.append(recording_pathname)
+        return missing
+
+    #--------------------------------------------------------------------------
+    def _time_rule_sets(self, processor):
+        """wrap the 'act' method of each rule set of the processor to
+        accumulate its time.  Returns the mapping of rule set name to the
+        accumulated seconds in the order that the rule sets are applied."""
+        rule_set_times = OrderedDict()
+
+        def timed_act(name, act):
+            def act_and_time(*args, **kwargs):
+                start = time.time()
+                try:
+                    return act(*args, **kwargs)
+                finally:
+                    rule_set_times[name] += time.time() - start
+            return act_and_time
+
+        for name, a_rule_set in processor.rule_system.iteritems():
+            rule_set_times[name] = 0.0
+            a_rule_set.act = timed_act(name, a_rule_set.act)
+        return rule_set_times
+
+    #--------------------------------------------------------------------------
+    def report(
+        self,
+        number_of_crashes,
+        number_of_failures,
+        elapsed,
+        rule_set_times
+    ):
+        """returns the lines of the report"""
+        lines = [
+            'crashes processed: %d' % number_of_crashes,
+            'crashes failed: %d' % number_of_failures,
+            'elapsed seconds: %.3f' % elapsed,
+            'crashes per second: %.2f' % (
+                number_of_crashes / elapsed if elapsed else 0.0
+            ),
+            'peak memory: %.1f MB' % (
+                # ru_maxrss is in kilobytes on Linux
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+            ),
+            'rule set times:',
+        ]
+        for name, seconds in rule_set_times.iteritems():
+            lines.append(
+                '    %s: %.3f ms per crash (%.1f%%)' % (
+                    name,
+                    seconds * 1000 / number_of_crashes
+                    if number_of_crashes else 0.0,
+                    seconds * 100 / elapsed if elapsed else 0.0,
+                )
+            )
+        return lines
+
+    #--------------------------------------------------------------------------
+    def main(self):
+        crashes = self._load_crashes()
+        if not crashes:
+            self.config.logger.error(
+                'there are no raw crashes in %s',
+                self.config.source_path
+            )
+            return 1
+        missing_recordings = self._missing_recordings(crashes)
+        if missing_recordings and not self.config.get(
+            'allow_missing_recordings',
+            False
+        ):
+            self.config.logger.error(
+                'there is no recorded stackwalker output for %d dumps, the '
+                'benchmark would not measure the processing of their '
+                'stacks: %s',
+                len(missing_recordings),
+                ', '.join(missing_recordings)
+            )
+            return 1
+
+        self.config.processor_name = self.app_instance_name
+        processor = self.config.processor.processor_class(
+            self.config.processor
+        )
+        rule_set_times = self._time_rule_sets(processor)
+
+        number_of_crashes = 0
+        number_of_failures = 0
+        elapsed = 0.0
+        try:
+            for a_pass in range(self.config.number_of_passes):
+                # the rules change the raw crashes, each pass gets fresh
+                # copies made outside of the timing
+                raw_crashes = [
+                    DotDict(ujson.loads(ujson.dumps(raw_crash)))
+                    for raw_crash, x in crashes
+                ]
+                start = time.time()
+                for raw_crash, (x, raw_dumps) in zip(raw_crashes, crashes):
+                    processed_crash = processor.process_crash(
+                        raw_crash,
+                        raw_dumps,
+                        DotDict()
+                    )
+                    if not processed_crash.success:
+                        number_of_failures += 1
+                elapsed += time.time() - start
+                number_of_crashes += len(crashes)
+        finally:
+            processor.close()
+
+        for a_line in self.report(
+            number_of_crashes,
+            number_of_failures,
+            elapsed,
+            rule_set_times
+        ):
+            print a_line
+        return 0
+
+
+if __name__ == '__main__':
+    main(ProcessorBenchmarkApp)
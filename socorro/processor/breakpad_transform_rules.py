@@ -1,6 +1,9 @@
 import re
 import os
+import shlex
+import signal
 import subprocess
+import sys
 import threading
 import ujson
 import tempfile
@@ -25,6 +28,66 @@ def _create_symbol_path_str(input_str):
     return ' '.join(quoted_symbols_list)
 
 
+# the command lines are taken apart with plain string operations rather
+# than regular expressions: compiling more patterns would evict the ones
+# that other modules count on finding in the cache of the 're' module
+
+# the characters that make a command line more than a plain command
+_SHELL_SYNTAX = frozenset('|&;<>()$`*?[~#\n')
+
+_SECONDS_PER_DURATION_UNIT = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+#------------------------------------------------------------------------------
+def _without_discarded_stderr(command_line):
+    """removes a '2>/dev/null', the only redirection that can be honored
+    without a shell, from a command line.
+
+    returns a tuple (the rest of the command line, discard_stderr)"""
+    words = command_line.split(' ')
+    plain_words = []
+    discard_stderr = False
+    while words:
+        a_word = words.pop(0)
+        if a_word == '2>/dev/null':
+            discard_stderr = True
+        elif a_word == '2>' and [x for x in words if x][:1] == ['/dev/null']:
+            discard_stderr = True
+            words = words[words.index('/dev/null') + 1:]
+        else:
+            plain_words.append(a_word)
+    return ' '.join(plain_words), discard_stderr
+
+
+#------------------------------------------------------------------------------
+def _duration_in_seconds(a_duration):
+    """converts a duration of the 'timeout' command, a number with an
+    optional s, m, h or d suffix, to seconds.  A duration of 0 disables the
+    timeout and gives None."""
+    number, multiplier = a_duration, 1
+    if a_duration[-1:] in _SECONDS_PER_DURATION_UNIT:
+        number = a_duration[:-1]
+        multiplier = _SECONDS_PER_DURATION_UNIT[a_duration[-1]]
+    if not number.replace('.', '', 1).isdigit():
+        raise ValueError('unsupported timeout duration %r' % a_duration)
+    return float(number) * multiplier or None
+
+
+#------------------------------------------------------------------------------
+def _signal_number(a_signal):
+    """converts a signal of the 'timeout' command, a number or a name with
+    or without its SIG prefix, to a signal number"""
+    if a_signal.isdigit():
+        return int(a_signal)
+    signal_name = a_signal.upper()
+    if not signal_name.startswith('SIG'):
+        signal_name = 'SIG' + signal_name
+    signal_number = getattr(signal, signal_name, None)
+    if not isinstance(signal_number, int) or signal_name.startswith('SIG_'):
+        raise ValueError('unsupported timeout signal %r' % a_signal)
+    return signal_number
+
+
 #==============================================================================
 class BreakpadStackwalkerRule(Rule):
 
@@ -337,6 +400,13 @@ class ExternalProcessRule(Rule):
         default='%s_return_code' %
             required_config.command_pathname.default.split('/')[-1],
     )
+    required_config.add_option(
+        'direct_execution',
+        doc='run the external program without a shell: a leading "timeout" '
+            'command is enforced from Python and "2>/dev/null" is honored by '
+            'the processor; other command lines are still run with a shell',
+        default=False,
+    )
 
     #--------------------------------------------------------------------------
     def __init__(self, config):
@@ -360,26 +430,207 @@ class ExternalProcessRule(Rule):
             return {}
 
     #--------------------------------------------------------------------------
-    def _execute_external_process(self, command_line, processor_meta):
+    @staticmethod
+    def _command_line_to_argv(command_line):
+        """split a shell command line into the pieces needed to run it
+        without a shell.  Only a plain command is understood, optionally led
+        by a 'timeout' command and followed by '2>/dev/null'; anything else
+        raises a ValueError.
+
+        returns a tuple (argv, timeout_in_seconds or None, timeout_signal,
+        discard_stderr)"""
+        plain_command_line, discard_stderr = _without_discarded_stderr(
+            command_line
+        )
+        if _SHELL_SYNTAX.intersection(plain_command_line):
+            raise ValueError(
+                'shell syntax in the command line %r' % command_line
+            )
+        argv = shlex.split(plain_command_line)
+        if not argv or '=' in argv[0]:
+            raise ValueError(
+                'no command in the command line %r' % command_line
+            )
+        timeout = None
+        timeout_signal = signal.SIGTERM
+        if os.path.basename(argv[0]) == 'timeout':
+            argv.pop(0)
+            while argv and argv[0].startswith('-'):
+                an_option = argv.pop(0)
+                if an_option == '--':
+                    break
+                elif an_option in ('-s', '--signal') and argv:
+                    timeout_signal = _signal_number(argv.pop(0))
+                elif an_option.startswith('--signal='):
+                    timeout_signal = _signal_number(
+                        an_option[len('--signal='):]
+                    )
+                elif an_option.startswith('-s') and len(an_option) > 2:
+                    timeout_signal = _signal_number(an_option[2:])
+                else:
+                    raise ValueError(
+                        'unsupported timeout option %r' % an_option
+                    )
+            if len(argv) < 2:
+                raise ValueError(
+                    'no command in the command line %r' % command_line
+                )
+            timeout = _duration_in_seconds(argv.pop(0))
+        return argv, timeout, timeout_signal, discard_stderr
+
+    #--------------------------------------------------------------------------
+    def _execute_external_process(
+        self,
+        command_line,
+        processor_meta,
+        stdin_data=None
+    ):
+        """run the external command capturing and interpreting its stdout.
+
+        parameters:
+            command_line - the command to run
+            processor_meta - the processor_meta of the crash being processed
+            stdin_data - a string to be fed to the command through its
+                         stdin.  Only used with 'direct_execution'."""
         if self.config.get('chatty', False):
             self.config.logger.debug(
                 "External Command: %s",
                 command_line
             )
+        if self.config.get('direct_execution', False):
+            try:
+                parsed_command_line = self._command_line_to_argv(command_line)
+            except ValueError, x:
+                # a command line that cannot be run without a shell is run
+                # with one, just as without 'direct_execution'
+                self.config.logger.debug(
+                    'running the external command with a shell: %s',
+                    x
+                )
+            else:
+                return self._execute_external_process_directly(
+                    parsed_command_line,
+                    processor_meta,
+                    stdin_data
+                )
+        else:
+            stdin_data = None
+        popen_kwargs = {}
+        if stdin_data is not None:
+            popen_kwargs['stdin'] = subprocess.PIPE
         subprocess_handle = subprocess.Popen(
             command_line,
             shell=True,
-            stdout=subprocess.PIPE
+            stdout=subprocess.PIPE,
+            **popen_kwargs
         )
-        with closing(subprocess_handle.stdout):
-            external_command_output = self._interpret_external_command_output(
-                subprocess_handle.stdout,
-                processor_meta
-            )
+        feeder = self._start_feeding_stdin(subprocess_handle, stdin_data)
+        try:
+            with closing(subprocess_handle.stdout):
+                external_command_output = \
+                    self._interpret_external_command_output(
+                        subprocess_handle.stdout,
+                        processor_meta
+                    )
+            return_code = subprocess_handle.wait()
+        finally:
+            if feeder is not None:
+                feeder.join()
+        return external_command_output, return_code
 
-        return_code = subprocess_handle.wait()
+    #--------------------------------------------------------------------------
+    def _execute_external_process_directly(
+        self,
+        parsed_command_line,
+        processor_meta,
+        stdin_data=None
+    ):
+        """exec the external program without the intervening shell and
+        'timeout' processes.  If the command line had a 'timeout', the
+        program is sent the timeout signal from here when it runs too long
+        and the return code is the one the 'timeout' command would give: 137
+        when the signal is KILL, 124 otherwise.  The 'stdin_data' is fed to
+        the program through an anonymous pipe on its stdin."""
+        argv, timeout, timeout_signal, discard_stderr = parsed_command_line
+        with open(os.devnull, 'r+') as devnull:
+            subprocess_handle = subprocess.Popen(
+                argv,
+                stdin=subprocess.PIPE if stdin_data is not None else devnull,
+                stdout=subprocess.PIPE,
+                stderr=devnull if discard_stderr else None,
+                close_fds=True
+            )
+        feeder = self._start_feeding_stdin(subprocess_handle, stdin_data)
+
+        timed_out = threading.Event()
+        if timeout is not None:
+            killer = threading.Timer(
+                timeout,
+                self._kill_process,
+                args=(subprocess_handle, timeout_signal, timed_out)
+            )
+            killer.start()
+        try:
+            with closing(subprocess_handle.stdout):
+                external_command_output = \
+                    self._interpret_external_command_output(
+                        subprocess_handle.stdout,
+                        processor_meta
+                    )
+            return_code = subprocess_handle.wait()
+        finally:
+            if timeout is not None:
+                killer.cancel()
+            if feeder is not None:
+                feeder.join()
+
+        if timed_out.is_set():
+            if timeout_signal == signal.SIGKILL:
+                # the 'timeout' command is killed along with the program
+                return_code = 128 + signal.SIGKILL
+            else:
+                return_code = 124
         return external_command_output, return_code
 
+    #--------------------------------------------------------------------------
+    def _start_feeding_stdin(self, subprocess_handle, stdin_data):
+        """a separate thread feeds the pipe: the data may be larger than the
+        pipe's buffer and the program may not read it all before it begins
+        to write its own output.  Returns the thread, if any."""
+        if stdin_data is None:
+            return None
+        feeder = threading.Thread(
+            target=self._feed_stdin,
+            args=(subprocess_handle.stdin, stdin_data)
+        )
+        feeder.start()
+        return feeder
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _feed_stdin(stdin, data):
+        try:
+            stdin.write(data)
+        except IOError:
+            # the program has quit or closed its stdin without reading
+            # everything, that's its business
+            pass
+        finally:
+            try:
+                stdin.close()
+            except IOError:
+                pass
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _kill_process(subprocess_handle, timeout_signal, timed_out):
+        timed_out.set()
+        try:
+            subprocess_handle.send_signal(timeout_signal)
+        except OSError:
+            # it finished on its own just in time
+            pass
+
     #--------------------------------------------------------------------------
     @staticmethod
     def dot_save(a_mapping, key, value):
@@ -535,6 +786,12 @@ class BreakpadStackwalkerRule2015(ExternalProcessRule):
         doc='a path where temporary files may be written',
         default=tempfile.gettempdir(),
     )
+    required_config.add_option(
+        'maximum_concurrent_dumps',
+        doc='the maximum number of the dumps of a single crash that may be '
+            'stackwalked at the same time',
+        default=1,
+    )
 
     #--------------------------------------------------------------------------
     def version(self):
@@ -558,12 +815,48 @@ class BreakpadStackwalkerRule2015(ExternalProcessRule):
             os.unlink(file_pathname)
 
     #--------------------------------------------------------------------------
-    def _execute_external_process(self, command_line, processor_meta):
+    @contextmanager
+    def _raw_crash_source(self, raw_crash, crash_id):
+        """yields a tuple of the pathname that the stackwalker should use to
+        read the raw crash and the data to feed it through its stdin.  With
+        'direct_execution', the raw crash never touches the file system."""
+        if self.config.get('direct_execution', False):
+            yield '/dev/stdin', ujson.dumps(raw_crash)
+        else:
+            with self._temp_raw_crash_json_file(
+                raw_crash,
+                crash_id
+            ) as raw_crash_pathname:
+                yield raw_crash_pathname, None
+
+    #--------------------------------------------------------------------------
+    def _execute_external_process(
+        self,
+        command_line,
+        processor_meta,
+        stdin_data=None
+    ):
         stackwalker_output, return_code = super(
             BreakpadStackwalkerRule2015,
             self
-        )._execute_external_process(command_line, processor_meta)
+        )._execute_external_process(command_line, processor_meta, stdin_data)
+        return self._interpret_stackwalker_output(
+            stackwalker_output,
+            return_code,
+            command_line,
+            processor_meta
+        )
 
+    #--------------------------------------------------------------------------
+    def _interpret_stackwalker_output(
+        self,
+        stackwalker_output,
+        return_code,
+        command_line,
+        processor_meta
+    ):
+        """turn the output and return code of the stackwalker into the
+        stackwalker_data to be saved in the processed crash"""
         if not isinstance(stackwalker_output, Mapping):
             processor_meta.processor_notes.append(
                 "MDSW produced unexpected output: %s..." %
@@ -596,55 +889,145 @@ class BreakpadStackwalkerRule2015(ExternalProcessRule):
         return stackwalker_data, return_code
 
     #--------------------------------------------------------------------------
-    def _action(self, raw_crash, raw_dumps, processed_crash, processor_meta):
-        if 'additional_minidumps' not in processed_crash:
-            processed_crash.additional_minidumps = []
-        with self._temp_raw_crash_json_file(
-            raw_crash,
-            raw_crash.uuid
-        ) as raw_crash_pathname:
-            for dump_name in raw_dumps.iterkeys():
-
-                if processor_meta.quit_check:
-                    processor_meta.quit_check()
-
-                # this rule is only interested in dumps targeted for the
-                # minidump stackwalker external program.  As of the writing
-                # of this code, there is one other dump type.  The only way
-                # to differentiate these dump types is by the name of the
-                # dump.  All minidumps targeted for the stackwalker will have
-                # a name with a prefix specified in configuration:
-                if not dump_name.startswith(self.config.dump_field):
-                    # dumps not intended for the stackwalker are ignored
-                    continue
+    def _stackwalk_dump(
+        self,
+        dump_name,
+        dump_pathname,
+        raw_crash_pathname,
+        stdin_data,
+        processor_meta
+    ):
+        if self.config.chatty:
+            self.config.logger.debug(
+                "BreakpadStackwalkerRule: %s, %s",
+                dump_name,
+                dump_pathname
+            )
 
-                dump_pathname = raw_dumps[dump_name]
+        command_line = self.config.command_line.format(
+            **dict(
+                self.config,
+                dump_file_pathname=dump_pathname,
+                raw_crash_pathname=raw_crash_pathname
+            )
+        )
 
-                if self.config.chatty:
-                    self.config.logger.debug(
-                        "BreakpadStackwalkerRule: %s, %s",
-                        dump_name,
-                        dump_pathname
-                    )
+        stackwalker_data, return_code = self._execute_external_process(
+            command_line,
+            processor_meta,
+            stdin_data
+        )
+        return stackwalker_data
 
-                command_line = self.config.command_line.format(
-                    **dict(
-                        self.config,
-                        dump_file_pathname=dump_pathname,
-                        raw_crash_pathname=raw_crash_pathname
-                    )
+    #--------------------------------------------------------------------------
+    def _stackwalk_dumps_concurrently(
+        self,
+        dump_names,
+        raw_dumps,
+        raw_crash_pathname,
+        stdin_data,
+        processor_meta
+    ):
+        """run the stackwalker on several dumps at once, no more than
+        'maximum_concurrent_dumps' at a time.  Each dump collects its own
+        processor notes so that they can be reported in the same order as
+        the sequential version would have.  Just like the sequential
+        version, a dump that fails makes the whole rule fail: once all the
+        dumps are done, the exception of the first failed dump is raised
+        again.
+
+        returns a list of stackwalker_data in the order of 'dump_names'"""
+        results = [None] * len(dump_names)
+        notes = [[] for x in dump_names]
+        failures = [None] * len(dump_names)
+
+        def stackwalk(index):
+            dump_processor_meta = DotDict(processor_meta)
+            dump_processor_meta.processor_notes = notes[index]
+            try:
+                results[index] = self._stackwalk_dump(
+                    dump_names[index],
+                    raw_dumps[dump_names[index]],
+                    raw_crash_pathname,
+                    stdin_data,
+                    dump_processor_meta
+                )
+            except Exception:
+                failures[index] = sys.exc_info()
+
+        maximum = max(int(self.config.maximum_concurrent_dumps), 1)
+        for batch_start in range(0, len(dump_names), maximum):
+            if processor_meta.quit_check:
+                processor_meta.quit_check()
+            threads = [
+                threading.Thread(target=stackwalk, args=(index,))
+                for index in range(
+                    batch_start,
+                    min(batch_start + maximum, len(dump_names))
                 )
+            ]
+            for a_thread in threads:
+                a_thread.start()
+            for a_thread in threads:
+                a_thread.join()
+
+        for some_notes, a_failure in zip(notes, failures):
+            processor_meta.processor_notes.extend(some_notes)
+            if a_failure is not None:
+                raise a_failure[0], a_failure[1], a_failure[2]
+        return results
 
-                stackwalker_data, return_code = self._execute_external_process(
-                    command_line,
+    #--------------------------------------------------------------------------
+    def _action(self, raw_crash, raw_dumps, processed_crash, processor_meta):
+        if 'additional_minidumps' not in processed_crash:
+            processed_crash.additional_minidumps = []
+        # this rule is only interested in dumps targeted for the
+        # minidump stackwalker external program.  As of the writing
+        # of this code, there is one other dump type.  The only way
+        # to differentiate these dump types is by the name of the
+        # dump.  All minidumps targeted for the stackwalker will have
+        # a name with a prefix specified in configuration:
+        dump_names = [
+            dump_name for dump_name in raw_dumps.iterkeys()
+            if dump_name.startswith(self.config.dump_field)
+        ]
+        with self._raw_crash_source(
+            raw_crash,
+            raw_crash.uuid
+        ) as (raw_crash_pathname, stdin_data):
+            if (
+                self.config.get('maximum_concurrent_dumps', 1) > 1
+                and len(dump_names) > 1
+            ):
+                all_stackwalker_data = self._stackwalk_dumps_concurrently(
+                    dump_names,
+                    raw_dumps,
+                    raw_crash_pathname,
+                    stdin_data,
                     processor_meta
                 )
-
-                if dump_name == self.config.dump_field:
-                    processed_crash.update(stackwalker_data)
-                else:
-                    processed_crash.additional_minidumps.append(dump_name)
-                    processed_crash[dump_name] = stackwalker_data
+            else:
+                all_stackwalker_data = []
+                for dump_name in dump_names:
+                    if processor_meta.quit_check:
+                        processor_meta.quit_check()
+                    all_stackwalker_data.append(self._stackwalk_dump(
+                        dump_name,
+                        raw_dumps[dump_name],
+                        raw_crash_pathname,
+                        stdin_data,
+                        processor_meta
+                    ))
+
+        for dump_name, stackwalker_data in zip(
+            dump_names,
+            all_stackwalker_data
+        ):
+            if dump_name == self.config.dump_field:
+                processed_crash.update(stackwalker_data)
+            else:
+                processed_crash.additional_minidumps.append(dump_name)
+                processed_crash[dump_name] = stackwalker_data
 
         return True
 
@@ -6,8 +6,10 @@ import datetime
 import time
 import ujson
 import re
+import threading
 
 from sys import maxint
+from collections import OrderedDict
 
 from gzip import open as gzip_open
 from ujson import loads as json_loads
@@ -23,7 +25,8 @@ from socorro.lib.transform_rules import Rule
 from socorro.lib.datetimeutil import (
     UTC,
     datetimeFromISOdateString,
-    datestring_to_weekly_partition
+    datestring_to_weekly_partition,
+    utc_now
 )
 from socorro.lib.context_tools import temp_file_context
 
@@ -366,6 +369,10 @@ class OutOfMemoryBinaryRule(Rule):
 
     )
 
+    dispatch_conditions = (
+        ('raw_dumps', 'memory_report', None),
+    )
+
     #--------------------------------------------------------------------------
     def version(self):
         return '1.0'
@@ -434,10 +441,13 @@ def setup_product_id_map(config, local_config, args_unused):
         "SELECT product_name, productid, rewrite FROM "
         "product_productid_map WHERE rewrite IS TRUE"
     )
-    product_mappings = transaction(
-        execute_query_fetchall,
-        sql
-    )
+    try:
+        product_mappings = transaction(
+            execute_query_fetchall,
+            sql
+        )
+    finally:
+        database_connection.close()
     product_id_map = {}
     for product_name, productid, rewrite in product_mappings:
         product_id_map[productid] = {
@@ -454,7 +464,7 @@ class ProductRewrite(Rule):
         'database_class',
         doc="the class of the database",
         default='socorro.external.postgresql.connection_context.'
-                'ConnectionContext',
+                'ConnectionContextPooled',
         from_string_converter=str_to_python_object,
         reference_value_from='resource.postgresql',
     )
@@ -472,6 +482,10 @@ class ProductRewrite(Rule):
         setup_product_id_map
     )
 
+    dispatch_conditions = (
+        ('raw_crash', 'ProductID', None),
+    )
+
     #--------------------------------------------------------------------------
     def __init__(self, config):
         super(ProductRewrite, self).__init__(config)
@@ -518,6 +532,10 @@ class ProductRewrite(Rule):
 #==============================================================================
 class ESRVersionRewrite(Rule):
 
+    dispatch_conditions = (
+        ('raw_crash', 'ReleaseChannel', ('esr',)),
+    )
+
     #--------------------------------------------------------------------------
     def version(self):
         return '2.0'
@@ -539,6 +557,10 @@ class ESRVersionRewrite(Rule):
 #==============================================================================
 class PluginContentURL(Rule):
 
+    dispatch_conditions = (
+        ('raw_crash', 'PluginContentURL', None),
+    )
+
     #--------------------------------------------------------------------------
     def version(self):
         return '2.0'
@@ -559,6 +581,10 @@ class PluginContentURL(Rule):
 #==============================================================================
 class PluginUserComment(Rule):
 
+    dispatch_conditions = (
+        ('raw_crash', 'PluginUserComment', None),
+    )
+
     #--------------------------------------------------------------------------
     def version(self):
         return '2.0'
@@ -763,12 +789,17 @@ class TopMostFilesRule(Rule):
 
 #==============================================================================
 class MissingSymbolsRule(Rule):
+    """records the modules that had missing symbols in the weekly
+    'missing_symbols' partitions.  Rather than one insert per module, the rows
+    are buffered across crashes and written with one multirow insert per
+    partition when the buffer is full, when the flush interval passes or when
+    the rule is closed."""
     required_config = Namespace()
     required_config.add_option(
         'database_class',
         doc="the class of the database",
         default='socorro.external.postgresql.connection_context.'
-                'ConnectionContext',
+                'ConnectionContextPooled',
         from_string_converter=str_to_python_object,
         reference_value_from='resource.postgresql',
     )
@@ -780,6 +811,19 @@ class MissingSymbolsRule(Rule):
         from_string_converter=str_to_python_object,
         reference_value_from='resource.postgresql',
     )
+    required_config.add_option(
+        'missing_symbols_batch_size',
+        doc='the number of buffered rows that triggers a write to the '
+            'database',
+        default=500,
+    )
+    required_config.add_option(
+        'missing_symbols_flush_interval',
+        doc='the maximum number of seconds that rows are buffered before '
+            'they are written to the database (0 to write only when the '
+            'buffer is full or the processor shuts down)',
+        default=10,
+    )
 
     #--------------------------------------------------------------------------
     def __init__(self, config):
@@ -792,19 +836,128 @@ class MissingSymbolsRule(Rule):
         self.sql = (
             "INSERT INTO missing_symbols_%s"
             " (date_processed, debug_file, debug_id, code_file, code_id)"
-            " VALUES (%%s, %%s, %%s, %%s, %%s)"
+            " VALUES %s"
         )
+        self.values_sql = "(%s, %s, %s, %s, %s)"
+        # a mapping of partition name to an OrderedDict of rows keyed by
+        # the row with the date truncated to the day, for the rows are
+        # indistinguishable once they are in the database
+        self._buffer = {}
+        self._number_buffered = 0
+        self._buffer_lock = threading.Lock()
+        # a flush is done by only one thread at a time to preserve the order
+        # of the inserts
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._closing = False
+        self._flusher_thread = None
+        if config.missing_symbols_flush_interval:
+            self._flusher_thread = threading.Thread(
+                name='MissingSymbolsFlusher',
+                target=self._flusher_thread_func
+            )
+            self._flusher_thread.daemon = True
+            self._flusher_thread.start()
 
     #--------------------------------------------------------------------------
     def version(self):
-        return '1.0'
+        return '2.0'
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _day_of(date):
+        try:
+            return date.date()
+        except AttributeError:
+            return str(date)[:10]
+
+    #--------------------------------------------------------------------------
+    def _buffer_rows(self, partition, rows):
+        with self._buffer_lock:
+            partition_rows = self._buffer.setdefault(partition, OrderedDict())
+            for a_row in rows:
+                key = (self._day_of(a_row[0]),) + a_row[1:]
+                if key not in partition_rows:
+                    partition_rows[key] = a_row
+                    self._number_buffered += 1
+            return self._number_buffered
+
+    #--------------------------------------------------------------------------
+    @staticmethod
+    def _insert_rows(connection, sql, rows):
+        parameters = []
+        for a_row in rows:
+            parameters.extend(a_row)
+        execute_no_results(connection, sql, parameters)
+
+    #--------------------------------------------------------------------------
+    def flush(self):
+        """write all the buffered rows to the database"""
+        with self._flush_lock:
+            with self._buffer_lock:
+                buffered = self._buffer
+                self._buffer = {}
+                self._number_buffered = 0
+            for partition, partition_rows in sorted(buffered.iteritems()):
+                rows = partition_rows.values()
+                sql = self.sql % (
+                    partition,
+                    ', '.join([self.values_sql] * len(rows))
+                )
+                try:
+                    self.transaction(self._insert_rows, sql, rows)
+                except self.database.ProgrammingError:
+                    self.config.logger.warning(
+                        'missing symbols rule failed to write %d rows to '
+                        'missing_symbols_%s, writing them one at a time',
+                        len(rows),
+                        partition,
+                        exc_info=True
+                    )
+                    self._insert_rows_one_at_a_time(partition, rows)
+
+    #--------------------------------------------------------------------------
+    def _insert_rows_one_at_a_time(self, partition, rows):
+        """a single bad row fails the whole multirow insert, this writes
+        the rows of a failed batch separately so that only the bad ones are
+        lost"""
+        sql = self.sql % (partition, self.values_sql)
+        for a_row in rows:
+            try:
+                self.transaction(self._insert_rows, sql, [a_row])
+            except self.database.ProgrammingError:
+                self.config.logger.error(
+                    'missing symbols rule dropped %r from '
+                    'missing_symbols_%s',
+                    a_row,
+                    partition,
+                    exc_info=True
+                )
+
+    #--------------------------------------------------------------------------
+    def _flusher_thread_func(self):
+        while not self._closing:
+            self._flush_requested.wait(
+                self.config.missing_symbols_flush_interval
+            )
+            self._flush_requested.clear()
+            if self._closing:
+                break
+            try:
+                self.flush()
+            except Exception:
+                self.config.logger.error(
+                    'missing symbols rule flush failed',
+                    exc_info=True
+                )
 
     #--------------------------------------------------------------------------
     def _action(self, raw_crash, raw_dumps, processed_crash, processor_meta):
         try:
             date = processed_crash['date_processed']
             # update partition information based on date processed
-            sql = self.sql % datestring_to_weekly_partition(date)
+            partition = datestring_to_weekly_partition(date)
+            rows = []
             for module in processed_crash['json_dump']['modules']:
                 try:
                     # First of all, only bother if there are
@@ -816,32 +969,40 @@ class MissingSymbolsRule(Rule):
                         module['debug_file'] and
                         module['debug_id']
                     ):
-                        self.transaction(
-                            execute_no_results,
-                            sql,
-                            (
-                                date,
-                                module['debug_file'],
-                                module['debug_id'],
-                                # These two use .get() because the keys
-                                # were added later in history. If it's
-                                # non-existent (or existant and None), it
-                                # will proceed and insert as a nullable.
-                                module.get('filename'),
-                                module.get('code_id'),
-                            )
-                        )
-                except self.database.ProgrammingError:
-                    processor_meta.processor_notes.append(
-                        "WARNING: missing symbols rule failed for"
-                        " %s" % raw_crash.uuid
-                    )
+                        rows.append((
+                            date,
+                            module['debug_file'],
+                            module['debug_id'],
+                            # These two use .get() because the keys
+                            # were added later in history. If it's
+                            # non-existent (or existant and None), it
+                            # will proceed and insert as a nullable.
+                            module.get('filename'),
+                            module.get('code_id'),
+                        ))
                 except KeyError:
                     pass
         except KeyError:
             return False
+        if rows:
+            number_buffered = self._buffer_rows(partition, rows)
+            if number_buffered >= self.config.missing_symbols_batch_size:
+                if self._flusher_thread is not None:
+                    self._flush_requested.set()
+                else:
+                    self.flush()
         return True
 
+    #--------------------------------------------------------------------------
+    def close(self):
+        """stop the flusher and write whatever remains in the buffer"""
+        self._closing = True
+        if self._flusher_thread is not None:
+            self._flush_requested.set()
+            self._flusher_thread.join()
+            self._flusher_thread = None
+        self.flush()
+
 
 #==============================================================================
 class BetaVersionRule(Rule):
@@ -850,7 +1011,7 @@ class BetaVersionRule(Rule):
         'database_class',
         doc="the class of the database",
         default='socorro.external.postgresql.connection_context.'
-                'ConnectionContext',
+                'ConnectionContextPooled',
         from_string_converter=str_to_python_object,
         reference_value_from='resource.postgresql',
     )
@@ -863,6 +1024,23 @@ class BetaVersionRule(Rule):
         reference_value_from='resource.postgresql',
     )
 
+    required_config.add_option(
+        'lookup_cache_class',
+        doc='the class of the cache of version lookups',
+        default='socorro.lib.lookup_cache.LookupCache',
+        from_string_converter=str_to_python_object,
+    )
+    required_config.add_option(
+        'preload_build_days',
+        doc='the versions of the builds from this many days back are loaded '
+            'into the cache in bulk (0 for no bulk loading)',
+        default=30,
+    )
+
+    dispatch_conditions = (
+        ('processed_crash', 'release_channel', None),
+    )
+
     #--------------------------------------------------------------------------
     def __init__(self, config):
         super(BetaVersionRule, self).__init__(config)
@@ -871,19 +1049,66 @@ class BetaVersionRule(Rule):
             config,
             database,
         )
-        self._versions_data_cache = {}
+        self._versions_data_cache = config.lookup_cache_class(
+            config,
+            self._lookup_version,
+            self._get_recent_versions if config.preload_build_days else None
+        )
 
     #--------------------------------------------------------------------------
     def version(self):
         return '1.0'
 
     #--------------------------------------------------------------------------
-    def _get_version_data(self, product, version, release_channel, build_id):
-        key = '%s:%s:%s:%s' % (product, version, release_channel, build_id)
+    @staticmethod
+    def _make_key(product, version, release_channel, build_id):
+        # the database compares these case insensitively
+        return tuple(
+            x.lower() if isinstance(x, basestring) else x
+            for x in (product, version, release_channel)
+        ) + (build_id,)
 
-        if key in self._versions_data_cache:
-            return self._versions_data_cache[key]
+    #--------------------------------------------------------------------------
+    def _get_recent_versions(self):
+        """returns the (key, version_string) pairs of the recent builds"""
+        sql = """
+            SELECT
+                pv.product_name,
+                pv.release_version,
+                pv.build_type,
+                pvb.build_id,
+                pv.version_string
+            FROM product_versions pv
+                JOIN product_version_builds pvb ON
+                    (pv.product_version_id = pvb.product_version_id)
+            WHERE pv.build_date >= %(since)s
+        """
+        params = {
+            'since': (
+                utc_now() -
+                datetime.timedelta(days=self.config.preload_build_days)
+            ).date(),
+        }
+        results = self.transaction(
+            execute_query_fetchall,
+            sql,
+            params
+        )
+        for product, version, build_type, build_id, real_version in results:
+            yield (
+                self._make_key(product, version, build_type, int(build_id)),
+                real_version
+            )
+
+    #--------------------------------------------------------------------------
+    def _get_version_data(self, product, version, release_channel, build_id):
+        return self._versions_data_cache.get(
+            self._make_key(product, version, release_channel, build_id)
+        )
 
+    #--------------------------------------------------------------------------
+    def _lookup_version(self, key):
+        product, version, release_channel, build_id = key
         sql = """
             SELECT
                 pv.version_string
@@ -906,10 +1131,10 @@ class BetaVersionRule(Rule):
             sql,
             params
         )
+        real_version = None
         for real_version, in results:
-            self._versions_data_cache[key] = real_version
-
-        return self._versions_data_cache.get(key)
+            pass
+        return real_version
 
     #--------------------------------------------------------------------------
     def _predicate(self, raw_crash, raw_dumps, processed_crash, proc_meta):
@@ -954,6 +1179,10 @@ class BetaVersionRule(Rule):
             return False
         return True
 
+    #--------------------------------------------------------------------------
+    def close(self):
+        self._versions_data_cache.close()
+
 
 #==============================================================================
 class FennecBetaError20150430(Rule):
@@ -981,7 +1210,7 @@ class OSPrettyVersionRule(Rule):
         'database_class',
         doc="the class of the database",
         default='socorro.external.postgresql.connection_context.'
-                'ConnectionContext',
+                'ConnectionContextPooled',
         from_string_converter=str_to_python_object,
         reference_value_from='resource.postgresql',
     )
@@ -993,6 +1222,12 @@ class OSPrettyVersionRule(Rule):
         from_string_converter=str_to_python_object,
         reference_value_from='resource.postgresql',
     )
+    required_config.add_option(
+        'lookup_cache_class',
+        doc='the class of the cache of Windows version lookups',
+        default='socorro.lib.lookup_cache.LookupCache',
+        from_string_converter=str_to_python_object,
+    )
 
     #--------------------------------------------------------------------------
     def __init__(self, config):
@@ -1002,28 +1237,52 @@ class OSPrettyVersionRule(Rule):
             config,
             database,
         )
-        self._windows_versions = self._get_windows_versions()
+        self._windows_versions = config.lookup_cache_class(
+            config,
+            self._lookup_windows_version,
+            self._get_windows_versions
+        )
 
     #--------------------------------------------------------------------------
     def version(self):
         return '1.0'
 
     #--------------------------------------------------------------------------
-    def _get_windows_versions(self):
+    def _get_windows_versions(self, major=None, minor=None):
+        """returns the ('major.minor', windows_version_name) pairs of all the
+        Windows versions or just those of the given major and minor version
+        """
         sql = """
             SELECT windows_version_name, major_version, minor_version
             FROM windows_versions
         """
-        results = self.transaction(
-            execute_query_fetchall,
-            sql,
-        )
-        versions = {}
-        for (version, major, minor) in results:
-            key = '%s.%s' % (major, minor)
-            versions[key] = version
+        if major is None:
+            results = self.transaction(
+                execute_query_fetchall,
+                sql,
+            )
+        else:
+            sql += """
+            WHERE major_version = %(major)s
+            AND minor_version = %(minor)s
+            """
+            results = self.transaction(
+                execute_query_fetchall,
+                sql,
+                {'major': major, 'minor': minor}
+            )
+        return [
+            ('%s.%s' % (major, minor), version)
+            for (version, major, minor) in results
+        ]
 
-        return versions
+    #--------------------------------------------------------------------------
+    def _lookup_windows_version(self, key):
+        major, minor = key.split('.')
+        for a_key, version in self._get_windows_versions(major, minor):
+            if a_key == key:
+                return version
+        return None
 
     #--------------------------------------------------------------------------
     def _get_pretty_os_version(self, processed_crash):
@@ -1053,10 +1312,9 @@ class OSPrettyVersionRule(Rule):
         if processed_crash.os_name.lower().startswith('windows'):
             # Get corresponding Windows version.
             key = '%s.%s' % (major_version, minor_version)
-            if key in self._windows_versions:
-                pretty_name = self._windows_versions[key]
-            else:
-                pretty_name = 'Windows Unknown'
+            pretty_name = (
+                self._windows_versions.get(key) or 'Windows Unknown'
+            )
 
         elif processed_crash.os_name == 'Mac OS X':
             if (
@@ -1078,6 +1336,10 @@ class OSPrettyVersionRule(Rule):
         )
         return True
 
+    #--------------------------------------------------------------------------
+    def close(self):
+        self._windows_versions.close()
+
 
 #==============================================================================
 class ThemePrettyNameRule(Rule):
@@ -1090,6 +1352,10 @@ class ThemePrettyNameRule(Rule):
 
     Must be run after the Addons Rule."""
 
+    dispatch_conditions = (
+        ('processed_crash', 'addons', None),
+    )
+
     #--------------------------------------------------------------------------
     def __init__(self, config):
         super(ThemePrettyNameRule, self).__init__(config)
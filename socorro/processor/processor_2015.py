@@ -240,6 +240,10 @@ class Processor2015(RequiredConfig):
             # raised, call it a success.
             processed_crash.success = True
 
+            if 'rule_timings' in processor_meta_data:
+                # the breakdown gathered by a ProcessorMetaRuleTimer
+                processed_crash.rule_timings = processor_meta_data.rule_timings
+
         except Exception, x:
             self.config.logger.warning(
                 'Error while processing %s: %s',
@@ -8,6 +8,7 @@
 import os
 import sys
 import collections
+import contextlib
 
 import raven
 from configman import Namespace
@@ -18,7 +19,9 @@ from socorro.app.fetch_transform_save_app import (
     main
 )
 from socorro.external.crashstorage_base import CrashIDNotFound
+from socorro.lib.process_pool_task_manager import ProcessPoolTaskManager
 from socorro.lib.util import DotDict
+from socorro.lib.staged_pipeline import Stage, StagedPipeline
 from socorro.external.fs.crashstorage import FSDatedPermanentStorage
 
 
@@ -68,6 +71,48 @@ class ProcessorApp(FetchTransformSaveWithSeparateNewCrashSourceApp):
     # signature generation stuff from the database.
     ###########################################################################
 
+    #--------------------------------------------------------------------------
+    # pipeline namespace
+    #     this namespace is for config parameters of the optional staged
+    #     pipeline.  When enabled, fetching, processing and saving each get
+    #     their own pool of threads so the processing of crashes never waits
+    #     on the network i/o of the other two.
+    #--------------------------------------------------------------------------
+    required_config.namespace('pipeline')
+    required_config.pipeline.add_option(
+        'use_staged_pipeline',
+        doc='fetch, process and save crashes in separate pools of threads '
+            '(not with the ProcessPoolTaskManager)',
+        default=False,
+    )
+    required_config.pipeline.add_option(
+        'number_of_fetch_threads',
+        doc='the number of threads fetching crashes from the source',
+        default=4,
+    )
+    required_config.pipeline.add_option(
+        'number_of_process_threads',
+        doc='the number of threads running the processor_class',
+        default=2,
+    )
+    required_config.pipeline.add_option(
+        'number_of_save_threads',
+        doc='the number of threads saving crashes to the destination',
+        default=4,
+    )
+    required_config.pipeline.add_option(
+        'maximum_stage_queue_size',
+        doc='the maximum number of crashes waiting in front of each stage',
+        default=8,
+    )
+    required_config.pipeline.add_option(
+        'metrics_class',
+        default='socorro.external.metrics_base.MetricsBase',
+        doc='the class that implements metrics for queue depth and stage '
+            'duration',
+        from_string_converter=class_converter
+    )
+
     required_config.namespace('sentry')
     required_config.sentry.add_option(
         'dsn',
@@ -84,6 +129,13 @@ class ProcessorApp(FetchTransformSaveWithSeparateNewCrashSourceApp):
             "destination.crashstorage_class": FSDatedPermanentStorage,
         }
 
+    #--------------------------------------------------------------------------
+    def __init__(self, config):
+        super(ProcessorApp, self).__init__(config)
+        # the staged pipeline, if configured, is created along with the
+        # processor in '_setup_source_and_destination'
+        self.pipeline = None
+
     #--------------------------------------------------------------------------
     def _transform(self, crash_id):
         """this implementation is the framework on how a raw crash is
@@ -91,6 +143,36 @@ class ProcessorApp(FetchTransformSaveWithSeparateNewCrashSourceApp):
         a key to fetch the raw crash from the 'source', the conversion funtion
         implemented by the 'processor_class' is applied, the
         processed crash is saved to the 'destination'"""
+        crash = self._fetch_crash(crash_id)
+        if crash is None:
+            return
+        try:
+            crash = self._process_crash(crash)
+            self._save_crash(crash)
+        finally:
+            # earlier, we created the dumps as files on the file system,
+            # we need to clean up after ourselves.
+            self._cleanup_dumps(crash['dumps'])
+
+    #--------------------------------------------------------------------------
+    def transform(
+        self,
+        crash_id,
+        finished_func=(lambda: None),
+    ):
+        """when the staged pipeline is in use, the crash is handed to the
+        pipeline's fetch stage and this method returns.  The pipeline calls
+        the 'finished_func' once the crash is saved or abandoned.  This call
+        blocks while the fetch stage's queue is full."""
+        if self.pipeline is None:
+            return super(ProcessorApp, self).transform(crash_id, finished_func)
+        self.pipeline.submit(crash_id, crash_id, finished_func)
+
+    #--------------------------------------------------------------------------
+    def _fetch_crash(self, crash_id):
+        """the fetch stage: load the raw crash, the dumps and any previously
+        processed crash from the 'source'.  Returns a mapping of those parts
+        or None if the crash had to be rejected."""
         try:
             raw_crash = self.source.get_raw_crash(crash_id)
             dumps = self.source.get_raw_dumps_as_files(crash_id)
@@ -99,7 +181,7 @@ class ProcessorApp(FetchTransformSaveWithSeparateNewCrashSourceApp):
                 crash_id,
                 'this crash cannot be found in raw crash storage'
             )
-            return
+            return None
         except Exception, x:
             self.config.logger.warning(
                 'error loading crash %s',
@@ -110,7 +192,7 @@ class ProcessorApp(FetchTransformSaveWithSeparateNewCrashSourceApp):
                 crash_id,
                 'error in loading: %s' % x
             )
-            return
+            return None
 
         try:
             processed_crash = self.source.get_unredacted_processed(
@@ -119,16 +201,30 @@ class ProcessorApp(FetchTransformSaveWithSeparateNewCrashSourceApp):
         except CrashIDNotFound:
             processed_crash = DotDict()
 
-        try:
-            if 'uuid' not in raw_crash:
-                raw_crash.uuid = crash_id
-            processed_crash = (
-                self.processor.process_crash(
-                    raw_crash,
-                    dumps,
-                    processed_crash,
-                )
+        if 'uuid' not in raw_crash:
+            raw_crash.uuid = crash_id
+        return {
+            'crash_id': crash_id,
+            'raw_crash': raw_crash,
+            'dumps': dumps,
+            'processed_crash': processed_crash,
+        }
+
+    #--------------------------------------------------------------------------
+    def _process_crash(self, crash):
+        """the process stage: apply the 'processor_class' algorithm"""
+        with self._errors_reported_to_sentry(crash['crash_id']):
+            crash['processed_crash'] = self.processor.process_crash(
+                crash['raw_crash'],
+                crash['dumps'],
+                crash['processed_crash'],
             )
+        return crash
+
+    #--------------------------------------------------------------------------
+    def _save_crash(self, crash):
+        """the save stage: send the processed crash to the 'destination'"""
+        with self._errors_reported_to_sentry(crash['crash_id']):
             """ bug 866973 - save_raw_and_processed() instead of just
                 save_processed().  The raw crash may have been modified
                 by the processor rules.  The individual crash storage
@@ -136,12 +232,51 @@ class ProcessorApp(FetchTransformSaveWithSeparateNewCrashSourceApp):
                 or not.
             """
             self.destination.save_raw_and_processed(
-                raw_crash,
+                crash['raw_crash'],
                 None,
-                processed_crash,
-                crash_id
+                crash['processed_crash'],
+                crash['crash_id']
             )
-            self.config.logger.info('saved - %s', crash_id)
+            self.config.logger.info('saved - %s', crash['crash_id'])
+        return crash
+
+    #--------------------------------------------------------------------------
+    def _process_crash_and_cleanup(self, crash):
+        """the process stage of the pipeline.  The dumps are no longer needed
+        once the processor is done with them, so they are removed right here
+        rather than after the save."""
+        try:
+            return self._process_crash(crash)
+        finally:
+            self._cleanup_dumps(crash['dumps'])
+
+    #--------------------------------------------------------------------------
+    def _cleanup_dumps(self, dumps):
+        try:
+            # dumps held in memory files are released by closing them
+            dumps.close()
+            return
+        except AttributeError:
+            # these dumps are ordinary files
+            pass
+        for a_dump_pathname in dumps.itervalues():
+            try:
+                if "TEMPORARY" in a_dump_pathname:
+                    os.unlink(a_dump_pathname)
+            except OSError, x:
+                # the file does not actually exist
+                self.config.logger.info(
+                    'deletion of dump failed: %s',
+                    x,
+                )
+
+    #--------------------------------------------------------------------------
+    @contextlib.contextmanager
+    def _errors_reported_to_sentry(self, crash_id):
+        """any exception raised within this context is sent to Sentry, if
+        configured, before being reraised"""
+        try:
+            yield
         except Exception as exception:
             # Immediately capture this as local variables.
             # During this error handling we're going to be using other
@@ -189,19 +324,60 @@ class ProcessorApp(FetchTransformSaveWithSeparateNewCrashSourceApp):
             # is going to point to *this* line (right after this comment)
             # rather than the actual error where it originally happened.
             raise exc_type, exc_value, exc_tb
-        finally:
-            # earlier, we created the dumps as files on the file system,
-            # we need to clean up after ourselves.
-            for a_dump_pathname in dumps.itervalues():
-                try:
-                    if "TEMPORARY" in a_dump_pathname:
-                        os.unlink(a_dump_pathname)
-                except OSError, x:
-                    # the file does not actually exist
-                    self.config.logger.info(
-                        'deletion of dump failed: %s',
-                        x,
-                    )
+
+    #--------------------------------------------------------------------------
+    def _setup_pipeline(self):
+        """when configured, build the staged pipeline of fetch, process and
+        save.  Its threads start with the first crash submitted."""
+        pipeline_config = self.config.pipeline
+        if not pipeline_config.use_staged_pipeline:
+            self.pipeline = None
+            return
+        producer_consumer_class = self.config.get(
+            'producer_consumer',
+            {}
+        ).get('producer_consumer_class')
+        if (
+            isinstance(producer_consumer_class, type) and
+            issubclass(producer_consumer_class, ProcessPoolTaskManager)
+        ):
+            # a worker process would report its crash as done, and the main
+            # process acknowledge it, as soon as the crash is queued in the
+            # pipeline rather than once it is saved
+            raise ValueError(
+                'use_staged_pipeline cannot be used with the '
+                'ProcessPoolTaskManager'
+            )
+        metrics = pipeline_config.metrics_class(pipeline_config)
+        self.pipeline = StagedPipeline([
+            Stage(
+                'fetch',
+                self._fetch_crash,
+                pipeline_config.number_of_fetch_threads,
+                pipeline_config.maximum_stage_queue_size,
+                self.config.logger,
+                metrics,
+                'processor.pipeline',
+            ),
+            Stage(
+                'process',
+                self._process_crash_and_cleanup,
+                pipeline_config.number_of_process_threads,
+                pipeline_config.maximum_stage_queue_size,
+                self.config.logger,
+                metrics,
+                'processor.pipeline',
+            ),
+            Stage(
+                'save',
+                self._save_crash,
+                pipeline_config.number_of_save_threads,
+                pipeline_config.maximum_stage_queue_size,
+                self.config.logger,
+                metrics,
+                'processor.pipeline',
+            ),
+        ])
 
     #--------------------------------------------------------------------------
     def _setup_source_and_destination(self):
@@ -227,10 +403,40 @@ class ProcessorApp(FetchTransformSaveWithSeparateNewCrashSourceApp):
             self.config.processor,
             self.quit_check
         )
+        self._setup_pipeline()
+
+    #--------------------------------------------------------------------------
+    def _setup_worker_process(self):
+        """in addition to the source and destination, each worker process
+        needs its own processor: the rules hold their own database
+        connections."""
+        super(ProcessorApp, self)._setup_worker_process()
+        self.processor = self.config.processor.processor_class(
+            self.config.processor,
+            self.quit_check
+        )
+        self._setup_pipeline()
+
+    #--------------------------------------------------------------------------
+    def _close_worker_process(self):
+        if self.pipeline is not None:
+            self.pipeline.close()
+        super(ProcessorApp, self)._close_worker_process()
+        try:
+            self.processor.close()
+        except AttributeError:
+            # the processor implementation does not have a close method
+            pass
 
     #--------------------------------------------------------------------------
     def close(self):
         """when  the processor shutsdown, this function cleans up"""
+        if self.pipeline is not None:
+            # finish everything already in the pipeline before the
+            # processor and storage go away
+            self.pipeline.close()
+        # the crashes finished above are acknowledged as their sources close
+        super(ProcessorApp, self).close()
         try:
             self.companion_process.close()
         except AttributeError:
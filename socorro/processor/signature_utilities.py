@@ -3,6 +3,7 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import re
+import time
 
 import ujson
 from itertools import islice
@@ -10,6 +11,7 @@ from itertools import islice
 from configman import Namespace, RequiredConfig
 from configman.converters import class_converter
 
+from socorro.lib.lru_cache import LRUCache
 from socorro.lib.transform_rules import Rule
 
 from socorro import siglists
@@ -78,6 +80,35 @@ class CSignatureToolBase(SignatureTool):
         doc="remove function arguments during normalization",
         reference_value_from='resource.signature'
     )
+    required_config.add_option(
+        'normalization_cache_size',
+        default=50000,
+        doc="the number of normalized function names to remember (0 to "
+            "disable)",
+        reference_value_from='resource.signature'
+    )
+    required_config.add_option(
+        'classification_cache_size',
+        default=50000,
+        doc="the number of frame signature classifications to remember (0 to "
+            "disable)",
+        reference_value_from='resource.signature'
+    )
+    required_config.add_option(
+        'metrics_class',
+        default='socorro.external.metrics_base.MetricsBase',
+        doc='the class that implements metrics for the normalization and '
+            'classification cache counters',
+        from_string_converter=class_converter,
+        reference_value_from='resource.signature'
+    )
+    required_config.add_option(
+        'cache_metrics_interval',
+        default=60,
+        doc='the minimum number of seconds between reports of the cache '
+            'counters',
+        reference_value_from='resource.signature'
+    )
 
     hang_prefixes = {
         -1: "hang",
@@ -96,19 +127,37 @@ class CSignatureToolBase(SignatureTool):
         self.fixup_space = re.compile(r' (?=[\*&,])')
         self.fixup_comma = re.compile(r',(?! )')
 
+        # the same function names recur in crash after crash, so their
+        # normalized forms and classifications are kept in caches
+        self._normalization_cache = LRUCache(
+            config.setdefault('normalization_cache_size', 50000)
+        )
+        self._classification_cache = LRUCache(
+            config.setdefault('classification_cache_size', 50000)
+        )
+        metrics_class = config.get('metrics_class')
+        self.metrics = metrics_class(config) if metrics_class else None
+        self._last_cache_metrics_report = time.time()
+        # the siglists the classifier was compiled from
+        self._classifier_source = None
+        self._frame_classifier_re = None
+        self._sentinel_conditions = None
+
     #--------------------------------------------------------------------------
-    @staticmethod
-    def _is_exception(
-        exception_list,
-        remaining_original_line,
-        line_up_to_current_position
-    ):
-        for an_exception in exception_list:
-            if remaining_original_line.startswith(an_exception):
-                return True
-            if line_up_to_current_position.endswith(an_exception):
-                return True
-        return False
+    _delimiter_re_cache = {}
+
+    @classmethod
+    def _delimiter_re(cls, open_string, close_string):
+        try:
+            return cls._delimiter_re_cache[(open_string, close_string)]
+        except KeyError:
+            delimiter_re = re.compile(
+                '[%s%s]' % (re.escape(open_string), re.escape(close_string))
+            )
+            cls._delimiter_re_cache[(open_string, close_string)] = (
+                delimiter_re
+            )
+            return delimiter_re
 
     #--------------------------------------------------------------------------
     def _collapse(
@@ -121,40 +170,104 @@ class CSignatureToolBase(SignatureTool):
         exception_substring_list=(),  # list of exceptions that shouldn't collapse
     ):
         """this method takes a string representing a C/C++ function signature
-        and replaces anything between to possibly nested delimiters"""
+        and replaces anything between to possibly nested delimiters.  Only the
+        delimiters are visited; the runs of characters between them are
+        copied whole."""
         target_counter = 0
         collapsed_list = []
         exception_mode = False
+        run_start = 0
 
-        def append_if_not_in_collapse_mode(a_character):
+        delimiters = self._delimiter_re(open_string, close_string)
+        for a_match in delimiters.finditer(function_signature_str):
+            index = a_match.start()
             if not target_counter:
-                collapsed_list.append(a_character)
-
-        for index, a_character in enumerate(function_signature_str):
-            if a_character == open_string:
-                if self._is_exception(
-                    exception_substring_list,
-                    function_signature_str[index + 1:],
-                    function_signature_str[:index]
+                collapsed_list.append(function_signature_str[run_start:index])
+            run_start = index + 1
+            if a_match.group() == open_string:
+                if any(
+                    function_signature_str.startswith(an_exception, index + 1)
+                    or function_signature_str.endswith(an_exception, 0, index)
+                    for an_exception in exception_substring_list
                 ):
                     exception_mode = True
-                    append_if_not_in_collapse_mode(a_character)
+                    if not target_counter:
+                        collapsed_list.append(open_string)
                     continue
-                append_if_not_in_collapse_mode(replacement_open_string)
+                if not target_counter:
+                    collapsed_list.append(replacement_open_string)
                 target_counter += 1
-            elif a_character == close_string:
-                if exception_mode:
-                    append_if_not_in_collapse_mode(a_character)
-                    exception_mode = False
-                else:
-                    target_counter -= 1
-                    append_if_not_in_collapse_mode(replacement_close_string)
+            elif exception_mode:
+                if not target_counter:
+                    collapsed_list.append(close_string)
+                exception_mode = False
             else:
-                append_if_not_in_collapse_mode(a_character)
+                target_counter -= 1
+                if not target_counter:
+                    collapsed_list.append(replacement_close_string)
+        if not target_counter:
+            collapsed_list.append(function_signature_str[run_start:])
 
         edited_function = ''.join(collapsed_list)
         return edited_function
 
+    #--------------------------------------------------------------------------
+    def _normalize_function(self, function):
+        """returns a tuple: the function with templates (and optionally
+        arguments) collapsed and, unless the function must have its line
+        number appended, its fully normalized form"""
+        function = self._collapse(
+            function,
+            '<',
+            '<',
+            '>',
+            'T>',
+            ('name omitted', 'IPC::ParamTraits')
+        )
+        if self.config.collapse_arguments:
+            function = self._collapse(
+                function,
+                '(',
+                '',
+                ')',
+                '',
+                ('anonymous namespace', 'operator')
+            )
+        if self.signatures_with_line_numbers_re.match(function):
+            return function, None
+        return function, self._fixup_function(function)
+
+    #--------------------------------------------------------------------------
+    def _fixup_function(self, function):
+        # Remove spaces before all stars, ampersands, and commas
+        function = self.fixup_space.sub('', function)
+        # Ensure a space after commas
+        function = self.fixup_comma.sub(', ', function)
+        return function
+
+    #--------------------------------------------------------------------------
+    def normalization_cache_stats(self):
+        """returns a mapping of the cache counters suitable for a metrics
+        'capture_stats' call"""
+        stats = self._normalization_cache.stats('normalization_cache')
+        stats.update(
+            self._classification_cache.stats('classification_cache')
+        )
+        return stats
+
+    #--------------------------------------------------------------------------
+    def _report_cache_metrics(self):
+        if self.metrics is None:
+            return
+        now = time.time()
+        if (
+            now - self._last_cache_metrics_report <
+            self.config.get('cache_metrics_interval', 60)
+        ):
+            return
+        self._last_cache_metrics_report = now
+        self.metrics.capture_stats(self.normalization_cache_stats())
+
     #--------------------------------------------------------------------------
     def normalize_signature(
         self,
@@ -178,31 +291,17 @@ class CSignatureToolBase(SignatureTool):
         if normalized is not None:
             return normalized
         if function:
-            function = self._collapse(
-                function,
-                '<',
-                '<',
-                '>',
-                'T>',
-                ('name omitted', 'IPC::ParamTraits')
-            )
-            if self.config.collapse_arguments:
-                function = self._collapse(
+            collapsed_function, normalized_function = (
+                self._normalization_cache.get(
                     function,
-                    '(',
-                    '',
-                    ')',
-                    '',
-                    ('anonymous namespace', 'operator')
+                    self._normalize_function
                 )
-
-            if self.signatures_with_line_numbers_re.match(function):
-                function = "%s:%s" % (function, line)
-            # Remove spaces before all stars, ampersands, and commas
-            function = self.fixup_space.sub('', function)
-            # Ensure a space after commas
-            function = self.fixup_comma.sub(', ', function)
-            return function
+            )
+            if normalized_function is not None:
+                return normalized_function
+            return self._fixup_function(
+                "%s:%s" % (collapsed_function, line)
+            )
         #if source is not None and source_line is not None:
         if file and line:
             filename = file.rstrip('/\\')
@@ -217,6 +316,74 @@ class CSignatureToolBase(SignatureTool):
             module = ''  # might have been None
         return '%s@%s' % (module, module_offset)
 
+    #--------------------------------------------------------------------------
+    def _compile_classifier(self):
+        """combine the irrelevant, trim dll and prefix siglists into a single
+        regular expression.  Each list sits in its own optional lookahead, so
+        one match reports every list that a frame signature matches.  The
+        classifier is recompiled if any of the siglists are replaced."""
+        classifier_source = (
+            self.irrelevant_signature_re,
+            self.trim_dll_signature_re,
+            self.prefix_signature_re,
+            tuple(self.signature_sentinels),
+        )
+        if self._classifier_source == classifier_source:
+            return
+        self._frame_classifier_re = re.compile(''.join(
+            '(?:(?=(?P<%s>(?:%s)))|)' % (a_label, a_regex.pattern)
+            for a_label, a_regex in (
+                ('irrelevant', self.irrelevant_signature_re),
+                ('trim_dll', self.trim_dll_signature_re),
+                ('prefix', self.prefix_signature_re),
+            )
+        ))
+        # a mapping of each sentinel to its conditions, None meaning that
+        # the sentinel is unconditional
+        sentinel_conditions = {}
+        for a_sentinel in self.signature_sentinels:
+            condition_fn = None
+            if type(a_sentinel) == tuple:
+                a_sentinel, condition_fn = a_sentinel
+            sentinel_conditions.setdefault(a_sentinel, []).append(condition_fn)
+        self._sentinel_conditions = sentinel_conditions
+        self._classification_cache.clear()
+        self._classifier_source = classifier_source
+
+    #--------------------------------------------------------------------------
+    def _classify_frame(self, a_signature):
+        """returns a tuple: True if the frame signature is irrelevant, the
+        signature to use for the frame, True if that signature was trimmed to
+        just a dll name, and True if that signature is a prefix"""
+        labels = self._frame_classifier_re.match(a_signature)
+        if labels.group('irrelevant') is not None:
+            return True, a_signature, False, False
+        is_trimmed = labels.group('trim_dll') is not None
+        if is_trimmed:
+            # rewrite it to remove all but the module name.
+            a_signature = a_signature.split('@')[0]
+            labels = self._frame_classifier_re.match(a_signature)
+        return (
+            False,
+            a_signature,
+            is_trimmed,
+            labels.group('prefix') is not None
+        )
+
+    #--------------------------------------------------------------------------
+    def _find_sentinel(self, source_list):
+        """returns the index of the first frame that is a sentinel whose
+        condition is met, or None"""
+        for index, a_signature in enumerate(source_list):
+            try:
+                conditions = self._sentinel_conditions[a_signature]
+            except KeyError:
+                continue
+            for condition_fn in conditions:
+                if condition_fn is None or condition_fn(source_list):
+                    return index
+        return None
+
     #--------------------------------------------------------------------------
     def _do_generate(self,
                      source_list,
@@ -231,47 +398,41 @@ class CSignatureToolBase(SignatureTool):
         The signature is a ' | ' separated string of frame names.
         """
         signature_notes = []
+        self._compile_classifier()
 
         # shorten source_list to the first signatureSentinel
-        sentinel_locations = []
-        for a_sentinel in self.signature_sentinels:
-            if type(a_sentinel) == tuple:
-                a_sentinel, condition_fn = a_sentinel
-                if not condition_fn(source_list):
-                    continue
-            try:
-                sentinel_locations.append(source_list.index(a_sentinel))
-            except ValueError:
-                pass
-        if sentinel_locations:
-            source_list = source_list[min(sentinel_locations):]
+        sentinel_location = self._find_sentinel(source_list)
+        if sentinel_location is not None:
+            source_list = source_list[sentinel_location:]
 
         # Get all the relevant frame signatures.
         new_signature_list = []
         for a_signature in source_list:
+            is_irrelevant, a_signature, is_trimmed, is_prefix = (
+                self._classification_cache.get(
+                    a_signature,
+                    self._classify_frame
+                )
+            )
             # If the signature matches the irrelevant signatures regex,
             # skip to the next frame.
-            if self.irrelevant_signature_re.match(a_signature):
+            if is_irrelevant:
                 continue
 
-            # If the signature matches the trim dll signatures regex,
-            # rewrite it to remove all but the module name.
-            if self.trim_dll_signature_re.match(a_signature):
-                a_signature = a_signature.split('@')[0]
-
-                # If this trimmed DLL signature is the same as the previous
-                # frame's, we do not want to add it.
-                if (
-                    new_signature_list and
-                    a_signature == new_signature_list[-1]
-                ):
-                    continue
+            # If this trimmed DLL signature is the same as the previous
+            # frame's, we do not want to add it.
+            if (
+                is_trimmed and
+                new_signature_list and
+                a_signature == new_signature_list[-1]
+            ):
+                continue
 
             new_signature_list.append(a_signature)
 
             # If the signature does not match the prefix signatures regex,
             # then it is the last one we add to the list.
-            if not self.prefix_signature_re.match(a_signature):
+            if not is_prefix:
                 break
 
         # Add a special marker for hang crash reports.
@@ -297,8 +458,40 @@ class CSignatureToolBase(SignatureTool):
                 except IndexError:
                     signature = "EMPTY: no frame data available"
 
+        self._report_cache_metrics()
         return signature, signature_notes
 
+    #--------------------------------------------------------------------------
+    def generate_many(
+        self,
+        list_of_frame_lists,
+        hang_type=0,
+        crashed_thread=None,
+        delimiter=' | ',
+        maximum_frames_to_consider=None,
+    ):
+        """a bulk version of 'generate' for tools that regenerate signatures
+        for many crashes at once.  Each element of 'list_of_frame_lists' is a
+        sequence of frames from a crashing thread: either frame mappings as
+        found in the jsonMDSW output or already normalized frame signatures.
+        This is a generator yielding a tuple of signature and signature notes
+        for each frame list in the same order."""
+        for a_frame_list in list_of_frame_lists:
+            source_list = [
+                a_frame if isinstance(a_frame, basestring)
+                else self.normalize_signature(**a_frame)
+                for a_frame in islice(
+                    a_frame_list,
+                    maximum_frames_to_consider
+                )
+            ]
+            yield self.generate(
+                source_list,
+                hang_type,
+                crashed_thread,
+                delimiter
+            )
+
 
 #==============================================================================
 class CSignatureTool(CSignatureToolBase):
@@ -585,6 +778,10 @@ class AbortSignature(Rule):
     """To satisfy Bug 803779, this rule will modify the signature to
     tag Abort crashes"""
 
+    dispatch_conditions = (
+        ('raw_crash', 'AbortMessage', None),
+    )
+
     #--------------------------------------------------------------------------
     def version(self):
         return '1.0'
@@ -711,6 +908,10 @@ class SignatureShutdownTimeout(Rule):
     """replaces the signature if there is a shutdown timeout message in the
     crash"""
 
+    dispatch_conditions = (
+        ('raw_crash', 'AsyncShutdownTimeout', None),
+    )
+
     def version(self):
         return '1.0'
 
@@ -751,6 +952,10 @@ class SignatureShutdownTimeout(Rule):
 class SignatureJitCategory(Rule):
     """replaces the signature if there is a JIT classification in the crash"""
 
+    dispatch_conditions = (
+        ('processed_crash', 'classifications', None),
+    )
+
     #--------------------------------------------------------------------------
     def version(self):
         return '1.0'
@@ -778,6 +983,10 @@ class SignatureJitCategory(Rule):
 class SignatureIPCChannelError(Rule):
     """replaces the signature if there is a IPC channel error in the crash"""
 
+    dispatch_conditions = (
+        ('raw_crash', 'ipc_channel_error', None),
+    )
+
     #--------------------------------------------------------------------------
     def version(self):
         return '1.0'
@@ -810,6 +1019,10 @@ class SignatureIPCChannelError(Rule):
 class SignatureIPCMessageName(Rule):
     """augments the signature if there is a IPC message name in the crash"""
 
+    dispatch_conditions = (
+        ('raw_crash', 'IPCMessageName', None),
+    )
+
     #--------------------------------------------------------------------------
     def version(self):
         return '1.0'
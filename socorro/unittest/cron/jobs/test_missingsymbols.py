@@ -83,6 +83,10 @@ class TestMissingSymbolsCronApp(IntegrationTestBase):
         self.mock_boto_class()._get_or_create_bucket.return_value = (
             self.mock_bucket
         )
+        # the connection context yields itself
+        self.mock_boto_class()().__enter__.return_value = (
+            self.mock_boto_class()
+        )
         self.mock_bucket.new_key.return_value = self.mock_key
 
     def tearDown(self):
@@ -129,7 +133,7 @@ class TestMissingSymbolsCronApp(IntegrationTestBase):
         assert information['missing-symbols']['last_success']
 
         self.mock_boto_class()._connect.assert_called_with()
-        self.mock_boto_class.close.assert_called_with()
+        self.mock_boto_class().close.assert_called_with()
         self.mock_bucket.new_key.assert_called_with('latest.csv')
         content = StringIO()
         writer = csv.writer(content)
@@ -4,9 +4,12 @@
 
 import datetime
 import json
+import threading
+import time
 
 import mock
-from nose.tools import eq_
+from boto.exception import StorageResponseError
+from nose.tools import eq_, ok_
 
 from socorro.lib.util import DotDict
 from socorro.external.boto.connection_context import (
@@ -15,6 +18,7 @@ from socorro.external.boto.connection_context import (
     KeyBuilderBase,
     KeyNotFound,
     S3ConnectionContext,
+    S3ConnectionPool,
     RegionalS3ConnectionContext,
     HostPortS3ConnectionContext,
 )
@@ -235,6 +239,163 @@ class ConnectionContextTestCase(socorro.unittest.testbase.TestCase):
             connection_source
         )
 
+    def test_fetch_many(self):
+        connection_source = self.setup_mocked_s3_storage(
+            maximum_concurrent_fetches=3
+        )
+
+        def get_key(key, validate=True):
+            a_key = mock.Mock()
+            if key.endswith('/missing/an_id'):
+                a_key.get_contents_as_string.side_effect = (
+                    StorageResponseError(404, 'not found')
+                )
+            else:
+                a_key.get_contents_as_string.return_value = (
+                    'contents of ' + key
+                )
+            return a_key
+        connection_source._mocked_connection.get_bucket.return_value \
+            .get_key.side_effect = get_key
+
+        try:
+            result = connection_source.fetch_many(
+                'an_id',
+                ['dump', 'flash1', 'flash2', 'flash3']
+            )
+            eq_(
+                result,
+                {
+                    'dump': 'contents of dev/v1/dump/an_id',
+                    'flash1': 'contents of dev/v1/flash1/an_id',
+                    'flash2': 'contents of dev/v1/flash2/an_id',
+                    'flash3': 'contents of dev/v1/flash3/an_id',
+                }
+            )
+            connection_source._mocked_connection.get_bucket.assert_called_with(
+                'silliness'
+            )
+
+            # the threads of the pool reuse the connections of the shared
+            # pool
+            for x in range(5):
+                connection_source.fetch_many('an_id', ['dump', 'flash1'])
+            ok_(connection_source._connect_to_endpoint.call_count <= 3)
+            eq_(
+                len(connection_source._pool),
+                connection_source._connect_to_endpoint.call_count
+            )
+
+            with self.assertRaises(KeyNotFound):
+                connection_source.fetch_many('an_id', ['dump', 'missing'])
+        finally:
+            connection_source.close()
+        ok_(connection_source._fetch_pool is None)
+
+    def test_fetch_many_without_concurrency(self):
+        connection_source = self.setup_mocked_s3_storage(
+            maximum_concurrent_fetches=1
+        )
+        connection_source.fetch = mock.Mock(side_effect=lambda id, name: name)
+        eq_(
+            connection_source.fetch_many('an_id', ['dump', 'flash1']),
+            {'dump': 'dump', 'flash1': 'flash1'}
+        )
+        eq_(connection_source.fetch.call_count, 2)
+        ok_(connection_source._fetch_pool is None)
+
+    def test_fetch_many_uses_pooled_connections(self):
+        connection_source = self.setup_mocked_s3_storage(
+            maximum_concurrent_fetches=2,
+            maximum_connections=1
+        )
+        pool = connection_source._pool
+        connection_source._fetch_in_pool_thread('an_id', 'dump')
+        connection_source._fetch_in_pool_thread('an_id', 'dump')
+        eq_(connection_source._connect_to_endpoint.call_count, 1)
+        eq_(len(pool._idle), 1)
+
+        # a connection in an unknown state is not returned to the pool
+        bucket = connection_source._mocked_connection.get_bucket.return_value
+        bucket.get_key.side_effect = ABadDeal
+        with self.assertRaises(ABadDeal):
+            connection_source._fetch_in_pool_thread('an_id', 'dump')
+        eq_(len(pool), 0)
+        bucket.get_key.side_effect = None
+
+        # when the transaction holds the only connection of the pool, it
+        # fetches everything itself rather than wait for the pool threads
+        try:
+            with connection_source() as transaction:
+                transaction._connect()
+                result = transaction.fetch_many('an_id', ['dump', 'flash1'])
+                eq_(sorted(result), ['dump', 'flash1'])
+                eq_(len(pool), 1)
+        finally:
+            connection_source.close()
+        eq_(connection_source._connect_to_endpoint.call_count, 2)
+
+    def test_transactions_share_pooled_connections(self):
+        connection_source = self.setup_mocked_s3_storage(
+            maximum_connections=2
+        )
+        connection_source._connect_to_endpoint.side_effect = (
+            lambda **kwargs: mock.Mock()
+        )
+        with connection_source() as boto_connection:
+            first_connection = boto_connection._connect()
+            # the connection is kept for the whole transaction
+            ok_(boto_connection._connect() is first_connection)
+            with connection_source() as nested_connection:
+                ok_(nested_connection._connect() is first_connection)
+        eq_(len(connection_source._pool._idle), 1)
+
+        # the connection is reused by the next transaction
+        with connection_source() as boto_connection:
+            ok_(boto_connection._connect() is first_connection)
+            boto_connection.fetch('an_id', 'dump')
+        first_connection.get_bucket.assert_called_once_with('silliness')
+        eq_(connection_source._connect_to_endpoint.call_count, 1)
+
+        # outside of a transaction, the connection is not from the pool
+        ok_(connection_source._connect() is not first_connection)
+        eq_(len(connection_source._pool), 1)
+
+    def test_failed_transaction_discards_connection(self):
+        connection_source = self.setup_mocked_s3_storage(
+            maximum_connections=2
+        )
+        connection_source.ResponseError = (KeyNotFound,)
+        connection_source._connect_to_endpoint.side_effect = (
+            lambda **kwargs: mock.Mock()
+        )
+
+        # a response from S3 leaves the connection usable
+        with self.assertRaises(KeyNotFound):
+            with connection_source() as boto_connection:
+                first_connection = boto_connection._connect()
+                raise KeyNotFound('an_id')
+        eq_(len(connection_source._pool._idle), 1)
+
+        with self.assertRaises(ABadDeal):
+            with connection_source() as boto_connection:
+                ok_(boto_connection._connect() is first_connection)
+                raise ABadDeal()
+        first_connection.close.assert_called_once_with()
+        eq_(len(connection_source._pool), 0)
+        eq_(connection_source._pool.discarded, 1)
+
+        with connection_source() as boto_connection:
+            ok_(boto_connection._connect() is not first_connection)
+
+    def test_close_closes_pooled_connections(self):
+        connection_source = self.setup_mocked_s3_storage()
+        with connection_source() as boto_connection:
+            boto_connection._connect()
+        connection_source.close()
+        connection_source._mocked_connection.close.assert_called_once_with()
+        eq_(len(connection_source._pool), 0)
+
     def test_create_bucket_with_regional_s3connection_context(self):
         connection_source = self.setup_mocked_s3_storage(
             resource_class=RegionalS3ConnectionContext,
@@ -550,7 +711,8 @@ class MultiplePathsTestCase(MultiplePathsBase):
             .get_key
             .assert_called_with(
                 'dev/v2/raw_crash/fff/20141114/fff13cf0-5671-4496-'
-                'ab89-47a922141114'
+                'ab89-47a922141114',
+                validate=False
             )
         )
 
@@ -569,10 +731,11 @@ class MultiplePathsTestCase(MultiplePathsBase):
             .return_value
             .get_key
         )
-        # First time get_key() is called, it returns None which causes fetch to
-        # call it again with the next key. We have to swap side-effect handling
-        # functions so that the second time get_key() is called, it returns an
-        # object which simulates the situation we're looking for.
+        # The first key that get_key() returns is not found by the GET, which
+        # causes fetch to call it again with the next key. We have to swap
+        # side-effect handling functions so that the second time get_key() is
+        # called, it returns an object which simulates the situation we're
+        # looking for.
         capture_args = []
 
         def get_key_first_call(*args, **kwargs):
@@ -583,13 +746,17 @@ class MultiplePathsTestCase(MultiplePathsBase):
                 capture_args.append((args, kwargs))
                 # Second time
                 get_key_return = mock.Mock()
-                get_key_return.return_value.get_contents_as_string = [
+                get_key_return.get_contents_as_string.return_value = (
                     thing_as_str
-                ]
+                )
                 return get_key_return
 
             mocked_get_key.side_effect = get_key_second_call
-            return None
+            get_key_return = mock.Mock()
+            get_key_return.get_contents_as_string.side_effect = (
+                StorageResponseError(404, 'not found')
+            )
+            return get_key_return
 
         mocked_get_key.side_effect = get_key_first_call
 
@@ -641,7 +808,9 @@ class MultiplePathsTestCase(MultiplePathsBase):
             .return_value
             .get_key
         )
-        mocked_get_key.return_value = None
+        mocked_get_key.return_value.get_contents_as_string.side_effect = (
+            StorageResponseError(404, 'not found')
+        )
 
         with self.assertRaises(KeyNotFound):
             connection_source.fetch(
@@ -663,3 +832,120 @@ class MultiplePathsTestCase(MultiplePathsBase):
             ),
             2
         )
+
+
+class S3ConnectionPoolTestCase(socorro.unittest.testbase.TestCase):
+
+    def get_pool(self, **kwargs):
+        connection_factory = mock.Mock(side_effect=lambda: mock.Mock())
+        metrics = mock.Mock()
+        pool = S3ConnectionPool(connection_factory, metrics=metrics, **kwargs)
+        pool._clock = mock.Mock(return_value=1000.0)
+        return pool
+
+    def test_most_recently_used_connection_first(self):
+        pool = self.get_pool(maximum_connections=2)
+        connection_a = pool.checkout()
+        connection_b = pool.checkout()
+        ok_(connection_a is not connection_b)
+        pool.checkin(connection_a)
+        pool.checkin(connection_b)
+        ok_(pool.checkout() is connection_b)
+        ok_(pool.checkout() is connection_a)
+        eq_(pool.connection_factory.call_count, 2)
+        eq_(
+            pool.stats('pool'),
+            {
+                'pool.size': 2,
+                'pool.idle': 0,
+                'pool.created': 2,
+                'pool.discarded': 0,
+                'pool.evicted': 0,
+                'pool.waits': 0,
+                'pool.timeouts': 0,
+                'pool.in_use': 2,
+            }
+        )
+        pool.metrics.capture_stats.assert_any_call({'boto.pool.created': 1})
+        pool.metrics.capture_stats.assert_called_with({
+            'boto.pool.wait': 0,
+            'boto.pool.in_use': 2,
+        })
+
+    def test_checkout_waits_for_a_connection(self):
+        pool = self.get_pool(maximum_connections=1)
+        pool._clock = time.time
+        connection = pool.checkout()
+        checked_out = []
+        waiter = threading.Thread(
+            target=lambda: checked_out.append(pool.checkout())
+        )
+        waiter.start()
+        time.sleep(0.1)
+        eq_(checked_out, [])
+        pool.checkin(connection)
+        waiter.join(5)
+        eq_(checked_out, [connection])
+        eq_(pool.connection_factory.call_count, 1)
+        eq_(pool.waits, 1)
+
+    def test_idle_connections_are_evicted(self):
+        pool = self.get_pool(maximum_idle_seconds=300)
+        connection = pool.checkout()
+        pool.checkin(connection)
+        pool._clock.return_value = 1301.0
+        ok_(pool.checkout() is not connection)
+        connection.close.assert_called_once_with()
+        eq_(pool.evicted, 1)
+        eq_(len(pool), 1)
+        pool.metrics.capture_stats.assert_any_call({'boto.pool.evicted': 1})
+
+    def test_health_check(self):
+        health_check = mock.Mock()
+        pool = self.get_pool(
+            health_check_seconds=60,
+            health_check=health_check,
+            logger=mock.Mock(),
+        )
+        connection = pool.checkout()
+        pool.checkin(connection)
+
+        # recently used connections are not checked
+        pool._clock.return_value = 1030.0
+        ok_(pool.checkout() is connection)
+        ok_(not health_check.called)
+        pool.checkin(connection)
+
+        pool._clock.return_value = 1100.0
+        ok_(pool.checkout() is connection)
+        health_check.assert_called_once_with(connection)
+        pool.checkin(connection)
+
+        health_check.side_effect = ABadDeal
+        pool._clock.return_value = 1200.0
+        ok_(pool.checkout() is not connection)
+        connection.close.assert_called_once_with()
+        eq_(pool.discarded, 1)
+        eq_(len(pool), 1)
+
+    def test_failed_connection_releases_its_place(self):
+        pool = self.get_pool(maximum_connections=1)
+        pool.connection_factory.side_effect = ABadDeal
+        with self.assertRaises(ABadDeal):
+            pool.checkout()
+        eq_(len(pool), 0)
+        pool.connection_factory.side_effect = lambda: mock.Mock()
+        ok_(pool.checkout())
+
+    def test_close(self):
+        pool = self.get_pool()
+        connection_a = pool.checkout()
+        connection_b = pool.checkout()
+        pool.checkin(connection_a)
+        pool.close()
+        connection_a.close.assert_called_once_with()
+        ok_(not connection_b.close.called)
+        # a connection checked in after the close is closed
+        pool.checkin(connection_b)
+        connection_b.close.assert_called_once_with()
+        eq_(len(pool), 0)
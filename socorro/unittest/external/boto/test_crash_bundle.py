@@ -0,0 +1,66 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from collections import OrderedDict
+
+from nose.tools import eq_
+
+from socorro.external.boto.crash_bundle import (
+    CrashBundleError,
+    PREFIX_LENGTH,
+    header_length_from_prefix,
+    pack_crash_bundle,
+    read_bundle_index,
+    unpack_crash_bundle,
+)
+from socorro.unittest.testbase import TestCase
+
+
+class TestCrashBundle(TestCase):
+
+    def test_pack_and_unpack(self):
+        dumps = OrderedDict([
+            ('dump', 'the main dump'),
+            ('flash_dump', 'the flash dump'),
+            ('empty_dump', ''),
+        ])
+        bundle = pack_crash_bundle('{"a": 1}', dumps)
+        raw_crash_as_string, unpacked_dumps = unpack_crash_bundle(bundle)
+        eq_(raw_crash_as_string, '{"a": 1}')
+        eq_(unpacked_dumps, dumps)
+        eq_(unpacked_dumps.keys(), dumps.keys())
+
+    def test_read_bundle_index(self):
+        bundle = pack_crash_bundle('{}', {'dump': 'the main dump'})
+        header_end = header_length_from_prefix(bundle[:PREFIX_LENGTH])
+        (offset, length), dumps_index = read_bundle_index(
+            bundle[:header_end]
+        )
+        eq_(bundle[offset:offset + length], '{}')
+        offset, length = dumps_index['dump']
+        eq_(bundle[offset:offset + length], 'the main dump')
+        eq_(offset + length, len(bundle))
+
+    def test_no_dumps(self):
+        bundle = pack_crash_bundle('{}', {})
+        eq_(unpack_crash_bundle(bundle), ('{}', {}))
+
+    def test_not_a_bundle(self):
+        with self.assertRaises(CrashBundleError):
+            unpack_crash_bundle('{"this is": "a raw crash"}')
+        with self.assertRaises(CrashBundleError):
+            header_length_from_prefix('SCB')
+
+    def test_truncated(self):
+        bundle = pack_crash_bundle('{}', {'dump': 'the main dump'})
+        with self.assertRaises(CrashBundleError):
+            unpack_crash_bundle(bundle[:-1])
+        with self.assertRaises(CrashBundleError):
+            read_bundle_index(bundle[:PREFIX_LENGTH + 2])
+
+    def test_corrupt_header(self):
+        bundle = pack_crash_bundle('{}', {'dump': 'the main dump'})
+        corrupt = bundle[:PREFIX_LENGTH] + 'X' + bundle[PREFIX_LENGTH + 1:]
+        with self.assertRaises(CrashBundleError):
+            unpack_crash_bundle(corrupt)
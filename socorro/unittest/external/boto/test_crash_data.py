@@ -68,7 +68,7 @@ class TestSimplifiedCrashData(TestCase):
             boto_s3_store.connection_source._connect_to_endpoint()
         )
 
-        def mocked_get_key(key):
+        def mocked_get_key(key, validate=True):
             assert '/processed_crash/' in key
             assert '0bba929f-8721-460c-dead-a43c20071027' in key
             raise StorageResponseError(404, 'not found')
@@ -107,7 +107,7 @@ class TestSimplifiedCrashData(TestCase):
             boto_s3_store.connection_source._connect_to_endpoint()
         )
 
-        def mocked_get_key(key):
+        def mocked_get_key(key, validate=True):
             assert '/dump/' in key
             assert '0bba929f-8721-460c-dead-a43c20071027' in key
             raise StorageResponseError(404, 'not found')
@@ -128,7 +128,7 @@ class TestSimplifiedCrashData(TestCase):
             boto_s3_store.connection_source._connect_to_endpoint()
         )
 
-        def mocked_get_key(key):
+        def mocked_get_key(key, validate=True):
             assert '/raw_crash/' in key
             assert '0bba929f-8721-460c-dead-a43c20071027' in key
             raise StorageResponseError(404, 'not found')
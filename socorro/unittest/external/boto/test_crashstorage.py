@@ -9,7 +9,8 @@ import tempfile
 from os.path import join
 
 import boto.exception
-from nose.tools import eq_, ok_
+import json_schema_reducer
+from nose.tools import eq_, ok_, assert_raises
 import mock
 
 from socorro.database.transaction_executor import (
@@ -24,6 +25,7 @@ from socorro.external.boto.crashstorage import (
     BotoS3CrashStorage,
     SupportReasonAPIStorage,
     TelemetryBotoS3CrashStorage,
+    compile_crash_report_projection,
 )
 from socorro.external.crashstorage_base import (
     CrashIDNotFound,
@@ -36,6 +38,7 @@ from socorro.unittest.testbase import TestCase
 
 
 from socorro.lib.util import DotDict
+from socorro.schemas import CRASH_REPORT_JSON_SCHEMA
 
 # Uncomment these lines to decrease verbosity of the elasticsearch library
 # while running unit tests.
@@ -82,6 +85,7 @@ class BaseTestCase(TestCase):
         bucket_name='mozilla-support-reason',
         host='',
         port=0,
+        **extra
     ):
         config = DotDict({
             'source': {
@@ -101,11 +105,14 @@ class BaseTestCase(TestCase):
             'secret_access_key': 'secrets',
             'temporary_file_system_storage_path': self.TEMPDIR,
             'dump_file_suffix': '.dump',
+            'dumps_in_memory': False,
+            'maximum_dumps_in_memory_bytes': 1024,
             'bucket_name': bucket_name,
             'prefix': 'dev',
             'calling_format': mock.Mock(),
             'json_object_hook': DotDict,
         })
+        config.update(extra)
 
         if isinstance(storage_class, basestring):
             if storage_class == 'BotoS3CrashStorage':
@@ -124,6 +131,48 @@ class BaseTestCase(TestCase):
 
         return s3
 
+    def use_fake_bucket(self, boto_s3_store):
+        """replace the mocked bucket with one that keeps its objects in a
+        mapping, returns that mapping and the list of GET requests"""
+        objects = {}
+        requests = []
+        bucket = (
+            boto_s3_store.connection_source._mocked_connection
+            .get_bucket.return_value
+        )
+
+        def new_key(key):
+            key_object = mock.Mock()
+
+            def set_contents_from_string(contents):
+                objects[key] = contents
+            key_object.set_contents_from_string.side_effect = (
+                set_contents_from_string
+            )
+            return key_object
+
+        def get_key(key, validate=True):
+            key_object = mock.Mock()
+
+            def get_contents_as_string(headers=None):
+                requests.append((key, headers))
+                try:
+                    contents = objects[key]
+                except KeyError:
+                    raise boto.exception.StorageResponseError(404, 'nope')
+                if headers:
+                    start, end = headers['Range'][len('bytes='):].split('-')
+                    return contents[int(start):int(end) + 1]
+                return contents
+            key_object.get_contents_as_string.side_effect = (
+                get_contents_as_string
+            )
+            return key_object
+
+        bucket.new_key.side_effect = new_key
+        bucket.get_key.side_effect = get_key
+        return objects, requests
+
     def assert_s3_connection_parameters(self, boto_s3_store):
         kwargs = {
             "aws_access_key_id": boto_s3_store.config.access_key,
@@ -721,7 +770,8 @@ class TestCase(BaseTestCase):
         get_bucket.assert_called_with('crash_storage')
 
         get_bucket.return_value.get_key.assert_called_with(
-            'dev/v1/dump/936ce666-ff3b-4c7a-9674-367fe2120408'
+            'dev/v1/dump/936ce666-ff3b-4c7a-9674-367fe2120408',
+            validate=False
         )
         key_mock = get_bucket.return_value.get_key.return_value
         eq_(key_mock.get_contents_as_string.call_count, 1)
@@ -766,7 +816,8 @@ class TestCase(BaseTestCase):
         get_bucket.assert_called_with('crash_storage')
 
         get_bucket.return_value.get_key.assert_called_with(
-            'dev/v1/dump/936ce666-ff3b-4c7a-9674-367fe2120408'
+            'dev/v1/dump/936ce666-ff3b-4c7a-9674-367fe2120408',
+            validate=False
         )
         key_mock = get_bucket \
             .return_value.get_key.return_value
@@ -818,7 +869,8 @@ class TestCase(BaseTestCase):
         get_bucket.assert_called_with('crash_storage')
 
         get_bucket.return_value.get_key.assert_called_with(
-            'dev/v1/dump/936ce666-ff3b-4c7a-9674-367fe2120408'
+            'dev/v1/dump/936ce666-ff3b-4c7a-9674-367fe2120408',
+            validate=False
         )
         key_mock = get_bucket.return_value.get_key.return_value
         eq_(key_mock.get_contents_as_string.call_count, 1)
@@ -886,6 +938,54 @@ class TestCase(BaseTestCase):
             }
         )
 
+    def test_get_raw_dumps_concurrently(self):
+        boto_s3_store = self.setup_mocked_s3_storage(
+            maximum_concurrent_fetches=4,
+            metrics_class=mock.Mock(),
+        )
+
+        def get_key(key, validate=True):
+            a_key = mock.Mock()
+            if key.endswith(
+                '/dump_names/936ce666-ff3b-4c7a-9674-367fe2120408'
+            ):
+                a_key.get_contents_as_string.return_value = (
+                    '["upload_file_minidump", "flash_dump", "city_dump"]'
+                )
+            else:
+                a_key.get_contents_as_string.return_value = (
+                    'contents of ' + key
+                )
+            return a_key
+        boto_s3_store.connection_source._mocked_connection.get_bucket \
+            .return_value.get_key.side_effect = get_key
+
+        try:
+            result = boto_s3_store.get_raw_dumps(
+                '936ce666-ff3b-4c7a-9674-367fe2120408'
+            )
+        finally:
+            boto_s3_store.close()
+
+        eq_(
+            result,
+            {
+                'dump': 'contents of dev/v1/dump/'
+                        '936ce666-ff3b-4c7a-9674-367fe2120408',
+                'flash_dump': 'contents of dev/v1/flash_dump/'
+                              '936ce666-ff3b-4c7a-9674-367fe2120408',
+                'city_dump': 'contents of dev/v1/city_dump/'
+                             '936ce666-ff3b-4c7a-9674-367fe2120408',
+            }
+        )
+        # the connection pool reports to the same metrics
+        fetch_stats = [
+            x[0][0] for x in boto_s3_store.metrics.capture_stats.call_args_list
+            if not x[0][0].keys()[0].startswith('boto.pool.')
+        ]
+        eq_(len(fetch_stats), 1)
+        eq_(fetch_stats[0].keys(), ['boto.get_raw_dumps'])
+
     def test_get_raw_dumps_as_files(self):
         # setup some internal behaviors and fake outs
         boto_s3_store = self.setup_mocked_s3_storage()
@@ -938,6 +1038,65 @@ class TestCase(BaseTestCase):
             }
         )
 
+    def _mock_three_dumps(self, boto_s3_store):
+        mocked_get_contents_as_string = (
+            boto_s3_store.connection_source._connect_to_endpoint.return_value
+            .get_bucket.return_value.get_key.return_value
+            .get_contents_as_string
+        )
+        mocked_get_contents_as_string.side_effect = [
+            '["dump", "flash_dump", "city_dump"]',
+            'this is "dump", the first one',
+            'this is "flash_dump", the second one',
+            'this is "city_dump", the last one',
+        ]
+
+    def test_get_raw_dumps_as_files_in_memory(self):
+        boto_s3_store = self.setup_mocked_s3_storage()
+        boto_s3_store.config.dumps_in_memory = True
+        self._mock_three_dumps(boto_s3_store)
+
+        # the tested call
+        result = boto_s3_store.get_raw_dumps_as_files(
+            '936ce666-ff3b-4c7a-9674-367fe2120408'
+        )
+
+        eq_(
+            sorted(result.keys()),
+            ['city_dump', 'flash_dump', 'upload_file_minidump']
+        )
+        for a_pathname in result.values():
+            ok_(a_pathname.startswith('/proc/'))
+        eq_(
+            open(result['city_dump']).read(),
+            'this is "city_dump", the last one'
+        )
+        ok_(boto_s3_store._dumps_in_memory_bytes > 0)
+        result.close()
+        eq_(boto_s3_store._dumps_in_memory_bytes, 0)
+
+    def test_get_raw_dumps_as_files_in_memory_over_quota(self):
+        boto_s3_store = self.setup_mocked_s3_storage()
+        boto_s3_store.config.dumps_in_memory = True
+        boto_s3_store.config.maximum_dumps_in_memory_bytes = 10
+        self._mock_three_dumps(boto_s3_store)
+
+        # the tested call
+        result = boto_s3_store.get_raw_dumps_as_files(
+            '936ce666-ff3b-4c7a-9674-367fe2120408'
+        )
+
+        # the dumps went to the file system instead
+        eq_(
+            result['city_dump'],
+            join(
+                self.TEMPDIR,
+                '936ce666-ff3b-4c7a-9674-367fe2120408.city_dump'
+                '.TEMPORARY.dump'
+            )
+        )
+        eq_(boto_s3_store._dumps_in_memory_bytes, 0)
+
     def test_get_unredacted_processed(self):
         # setup some internal behaviors and fake outs
         boto_s3_store = self.setup_mocked_s3_storage()
@@ -1075,10 +1234,14 @@ class TestCase(BaseTestCase):
             '0bba929f-dead-dead-dead-a43c20071027'
         )
 
-    def test_not_found_get_key_returns_none(self):
+    def test_not_found_get_returns_404(self):
         boto_s3_store = self.setup_mocked_s3_storage()
         boto_s3_store.connection_source._mocked_connection.get_bucket \
-            .return_value.get_key.return_value = None
+            .return_value.get_key.return_value.get_contents_as_string \
+            .side_effect = boto.exception.StorageResponseError(
+                404,
+                'not found'
+            )
         self.assertRaises(
             CrashIDNotFound,
             boto_s3_store.get_raw_crash,
@@ -1086,6 +1249,303 @@ class TestCase(BaseTestCase):
         )
 
 
+class CrashBundleTestCase(BaseTestCase):
+
+    crash_id = '0bba929f-8721-460c-dead-a43c20071027'
+
+    def test_save_and_get_crash_bundle(self):
+        boto_s3_store = self.setup_mocked_s3_storage(
+            save_crash_bundles=True,
+            read_crash_bundles=True,
+            crash_bundle_prefix_bytes=1024,
+        )
+        objects, requests = self.use_fake_bucket(boto_s3_store)
+
+        boto_s3_store.save_raw_crash(
+            a_raw_crash,
+            MemoryDumpsMapping({
+                'upload_file_minidump': 'the main dump',
+                'flash_dump': 'the flash dump',
+            }),
+            self.crash_id
+        )
+        # everything is in one object
+        eq_(objects.keys(), ['dev/v1/crash_bundle/' + self.crash_id])
+
+        # the header and the raw crash are within the first bytes
+        eq_(boto_s3_store.get_raw_crash(self.crash_id), a_raw_crash)
+        eq_(
+            requests,
+            [
+                (
+                    'dev/v1/crash_bundle/' + self.crash_id,
+                    {'Range': 'bytes=0-1023'}
+                )
+            ]
+        )
+
+        del requests[:]
+        eq_(
+            boto_s3_store.get_raw_dumps(self.crash_id),
+            {'dump': 'the main dump', 'flash_dump': 'the flash dump'}
+        )
+        eq_(requests, [('dev/v1/crash_bundle/' + self.crash_id, None)])
+
+        eq_(
+            boto_s3_store.get_raw_dump(self.crash_id, 'flash_dump'),
+            'the flash dump'
+        )
+        eq_(
+            boto_s3_store.get_raw_dump(self.crash_id, 'upload_file_minidump'),
+            'the main dump'
+        )
+        with self.assertRaises(CrashIDNotFound):
+            boto_s3_store.get_raw_dump(self.crash_id, 'city_dump')
+
+    def test_crash_bundle_byte_range_reads(self):
+        boto_s3_store = self.setup_mocked_s3_storage(
+            save_crash_bundles=True,
+            read_crash_bundles=True,
+            crash_bundle_prefix_bytes=16,
+        )
+        objects, requests = self.use_fake_bucket(boto_s3_store)
+        boto_s3_store.save_raw_crash(
+            a_raw_crash,
+            MemoryDumpsMapping({'flash_dump': 'the flash dump'}),
+            self.crash_id
+        )
+        bundle = objects['dev/v1/crash_bundle/' + self.crash_id]
+
+        eq_(
+            boto_s3_store.get_raw_dump(self.crash_id, 'flash_dump'),
+            'the flash dump'
+        )
+        # the first bytes, the rest of the header and then the dump alone
+        eq_(len(requests), 3)
+        eq_(requests[0][1], {'Range': 'bytes=0-15'})
+        eq_(
+            requests[2][1],
+            {'Range': 'bytes=%d-%d' % (len(bundle) - 14, len(bundle) - 1)}
+        )
+
+    def test_crash_bundle_reads_fall_back_to_legacy_objects(self):
+        boto_s3_store = self.setup_mocked_s3_storage(
+            read_crash_bundles=True,
+        )
+        objects, requests = self.use_fake_bucket(boto_s3_store)
+        boto_s3_store.save_raw_crash(
+            a_raw_crash,
+            MemoryDumpsMapping({'upload_file_minidump': 'the main dump'}),
+            self.crash_id
+        )
+        ok_('dev/v1/crash_bundle/' + self.crash_id not in objects)
+
+        eq_(boto_s3_store.get_raw_crash(self.crash_id), a_raw_crash)
+        eq_(
+            boto_s3_store.get_raw_dumps(self.crash_id),
+            {'dump': 'the main dump'}
+        )
+        eq_(
+            boto_s3_store.get_raw_dump(self.crash_id),
+            'the main dump'
+        )
+        with self.assertRaises(CrashIDNotFound):
+            boto_s3_store.get_raw_crash('0bba929f-dead-dead-dead-a43c20071027')
+
+    def test_crash_bundle_reads_fall_back_only_when_not_found(self):
+        boto_s3_store = self.setup_mocked_s3_storage(
+            read_crash_bundles=True,
+        )
+        objects, requests = self.use_fake_bucket(boto_s3_store)
+        bucket = (
+            boto_s3_store.connection_source._mocked_connection
+            .get_bucket.return_value
+        )
+        bucket.get_key.side_effect = None
+        bucket.get_key.return_value.get_contents_as_string.side_effect = (
+            boto.exception.StorageResponseError(403, 'forbidden')
+        )
+        for a_get in (
+            boto_s3_store.get_raw_crash,
+            boto_s3_store.get_raw_dump,
+            boto_s3_store.get_raw_dumps,
+        ):
+            with self.assertRaises(boto.exception.StorageResponseError):
+                a_get(self.crash_id)
+        # only the bundles were asked for
+        eq_(
+            set(
+                a_call[0][0].split('/')[2]
+                for a_call in bucket.get_key.call_args_list
+            ),
+            set(['crash_bundle'])
+        )
+
+    def test_corrupt_crash_bundle(self):
+        boto_s3_store = self.setup_mocked_s3_storage(
+            read_crash_bundles=True,
+        )
+        objects, requests = self.use_fake_bucket(boto_s3_store)
+        objects['dev/v1/crash_bundle/' + self.crash_id] = 'not a bundle'
+        for a_get in (
+            boto_s3_store.get_raw_crash,
+            boto_s3_store.get_raw_dump,
+            boto_s3_store.get_raw_dumps,
+        ):
+            with self.assertRaises(CrashIDNotFound):
+                a_get(self.crash_id)
+        # the legacy objects were not tried
+        eq_(
+            set(key for key, headers in requests),
+            set(['dev/v1/crash_bundle/' + self.crash_id])
+        )
+
+
+class ProcessedCrashCompressionTestCase(BaseTestCase):
+
+    crash_id = '0bba929f-8721-460c-dead-a43c20071027'
+
+    def test_compressed_and_uncompressed_processed_crashes(self):
+        boto_s3_store = self.setup_mocked_s3_storage(
+            processed_crash_compression='gzip',
+            processed_crash_compression_level=9,
+            metrics_class=mock.Mock(),
+        )
+        objects, requests = self.use_fake_bucket(boto_s3_store)
+        processed_crash = {
+            'uuid': self.crash_id,
+            'json_dump': {'threads': [{'frames': ['a frame'] * 100}]},
+        }
+        boto_s3_store.save_processed(processed_crash)
+
+        saved = objects['dev/v1/processed_crash/' + self.crash_id]
+        ok_(saved.startswith('\x1f\x8b'))
+        eq_(
+            boto_s3_store.get_unredacted_processed(self.crash_id),
+            processed_crash
+        )
+        stats = [
+            x[0][0] for x in boto_s3_store.metrics.capture_stats.call_args_list
+            if 'boto.processed_crash.compressed_size' in x[0][0]
+        ][0]
+        eq_(stats['boto.processed_crash.compressed_size'], len(saved))
+        eq_(stats['boto.processed_crash.compression_level'], 9)
+        ok_(stats['boto.processed_crash.compression_savings_percent'] > 50)
+
+        # processed crashes saved before compression are still read
+        objects['dev/v1/processed_crash/' + self.crash_id] = json.dumps(
+            processed_crash
+        )
+        eq_(
+            boto_s3_store.get_unredacted_processed(self.crash_id),
+            processed_crash
+        )
+
+    def test_no_compression(self):
+        boto_s3_store = self.setup_mocked_s3_storage(
+            processed_crash_compression='none',
+            metrics_class=mock.Mock(),
+        )
+        objects, requests = self.use_fake_bucket(boto_s3_store)
+        boto_s3_store.save_processed({'uuid': self.crash_id})
+        eq_(
+            objects['dev/v1/processed_crash/' + self.crash_id],
+            '{"uuid": "%s"}' % self.crash_id
+        )
+        # only the connection pool reported to the metrics
+        for a_call in boto_s3_store.metrics.capture_stats.call_args_list:
+            ok_(a_call[0][0].keys()[0].startswith('boto.pool.'))
+
+
+class CrashReportProjectionTestCase(BaseTestCase):
+
+    all_fields = {
+        'plugin_name': {
+            'in_database_name': 'PluginName',
+            'name': 'plugin_name',
+            'namespace': 'processed_crash',
+        },
+        'product': {
+            'in_database_name': 'ProductName',
+            'name': 'product',
+            'namespace': 'raw_crash',
+        },
+        'platform': {
+            'in_database_name': 'os_name',
+            'name': 'platform',
+            'namespace': 'processed_crash',
+        },
+    }
+
+    def test_same_as_reducing_the_renamed_crashes(self):
+        raw_crash = {
+            'ProductName': 'Firefox',
+            'Version': '42.0',
+            'submitted_timestamp': '2013-01-09T22:21:18.646733+00:00',
+            'not_in_the_schema': 'junk',
+        }
+        processed_crash = {
+            'uuid': '0bba929f-8721-460c-dead-a43c20071027',
+            'signature': 'now_this_is_a_signature',
+            'os_name': 'Linux',
+            'PluginName': 'Flash',
+            # wins over the raw crash
+            'Version': '43.0',
+            'json_dump': {
+                'pid': 42,
+                'not_in_the_schema': 'junk',
+                'system_info': {'os': 'Linux', 'junk': True},
+            },
+            'classifications': '{"jit": {"category": "nope"}, "x": 1}',
+        }
+        renamed = dict(raw_crash)
+        renamed['product'] = renamed.pop('ProductName')
+        renamed.update(processed_crash)
+        renamed['platform'] = renamed.pop('os_name')
+        renamed['plugin_name'] = renamed.pop('PluginName')
+        expected = json_schema_reducer.make_reduced_dict(
+            CRASH_REPORT_JSON_SCHEMA,
+            renamed
+        )
+
+        project = compile_crash_report_projection(
+            CRASH_REPORT_JSON_SCHEMA,
+            self.all_fields
+        )
+        crash_report = project(raw_crash, processed_crash)
+        eq_(crash_report, expected)
+        eq_(crash_report['product'], 'Firefox')
+        eq_(
+            crash_report['json_dump'],
+            {'pid': 42, 'system_info': {'os': 'Linux'}}
+        )
+        ok_('os_name' not in crash_report)
+        ok_('not_in_the_schema' not in crash_report)
+        # the crashes were left alone
+        eq_(processed_crash['json_dump']['not_in_the_schema'], 'junk')
+
+    def test_required_keys(self):
+        schema = {
+            'type': 'object',
+            'required': ['uuid'],
+            'properties': {
+                'uuid': {'type': 'string'},
+                'product': {'type': 'string'},
+            },
+        }
+        project = compile_crash_report_projection(schema, self.all_fields)
+        eq_(
+            project({'ProductName': 'Firefox'}, {'uuid': 'a'}),
+            {'uuid': 'a', 'product': 'Firefox'}
+        )
+        assert_raises(
+            json_schema_reducer.ValidationError,
+            project,
+            {'ProductName': 'Firefox'},
+            {}
+        )
+
+
 class TelemetryTestCase(ElasticsearchTestCase, BaseTestCase):
 
     def get_s3_store(
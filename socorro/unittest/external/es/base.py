@@ -14,6 +14,7 @@ from nose import SkipTest
 
 from socorro.external.es.base import ElasticsearchConfig
 from socorro.external.es.index_creator import IndexCreator
+from socorro.external.es.index_registry import clear_index_registries
 from socorro.external.es.supersearch import SuperSearch
 from socorro.external.es.super_search_fields import SuperSearchFields
 from socorro.unittest.testbase import TestCase
@@ -843,6 +844,10 @@ class ElasticsearchTestCase(TestCase):
             self.connection = conn
 
     def setUp(self):
+        # The indices of the previous tests are gone, so are the registries
+        # that knew them.
+        clear_index_registries()
+
         # Create the supersearch fields.
         self.index_super_search_fields()
 
@@ -0,0 +1,223 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+from contextlib import contextmanager
+
+import mock
+from nose.tools import eq_, ok_
+
+from socorro.external.es.bulk_indexer import BulkIndexer
+from socorro.unittest.testbase import TestCase
+
+
+def an_action(crash_id, **source):
+    source.setdefault('crash_id', crash_id)
+    return {
+        '_index': 'socorro201601',
+        '_type': 'crash_reports',
+        '_id': crash_id,
+        '_source': source,
+    }
+
+
+def an_item(crash_id, status=201, error=None):
+    outcome = {
+        '_index': 'socorro201601',
+        '_type': 'crash_reports',
+        '_id': crash_id,
+        'status': status,
+    }
+    if error is not None:
+        outcome['error'] = error
+    return {'index': outcome}
+
+
+def sent_documents(body):
+    lines = body.splitlines()
+    return [json.loads(x) for x in lines[1::2]]
+
+
+class TestBulkIndexer(TestCase):
+    """These tests are self-contained and use Mock where necessary.
+    """
+
+    def get_indexer(self, **kwargs):
+        es = mock.Mock()
+
+        @contextmanager
+        def es_context():
+            yield es
+
+        kwargs.setdefault('metrics', mock.Mock())
+        indexer = BulkIndexer(es_context, mock.Mock(), **kwargs)
+        indexer._clock = mock.Mock(return_value=1000.0)
+        indexer._sleep = mock.Mock()
+        return indexer, es
+
+    def test_due_by_count(self):
+        indexer, es = self.get_indexer(maximum_items=2)
+        ok_(not indexer.is_due())
+        eq_(indexer.seconds_until_due(), None)
+        indexer.add(an_action('a'))
+        ok_(not indexer.is_due())
+        indexer.add(an_action('b'))
+        ok_(indexer.is_due())
+
+    def test_due_by_bytes(self):
+        indexer, es = self.get_indexer(maximum_bytes=200)
+        indexer.add(an_action('a'))
+        ok_(not indexer.is_due())
+        indexer.add(an_action('b', payload='x' * 100))
+        ok_(indexer.is_due())
+
+    def test_due_by_latency(self):
+        indexer, es = self.get_indexer(maximum_latency=5.0)
+        indexer.add(an_action('a'))
+        eq_(indexer.seconds_until_due(), 5.0)
+        ok_(not indexer.is_due())
+        indexer._clock.return_value = 1003.0
+        indexer.add(an_action('b'))
+        eq_(indexer.seconds_until_due(), 2.0)
+        indexer._clock.return_value = 1006.0
+        eq_(indexer.seconds_until_due(), 0)
+        ok_(indexer.is_due())
+
+    def test_flush(self):
+        indexer, es = self.get_indexer()
+        es.bulk.return_value = {
+            'errors': False,
+            'items': [an_item('a'), an_item('b')],
+        }
+        indexer.add(an_action('a'))
+        indexer.add(an_action('b'))
+        indexer._clock.return_value = 1002.0
+        eq_(indexer.flush(), 0)
+        eq_(len(indexer), 0)
+
+        body = es.bulk.call_args[1]['body']
+        eq_(
+            json.loads(body.splitlines()[0]),
+            {
+                'index': {
+                    '_index': 'socorro201601',
+                    '_type': 'crash_reports',
+                    '_id': 'a',
+                }
+            }
+        )
+        eq_(sent_documents(body), [{'crash_id': 'a'}, {'crash_id': 'b'}])
+
+        stats = indexer.metrics.capture_stats.call_args[0][0]
+        eq_(stats['es.bulk.batch_size'], 2)
+        eq_(stats['es.bulk.indexing_latency'], 2000)
+        eq_(stats['es.bulk.failed_items'], 0)
+        eq_(stats['es.bulk.retried_items'], 0)
+
+        # an empty batch sends nothing
+        eq_(indexer.flush(), 0)
+        eq_(es.bulk.call_count, 1)
+
+    def test_flush_fixes_failed_items_only(self):
+        fix_document = mock.Mock(
+            side_effect=lambda source, error: source.pop('bad', None)
+        )
+        indexer, es = self.get_indexer(fix_document=fix_document)
+        es.bulk.side_effect = [
+            {
+                'errors': True,
+                'items': [
+                    an_item('a'),
+                    an_item('b', 400, 'MaxBytesLengthExceededException'),
+                    an_item('c', 400, 'MapperParsingException'),
+                ],
+            },
+            {
+                'errors': False,
+                'items': [an_item('b')],
+            },
+        ]
+        indexer.add(an_action('a'))
+        indexer.add(an_action('b', bad='x'))
+        indexer.add(an_action('c'))
+        eq_(indexer.flush(), 1)
+
+        eq_(es.bulk.call_count, 2)
+        eq_(
+            sent_documents(es.bulk.call_args[1]['body']),
+            [{'crash_id': 'b'}]
+        )
+        eq_(fix_document.call_count, 2)
+        indexer.logger.critical.assert_called_once_with(
+            'Submission to Elasticsearch failed for %s (%s)',
+            'c',
+            'MapperParsingException'
+        )
+        # the cluster was not busy, there was no waiting
+        ok_(not indexer._sleep.called)
+        stats = indexer.metrics.capture_stats.call_args[0][0]
+        eq_(stats['es.bulk.failed_items'], 1)
+        eq_(stats['es.bulk.retried_items'], 1)
+
+    def test_flush_retries_busy_items_with_backoff(self):
+        indexer, es = self.get_indexer(backoff_delays=[1, 5])
+        es.bulk.side_effect = [
+            {
+                'errors': True,
+                'items': [an_item('a'), an_item('b', 429, 'rejected')],
+            },
+            {
+                'errors': True,
+                'items': [an_item('b', 429, 'rejected')],
+            },
+            {
+                'errors': True,
+                'items': [an_item('b', 429, 'rejected')],
+            },
+        ]
+        indexer.add(an_action('a'))
+        indexer.add(an_action('b'))
+        eq_(indexer.flush(), 1)
+        eq_(es.bulk.call_count, 3)
+        eq_(indexer._sleep.call_args_list, [mock.call(1), mock.call(5)])
+
+    def test_flush_gives_up_after_maximum_attempts(self):
+        indexer, es = self.get_indexer(
+            fix_document=mock.Mock(return_value=True),
+            maximum_attempts=3,
+        )
+        es.bulk.return_value = {
+            'errors': True,
+            'items': [an_item('a', 400, 'NumberFormatException')],
+        }
+        indexer.add(an_action('a'))
+        eq_(indexer.flush(), 1)
+        eq_(es.bulk.call_count, 3)
+
+    def test_flush_retries_failed_requests(self):
+        indexer, es = self.get_indexer(backoff_delays=[1, 5])
+        responses = [
+            Exception('connection refused'),
+            {'errors': False, 'items': [an_item('a')]},
+        ]
+
+        def bulk(body):
+            response = responses.pop(0)
+            if isinstance(response, Exception):
+                raise response
+            return response
+        es.bulk.side_effect = bulk
+        indexer.add(an_action('a'))
+        eq_(indexer.flush(), 0)
+        eq_(indexer._sleep.call_args_list, [mock.call(1)])
+
+        es.bulk.side_effect = Exception('connection refused')
+        indexer.add(an_action('b'))
+        eq_(indexer.flush(), 1)
+        eq_(es.bulk.call_count, 5)
+        indexer.logger.critical.assert_called_once_with(
+            'Submission to Elasticsearch failed for %s (%s)',
+            'b',
+            es.bulk.side_effect
+        )
@@ -2,6 +2,8 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import json
+
 import mock
 import elasticsearch
 
@@ -18,6 +20,7 @@ from socorro.external.es.crashstorage import (
     ESCrashStorageRedactedJsonDump,
     ESBulkCrashStorage
 )
+from socorro.external.es.index_registry import clear_index_registries
 from socorro.unittest.external.es.base import ElasticsearchTestCase
 from socorro.lib.datetimeutil import string_to_datetime
 
@@ -252,10 +255,10 @@ class TestESCrashStorage(ElasticsearchTestCase):
         self.config = self.get_tuned_config(ESCrashStorage)
 
     def setUp(self):
-        pass
+        clear_index_registries()
 
     def tearDown(self):
-        pass
+        clear_index_registries()
 
     def test_get_index_for_crash_static_name(self):
         """Test a static index name.
@@ -817,3 +820,102 @@ class TestESCrashStorage(ElasticsearchTestCase):
             processed_crash,
             crash_id
         )
+
+    @mock.patch('socorro.external.es.connection_context.elasticsearch')
+    def test_bulk_index_crash_with_failed_items(self, espy_mock):
+        """Test a bulk load where one of the crashes is refused because of a
+        bogus field. Expected behavior is to remove that field and send only
+        that crash again.
+        """
+        sub_mock = mock.MagicMock()
+        espy_mock.Elasticsearch.return_value = sub_mock
+
+        local_config = self.get_tuned_config(
+            ESBulkCrashStorage,
+            {'items_per_bulk_load': 2}
+        )
+        sent_documents = []
+
+        def mock_bulk(body):
+            items = []
+            for line in body.splitlines()[1::2]:
+                document = json.loads(line)
+                sent_documents.append(document)
+                outcome = {'_id': document['crash_id'], 'status': 201}
+                if 'bogus-field' in document['processed_crash']:
+                    outcome['status'] = 400
+                    outcome['error'] = (
+                        'MapperParsingException[failed to parse]; nested: '
+                        'IllegalArgumentException[Document contains at least '
+                        'one immense term in '
+                        'field="processed_crash.bogus-field.full"]; nested: '
+                        'MaxBytesLengthExceededException'
+                    )
+                items.append({'index': outcome})
+            return {'errors': True, 'items': items}
+
+        sub_mock.bulk.side_effect = mock_bulk
+
+        es_storage = ESBulkCrashStorage(config=local_config)
+        es_storage.metrics = mock.Mock()
+        es_storage.bulk_indexer.metrics = es_storage.metrics
+        for crash_id in ('a', 'b'):
+            processed_crash = {
+                'date_processed': '2012-04-08 10:56:41.558922',
+                'foo': 'bar',
+            }
+            if crash_id == 'b':
+                processed_crash['bogus-field'] = 'some bogus value'
+            es_storage.save_raw_and_processed(
+                {},
+                None,
+                processed_crash,
+                crash_id
+            )
+        es_storage.close()
+
+        eq_(sub_mock.bulk.call_count, 2)
+        eq_([x['crash_id'] for x in sent_documents], ['a', 'b', 'b'])
+        eq_(
+            sent_documents[-1]['removed_fields'],
+            'processed_crash.bogus-field'
+        )
+        ok_('bogus-field' not in sent_documents[-1]['processed_crash'])
+        ok_(es_storage.done)
+        ok_(not local_config.logger.critical.called)
+
+        stats = {}
+        for a_call in es_storage.metrics.capture_stats.call_args_list:
+            stats.update(a_call[0][0])
+        eq_(stats['es.bulk.batch_size'], 2)
+        eq_(stats['es.bulk.retried_items'], 1)
+        eq_(stats['es.bulk.failed_items'], 0)
+        ok_('es.bulk.queue_depth' in stats)
+
+    @mock.patch('socorro.external.es.connection_context.elasticsearch')
+    def test_bulk_consumer_survives_failures(self, espy_mock):
+        """Test that the consuming thread goes on with the next crashes after
+        a bulk load failed.
+        """
+        sub_mock = mock.MagicMock()
+        espy_mock.Elasticsearch.return_value = sub_mock
+
+        local_config = self.get_tuned_config(
+            ESBulkCrashStorage,
+            {
+                'items_per_bulk_load': 1,
+                'bulk_load_backoff_delays': '0',
+            }
+        )
+        sub_mock.bulk.side_effect = Exception('the cluster is gone')
+
+        es_storage = ESBulkCrashStorage(config=local_config)
+        processed_crash = {'date_processed': '2012-04-08 10:56:41.558922'}
+        es_storage.save_raw_and_processed({}, None, processed_crash, 'a')
+        es_storage.save_raw_and_processed({}, None, processed_crash, 'b')
+        es_storage.close()
+
+        # each crash was tried twice, once and after the only backoff delay
+        eq_(sub_mock.bulk.call_count, 4)
+        ok_(es_storage.done)
+        eq_(local_config.logger.critical.call_count, 2)
@@ -0,0 +1,178 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import datetime
+
+import mock
+from nose.tools import eq_, ok_, assert_raises
+
+from configman.dotdict import DotDict
+
+from socorro.external.es.index_registry import (
+    IndexRegistry,
+    clear_index_registries,
+    get_index_registry,
+)
+from socorro.lib.datetimeutil import UTC
+from socorro.unittest.testbase import TestCase
+
+
+class TestIndexRegistry(TestCase):
+    """These tests are self-contained and use Mock where necessary.
+    """
+
+    def setUp(self):
+        super(TestIndexRegistry, self).setUp()
+        clear_index_registries()
+
+    def tearDown(self):
+        clear_index_registries()
+        super(TestIndexRegistry, self).tearDown()
+
+    def get_config(self, existing_indices=('socorro201601',)):
+        config = DotDict()
+        config.logger = mock.Mock()
+        config.elasticsearch = DotDict()
+        config.elasticsearch.elasticsearch_class = mock.Mock()
+        config.elasticsearch.elasticsearch_urls = ['localhost:9200']
+        config.elasticsearch.elasticsearch_index = 'socorro%Y%W'
+        config.elasticsearch.index_creation_interval = 0
+        config.elasticsearch.index_creation_days_ahead = 1
+        config.elasticsearch.index_reload_seconds = 60
+        self.get_aliases(config).return_value = dict(
+            (x, {'aliases': {}}) for x in existing_indices
+        )
+        return config
+
+    def get_aliases(self, config):
+        es_context = config.elasticsearch.elasticsearch_class.return_value
+        return es_context.indices_client.return_value.get_aliases
+
+    def test_load(self):
+        registry = IndexRegistry(self.get_config())
+        ok_('socorro201601' in registry)
+        ok_('socorro201602' not in registry)
+        eq_(registry.known_indices(), ['socorro201601'])
+
+    def test_load_failure_keeps_known_indices(self):
+        config = self.get_config()
+        registry = IndexRegistry(config)
+        self.get_aliases(config).side_effect = Exception('down')
+        ok_(not registry.load())
+        eq_(registry.known_indices(), ['socorro201601'])
+        ok_(config.logger.warning.called)
+
+    def test_ensure_index(self):
+        registry = IndexRegistry(self.get_config())
+        registry.index_creator = mock.Mock()
+
+        registry.ensure_index('socorro201601')
+        ok_(not registry.index_creator.create_socorro_index.called)
+
+        registry.ensure_index('socorro201602')
+        registry.ensure_index('socorro201602')
+        registry.index_creator.create_socorro_index.assert_called_once_with(
+            'socorro201602'
+        )
+        ok_('socorro201602' in registry)
+
+    def test_ensure_index_failure(self):
+        registry = IndexRegistry(self.get_config())
+        registry.index_creator = mock.Mock()
+        registry.index_creator.create_socorro_index.side_effect = Exception(
+            'nope'
+        )
+        assert_raises(Exception, registry.ensure_index, 'socorro201602')
+        ok_('socorro201602' not in registry)
+
+    def test_split_known(self):
+        config = self.get_config()
+        registry = IndexRegistry(config)
+        registry._clock = mock.Mock(return_value=registry._loaded_at + 10)
+
+        eq_(
+            registry.split_known(['socorro201601', 'socorro201602']),
+            (['socorro201601'], ['socorro201602'])
+        )
+        # loaded recently, the cluster is not asked again
+        eq_(self.get_aliases(config).call_count, 1)
+
+        # later on, an unknown index causes a reload
+        self.get_aliases(config).return_value = {
+            'socorro201601': {},
+            'socorro201602': {},
+        }
+        registry._clock.return_value = registry._loaded_at + 60
+        eq_(
+            registry.split_known(['socorro201601', 'socorro201602']),
+            (['socorro201601', 'socorro201602'], [])
+        )
+        eq_(self.get_aliases(config).call_count, 2)
+
+        registry.forget('socorro201602')
+        ok_('socorro201602' not in registry)
+
+    def test_split_known_never_loaded(self):
+        config = self.get_config()
+        self.get_aliases(config).side_effect = Exception('down')
+        registry = IndexRegistry(config)
+        eq_(
+            registry.split_known(['socorro201601', 'socorro201602']),
+            (['socorro201601', 'socorro201602'], [])
+        )
+
+    @mock.patch('socorro.external.es.index_registry.utc_now')
+    def test_create_upcoming_indices(self, utc_now_mock):
+        # a Sunday, the following day is in the next week
+        utc_now_mock.return_value = datetime.datetime(
+            2016, 1, 10, 12, 0, tzinfo=UTC
+        )
+        registry = IndexRegistry(self.get_config())
+        registry.index_creator = mock.Mock()
+        registry.create_upcoming_indices()
+        eq_(
+            registry.index_creator.create_socorro_index.call_args_list,
+            [mock.call('socorro201602')]
+        )
+        registry.index_creator.create_socorro_index.side_effect = Exception(
+            'nope'
+        )
+        registry.forget('socorro201602')
+        # failures are logged, not raised
+        registry.create_upcoming_indices()
+        ok_(registry.config.logger.warning.called)
+
+    def test_get_index_registry(self):
+        config = self.get_config()
+        registry = get_index_registry(config)
+        ok_(get_index_registry(config) is registry)
+        # no thread without an interval
+        ok_(registry._thread is None)
+
+        other_config = self.get_config()
+        other_config.elasticsearch.elasticsearch_class = (
+            config.elasticsearch.elasticsearch_class
+        )
+        other_config.elasticsearch.elasticsearch_index = 'other%Y%W'
+        ok_(get_index_registry(other_config) is not registry)
+
+    def test_index_creation_thread(self):
+        config = self.get_config()
+        config.elasticsearch.index_creation_interval = 3600
+        with mock.patch.object(
+            IndexRegistry,
+            'create_upcoming_indices'
+        ) as create_mock:
+            registry = get_index_registry(config)
+            ok_(registry._thread is not None)
+            clear_index_registries()
+        ok_(create_mock.called)
+        ok_(registry._thread is None)
+
+    def test_no_thread_for_static_index(self):
+        config = self.get_config()
+        config.elasticsearch.elasticsearch_index = 'socorro'
+        config.elasticsearch.index_creation_interval = 3600
+        registry = get_index_registry(config)
+        ok_(registry._thread is None)
@@ -0,0 +1,197 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+
+from mock import Mock
+from nose.tools import eq_, ok_, assert_raises
+
+from configman.dotdict import DotDict
+
+from socorro.external.crashstorage_base import (
+    CrashIDNotFound,
+    MemoryDumpsMapping,
+)
+from socorro.external.fs.crashstorage import (
+    ArchiveReadingCrashStore,
+    ArchiveWritingCrashStore,
+    archive_shard_for,
+    archive_shard_paths,
+)
+from socorro.unittest.testbase import TestCase
+
+
+CRASH_IDS = [
+    '0bba929f-8721-460c-dead-a43c2%s' % x
+    for x in ('0071025', '0071026', '0071027', '0071028', '0071029')
+]
+
+
+#==============================================================================
+class TestArchiveCrashStore(TestCase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        super(TestArchiveCrashStore, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        super(TestArchiveCrashStore, self).tearDown()
+
+    #--------------------------------------------------------------------------
+    def _get_config(self, **kwargs):
+        config = DotDict()
+        config.logger = Mock()
+        config.redactor_class = Mock()
+        config.archive_name = os.path.join(self.temp_dir, 'an_archive')
+        config.number_of_shards = 1
+        config.archive_compression = 'zlib'
+        config.archive_compression_level = 6
+        config.shard_numbers = ''
+        config.temporary_file_system_storage_path = self.temp_dir
+        config.dump_file_suffix = '.dump'
+        config.update(kwargs)
+        return config
+
+    #--------------------------------------------------------------------------
+    def _write_archive(self, **kwargs):
+        writer = ArchiveWritingCrashStore(self._get_config(**kwargs))
+        for crash_id in CRASH_IDS:
+            writer.save_raw_crash(
+                {'crash_id': crash_id},
+                MemoryDumpsMapping({
+                    'upload_file_minidump': 'dump of %s' % crash_id,
+                    'flash1': 'flash of %s' % crash_id,
+                }),
+                crash_id
+            )
+            writer.save_processed({'uuid': crash_id, 'signature': 'sig'})
+        writer.close()
+
+    #--------------------------------------------------------------------------
+    def test_random_access(self):
+        self._write_archive()
+        reader = ArchiveReadingCrashStore(self._get_config())
+        try:
+            for crash_id in reversed(CRASH_IDS):
+                eq_(reader.get_raw_crash(crash_id), {'crash_id': crash_id})
+                eq_(
+                    reader.get_unredacted_processed(crash_id),
+                    {'uuid': crash_id, 'signature': 'sig'}
+                )
+                eq_(reader.get_raw_dump(crash_id), 'dump of %s' % crash_id)
+                eq_(
+                    reader.get_raw_dumps(crash_id),
+                    {
+                        'upload_file_minidump': 'dump of %s' % crash_id,
+                        'flash1': 'flash of %s' % crash_id,
+                    }
+                )
+            eq_(list(reader.new_crashes()), CRASH_IDS)
+
+            assert_raises(CrashIDNotFound, reader.get_raw_crash, 'nope')
+            assert_raises(
+                CrashIDNotFound,
+                reader.get_raw_dump,
+                CRASH_IDS[0],
+                'flash2'
+            )
+
+            dumps = reader.get_raw_dumps_as_files(CRASH_IDS[0])
+            with open(dumps['flash1']) as dump_file:
+                eq_(dump_file.read(), 'flash of %s' % CRASH_IDS[0])
+        finally:
+            reader.close()
+
+    #--------------------------------------------------------------------------
+    def test_uncompressed_and_appended(self):
+        self._write_archive(archive_compression='none')
+        # an archive may be added to, a crash saved again replaces its
+        # earlier records
+        writer = ArchiveWritingCrashStore(self._get_config())
+        writer.save_processed({'uuid': CRASH_IDS[0], 'signature': 'new'})
+        writer.close()
+
+        data_path, index_path = archive_shard_paths(
+            self._get_config().archive_name,
+            0
+        )
+        with open(data_path) as data_file:
+            ok_(
+                '{"crash_id": "%s"}' % CRASH_IDS[0] in data_file.read()
+            )
+
+        reader = ArchiveReadingCrashStore(self._get_config())
+        try:
+            eq_(
+                reader.get_unredacted_processed(CRASH_IDS[0]),
+                {'uuid': CRASH_IDS[0], 'signature': 'new'}
+            )
+            eq_(
+                reader.get_raw_crash(CRASH_IDS[0]),
+                {'crash_id': CRASH_IDS[0]}
+            )
+            eq_(list(reader.new_crashes()), CRASH_IDS)
+        finally:
+            reader.close()
+
+    #--------------------------------------------------------------------------
+    def test_shards(self):
+        self._write_archive(number_of_shards=3)
+        shards = dict(
+            (crash_id, archive_shard_for(crash_id, 3))
+            for crash_id in CRASH_IDS
+        )
+
+        crash_ids_read = []
+        for a_shard_number in range(3):
+            reader = ArchiveReadingCrashStore(
+                self._get_config(shard_numbers=str(a_shard_number))
+            )
+            try:
+                for crash_id in reader.new_crashes():
+                    eq_(shards[crash_id], a_shard_number)
+                    eq_(
+                        reader.get_raw_crash(crash_id),
+                        {'crash_id': crash_id}
+                    )
+                    crash_ids_read.append(crash_id)
+            finally:
+                reader.close()
+        eq_(sorted(crash_ids_read), sorted(CRASH_IDS))
+
+        reader = ArchiveReadingCrashStore(self._get_config())
+        eq_(sorted(reader.new_crashes()), sorted(CRASH_IDS))
+        reader.close()
+
+    #--------------------------------------------------------------------------
+    def test_records_without_data_are_skipped(self):
+        self._write_archive()
+        data_path, index_path = archive_shard_paths(
+            self._get_config().archive_name,
+            0
+        )
+        # an index line without data, as left by a writer that was killed,
+        # and a garbled line
+        with open(index_path, 'a') as index_file:
+            index_file.write('%s\traw_crash\t999999\t10\t1\n' % ('x' * 36))
+            index_file.write('garbage\n')
+        reader = ArchiveReadingCrashStore(self._get_config())
+        try:
+            eq_(list(reader.new_crashes()), CRASH_IDS)
+            ok_(reader.logger.warning.called)
+        finally:
+            reader.close()
+
+    #--------------------------------------------------------------------------
+    def test_empty_archive(self):
+        ArchiveWritingCrashStore(self._get_config()).close()
+        reader = ArchiveReadingCrashStore(self._get_config())
+        eq_(list(reader.new_crashes()), [])
+        assert_raises(CrashIDNotFound, reader.get_raw_crash, CRASH_IDS[0])
+        reader.close()
@@ -1,5 +1,6 @@
 import os
 import shutil
+import time
 from mock import Mock
 from configman import ConfigurationManager
 from nose.tools import eq_, ok_, assert_raises
@@ -36,7 +37,8 @@ class TestFSDatedRadixTreeStorage(TestCase):
           app_description='app description',
           values_source_list=[{
             'logger': mock_logging,
-            'minute_slice_interval': 1
+            'minute_slice_interval': 1,
+            'new_crash_journal': True,
           }],
           argv_source=[]
         )
@@ -252,3 +254,122 @@ class TestFSDatedRadixTreeStorage(TestCase):
         eq_(list(self.fsrts.new_crashes()), [])
         self.fsrts.remove(self.CRASH_ID_1)
         del self.fsrts._current_slot
+
+    def _get_journal_path(self):
+        return self.fsrts._get_journal_path(
+            os.sep.join(self.fsrts._get_base(self.CRASH_ID_1))
+        )
+
+    def test_new_crashes_from_journal(self):
+        self.fsrts._current_slot = lambda: ['00', '00_00']
+        self._make_test_crash()
+        journal_path = self._get_journal_path()
+        with open(journal_path) as journal:
+            eq_(journal.read(), '%s 00/00_00\n' % self.CRASH_ID_1)
+
+        # no full scan was due, the journal is enough
+        self.fsrts._last_full_scan = time.time()
+        self.fsrts._scan_new_crashes = Mock(return_value=iter([]))
+        self.fsrts._current_slot = lambda: ['00', '00_01']
+        eq_(list(self.fsrts.new_crashes()), [self.CRASH_ID_1])
+        ok_(not self.fsrts._scan_new_crashes.called)
+        eq_(
+            self.fsrts._load_journal_offset(journal_path),
+            os.path.getsize(journal_path)
+        )
+        # the empty slot was removed
+        ok_(not os.path.exists(
+            self.fsrts._get_dated_parent_directory(
+                self.CRASH_ID_1,
+                ['00', '00_00']
+            )
+        ))
+        eq_(list(self.fsrts.new_crashes()), [])
+
+        # a removed crash is skipped
+        self.fsrts._current_slot = lambda: ['00', '00_02']
+        self.fsrts.save_raw_crash(
+            {"test": "TEST"},
+            MemoryDumpsMapping(),
+            self.CRASH_ID_2
+        )
+        self.fsrts.remove(self.CRASH_ID_2)
+        self.fsrts._current_slot = lambda: ['00', '00_03']
+        eq_(list(self.fsrts.new_crashes()), [])
+        eq_(
+            self.fsrts._load_journal_offset(journal_path),
+            os.path.getsize(journal_path)
+        )
+
+    def test_journal_stops_at_current_slot(self):
+        self.fsrts._get_current_date = lambda: '20071025'
+        self.fsrts._last_full_scan = time.time()
+        self.fsrts._current_slot = lambda: ['00', '00_00']
+        self._make_test_crash()
+        journal_path = self._get_journal_path()
+        # a partly written line is left alone
+        with open(journal_path, 'a') as journal:
+            journal.write('0bba929f-8721-460c')
+
+        eq_(list(self.fsrts.new_crashes()), [])
+        eq_(self.fsrts._load_journal_offset(journal_path), 0)
+
+        self.fsrts._current_slot = lambda: ['00', '00_01']
+        eq_(list(self.fsrts.new_crashes()), [self.CRASH_ID_1])
+        eq_(
+            self.fsrts._load_journal_offset(journal_path),
+            len('%s 00/00_00\n' % self.CRASH_ID_1)
+        )
+
+    def test_full_scans(self):
+        self.fsrts._current_slot = lambda: ['00', '00_00']
+        self._make_test_crash()
+        # crashes saved without a journal are found by the full scan of the
+        # first pass
+        os.unlink(self._get_journal_path())
+        self.fsrts._current_slot = lambda: ['00', '00_01']
+        eq_(list(self.fsrts.new_crashes()), [self.CRASH_ID_1])
+
+        self.fsrts._scan_new_crashes = Mock(return_value=iter([]))
+        list(self.fsrts.new_crashes())
+        ok_(not self.fsrts._scan_new_crashes.called)
+
+        self.fsrts._last_full_scan -= (
+            self.fsrts.config.journal_full_scan_interval
+        )
+        list(self.fsrts.new_crashes())
+        ok_(self.fsrts._scan_new_crashes.called)
+
+    def test_finished_journals_do_not_keep_their_date(self):
+        self.fsrts._current_slot = lambda: ['00', '00_00']
+        self._make_test_crash()
+        self.fsrts._current_slot = lambda: ['00', '00_01']
+        eq_(list(self.fsrts.new_crashes()), [self.CRASH_ID_1])
+        date_root = os.sep.join(self.fsrts._get_base(self.CRASH_ID_1))
+        # the journal stays while the crash is in the date directory
+        list(self.fsrts.new_crashes())
+        ok_(os.path.exists(self._get_journal_path()))
+
+        self.fsrts.remove(self.CRASH_ID_1)
+        for a_branch in (
+            self.fsrts.config.name_branch_base,
+            self.fsrts.config.date_branch_base,
+        ):
+            shutil.rmtree(os.sep.join([date_root, a_branch]))
+        list(self.fsrts.new_crashes())
+        ok_(not os.path.exists(date_root))
+
+    def test_journal_is_off_by_default(self):
+        eq_(
+            FSDatedRadixTreeStorage.get_required_config()
+            .new_crash_journal.default,
+            False
+        )
+
+    def test_new_crashes_without_journal(self):
+        self.fsrts.config.new_crash_journal = False
+        self.fsrts._current_slot = lambda: ['00', '00_00']
+        self._make_test_crash()
+        ok_(not os.path.exists(self._get_journal_path()))
+        self.fsrts._current_slot = lambda: ['00', '00_01']
+        eq_(list(self.fsrts.new_crashes()), [self.CRASH_ID_1])
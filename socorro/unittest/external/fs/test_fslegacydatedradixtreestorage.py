@@ -1,5 +1,6 @@
 import os
 import shutil
+import time
 from mock import Mock
 from configman import ConfigurationManager
 from nose.tools import eq_, ok_, assert_raises
@@ -147,6 +148,19 @@ class TestFSLegacyDatedRadixTreeStorage(TestCase):
         eq_(list(self.fsrts.new_crashes()),
                          [self.CRASH_ID_1])
 
+    def test_journal_is_not_used(self):
+        # the journal does not list the crashes in the webhead slots, so the
+        # legacy storage scans the whole tree on every pass
+        self.fsrts.config.new_crash_journal = True
+        self.fsrts._current_slot = lambda: ['00', '00_00']
+        self._make_test_crash()
+        ok_(not os.path.exists(self.fsrts._get_journal_path(
+            os.sep.join(self.fsrts._get_base(self.CRASH_ID_1))
+        )))
+        self.fsrts._last_full_scan = time.time()
+        self.fsrts._current_slot = lambda: ['00', '00_01']
+        eq_(list(self.fsrts.new_crashes()), [self.CRASH_ID_1])
+
     def test_doesnt_raise_oserror(self):
         # Bug 1297760 is caused by trying to create a symlink which kicks up
         # an OSError which never gets handled which causes the collector to
@@ -85,6 +85,29 @@ class TestFSRadixTreeStorage(TestCase):
         assert_raises(CrashIDNotFound, self.fsrts.get_unredacted_processed,
                           self.CRASH_ID_1)
 
+    def test_processed_crash_compression(self):
+        jsonz_pathname = os.path.join(
+            self.fsrts._get_radixed_parent_directory(self.CRASH_ID_2),
+            self.CRASH_ID_2 + self.fsrts.config.jsonz_file_suffix
+        )
+        self.fsrts.config.processed_crash_compression = 'zlib'
+        self.fsrts.metrics = Mock()
+        self._make_processed_test_crash()
+        with open(jsonz_pathname, 'rb') as f:
+            ok_(f.read(1) == 'x')
+        eq_(self.fsrts.get_unredacted_processed(self.CRASH_ID_2)['test'],
+            "TEST")
+        stats = self.fsrts.metrics.capture_stats.call_args[0][0]
+        eq_(stats['fs.processed_crash.compression_level'], 9)
+
+        # an uncompressed processed crash is read as well
+        self.fsrts.config.processed_crash_compression = 'none'
+        self._make_processed_test_crash()
+        with open(jsonz_pathname, 'rb') as f:
+            ok_(f.read(1) == '{')
+        eq_(self.fsrts.get_unredacted_processed(self.CRASH_ID_2)['test'],
+            "TEST")
+
     def test_get_processed_crash(self):
         self._make_processed_test_crash()
         eq_(self.fsrts.get_processed(self.CRASH_ID_2)['test'],
@@ -2,10 +2,17 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
-from nose.tools import eq_, ok_
+import mock
+from nose.tools import eq_, ok_, assert_raises
 import psycopg2
 
-from socorro.external.postgresql.connection_context import ConnectionContext
+from socorro.external.postgresql.connection_context import (
+    ConnectionContext,
+    ConnectionContextPooled,
+    clear_connection_pools,
+)
+from socorro.lib.connection_pool import ConnectionPoolTimeout
+from socorro.lib.util import DotDict
 from socorro.unittest.testbase import TestCase
 from configman import Namespace
 
@@ -17,6 +24,7 @@ class MockConnection(object):
 
     def __init__(self, dsn):
         self.dsn = dsn
+        self.closed = 0
         self.transaction_status = psycopg2.extensions.TRANSACTION_STATUS_IDLE
 
     def get_transaction_status(self):
@@ -87,3 +95,190 @@ class TestConnectionContext(TestCase):
         eq_(_closes, 3)
         eq_(_commits, 0)
         eq_(_rollbacks, 0)
+
+
+class TestConnectionContextPooled(TestCase):
+
+    def setUp(self):
+        super(TestConnectionContextPooled, self).setUp()
+        clear_connection_pools()
+
+    def tearDown(self):
+        clear_connection_pools()
+        super(TestConnectionContextPooled, self).tearDown()
+
+    def get_config(self, **kwargs):
+        config = DotDict()
+        config.logger = mock.Mock()
+        config.database_hostname = 'host'
+        config.database_name = 'name'
+        config.database_port = 5432
+        config.database_username = 'user'
+        config.database_password = 'password'
+        config.maximum_connections = 2
+        config.checkout_timeout = 0
+        config.maximum_connection_idle_seconds = 300
+        config.connection_health_check_seconds = 10
+        config.metrics_class = None
+        config.update(kwargs)
+        return config
+
+    def get_context(self, config=None, **kwargs):
+        context = ConnectionContextPooled(config or self.get_config(**kwargs))
+        context.pool.connection_factory = mock.Mock(
+            side_effect=lambda: mock.Mock(
+                closed=0,
+                get_transaction_status=mock.Mock(
+                    return_value=psycopg2.extensions.TRANSACTION_STATUS_IDLE
+                ),
+            )
+        )
+        return context
+
+    def test_connections_are_reused(self):
+        context = self.get_context()
+        with context() as connection:
+            pass
+        with context() as same_connection:
+            ok_(same_connection is connection)
+        ok_(not connection.close.called)
+        eq_(context.pool.connection_factory.call_count, 1)
+        eq_(context.pool_stats()['postgresql.pool.idle'], 1)
+
+    def test_pool_is_shared(self):
+        config = self.get_config()
+        context = self.get_context(config)
+        other_context = self.get_context(config)
+        ok_(other_context.pool is context.pool)
+        ok_(
+            self.get_context(database_name='other').pool is not context.pool
+        )
+
+        with context() as connection:
+            pass
+        with other_context() as other_connection:
+            ok_(other_connection is connection)
+
+        # the pool is closed with its last user
+        context.close()
+        context.close()
+        ok_(not connection.close.called)
+        other_context.close()
+        connection.close.assert_called_once_with()
+
+    def test_pools_are_not_shared_across_a_fork(self):
+        context = self.get_context()
+        with context() as connection:
+            pass
+        parent_pool = context.pool
+
+        patch_path = 'socorro.external.postgresql.connection_context.os.getpid'
+        with mock.patch(patch_path, return_value=-1):
+            # as in the child process of a fork
+            context.pool = parent_pool
+            ok_(self.get_context().pool is not parent_pool)
+            with context() as child_connection:
+                ok_(child_connection is not connection)
+            ok_(context.pool is not parent_pool)
+
+            # the inherited pool is forgotten, not closed
+            clear_connection_pools()
+            ok_(not connection.close.called)
+
+    def test_maximum_connections_and_timeout(self):
+        context = self.get_context(
+            maximum_connections=1,
+            checkout_timeout=0.01
+        )
+        with context():
+            def second_transaction():
+                with context():
+                    raise AssertionError('a second connection was made')
+            assert_raises(ConnectionPoolTimeout, second_transaction)
+        eq_(context.pool.timeouts, 1)
+        # the transaction executors retry on a timeout
+        ok_(ConnectionPoolTimeout in context.operational_exceptions)
+
+    def test_failed_connections_are_discarded(self):
+        context = self.get_context()
+        try:
+            with context() as connection:
+                raise psycopg2.OperationalError('server closed the connection')
+        except psycopg2.OperationalError:
+            pass
+        connection.close.assert_called_once_with()
+        eq_(len(context.pool), 0)
+
+        # a genuine error leaves the connection usable
+        try:
+            with context() as connection:
+                raise psycopg2.ProgrammingError('syntax error')
+        except psycopg2.ProgrammingError:
+            pass
+        ok_(not connection.close.called)
+        eq_(len(context.pool), 1)
+
+        # so does an error outside the database
+        try:
+            with context() as connection:
+                raise NameError('oops')
+        except NameError:
+            pass
+        ok_(not connection.close.called)
+
+        # connections closed during the transaction are discarded
+        with context() as connection:
+            connection.closed = 2
+        eq_(len(context.pool), 0)
+
+    def test_open_transactions_are_rolled_back(self):
+        context = self.get_context()
+        with context() as connection:
+            connection.get_transaction_status.return_value = (
+                psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+            )
+        connection.rollback.assert_called_once_with()
+        eq_(context.pool_stats()['postgresql.pool.idle'], 1)
+
+        connection.rollback.side_effect = psycopg2.InterfaceError('gone')
+        with context() as same_connection:
+            ok_(same_connection is connection)
+        eq_(len(context.pool), 0)
+
+    def test_health_check(self):
+        context = self.get_context()
+        context.pool._clock = mock.Mock(return_value=1000.0)
+        with context() as connection:
+            pass
+        context.pool._clock.return_value = 1020.0
+        connection.cursor.return_value.execute.side_effect = (
+            psycopg2.OperationalError('server closed the connection')
+        )
+        with context() as new_connection:
+            ok_(new_connection is not connection)
+        connection.cursor.return_value.execute.assert_called_once_with(
+            'select 1'
+        )
+        connection.close.assert_called_once_with()
+
+    def test_with_transaction_executor(self):
+        from socorro.database.transaction_executor import (
+            TransactionExecutorWithInfiniteBackoff
+        )
+        config = self.get_config()
+        config.backoff_delays = [0, 0]
+        config.wait_log_interval = 0
+        context = self.get_context(config)
+        executor = TransactionExecutorWithInfiniteBackoff(config, context)
+        connections = []
+
+        def a_transaction(connection):
+            connections.append(connection)
+            if len(connections) == 1:
+                raise psycopg2.OperationalError('server closed the connection')
+            return 17
+        eq_(executor(a_transaction), 17)
+        ok_(connections[0] is not connections[1])
+        connections[0].close.assert_called_once_with()
+        connections[1].commit.assert_called_once_with()
+        eq_(context.pool_stats()['postgresql.pool.idle'], 1)
@@ -2,6 +2,8 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+import datetime
+import json
 import time
 
 import mock
@@ -21,6 +23,7 @@ from socorro.external.postgresql.crashstorage import (
     PostgreSQLBasicCrashStorage,
     PostgreSQLCrashStorage,
 )
+from socorro.lib.datetimeutil import UTC
 from socorro.unittest.testbase import TestCase
 
 empty_tuple = ()
@@ -659,3 +662,197 @@ class TestPostgresCrashStorage(TestCase):
                     'select raw_crash from raw_crashes_20120402 where uuid = %s',
                     ('936ce666-ff3b-4c7a-9674-367fe2120408',)
                 )
+
+
+class TestPostgresCrashStorageBatches(TestCase):
+    """
+    Tests of the batched saving of processed crashes where the actual
+    PostgreSQL part is mocked.
+    """
+
+    other_crash_id = "aaace666-ff3b-4c7a-9674-367fe2120408"
+
+    def get_config(self, batch_size):
+        config = DotDict()
+        config.database_class = mock.MagicMock()
+        config.transaction_executor_class = (
+            TransactionExecutorWithInfiniteBackoff
+        )
+        config.backoff_delays = [1]
+        config.wait_log_interval = 10
+        config.redactor_class = mock.Mock()
+        config.logger = mock.Mock()
+        config.processed_crash_batch_size = batch_size
+        config.processed_crash_flush_interval = 0
+        config.plugin_id_cache_size = 10
+        return config
+
+    def get_cursor(self, config):
+        mocked_connection = (
+            config.database_class.return_value.return_value
+            .__enter__.return_value
+        )
+        return mocked_connection.cursor.return_value.__enter__.return_value
+
+    def get_other_processed_crash(self):
+        other_processed_crash = dict(a_processed_crash)
+        other_processed_crash['uuid'] = self.other_crash_id
+        return other_processed_crash
+
+    def test_save_processed_in_a_batch(self):
+        config = self.get_config(2)
+        mocked_cursor = self.get_cursor(config)
+        fetch_all_returns = [
+            [(666, a_processed_crash['uuid']), (667, self.other_crash_id)],
+            ((23,),),
+        ]
+        mocked_cursor.fetchall.side_effect = (
+            lambda: fetch_all_returns.pop(0)
+        )
+
+        crashstorage = PostgreSQLCrashStorage(config)
+        crashstorage.save_processed(a_processed_crash)
+        # nothing is written until the batch is full
+        eq_(mocked_cursor.execute.call_count, 0)
+        crashstorage.save_processed(self.get_other_processed_crash())
+
+        # the plugin is looked up once for both crashes
+        eq_(mocked_cursor.execute.call_count, 5)
+        sql_fragments = [
+            'json_populate_recordset(\n                NULL::reports_20120402',
+            'select id from plugins',
+            'delete from plugins_reports_20120402 where report_id = ANY',
+            'insert into plugins_reports_20120402',
+            'INSERT INTO processed_crashes_20120402',
+        ]
+        calls = mocked_cursor.execute.call_args_list
+        for a_call, a_fragment in zip(calls, sql_fragments):
+            ok_(a_fragment in a_call[0][0], a_fragment)
+
+        reports = json.loads(calls[0][0][1][0])
+        eq_(
+            [x['uuid'] for x in reports],
+            [a_processed_crash['uuid'], self.other_crash_id]
+        )
+        eq_(reports[0]['signature'], 'libxul.so@0x117441c')
+        eq_(calls[2][0][1], ([666, 667],))
+        eq_(
+            json.loads(calls[3][0][1][0]),
+            [
+                {
+                    'report_id': 666,
+                    'plugin_id': 23,
+                    'date_processed': '2012-04-08 10:56:41.558922',
+                    'version': '69',
+                },
+                {
+                    'report_id': 667,
+                    'plugin_id': 23,
+                    'date_processed': '2012-04-08 10:56:41.558922',
+                    'version': '69',
+                },
+            ]
+        )
+        processed_crashes = json.loads(calls[4][0][1][0])
+        eq_(processed_crashes[1]['uuid'], self.other_crash_id)
+        eq_(
+            processed_crashes[1]['processed_crash']['product'],
+            'FennecAndroid'
+        )
+
+        # the statements of the partition are kept for the next batches
+        eq_(len(crashstorage._sql_cache), 4)
+        crashstorage.close()
+        eq_(mocked_cursor.execute.call_count, 5)
+
+    def test_timestamps_keep_their_offset_in_a_batch(self):
+        config = self.get_config(1)
+        mocked_cursor = self.get_cursor(config)
+        mocked_cursor.fetchall.return_value = [
+            (666, a_processed_crash['uuid'])
+        ]
+        a_crash = dict(
+            a_processed_crash,
+            date_processed=datetime.datetime(
+                2012, 4, 8, 10, 56, 41, 558922, tzinfo=UTC
+            ),
+        )
+        crashstorage = PostgreSQLCrashStorage(config)
+        crashstorage.save_processed(a_crash)
+
+        calls = mocked_cursor.execute.call_args_list
+        reports = json.loads(calls[0][0][1][0])
+        eq_(reports[0]['date_processed'], '2012-04-08T10:56:41.558922+00:00')
+        processed_crashes = json.loads(calls[-1][0][1][0])
+        eq_(
+            processed_crashes[0]['date_processed'],
+            '2012-04-08T10:56:41.558922+00:00'
+        )
+
+    def test_save_processed_again_in_a_batch(self):
+        config = self.get_config(2)
+        crashstorage = PostgreSQLCrashStorage(config)
+        crashstorage.save_processed(a_processed_crash)
+        crashstorage.save_processed(a_processed_crash)
+        # the second save replaced the first one in the batch
+        eq_(crashstorage._number_buffered, 1)
+
+    def test_save_processed_refuses_broken_crashes(self):
+        config = self.get_config(2)
+        crashstorage = PostgreSQLCrashStorage(config)
+        assert_raises(
+            KeyError,
+            crashstorage.save_processed,
+            {"uuid": self.other_crash_id}
+        )
+        eq_(crashstorage._number_buffered, 0)
+
+    def test_close_writes_failed_batch_one_crash_at_a_time(self):
+        config = self.get_config(10)
+        mocked_cursor = self.get_cursor(config)
+        mocked_cursor.fetchall.return_value = [
+            (666, a_processed_crash['uuid'])
+        ]
+
+        def mock_execute(sql, parameters):
+            if 'reports' in sql and self.other_crash_id in parameters[0]:
+                raise psycopg2.ProgrammingError('bad crash')
+        mocked_cursor.execute.side_effect = mock_execute
+
+        crashstorage = PostgreSQLCrashStorage(config)
+        a_crash = dict(a_processed_crash, process_type=None)
+        crashstorage.save_processed(a_crash)
+        other_crash = self.get_other_processed_crash()
+        other_crash['process_type'] = None
+        crashstorage.save_processed(other_crash)
+        crashstorage.close()
+
+        # the batch, then each crash on its own
+        reports_calls = [
+            x for x in mocked_cursor.execute.call_args_list
+            if 'reports_20120402' in x[0][0]
+        ]
+        eq_(len(reports_calls), 3)
+        ok_(config.logger.warning.called)
+        config.logger.error.assert_called_once_with(
+            'failed to save processed crash %s',
+            self.other_crash_id,
+            exc_info=True
+        )
+        eq_(crashstorage._number_buffered, 0)
+
+    def test_plugin_ids_and_statements_are_cached(self):
+        config = self.get_config(0)
+        mocked_cursor = self.get_cursor(config)
+
+        crashstorage = PostgreSQLCrashStorage(config)
+        crashstorage.save_processed(a_processed_crash)
+        crashstorage.save_processed(self.get_other_processed_crash())
+
+        plugin_lookups = [
+            x for x in mocked_cursor.execute.call_args_list
+            if 'select id from plugins' in x[0][0]
+        ]
+        eq_(len(plugin_lookups), 1)
+        # reports_20120402 and processed_crashes_20120402
+        eq_(len(crashstorage._sql_cache), 2)
@@ -1,4 +1,4 @@
-from mock import Mock, MagicMock, patch
+from mock import Mock, MagicMock, patch, call
 
 from nose.tools import eq_, ok_
 
@@ -464,3 +464,170 @@ class TestCrashStorage(TestCase):
         expected = ['normal_crash_id', 'reprocessing_crash_id']
         for result in crash_store.new_crashes():
             eq_(expected.pop(), result)
+
+
+class TestPushConsumer(TestCase):
+
+    def _setup_crash_store(self, deliveries):
+        """returns a crash store whose consumers receive, for each call to
+        process_data_events, the next list of (queue, crash_id) pairs of
+        'deliveries'"""
+        config = DotDict()
+        config.transaction_executor_class = TransactionExecutor
+        config.logger = Mock()
+        config.rabbitmq_class = MagicMock()
+        config.routing_key = 'socorro.normal'
+        config.filter_on_legacy_processing = True
+        config.redactor_class = Redactor
+        config.forbidden_keys = Redactor.required_config.forbidden_keys.default
+        config.throttle = 100
+        config.push_consumer = True
+        config.prefetch_count = 10
+        config.queue_weights = '3,2,1'
+        config.consumer_wait_seconds = 1.0
+        config.consumer_metrics_interval = 60
+        config.metrics_class = None
+        crash_store = RabbitMQCrashStorage(config)
+        crash_store.rabbitmq.config.standard_queue_name = 'socorro.normal'
+        crash_store.rabbitmq.config.reprocessing_queue_name = \
+            'socorro.reprocessing'
+        crash_store.rabbitmq.config.priority_queue_name = 'socorro.priority'
+
+        connection = \
+            crash_store.rabbitmq.return_value.__enter__.return_value
+        consumers = {}
+
+        def basic_consume(callback, queue):
+            consumers[queue] = callback
+        connection.channel.basic_consume.side_effect = basic_consume
+
+        def process_data_events(time_limit):
+            if deliveries:
+                for queue, crash_id in deliveries.pop(0):
+                    method_frame = DotDict({'delivery_tag': crash_id})
+                    consumers[queue](
+                        connection.channel,
+                        method_frame,
+                        None,
+                        crash_id
+                    )
+        connection.connection.process_data_events.side_effect = \
+            process_data_events
+        return crash_store, connection
+
+    def test_new_crashes(self):
+        crash_store, connection = self._setup_crash_store([
+            [('socorro.normal', 'normal_1')],
+            [],
+            [('socorro.priority', 'priority_1')],
+        ])
+        eq_(list(crash_store.new_crashes()), ['normal_1', 'priority_1'])
+
+        connection.channel.basic_qos.assert_called_once_with(
+            prefetch_count=10,
+            all_channels=True
+        )
+        eq_(
+            sorted(
+                x[1]['queue']
+                for x in connection.channel.basic_consume.call_args_list
+            ),
+            ['socorro.normal', 'socorro.priority', 'socorro.reprocessing']
+        )
+        # nothing arrived in the last wait
+        connection.connection.process_data_events.assert_called_with(
+            time_limit=1.0
+        )
+        ok_(not connection.channel.basic_get.called)
+
+        # the consumers are registered only once per channel
+        eq_(list(crash_store.new_crashes()), [])
+        eq_(connection.channel.basic_qos.call_count, 1)
+
+        crash_store.ack_crash('normal_1')
+        list(crash_store.new_crashes())
+        connection.channel.basic_ack.assert_called_once_with(
+            delivery_tag='normal_1'
+        )
+        eq_(crash_store.acknowledgement_token_cache.keys(), ['priority_1'])
+
+    def test_close_sends_the_remaining_acknowledgements(self):
+        crash_store, connection = self._setup_crash_store([
+            [('socorro.normal', 'normal_1'), ('socorro.priority', 'p_1')],
+        ])
+        eq_(list(crash_store.new_crashes()), ['p_1', 'normal_1'])
+        # the crashes finish processing after the iteration has stopped
+        crash_store.ack_crash('p_1')
+        crash_store.ack_crash('normal_1')
+        ok_(not connection.channel.basic_ack.called)
+
+        crash_store.close()
+        eq_(
+            connection.channel.basic_ack.call_args_list,
+            [call(delivery_tag='p_1'), call(delivery_tag='normal_1')]
+        )
+        eq_(crash_store.acknowledgement_token_cache, {})
+        crash_store.rabbitmq.close.assert_called_once_with()
+
+    def test_weighted_round_robin(self):
+        deliveries = [
+            [('socorro.priority', 'p%d' % x) for x in range(6)] +
+            [('socorro.normal', 'n%d' % x) for x in range(6)] +
+            [('socorro.reprocessing', 'r%d' % x) for x in range(2)]
+        ]
+        crash_store, connection = self._setup_crash_store(deliveries)
+        eq_(
+            list(crash_store.new_crashes()),
+            [
+                'p0', 'n0', 'p1', 'r0', 'n1', 'p2',
+                'p3', 'n2', 'p4', 'r1', 'n3', 'p5',
+                # the standard queue is left alone
+                'n4', 'n5',
+            ]
+        )
+
+    def test_duplicates_are_acknowledged(self):
+        crash_store, connection = self._setup_crash_store([
+            [('socorro.normal', 'a_crash'), ('socorro.priority', 'a_crash')],
+        ])
+        eq_(list(crash_store.new_crashes()), ['a_crash'])
+        connection.channel.basic_ack.assert_called_once_with(
+            delivery_tag='a_crash'
+        )
+
+    def test_new_channel_registers_again(self):
+        crash_store, connection = self._setup_crash_store([
+            [('socorro.normal', 'normal_1'), ('socorro.normal', 'normal_2')],
+        ])
+        crashes = crash_store.new_crashes()
+        eq_(next(crashes), 'normal_1')
+        # as after a reconnection
+        connection.channel = MagicMock()
+        eq_(list(crashes), [])
+        eq_(connection.channel.basic_qos.call_count, 1)
+        eq_(connection.channel.basic_consume.call_count, 3)
+
+    def test_metrics(self):
+        crash_store, connection = self._setup_crash_store([
+            [('socorro.priority', 'p0'), ('socorro.normal', 'n0')],
+        ])
+        crash_store.metrics = Mock()
+        connection.channel.queue_declare.return_value.method \
+            .message_count = 5
+        crashes = crash_store.new_crashes()
+        eq_(next(crashes), 'p0')
+        ok_(not crash_store.metrics.capture_stats.called)
+        crash_store._last_metrics_report -= 120
+        eq_(list(crashes), ['n0'])
+        eq_(crash_store.metrics.capture_stats.call_count, 1)
+        stats = crash_store.metrics.capture_stats.call_args[0][0]
+        eq_(stats['rabbitmq.consumer.priority.consumed'], 1)
+        eq_(stats['rabbitmq.consumer.standard.consumed'], 0)
+        eq_(stats['rabbitmq.consumer.reprocessing.lag'], 5)
+        # one crash was yielded, the other was still waiting
+        eq_(stats['rabbitmq.consumer.prefetch_occupancy'], 20)
+        connection.channel.queue_declare.assert_called_with(
+            queue='socorro.reprocessing',
+            durable=True,
+            passive=True
+        )
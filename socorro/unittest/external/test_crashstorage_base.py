@@ -3,6 +3,10 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import copy
+import shutil
+import tempfile
+import threading
+import time
 
 import mock
 from nose.tools import eq_, ok_, assert_raises
@@ -10,6 +14,7 @@ from nose.tools import eq_, ok_, assert_raises
 from socorro.external.crashstorage_base import (
     CrashStorageBase,
     PolyStorageError,
+    PolyStorageTimeout,
     PolyCrashStorage,
     FallbackCrashStorage,
     MigrationCrashStorage,
@@ -17,8 +22,11 @@ from socorro.external.crashstorage_base import (
     PrimaryDeferredProcessedStorage,
     Redactor,
     BenchmarkingCrashStorage,
+    CachingCrashStorage,
+    CrashIDNotFound,
     MemoryDumpsMapping,
     FileDumpsMapping,
+    MemoryBackedFileDumpsMapping,
     socorrodotdict_to_dict
 )
 from socorro.lib.util import DotDict as SocorroDotDict
@@ -496,6 +504,248 @@ class TestBase(TestCase):
             eq_(processed_crash['foo']['other'], 'thing')
             eq_(processed_crash['bar']['something'], 'else')
 
+    def test_poly_crash_storage_concurrent_saves(self):
+        n = Namespace()
+        n.add_option(
+            'storage',
+            default=PolyCrashStorage,
+        )
+        n.add_option(
+            'logger',
+            default=mock.Mock(),
+        )
+        value = {
+            'storage_classes': (
+                'socorro.unittest.external.test_crashstorage_base.A,'
+                'socorro.unittest.external.test_crashstorage_base.A,'
+                'socorro.unittest.external.test_crashstorage_base.B'
+            ),
+            'concurrent_saves': True,
+            'number_of_save_threads': 3,
+            'save_timeout': 5,
+        }
+        cm = ConfigurationManager(n, values_source_list=[value])
+        with cm.context() as config:
+            poly_store = config.storage(config)
+            raw_crash = {'ooid': ''}
+            dump = '12345'
+            processed_crash = {'ooid': '', 'product': 17}
+
+            # the stores save in the threads of the pool
+            saving_threads = set()
+
+            def save(*args):
+                saving_threads.add(threading.current_thread().name)
+            for v in poly_store.stores.itervalues():
+                v.save_raw_crash = Mock(side_effect=save)
+                v.save_processed = Mock(side_effect=save)
+                v.save_raw_and_processed = Mock(side_effect=save)
+                v.close = Mock()
+
+            poly_store.save_raw_crash(raw_crash, dump, 'n')
+            for v in poly_store.stores.itervalues():
+                v.save_raw_crash.assert_called_once_with(raw_crash, dump, 'n')
+            poly_store.save_processed(processed_crash)
+            for v in poly_store.stores.itervalues():
+                v.save_processed.assert_called_once_with(processed_crash)
+            poly_store.save_raw_and_processed(
+                raw_crash,
+                dump,
+                processed_crash,
+                'n'
+            )
+            for v in poly_store.stores.itervalues():
+                v.save_raw_and_processed.assert_called_once_with(
+                    raw_crash,
+                    dump,
+                    processed_crash,
+                    'n'
+                )
+            ok_(threading.current_thread().name not in saving_threads)
+
+            poly_store.stores.storage1.save_raw_crash.side_effect = (
+                Exception('this is messed up')
+            )
+            with self.assertRaises(PolyStorageError) as raised:
+                poly_store.save_raw_crash(raw_crash, dump, 'n')
+            eq_(len(raised.exception), 1)
+            eq_(str(raised.exception[0][1]), 'this is messed up')
+            for v in poly_store.stores.itervalues():
+                eq_(v.save_raw_crash.call_count, 2)
+
+            poly_store.close()
+            eq_(poly_store._save_pools, {})
+            for v in poly_store.stores.itervalues():
+                v.close.assert_called_with()
+
+    def test_poly_crash_storage_concurrent_save_deadline(self):
+        n = Namespace()
+        n.add_option(
+            'storage',
+            default=PolyCrashStorage,
+        )
+        n.add_option(
+            'logger',
+            default=mock.Mock(),
+        )
+        value = {
+            'storage_classes': (
+                'socorro.unittest.external.test_crashstorage_base.A,'
+                'socorro.unittest.external.test_crashstorage_base.B'
+            ),
+            'concurrent_saves': True,
+            'save_timeout': 5,
+            'store_save_timeouts': 'storage1=0.1',
+        }
+        cm = ConfigurationManager(n, values_source_list=[value])
+        with cm.context() as config:
+            poly_store = config.storage(config)
+            eq_(
+                poly_store.save_timeouts,
+                {'storage0': 5.0, 'storage1': 0.1}
+            )
+            release = threading.Event()
+            poly_store.stores.storage0.save_processed = Mock()
+            poly_store.stores.storage1.save_processed = Mock(
+                side_effect=lambda crash: release.wait(5)
+            )
+            try:
+                with self.assertRaises(PolyStorageError) as raised:
+                    poly_store.save_processed({'uuid': 'n'})
+            finally:
+                release.set()
+            eq_(len(raised.exception), 1)
+            eq_(raised.exception[0][0], PolyStorageTimeout)
+            poly_store.stores.storage0.save_processed.assert_called_once_with(
+                {'uuid': 'n'}
+            )
+            poly_store.close()
+
+    def test_poly_crash_storage_hung_store_does_not_hold_up_others(self):
+        n = Namespace()
+        n.add_option(
+            'storage',
+            default=PolyCrashStorage,
+        )
+        n.add_option(
+            'logger',
+            default=mock.Mock(),
+        )
+        value = {
+            'storage_classes': (
+                'socorro.unittest.external.test_crashstorage_base.A,'
+                'socorro.unittest.external.test_crashstorage_base.B'
+            ),
+            'concurrent_saves': True,
+            'number_of_save_threads': 2,
+            'save_timeout': 5,
+            'store_save_timeouts': 'storage1=0.1',
+        }
+        cm = ConfigurationManager(n, values_source_list=[value])
+        with cm.context() as config:
+            poly_store = config.storage(config)
+            release = threading.Event()
+            poly_store.stores.storage0.save_processed = Mock()
+            poly_store.stores.storage1.save_processed = Mock(
+                side_effect=lambda crash: release.wait(5)
+            )
+            try:
+                for crash_id in ('a', 'b'):
+                    with self.assertRaises(PolyStorageError) as raised:
+                        poly_store.save_processed({'uuid': crash_id})
+                    eq_(len(raised.exception), 1)
+                    eq_(raised.exception[0][0], PolyStorageTimeout)
+                # both threads of the hung store are taken, its next save
+                # fails at once while the other store goes on saving
+                with self.assertRaises(PolyStorageError) as raised:
+                    poly_store.save_processed({'uuid': 'c'})
+                eq_(len(raised.exception), 1)
+                eq_(raised.exception[0][0], PolyStorageTimeout)
+                ok_('busy' in str(raised.exception[0][1]))
+                eq_(poly_store.stores.storage0.save_processed.call_count, 3)
+                eq_(poly_store.stores.storage1.save_processed.call_count, 2)
+            finally:
+                release.set()
+            poly_store.close()
+            eq_(poly_store._saves_in_flight, {'storage0': 0, 'storage1': 0})
+
+    def test_poly_crash_storage_deadline_starts_with_the_save(self):
+        n = Namespace()
+        n.add_option(
+            'storage',
+            default=PolyCrashStorage,
+        )
+        n.add_option(
+            'logger',
+            default=mock.Mock(),
+        )
+        value = {
+            'storage_classes': (
+                'socorro.unittest.external.test_crashstorage_base.A'
+            ),
+            'concurrent_saves': True,
+            'save_timeout': 0.2,
+        }
+        cm = ConfigurationManager(n, values_source_list=[value])
+        with cm.context() as config:
+            poly_store = config.storage(config)
+            poly_store.stores.storage0.save_processed = Mock(
+                side_effect=lambda crash: time.sleep(0.1)
+            )
+            original_start_save = poly_store._start_save
+
+            def slow_start_save(a_namespace):
+                pool = original_start_save(a_namespace)
+                # the pool is slow to start the save
+                pool.apply_async(time.sleep, (0.15,))
+                return pool
+            poly_store.config.number_of_save_threads = 1
+            poly_store._start_save = slow_start_save
+            # waiting for the thread does not count against the store
+            poly_store.save_processed({'uuid': 'n'})
+            poly_store.close()
+
+    def test_poly_crash_storage_concurrent_saves_copy_for_mutators(self):
+        n = Namespace()
+        n.add_option(
+            'storage',
+            default=PolyCrashStorage,
+        )
+        n.add_option(
+            'logger',
+            default=mock.Mock(),
+        )
+        value = {
+            'storage_classes': (
+                'socorro.unittest.external.test_crashstorage_base'
+                '.MutatingProcessedCrashCrashStorage,'
+                'socorro.unittest.external.test_crashstorage_base'
+                '.NonMutatingProcessedCrashCrashStorage'
+            ),
+            'concurrent_saves': True,
+        }
+        cm = ConfigurationManager(n, values_source_list=[value])
+        with cm.context() as config:
+            poly_store = config.storage(config)
+            raw_crash = {'ooid': '12345'}
+            processed_crash = {'foo': 'bar'}
+            saved = []
+            poly_store.stores.storage1.save_raw_and_processed = Mock(
+                side_effect=lambda *args: saved.append(args)
+            )
+            poly_store.save_raw_and_processed(
+                raw_crash,
+                '12345',
+                processed_crash,
+                'n'
+            )
+            # the mutating store deleted 'foo' from a copy of its own
+            eq_(processed_crash, {'foo': 'bar'})
+            # the store that does not mutate is given the original
+            ok_(saved[0][0] is raw_crash)
+            ok_(saved[0][2] is processed_crash)
+            poly_store.close()
+
     def test_fallback_crash_storage(self):
         n = Namespace()
         n.add_option(
@@ -1122,3 +1372,169 @@ class TestDumpsMappings(TestCase):
         )
         ok_(fdm.as_file_dumps_mapping() is fdm)
         eq_(fdm.as_memory_dumps_mapping(), mdm)
+
+    def test_memory_backed_files(self):
+        mdm = MemoryDumpsMapping({
+            'dump': 'binary_data',
+            'moar_dump': "more binary data",
+        })
+        fdm = mdm.as_memory_backed_file_dumps_mapping('a', '.dump')
+        ok_(isinstance(fdm, MemoryBackedFileDumpsMapping))
+        eq_(sorted(fdm.keys()), ['moar_dump', 'upload_file_minidump'])
+        eq_(
+            fdm.as_memory_dumps_mapping(),
+            {
+                'upload_file_minidump': 'binary_data',
+                'moar_dump': "more binary data",
+            }
+        )
+        # the files are readable more than once
+        eq_(open(fdm['moar_dump']).read(), "more binary data")
+
+        closed = []
+        fdm.close_callback = lambda: closed.append(True)
+        fdm.close()
+        eq_(fdm.file_descriptors, [])
+        eq_(closed, [True])
+        # closing twice is harmless
+        fdm.close()
+        eq_(closed, [True])
+
+    @mock.patch('socorro.external.crashstorage_base.memfd_create')
+    def test_memory_backed_files_failure(self, mocked_memfd_create):
+        mocked_memfd_create.side_effect = OSError(38, 'not implemented')
+        mdm = MemoryDumpsMapping({'upload_file_minidump': 'binary_data'})
+        assert_raises(
+            OSError,
+            mdm.as_memory_backed_file_dumps_mapping,
+            'a',
+            '.dump'
+        )
+
+
+class TestCachingCrashStorage(TestCase):
+
+    def setUp(self):
+        super(TestCachingCrashStorage, self).setUp()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        super(TestCachingCrashStorage, self).tearDown()
+
+    def get_store(self):
+        wrapped = Mock()
+        wrapped.get_raw_crash.return_value = {'a': 1, 'b': {'c': 2}}
+        wrapped.get_unredacted_processed.return_value = {'uuid': 'ooid1'}
+        wrapped.get_raw_dump.return_value = 'a dump'
+        wrapped.get_raw_dumps.return_value = MemoryDumpsMapping({
+            'upload_file_minidump': 'a dump',
+            'flash1': 'a flash dump',
+        })
+        config = DotDict()
+        config.logger = Mock()
+        config.redactor_class = Mock()
+        config.wrapped_crashstore = Mock(return_value=wrapped)
+        config.cache_directory = self.temp_dir
+        config.maximum_cache_bytes = 1000
+        config.temporary_file_system_storage_path = self.temp_dir
+        config.dump_file_suffix = '.dump'
+        config.metrics_class = None
+        return CachingCrashStorage(config), wrapped
+
+    def test_reads_are_cached(self):
+        store, wrapped = self.get_store()
+        for x in range(2):
+            raw_crash = store.get_raw_crash('ooid1')
+            eq_(raw_crash, {'a': 1, 'b': {'c': 2}})
+            eq_(raw_crash.b.c, 2)
+            eq_(
+                store.get_unredacted_processed('ooid1'),
+                {'uuid': 'ooid1'}
+            )
+            eq_(
+                store.get_raw_dumps('ooid1'),
+                {'upload_file_minidump': 'a dump', 'flash1': 'a flash dump'}
+            )
+            # the default dump came along with the others
+            eq_(store.get_raw_dump('ooid1'), 'a dump')
+        eq_(wrapped.get_raw_crash.call_count, 1)
+        eq_(wrapped.get_unredacted_processed.call_count, 1)
+        eq_(wrapped.get_raw_dumps.call_count, 1)
+        ok_(not wrapped.get_raw_dump.called)
+
+        dumps = store.get_raw_dumps_as_files('ooid1')
+        eq_(open(dumps['flash1']).read(), 'a flash dump')
+        eq_(store.cache_stats()['crashstorage.cache.misses'], 3)
+
+        # a cache on the same directory starts with the same crashes
+        store, wrapped = self.get_store()
+        eq_(store.get_raw_crash('ooid1'), {'a': 1, 'b': {'c': 2}})
+        ok_(not wrapped.get_raw_crash.called)
+
+    def test_writes_drop_the_cached_crash(self):
+        store, wrapped = self.get_store()
+        store.get_raw_crash('ooid1')
+        store.get_raw_dumps('ooid1')
+        store.get_unredacted_processed('ooid1')
+
+        store.save_processed({'uuid': 'ooid1'})
+        wrapped.save_processed.assert_called_once_with({'uuid': 'ooid1'})
+        store.get_unredacted_processed('ooid1')
+        eq_(wrapped.get_unredacted_processed.call_count, 2)
+        store.get_raw_crash('ooid1')
+        eq_(wrapped.get_raw_crash.call_count, 1)
+
+        store.save_raw_crash({'a': 1}, {}, 'ooid1')
+        wrapped.save_raw_crash.assert_called_once_with({'a': 1}, {}, 'ooid1')
+        store.get_raw_crash('ooid1')
+        eq_(store.get_raw_dump('ooid1', 'flash1'), 'a flash dump')
+        eq_(store.get_raw_dump('ooid1', 'upload_file_minidump'), 'a dump')
+        eq_(wrapped.get_raw_crash.call_count, 2)
+        eq_(wrapped.get_raw_dumps.call_count, 2)
+        ok_(not wrapped.get_raw_dump.called)
+        assert_raises(CrashIDNotFound, store.get_raw_dump, 'ooid1', 'nope')
+
+        store.remove('ooid1')
+        wrapped.remove.assert_called_once_with('ooid1')
+        eq_(len(store.cache), 0)
+
+    def test_a_save_during_a_read_drops_the_read(self):
+        store, wrapped = self.get_store()
+
+        def get_raw_dumps_then_saved(crash_id):
+            # the crash is saved by another thread after this read
+            store.save_raw_crash({'a': 2}, {}, crash_id)
+            return MemoryDumpsMapping({
+                'upload_file_minidump': 'an old dump',
+                'flash1': 'an old flash dump',
+            })
+        wrapped.get_raw_dumps.side_effect = get_raw_dumps_then_saved
+        wrapped.get_raw_crash.side_effect = lambda crash_id: (
+            store.save_raw_crash({'a': 2}, {}, crash_id) or {'a': 1}
+        )
+        eq_(store.get_raw_crash('ooid1'), {'a': 1})
+        eq_(store.get_raw_dumps('ooid1')['flash1'], 'an old flash dump')
+        # neither the old crash nor its old default dump is cached
+        ok_(store._key('ooid1', 'raw_crash') not in store.cache)
+        ok_(store._key('ooid1', 'dump_names') not in store.cache)
+        ok_(
+            store._key('ooid1', 'dump', 'upload_file_minidump')
+            not in store.cache
+        )
+
+        wrapped.get_raw_crash.side_effect = None
+        wrapped.get_raw_crash.return_value = {'a': 2}
+        wrapped.get_raw_dumps.side_effect = None
+        eq_(store.get_raw_crash('ooid1'), {'a': 2})
+        eq_(store.get_raw_dump('ooid1'), 'a dump')
+        eq_(store.get_raw_dump('ooid1', 'flash1'), 'a flash dump')
+        eq_(wrapped.get_raw_dumps.call_count, 2)
+
+    def test_failed_reads_are_not_cached(self):
+        store, wrapped = self.get_store()
+        wrapped.get_raw_crash.side_effect = KeyError('ooid1')
+        assert_raises(KeyError, store.get_raw_crash, 'ooid1')
+        wrapped.get_raw_crash.side_effect = None
+        eq_(store.get_raw_crash('ooid1'), {'a': 1, 'b': {'c': 2}})
+        eq_(wrapped.get_raw_crash.call_count, 2)
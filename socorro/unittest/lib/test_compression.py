@@ -0,0 +1,63 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import json
+
+from nose.tools import eq_, ok_
+
+from socorro.lib.compression import (
+    compress,
+    compression_stats,
+    decompress,
+    is_gzip,
+    is_zlib,
+)
+from socorro.unittest.testbase import TestCase
+
+
+class TestCompression(TestCase):
+
+    data = json.dumps({'json_dump': {'frames': ['a frame'] * 100}})
+
+    def test_gzip(self):
+        compressed = compress(self.data, 'gzip', 9)
+        ok_(is_gzip(compressed))
+        ok_(len(compressed) < len(self.data))
+        eq_(decompress(compressed), self.data)
+
+    def test_zlib(self):
+        compressed = compress(self.data, 'zlib', 1)
+        ok_(is_zlib(compressed))
+        ok_(not is_gzip(compressed))
+        eq_(decompress(compressed), self.data)
+
+    def test_none(self):
+        eq_(compress(self.data, 'none'), self.data)
+
+    def test_uncompressed_json_passes_through(self):
+        for data in (self.data, '[1, 2]', ' {}', '"x"', '', '{'):
+            ok_(not is_gzip(data))
+            ok_(not is_zlib(data))
+            eq_(decompress(data), data)
+
+    def test_unknown_method(self):
+        with self.assertRaises(ValueError):
+            compress(self.data, 'lzma')
+
+    def test_compression_stats(self):
+        eq_(
+            compression_stats('test', 1000, 250, 6),
+            {
+                'test.uncompressed_size': 1000,
+                'test.compressed_size': 250,
+                'test.compression_savings_percent': 75,
+                'test.compression_level': 6,
+            }
+        )
+        eq_(
+            compression_stats('test', 0, 0, 6)[
+                'test.compression_savings_percent'
+            ],
+            0
+        )
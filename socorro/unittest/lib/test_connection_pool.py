@@ -0,0 +1,83 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import threading
+import time
+
+import mock
+from nose.tools import eq_, ok_, assert_raises
+
+from socorro.lib.connection_pool import ConnectionPool, ConnectionPoolTimeout
+from socorro.unittest.testbase import TestCase
+
+
+class TestConnectionPool(TestCase):
+
+    def get_pool(self, **kwargs):
+        connection_factory = mock.Mock(side_effect=lambda: mock.Mock())
+        pool = ConnectionPool(
+            connection_factory,
+            metrics=mock.Mock(),
+            **kwargs
+        )
+        pool._clock = mock.Mock(return_value=1000.0)
+        return pool
+
+    def test_metrics_prefix(self):
+
+        class MyPool(ConnectionPool):
+            metrics_prefix = 'my.pool'
+
+        pool = MyPool(lambda: mock.Mock(), metrics=mock.Mock())
+        pool._clock = mock.Mock(return_value=1000.0)
+        pool.checkout()
+        pool.metrics.capture_stats.assert_any_call({'my.pool.created': 1})
+        pool.metrics.capture_stats.assert_called_with({
+            'my.pool.wait': 0,
+            'my.pool.in_use': 1,
+        })
+
+    def test_checkout_timeout(self):
+        pool = self.get_pool(maximum_connections=1, checkout_timeout=0.1)
+        pool._clock = time.time
+        connection = pool.checkout()
+        assert_raises(ConnectionPoolTimeout, pool.checkout)
+        eq_(pool.timeouts, 1)
+        eq_(len(pool), 1)
+        pool.metrics.capture_stats.assert_any_call({'pool.timeouts': 1})
+
+        # a connection given back in time is handed to the waiting thread
+        checked_out = []
+        pool.checkout_timeout = 5
+        waiter = threading.Thread(
+            target=lambda: checked_out.append(pool.checkout())
+        )
+        waiter.start()
+        time.sleep(0.1)
+        pool.checkin(connection)
+        waiter.join(5)
+        eq_(checked_out, [connection])
+        eq_(pool.timeouts, 1)
+
+    def test_checkout_without_waiting(self):
+        pool = self.get_pool(maximum_connections=1)
+        connection = pool.checkout(wait=False)
+        ok_(connection is not None)
+        ok_(pool.checkout(wait=False) is None)
+        eq_(pool.waits, 0)
+        eq_(pool.timeouts, 0)
+        pool.checkin(connection)
+        ok_(pool.checkout(wait=False) is connection)
+
+    def test_stats(self):
+        pool = self.get_pool(maximum_connections=3)
+        connection_a = pool.checkout()
+        pool.checkout()
+        pool.checkin(connection_a)
+        stats = pool.stats('pool')
+        eq_(stats['pool.size'], 2)
+        eq_(stats['pool.idle'], 1)
+        eq_(stats['pool.in_use'], 1)
+        eq_(stats['pool.timeouts'], 0)
+        ok_(pool.metrics.capture_stats.called)
@@ -0,0 +1,179 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+import mock
+from nose.tools import eq_, ok_, assert_raises
+
+from socorro.lib.disk_cache import DiskLRUCache
+from socorro.unittest.testbase import TestCase
+
+
+class TestDiskLRUCache(TestCase):
+
+    def setUp(self):
+        super(TestDiskLRUCache, self).setUp()
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super(TestDiskLRUCache, self).tearDown()
+
+    def get_cache(self, maximum_bytes=100):
+        return DiskLRUCache(
+            self.directory,
+            maximum_bytes,
+            metrics=mock.Mock(),
+            metrics_prefix='a.cache',
+        )
+
+    def test_hits_and_misses(self):
+        cache = self.get_cache()
+        compute = mock.Mock(side_effect=lambda key: 'value of %s' % key)
+        eq_(cache.get('a', compute), 'value of a')
+        eq_(cache.get('a', compute), 'value of a')
+        compute.assert_called_once_with('a')
+        ok_('a' in cache)
+        eq_(
+            cache.stats('a.cache'),
+            {
+                'a.cache.hits': 1,
+                'a.cache.misses': 1,
+                'a.cache.waits': 0,
+                'a.cache.evictions': 0,
+                'a.cache.size': 1,
+                'a.cache.bytes': 10,
+            }
+        )
+        cache.metrics.capture_stats.assert_called_with({'a.cache.hits': 1})
+
+    def test_eviction_by_size(self):
+        cache = self.get_cache(maximum_bytes=25)
+        cache.get('a', lambda key: 'a' * 10)
+        cache.get('b', lambda key: 'b' * 10)
+        # 'a' becomes the most recently used
+        cache.get('a', None)
+        cache.get('c', lambda key: 'c' * 10)
+        ok_('a' in cache)
+        ok_('b' not in cache)
+        ok_('c' in cache)
+        eq_(cache.evictions, 1)
+        eq_(cache.stats('x')['x.bytes'], 20)
+        eq_(
+            sum(len(files) for x, y, files in os.walk(self.directory)),
+            2
+        )
+        cache.metrics.capture_stats.assert_any_call({'a.cache.evictions': 1})
+
+        # too large to be cached at all
+        eq_(cache.get('d', lambda key: 'd' * 30), 'd' * 30)
+        ok_('d' not in cache)
+        ok_('a' in cache)
+
+    def test_files_outlive_the_cache(self):
+        cache = self.get_cache(maximum_bytes=25)
+        cache.put('a', 'a' * 10)
+        cache.put('b', 'b' * 10)
+        # left by an interrupted write
+        open(os.path.join(self.directory, 'x.tmp'), 'w').close()
+
+        cache = self.get_cache(maximum_bytes=15)
+        eq_(len(cache), 1)
+        eq_(cache.get('b', None), 'b' * 10)
+        ok_(not os.path.exists(os.path.join(self.directory, 'x.tmp')))
+
+    def test_put_peek_and_discard(self):
+        cache = self.get_cache()
+        eq_(cache.peek('a'), None)
+        cache.put('a', 'one')
+        cache.put('a', 'two')
+        eq_(cache.peek('a'), 'two')
+        eq_(cache.stats('x')['x.bytes'], 3)
+        eq_(cache.hits, 0)
+        cache.discard('a')
+        cache.discard('a')
+        ok_('a' not in cache)
+        eq_(cache.stats('x')['x.bytes'], 0)
+
+    def test_discard_during_a_fill(self):
+        cache = self.get_cache()
+
+        def compute(key):
+            # the key is discarded while its old value is being read
+            cache.discard('a')
+            return 'old'
+        eq_(cache.get('a', compute), 'old')
+        ok_('a' not in cache)
+        eq_(os.listdir(os.path.join(self.directory, cache._name('a')[:2])), [])
+        eq_(cache.get('a', lambda key: 'new'), 'new')
+        eq_(cache.peek('a'), 'new')
+        eq_(cache._discarded, {})
+
+        def compute_with_put(key):
+            generation = cache.generation()
+            cache.discard('c')
+            cache.put('c', 'old', generation)
+            cache.put('d', 'current', generation)
+            return 'b'
+        cache.get('b', compute_with_put)
+        ok_('c' not in cache)
+        eq_(cache.peek('d'), 'current')
+        # outside of a fill, the discards are not remembered
+        cache.discard('e')
+        eq_(cache._discarded, {})
+
+    def test_a_removed_file_is_a_miss(self):
+        cache = self.get_cache()
+        cache.put('a', 'one')
+        shutil.rmtree(self.directory)
+        eq_(cache.get('a', lambda key: 'two'), 'two')
+        eq_(cache.misses, 1)
+
+    def test_concurrent_fills_share_one_fetch(self):
+        cache = self.get_cache()
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def compute(key):
+            calls.append(key)
+            started.set()
+            release.wait(5)
+            return 'value'
+
+        results = []
+
+        def a_reader():
+            results.append(cache.get('a', compute))
+
+        readers = [threading.Thread(target=a_reader) for x in range(3)]
+        readers[0].start()
+        started.wait(5)
+        for a_reader_thread in readers[1:]:
+            a_reader_thread.start()
+        while cache.waits < 2:
+            time.sleep(0.01)
+        release.set()
+        for a_reader_thread in readers:
+            a_reader_thread.join(5)
+        eq_(calls, ['a'])
+        eq_(results, ['value'] * 3)
+        eq_(cache.misses, 1)
+
+    def test_failed_fills_are_shared_and_not_cached(self):
+        cache = self.get_cache()
+
+        class Nope(Exception):
+            pass
+
+        def compute(key):
+            raise Nope()
+        assert_raises(Nope, cache.get, 'a', compute)
+        ok_('a' not in cache)
+        eq_(cache.get('a', lambda key: 'value'), 'value')
@@ -0,0 +1,84 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import threading
+
+from mock import Mock
+from nose.tools import eq_, ok_
+
+from socorro.lib.lookup_cache import LookupCache
+from socorro.lib.util import DotDict
+from socorro.unittest.testbase import TestCase
+
+
+class TestLookupCache(TestCase):
+
+    def _get_config(self, refresh_interval=0):
+        config = DotDict()
+        config.logger = Mock()
+        config.lookup_cache_size = 2
+        config.lookup_cache_ttl = 100
+        config.lookup_cache_negative_ttl = 10
+        config.lookup_cache_refresh_interval = refresh_interval
+        return config
+
+    def test_ttl_and_negative_ttl(self):
+        values = {'a': 'A'}
+        lookup = Mock(side_effect=values.get)
+        cache = LookupCache(self._get_config(), lookup)
+        cache._clock = Mock(return_value=1000)
+
+        eq_(cache.get('a'), 'A')
+        eq_(cache.get('b'), None)
+        eq_(cache.get('a'), 'A')
+        eq_(cache.get('b'), None)
+        eq_(lookup.call_count, 2)
+
+        # the negative entry expires first
+        values['b'] = 'B'
+        cache._clock.return_value = 1050
+        eq_(cache.get('a'), 'A')
+        eq_(cache.get('b'), 'B')
+        eq_(lookup.call_count, 3)
+
+        cache._clock.return_value = 1101
+        eq_(cache.get('a'), 'A')
+        eq_(lookup.call_count, 4)
+        eq_(
+            cache.stats('test'),
+            {'test.hits': 3, 'test.misses': 4, 'test.size': 2}
+        )
+
+    def test_size_bound(self):
+        lookup = Mock(side_effect=lambda key: key.upper())
+        cache = LookupCache(self._get_config(), lookup)
+        cache.get('a')
+        cache.get('b')
+        cache.get('a')
+        cache.get('c')
+        eq_(len(cache), 2)
+        # 'b' was the least recently used
+        cache.get('a')
+        cache.get('b')
+        eq_(lookup.call_count, 4)
+
+    def test_preload_and_refresh(self):
+        refreshed = threading.Event()
+        preloads = []
+
+        def preload():
+            preloads.append(1)
+            if len(preloads) > 1:
+                refreshed.set()
+            return [('a', 'A')]
+
+        lookup = Mock()
+        cache = LookupCache(self._get_config(0.01), lookup, preload)
+        try:
+            eq_(cache.get('a'), 'A')
+            ok_(not lookup.called)
+            ok_(refreshed.wait(5))
+        finally:
+            cache.close()
+        ok_(cache._refresh_thread is None)
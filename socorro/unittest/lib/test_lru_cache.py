@@ -0,0 +1,44 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+from mock import Mock
+from nose.tools import eq_, ok_
+
+from socorro.lib.lru_cache import LRUCache
+from socorro.unittest.testbase import TestCase
+
+
+class TestLRUCache(TestCase):
+
+    def test_get(self):
+        compute = Mock(side_effect=lambda x: x * 2)
+        cache = LRUCache(2)
+        eq_(cache.get(1, compute), 2)
+        eq_(cache.get(1, compute), 2)
+        eq_(compute.call_count, 1)
+        eq_(cache.get(2, compute), 4)
+        # touching 1 makes 2 the least recently used
+        eq_(cache.get(1, compute), 2)
+        eq_(cache.get(3, compute), 6)
+        ok_(1 in cache)
+        ok_(2 not in cache)
+        eq_(len(cache), 2)
+        eq_(
+            cache.stats('test'),
+            {'test.hits': 2, 'test.misses': 3, 'test.size': 2}
+        )
+
+    def test_disabled(self):
+        compute = Mock(side_effect=lambda x: x * 2)
+        cache = LRUCache(0)
+        eq_(cache.get(1, compute), 2)
+        eq_(cache.get(1, compute), 2)
+        eq_(compute.call_count, 2)
+        eq_(len(cache), 0)
+
+    def test_clear(self):
+        cache = LRUCache(10)
+        cache.get(1, str)
+        cache.clear()
+        eq_(len(cache), 0)
@@ -0,0 +1,131 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import multiprocessing
+import os
+
+from nose.tools import ok_, eq_
+
+from socorro.lib.process_pool_task_manager import ProcessPoolTaskManager
+from socorro.lib.threaded_task_manager import default_task_func
+from socorro.lib.util import DotDict, SilentFakeLogger
+from socorro.unittest.testbase import TestCase
+
+
+def drain(a_queue):
+    result = []
+    while not a_queue.empty():
+        result.append(a_queue.get())
+    return result
+
+
+class TestProcessPoolTaskManager(TestCase):
+
+    def setUp(self):
+        super(TestProcessPoolTaskManager, self).setUp()
+        self.logger = SilentFakeLogger()
+
+    def _get_config(self, number_of_processes=2):
+        config = DotDict()
+        config.logger = self.logger
+        config.number_of_threads = 1
+        config.number_of_processes = number_of_processes
+        config.maximum_queue_size = 2
+        config.quit_on_empty_queue = True
+        config.idle_delay = 1
+        return config
+
+    def test_constuctor1(self):
+        config = self._get_config(number_of_processes=1)
+        pptm = ProcessPoolTaskManager(config)
+        ok_(pptm.config == config)
+        ok_(pptm.logger == self.logger)
+        ok_(pptm.task_func == default_task_func)
+        ok_(pptm.quit == False)
+        eq_(pptm.number_of_threads, 1)
+
+    def test_doing_work_with_two_workers(self):
+        config = self._get_config()
+        results = multiprocessing.Queue()
+
+        def insert_into_queue(an_item):
+            results.put((an_item, os.getpid()))
+
+        pptm = ProcessPoolTaskManager(
+            config,
+            task_func=insert_into_queue,
+            job_source_iterator=(((x,), {}) for x in xrange(10))
+        )
+        pptm.blocking_start()
+
+        eq_(len(pptm.thread_list), 2)
+        done = drain(results)
+        eq_(sorted(x for x, pid in done), range(10))
+        # the work was not done in this process
+        ok_(os.getpid() not in [pid for x, pid in done])
+
+    def test_finished_func_runs_in_main_process(self):
+        config = self._get_config()
+        finished = []
+
+        def finished_func_maker(x):
+            def finished_func():
+                finished.append((x, os.getpid()))
+            return finished_func
+
+        pptm = ProcessPoolTaskManager(
+            config,
+            job_source_iterator=(
+                ((x,), {'finished_func': finished_func_maker(x)})
+                for x in xrange(10)
+            )
+        )
+        pptm.blocking_start()
+
+        eq_(sorted(x for x, pid in finished), range(10))
+        eq_(set(pid for x, pid in finished), set([os.getpid()]))
+        eq_(pptm.pending_finished_funcs, {})
+
+    def test_finished_func_called_when_task_fails(self):
+        config = self._get_config(number_of_processes=1)
+        finished = []
+
+        def failing_task(an_item):
+            if an_item == 3:
+                raise Exception('Unexpected')
+
+        pptm = ProcessPoolTaskManager(
+            config,
+            task_func=failing_task,
+            job_source_iterator=(
+                ((x,), {'finished_func': lambda x=x: finished.append(x)})
+                for x in xrange(5)
+            )
+        )
+        pptm.blocking_start()
+
+        eq_(sorted(finished), range(5))
+
+    def test_worker_setup_and_teardown(self):
+        config = self._get_config()
+        events = multiprocessing.Queue()
+
+        pptm = ProcessPoolTaskManager(
+            config,
+            worker_setup_func=lambda: events.put(('setup', os.getpid())),
+            worker_teardown_func=lambda: events.put(('teardown', os.getpid()))
+        )
+        pptm.blocking_start()
+
+        happenings = drain(events)
+        setups = [pid for event, pid in happenings if event == 'setup']
+        teardowns = [pid for event, pid in happenings if event == 'teardown']
+        eq_(len(setups), 2)
+        eq_(sorted(setups), sorted(teardowns))
+        ok_(os.getpid() not in setups)
+
+    def test_executor_identity(self):
+        config = self._get_config()
+        pptm = ProcessPoolTaskManager(config)
+        ok_(pptm.executor_identity().startswith('%s-' % os.getpid()))
@@ -0,0 +1,86 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import signal
+
+from mock import Mock
+from nose.tools import eq_, ok_
+
+from socorro.lib import rule_timing
+from socorro.lib.rule_timing import (
+    AggregatingRuleTimer,
+    MetricsRuleTimer,
+    ProcessorMetaRuleTimer,
+)
+from socorro.lib.util import DotDict
+from socorro.unittest.testbase import TestCase
+
+
+class TestMetricsRuleTimer(TestCase):
+
+    def test_record(self):
+        config = DotDict()
+        config.metrics_class = Mock()
+        rule_timer = MetricsRuleTimer(config)
+        rule_timer.record('processor.raw', 'ProductRule', 'action', 0.25, ())
+        metrics = config.metrics_class.return_value
+        metrics.capture_stats.assert_called_once_with(
+            {'processor.raw.ProductRule.action': 250}
+        )
+
+
+class TestAggregatingRuleTimer(TestCase):
+
+    def _get_rule_timer(self):
+        config = DotDict()
+        config.logger = Mock()
+        config.number_of_histogram_buckets = 4
+        return AggregatingRuleTimer(config)
+
+    def test_record_and_report(self):
+        rule_timer = self._get_rule_timer()
+        try:
+            rule_timer.record('t', 'FastRule', 'action', 0.0005, ())
+            rule_timer.record('t', 'FastRule', 'action', 0.0015, ())
+            rule_timer.record('t', 'SlowRule', 'action', 10.0, ())
+            eq_(
+                rule_timer.aggregates[('t', 'FastRule', 'action')][3],
+                [1, 1, 0, 0]
+            )
+            # everything too slow lands in the last bucket
+            eq_(
+                rule_timer.aggregates[('t', 'SlowRule', 'action')][3],
+                [0, 0, 0, 1]
+            )
+            report = rule_timer.report()
+            eq_(len(report), 2)
+            ok_(report[0].startswith('t SlowRule action: count=1'))
+            ok_('count=2' in report[1])
+        finally:
+            rule_timer.close()
+
+    def test_report_on_signal(self):
+        rule_timer = self._get_rule_timer()
+        try:
+            rule_timer.record('t', 'FastRule', 'action', 0.0005, ())
+            os.kill(os.getpid(), signal.SIGUSR1)
+            ok_(rule_timer.config.logger.info.called)
+        finally:
+            rule_timer.close()
+        ok_(rule_timer not in rule_timing._aggregating_rule_timers)
+
+
+class TestProcessorMetaRuleTimer(TestCase):
+
+    def test_record(self):
+        rule_timer = ProcessorMetaRuleTimer(DotDict())
+        processor_meta = DotDict()
+        rule_args = ({}, {}, {}, processor_meta)
+        rule_timer.record('t', 'ProductRule', 'action', 0.002, rule_args)
+        rule_timer.record('t', 'ProductRule', 'action', 0.001, rule_args)
+        eq_(processor_meta.rule_timings.keys(), ['ProductRule.action'])
+        ok_(abs(processor_meta.rule_timings['ProductRule.action'] - 3) < 1e-6)
+        # rule sets that don't pass a processor_meta are ignored
+        rule_timer.record('t', 'ProductRule', 'action', 0.002, ())
@@ -0,0 +1,99 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import threading
+
+from mock import Mock
+from nose.tools import eq_, ok_
+
+from socorro.lib.staged_pipeline import Stage, StagedPipeline
+from socorro.lib.util import SilentFakeLogger
+from socorro.unittest.testbase import TestCase
+
+
+class TestStagedPipeline(TestCase):
+
+    def _get_pipeline(self, *stage_funcs, **kwargs):
+        return StagedPipeline([
+            Stage(
+                'stage%d' % i,
+                a_func,
+                2,
+                2,
+                SilentFakeLogger(),
+                kwargs.get('metrics'),
+                'test'
+            )
+            for i, a_func in enumerate(stage_funcs)
+        ])
+
+    def test_jobs_flow_through_all_stages(self):
+        results = []
+        lock = threading.Lock()
+
+        def last_stage(x):
+            with lock:
+                results.append(x)
+            return x
+
+        finished = []
+        pipeline = self._get_pipeline(
+            lambda x: x + 1,
+            lambda x: x * 10,
+            last_stage
+        )
+        for x in range(20):
+            pipeline.submit(x, x, lambda x=x: finished.append(x))
+        pipeline.close()
+
+        eq_(sorted(results), [(x + 1) * 10 for x in range(20)])
+        eq_(sorted(finished), range(20))
+        ok_(not pipeline.started)
+
+    def test_dropped_and_failed_jobs_are_finished(self):
+        passed_on = []
+
+        def picky_stage(x):
+            if x == 3:
+                return None
+            if x == 5:
+                raise Exception('bad job')
+            return x
+
+        finished = []
+        pipeline = self._get_pipeline(picky_stage, passed_on.append)
+        for x in range(8):
+            pipeline.submit(x, x, lambda x=x: finished.append(x))
+        pipeline.close()
+
+        eq_(sorted(passed_on), [0, 1, 2, 4, 6, 7])
+        eq_(sorted(finished), range(8))
+
+    def test_metrics(self):
+        metrics = Mock()
+        pipeline = self._get_pipeline(
+            lambda x: x,
+            lambda x: x,
+            metrics=metrics
+        )
+        pipeline.submit(1, 1)
+        pipeline.close()
+
+        captured = {}
+        for args, kwargs in metrics.capture_stats.call_args_list:
+            captured.update(args[0])
+        eq_(
+            sorted(captured.keys()),
+            [
+                'test.stage0.duration_ms',
+                'test.stage0.queue_depth',
+                'test.stage1.duration_ms',
+                'test.stage1.queue_depth',
+            ]
+        )
+
+    def test_close_without_submit(self):
+        pipeline = self._get_pipeline(lambda x: x)
+        pipeline.close()
+        ok_(not pipeline.started)
@@ -709,3 +709,123 @@ class TestTransformRules(TestCase):
             'socorro.unittest.lib.test_transform_rules.'
             'TestRuleTestBrokenCloseMethod'
         )
+
+    def test_timed_act(self):
+        config = DotDict()
+        config.laughable = 'wilma'
+        rule = TestRuleTestLaughable(config)
+        results, (predicate_time, action_time) = rule.timed_act()
+        eq_(results, (True, True))
+        ok_(predicate_time >= 0)
+        ok_(action_time >= 0)
+
+        config.laughable = 'fred'
+        results, (predicate_time, action_time) = rule.timed_act()
+        eq_(results, (False, None))
+        eq_(action_time, None)
+
+        rule = transform_rules.TransformRule(True, '', '', foo, '', '')
+        results, (predicate_time, action_time) = rule.timed_act(1, 2)
+        eq_(results, (True, None))
+
+    def test_rules_with_rule_timer(self):
+        config = DotDict()
+        config.logger = Mock()
+        config.chatty_rules = False
+        config.chatty = False
+        config.tag = 'test.rule'
+        config.action = 'apply_all_rules'
+        config.rule_timer_class = Mock()
+        config['TestRuleTestLaughable.laughable'] = 'fred'
+        config.rules_list = DotDict()
+        config.rules_list.class_list = [
+            (
+                'TestRuleTestLaughable',
+                TestRuleTestLaughable,
+                'TestRuleTestLaughable'
+            ),
+            (
+                'TestRuleTestNoCloseMethod',
+                TestRuleTestNoCloseMethod,
+                'TestRuleTestNoCloseMethod'
+            ),
+        ]
+        trs = transform_rules.TransformRuleSystem(config)
+        trs.act('an argument')
+
+        rule_timer = config.rule_timer_class.return_value
+        recorded = [
+            (args[0], args[1], args[2], args[4])
+            for args, kwargs in rule_timer.record.call_args_list
+        ]
+        eq_(
+            recorded,
+            [
+                (
+                    'test.rule',
+                    'TestRuleTestLaughable',
+                    'predicate',
+                    ('an argument',)
+                ),
+                (
+                    'test.rule',
+                    'TestRuleTestNoCloseMethod',
+                    'predicate',
+                    ('an argument',)
+                ),
+                (
+                    'test.rule',
+                    'TestRuleTestNoCloseMethod',
+                    'action',
+                    ('an argument',)
+                ),
+            ]
+        )
+
+        # a failing timer doesn't stop the rules
+        rule_timer.record.side_effect = Exception('bad timer')
+        ok_(trs.act('an argument'))
+
+        trs.close()
+        rule_timer.close.assert_called_once_with()
+
+    def test_rules_dispatch_conditions(self):
+
+        class ChannelRule(transform_rules.Rule):
+            dispatch_conditions = (
+                ('raw_crash', 'ReleaseChannel', ('esr', 'beta')),
+                ('raw_dumps', 'upload_file_minidump', None),
+            )
+            predicate_counter = 0
+
+            def _predicate(self, *args, **kwargs):
+                self.predicate_counter += 1
+                return True
+
+        config = DotDict()
+        config.logger = Mock()
+        config.chatty_rules = False
+        config.chatty = False
+        config.tag = 'test.rule'
+        config.action = 'apply_until_action_succeeds'
+        config.rules_list = DotDict()
+        config.rules_list.class_list = [
+            ('ChannelRule', ChannelRule, 'ChannelRule'),
+        ]
+        trs = transform_rules.TransformRuleSystem(config)
+        rule = trs.rules[0]
+        dumps = {'upload_file_minidump': 'a path'}
+
+        # the value doesn't match
+        ok_(not trs.act({'ReleaseChannel': 'release'}, dumps, {}, {}))
+        # a key is missing
+        ok_(not trs.act({'ReleaseChannel': 'esr'}, {}, {}, {}))
+        ok_(not trs.act({}, dumps, {}, {}))
+        eq_(rule.predicate_counter, 0)
+
+        ok_(trs.act({'ReleaseChannel': 'beta'}, dumps, {}, {}))
+        eq_(rule.predicate_counter, 1)
+        # arguments that can't be checked are left to the predicate
+        ok_(trs.act({'ReleaseChannel': ['beta']}, dumps, {}, {}))
+        ok_(trs.act())
+        eq_(rule.predicate_counter, 3)
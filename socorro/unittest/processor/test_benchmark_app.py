@@ -0,0 +1,255 @@
+# This Source Code Form is subject to the terms of the Mozilla Public
+# License, v. 2.0. If a copy of the MPL was not distributed with this
+# file, You can obtain one at http://mozilla.org/MPL/2.0/.
+
+import os
+import shutil
+import tempfile
+
+import ujson
+from mock import Mock
+from nose.tools import eq_, ok_
+
+from configman.dotdict import DotDict as CDotDict
+
+from socorro.lib.util import DotDict
+from socorro.processor.benchmark_app import (
+    ProcessorBenchmarkApp,
+    RecordedStackwalkerRule,
+    benchmark_rule_sets,
+)
+from socorro.processor.mozilla_processor_2015 import (
+    mozilla_processor_rule_sets
+)
+from socorro.unittest.testbase import TestCase
+
+
+#==============================================================================
+class TestBenchmarkRuleSets(TestCase):
+
+    #--------------------------------------------------------------------------
+    def test_benchmark_rule_sets(self):
+        rule_sets = benchmark_rule_sets()
+        eq_(
+            [x[0] for x in rule_sets],
+            [x[0] for x in mozilla_processor_rule_sets]
+        )
+        all_rules = ' '.join(x[4] for x in rule_sets)
+        ok_('BreakpadStackwalkerRule2015' not in all_rules)
+        ok_(
+            'socorro.processor.benchmark_app.RecordedStackwalkerRule'
+            in all_rules
+        )
+        ok_('MissingSymbolsRule' not in all_rules)
+        ok_('BetaVersionRule' not in all_rules)
+        ok_('SignatureGenerationRule' in all_rules)
+
+
+#==============================================================================
+class TestRecordedStackwalkerRule(TestCase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        super(TestRecordedStackwalkerRule, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+        super(TestRecordedStackwalkerRule, self).tearDown()
+        shutil.rmtree(self.tempdir)
+
+    #--------------------------------------------------------------------------
+    def get_basic_config(self):
+        config = CDotDict()
+        config.logger = Mock()
+        config.chatty = False
+        config.dump_field = 'upload_file_minidump'
+        config.command_line = '{dump_file_pathname}'
+        config.command_pathname = 'stackwalker'
+        config.public_symbols_url = 'https://localhost'
+        config.private_symbols_url = 'https://localhost'
+        config.symbol_cache_path = self.tempdir
+        config.temporary_file_system_storage_path = self.tempdir
+        config.recorded_output_suffix = '.stackwalker.json'
+        return config
+
+    #--------------------------------------------------------------------------
+    def test_recorded_output(self):
+        with open(os.path.join(self.tempdir, 'a.stackwalker.json'), 'w') as f:
+            ujson.dump({'status': 'OK', 'modules': []}, f)
+        raw_dumps = {
+            'upload_file_minidump': os.path.join(self.tempdir, 'a.dump'),
+            'upload_file_minidump_flash1': os.path.join(
+                self.tempdir,
+                'a.upload_file_minidump_flash1.dump'
+            ),
+        }
+        raw_crash = DotDict(uuid='a')
+        processed_crash = DotDict()
+        processor_meta = DotDict(processor_notes=[], quit_check=None)
+
+        rule = RecordedStackwalkerRule(self.get_basic_config())
+        rule.act(raw_crash, raw_dumps, processed_crash, processor_meta)
+
+        eq_(processed_crash.json_dump, {'status': 'OK', 'modules': []})
+        eq_(processed_crash.mdsw_return_code, 0)
+        ok_(processed_crash.success)
+        eq_(
+            processed_crash.additional_minidumps,
+            ['upload_file_minidump_flash1']
+        )
+        flash_data = processed_crash.upload_file_minidump_flash1
+        eq_(flash_data.json_dump, {})
+        eq_(flash_data.mdsw_return_code, 1)
+        ok_(not flash_data.success)
+        ok_(
+            'no recorded stackwalker output: %s' % os.path.join(
+                self.tempdir,
+                'a.upload_file_minidump_flash1.stackwalker.json'
+            )
+            in processor_meta.processor_notes
+        )
+
+
+#==============================================================================
+class TestProcessorBenchmarkApp(TestCase):
+
+    #--------------------------------------------------------------------------
+    def setUp(self):
+        super(TestProcessorBenchmarkApp, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        for crash_id in ('a', 'b'):
+            raw_crash_pathname = os.path.join(self.tempdir, crash_id + '.json')
+            with open(raw_crash_pathname, 'w') as f:
+                ujson.dump({'ProductName': 'WaterWolf'}, f)
+        for file_name in (
+            'a.dump',
+            'a.upload_file_minidump_flash1.dump',
+            'a.stackwalker.json',
+            'a.upload_file_minidump_flash1.stackwalker.json',
+            'b.dump',
+            'b.stackwalker.json',
+        ):
+            with open(os.path.join(self.tempdir, file_name), 'w') as f:
+                f.write('{}')
+
+    #--------------------------------------------------------------------------
+    def tearDown(self):
+        super(TestProcessorBenchmarkApp, self).tearDown()
+        shutil.rmtree(self.tempdir)
+
+    #--------------------------------------------------------------------------
+    def get_basic_config(self):
+        config = DotDict()
+        config.logger = Mock()
+        config.source_path = self.tempdir
+        config.number_of_passes = 3
+        config.processor = DotDict()
+        config.processor.processor_class = Mock()
+        return config
+
+    #--------------------------------------------------------------------------
+    def test_load_crashes(self):
+        app = ProcessorBenchmarkApp(self.get_basic_config())
+        crashes = app._load_crashes()
+        eq_(
+            crashes,
+            [
+                (
+                    {'ProductName': 'WaterWolf', 'uuid': 'a'},
+                    {
+                        'upload_file_minidump':
+                            os.path.join(self.tempdir, 'a.dump'),
+                        'upload_file_minidump_flash1': os.path.join(
+                            self.tempdir,
+                            'a.upload_file_minidump_flash1.dump'
+                        ),
+                    }
+                ),
+                (
+                    {'ProductName': 'WaterWolf', 'uuid': 'b'},
+                    {
+                        'upload_file_minidump':
+                            os.path.join(self.tempdir, 'b.dump'),
+                    }
+                ),
+            ]
+        )
+
+    #--------------------------------------------------------------------------
+    def test_main(self):
+        config = self.get_basic_config()
+        processor = config.processor.processor_class.return_value
+        rule_set = Mock()
+        original_act = rule_set.act
+        processor.rule_system = {'only': rule_set}
+        seen_raw_crashes = []
+
+        def process_crash(raw_crash, raw_dumps, processed_crash):
+            rule_set.act(raw_crash, raw_dumps, processed_crash, {})
+            seen_raw_crashes.append(raw_crash)
+            processed_crash.success = raw_crash.uuid == 'a'
+            return processed_crash
+        processor.process_crash.side_effect = process_crash
+
+        app = ProcessorBenchmarkApp(config)
+        app.report = Mock(return_value=[])
+        eq_(app.main(), 0)
+
+        eq_(processor.process_crash.call_count, 6)
+        eq_(original_act.call_count, 6)
+        # every pass is given its own copy of the raw crashes
+        eq_(len(set(id(x) for x in seen_raw_crashes)), 6)
+        processor.close.assert_called_once_with()
+        number_of_crashes, number_of_failures, elapsed, rule_set_times = \
+            app.report.call_args[0]
+        eq_(number_of_crashes, 6)
+        eq_(number_of_failures, 3)
+        eq_(rule_set_times.keys(), ['only'])
+
+    #--------------------------------------------------------------------------
+    def test_main_without_crashes(self):
+        config = self.get_basic_config()
+        config.source_path = tempfile.mkdtemp(dir=self.tempdir)
+        app = ProcessorBenchmarkApp(config)
+        eq_(app.main(), 1)
+        ok_(not config.processor.processor_class.called)
+
+    #--------------------------------------------------------------------------
+    def test_main_without_recordings(self):
+        config = self.get_basic_config()
+        os.unlink(os.path.join(self.tempdir, 'b.stackwalker.json'))
+        app = ProcessorBenchmarkApp(config)
+        eq_(app.main(), 1)
+        ok_(not config.processor.processor_class.called)
+        eq_(
+            config.logger.error.call_args[0][2],
+            os.path.join(self.tempdir, 'b.stackwalker.json')
+        )
+
+        config.allow_missing_recordings = True
+        config.processor.processor_class.return_value.rule_system = {}
+        app = ProcessorBenchmarkApp(config)
+        app.report = Mock(return_value=[])
+        eq_(app.main(), 0)
+
+    #--------------------------------------------------------------------------
+    def test_default_corpus_is_recorded(self):
+        config = self.get_basic_config()
+        config.source_path = os.path.join(
+            os.path.dirname(__file__),
+            '..', '..', '..', 'testcrash', 'benchmark'
+        )
+        crashes = ProcessorBenchmarkApp(config)._load_crashes()
+        ok_(crashes)
+        eq_(ProcessorBenchmarkApp._missing_recordings(crashes), [])
+
+    #--------------------------------------------------------------------------
+    def test_report(self):
+        app = ProcessorBenchmarkApp(self.get_basic_config())
+        lines = app.report(10, 1, 2.0, {'only': 1.0})
+        eq_(lines[0], 'crashes processed: 10')
+        eq_(lines[1], 'crashes failed: 1')
+        eq_(lines[3], 'crashes per second: 5.00')
+        ok_(lines[4].startswith('peak memory: '))
+        eq_(lines[-1], '    only: 100.000 ms per crash (50.0%)')
@@ -3,10 +3,15 @@
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
 import copy
+import os
+import shutil
+import signal
+import tempfile
+import time
 import ujson
 
 from mock import Mock, patch
-from nose.tools import eq_, ok_
+from nose.tools import eq_, ok_, assert_raises
 from contextlib import contextmanager
 
 from configman.dotdict import DotDict as CDotDict
@@ -570,6 +575,118 @@ class TestExternalProcessRule(TestCase):
         )
 
 
+    #--------------------------------------------------------------------------
+    def test_command_line_to_argv(self):
+        argv, timeout, timeout_signal, discard_stderr = (
+            ExternalProcessRule._command_line_to_argv(
+                'timeout -s KILL 30 /bin/stackwalker --raw-json /dev/stdin '
+                '"/a path/with spaces.dump" 2>/dev/null'
+            )
+        )
+        eq_(
+            argv,
+            [
+                '/bin/stackwalker',
+                '--raw-json',
+                '/dev/stdin',
+                '/a path/with spaces.dump'
+            ]
+        )
+        eq_(timeout, 30.0)
+        eq_(timeout_signal, signal.SIGKILL)
+        ok_(discard_stderr)
+
+        argv, timeout, timeout_signal, discard_stderr = (
+            ExternalProcessRule._command_line_to_argv('dump-lookup a.dump')
+        )
+        eq_(argv, ['dump-lookup', 'a.dump'])
+        eq_(timeout, None)
+        ok_(not discard_stderr)
+
+        for a_command_line, expected in (
+            ('timeout 1m x 2> /dev/null', (60.0, signal.SIGTERM, True)),
+            ('timeout -s9 2h x', (7200.0, signal.SIGKILL, False)),
+            ('timeout --signal=term .5s x', (0.5, signal.SIGTERM, False)),
+            ('timeout -s SIGKILL 1d x', (86400.0, signal.SIGKILL, False)),
+            ('timeout 0 x', (None, signal.SIGTERM, False)),
+            ('timeout 5. x 2>  /dev/null', (5.0, signal.SIGTERM, True)),
+        ):
+            argv, timeout, timeout_signal, discard_stderr = (
+                ExternalProcessRule._command_line_to_argv(a_command_line)
+            )
+            eq_(argv, ['x'])
+            eq_((timeout, timeout_signal, discard_stderr), expected)
+
+    #--------------------------------------------------------------------------
+    def test_command_line_to_argv_rejects_shell_syntax(self):
+        for a_command_line in (
+            'x a.dump >output.json',
+            'x a.dump 2>errors.log',
+            'x a.dump 2>&1',
+            'x a.dump | grep OK',
+            'x a.dump; echo done',
+            'x $HOME/a.dump',
+            'x *.dump',
+            'LANG=C x a.dump',
+            'timeout -k 5 30 x',
+            'timeout 30x x',
+            'timeout 1.5.2 x',
+            'timeout -1 x',
+            'x a.dump 2> /dev/null.log',
+            'timeout -s NOPE 30 x',
+            'timeout 30',
+            '',
+        ):
+            assert_raises(
+                ValueError,
+                ExternalProcessRule._command_line_to_argv,
+                a_command_line
+            )
+
+    #--------------------------------------------------------------------------
+    @patch('socorro.processor.breakpad_transform_rules.subprocess')
+    def test_direct_execution(self, mocked_subprocess_module):
+        config = self.get_basic_config()
+        config.direct_execution = True
+
+        raw_crash = copy.copy(canonical_standard_raw_crash)
+        raw_dumps = {config.dump_field: 'a_fake_dump.dump'}
+        processed_crash = DotDict()
+        processor_meta = self.get_basic_processor_meta()
+
+        mocked_subprocess_handle = (
+            mocked_subprocess_module.Popen.return_value
+        )
+        mocked_subprocess_handle.stdout.read.return_value = (
+            cannonical_external_output_str
+        )
+        mocked_subprocess_handle.wait.return_value = 0
+
+        rule = ExternalProcessRule(config)
+
+        # the call to be tested
+        rule.act(raw_crash, raw_dumps, processed_crash, processor_meta)
+        args, kwargs = mocked_subprocess_module.Popen.call_args
+        eq_(
+            args[0],
+            [
+                'bogus_command',
+                'a_fake_dump.dump',
+                '/mnt/socorro/symbols/symbols_ffx,/mnt/socorro/symbols/'
+                'symbols_sea,/mnt/socorro/symbols/symbols_tbrd,/mnt/socorro/'
+                'symbols/symbols_sbrd,/mnt/socorro/symbols/symbols_os'
+            ]
+        )
+        ok_('shell' not in kwargs)
+        ok_(kwargs['close_fds'])
+
+        eq_(
+            processed_crash.bogus_command_result,
+            cannonical_external_output
+        )
+        eq_(processed_crash.bogus_command_return_code, 0)
+
+
 #==============================================================================
 class TestDumpLookupExternalRule(TestCase):
 
@@ -734,6 +851,180 @@ class TestBreakpadTransformRule2015(TestCase):
             ]
         )
 
+    #--------------------------------------------------------------------------
+    def test_direct_execution_raw_crash_through_stdin(self):
+        config = self.get_basic_config()
+        config.direct_execution = True
+        # 'cat' echoes the raw crash it was given back as its output
+        config.command_line = (
+            'timeout -s KILL 30 {command_pathname} {raw_crash_pathname} '
+            '2>/dev/null'
+        )
+        config.command_pathname = 'cat'
+
+        raw_crash = DotDict({
+            'uuid': '00000000-0000-0000-0000-000002140504',
+            'status': 'OK',
+            'stuff': 'x' * 100000,  # bigger than a pipe's buffer
+        })
+        raw_dumps = {config.dump_field: 'a_fake_dump.dump'}
+        processed_crash = DotDict()
+        processor_meta = self.get_basic_processor_meta()
+
+        rule = BreakpadStackwalkerRule2015(config)
+        rule.act(raw_crash, raw_dumps, processed_crash, processor_meta)
+
+        eq_(processed_crash.json_dump, dict(raw_crash))
+        eq_(processed_crash.mdsw_return_code, 0)
+        ok_(processed_crash.success)
+        eq_(processor_meta.processor_notes, [])
+
+    #--------------------------------------------------------------------------
+    def test_direct_execution_timeout(self):
+        config = self.get_basic_config()
+        config.direct_execution = True
+        config.command_line = 'timeout -s KILL 0.2 {command_pathname} 10'
+        config.command_pathname = 'sleep'
+
+        raw_crash = copy.copy(canonical_standard_raw_crash)
+        raw_dumps = {config.dump_field: 'a_fake_dump.dump'}
+        processed_crash = DotDict()
+        processor_meta = self.get_basic_processor_meta()
+
+        rule = BreakpadStackwalkerRule2015(config)
+        start = time.time()
+        rule.act(raw_crash, raw_dumps, processed_crash, processor_meta)
+
+        ok_(time.time() - start < 5)
+        # just like the 'timeout' command killed with its program
+        eq_(processed_crash.mdsw_return_code, 137)
+        ok_(not processed_crash.success)
+
+        config.command_line = 'timeout 0.2 {command_pathname} 10'
+        processor_meta = self.get_basic_processor_meta()
+        rule = BreakpadStackwalkerRule2015(config)
+        rule.act(raw_crash, raw_dumps, processed_crash, processor_meta)
+
+        eq_(processed_crash.mdsw_return_code, 124)
+        ok_(
+            "MDSW terminated with SIGKILL due to timeout" in
+            processor_meta.processor_notes
+        )
+
+    #--------------------------------------------------------------------------
+    def test_direct_execution_falls_back_to_the_shell(self):
+        config = self.get_basic_config()
+        config.direct_execution = True
+        config.command_line = (
+            '{command_pathname} {raw_crash_pathname} | cat 2>&1'
+        )
+        config.command_pathname = 'cat'
+
+        raw_crash = DotDict({
+            'uuid': '00000000-0000-0000-0000-000002140504',
+            'status': 'OK',
+        })
+        raw_dumps = {config.dump_field: 'a_fake_dump.dump'}
+        processed_crash = DotDict()
+        processor_meta = self.get_basic_processor_meta()
+
+        rule = BreakpadStackwalkerRule2015(config)
+        rule.act(raw_crash, raw_dumps, processed_crash, processor_meta)
+
+        # the raw crash still goes through the stdin of the shell
+        eq_(processed_crash.json_dump, dict(raw_crash))
+        eq_(processed_crash.mdsw_return_code, 0)
+        ok_(processed_crash.success)
+
+    #--------------------------------------------------------------------------
+    def test_concurrent_dumps(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            config = self.get_basic_config()
+            config.direct_execution = True
+            config.maximum_concurrent_dumps = 2
+            config.command_line = '{command_pathname} {dump_file_pathname}'
+            config.command_pathname = 'cat'
+
+            raw_dumps = {}
+            for dump_name in (
+                'upload_file_minidump',
+                'upload_file_minidump_browser',
+                'upload_file_minidump_flash1',
+                'not_a_minidump',
+            ):
+                raw_dumps[dump_name] = os.path.join(temp_dir, dump_name)
+                with open(raw_dumps[dump_name], 'w') as f:
+                    ujson.dump({'status': 'OK', 'name': dump_name}, f)
+            raw_crash = copy.copy(canonical_standard_raw_crash)
+            processed_crash = DotDict()
+            processor_meta = self.get_basic_processor_meta()
+
+            rule = BreakpadStackwalkerRule2015(config)
+            rule.act(raw_crash, raw_dumps, processed_crash, processor_meta)
+
+            eq_(processed_crash.json_dump['name'], 'upload_file_minidump')
+            ok_(processed_crash.success)
+            eq_(
+                sorted(processed_crash.additional_minidumps),
+                ['upload_file_minidump_browser', 'upload_file_minidump_flash1']
+            )
+            for dump_name in processed_crash.additional_minidumps:
+                eq_(processed_crash[dump_name].json_dump['name'], dump_name)
+                ok_(processed_crash[dump_name].success)
+            ok_('not_a_minidump' not in processed_crash)
+            eq_(processor_meta.processor_notes, [])
+        finally:
+            shutil.rmtree(temp_dir)
+
+    #--------------------------------------------------------------------------
+    def test_failed_dump_with_and_without_concurrency(self):
+        outcomes = []
+        for maximum_concurrent_dumps in (1, 3):
+            config = self.get_basic_config()
+            config.maximum_concurrent_dumps = maximum_concurrent_dumps
+            raw_crash = copy.copy(canonical_standard_raw_crash)
+            raw_dumps = {
+                'upload_file_minidump': 'a.dump',
+                'upload_file_minidump_browser': 'b.dump',
+                'upload_file_minidump_flash1': 'c.dump',
+            }
+            processed_crash = DotDict()
+            processor_meta = self.get_basic_processor_meta()
+
+            rule = BreakpadStackwalkerRule2015(config)
+
+            def stackwalk_dump(dump_name, dump_pathname, *args):
+                args[-1].processor_notes.append('walked %s' % dump_name)
+                if dump_name == 'upload_file_minidump_browser':
+                    raise IOError('the dump went away')
+                return DotDict(json_dump={}, success=True)
+            rule._stackwalk_dump = stackwalk_dump
+
+            result = rule.act(
+                raw_crash,
+                raw_dumps,
+                processed_crash,
+                processor_meta
+            )
+            outcomes.append((
+                result,
+                'json_dump' in processed_crash,
+                processor_meta.processor_notes[-1],
+            ))
+        # the failure of a dump makes the action fail either way
+        eq_(
+            outcomes,
+            [
+                (
+                    (True, False),
+                    False,
+                    'walked upload_file_minidump_browser'
+                )
+            ] * 2
+        )
+
+
 #==============================================================================
 class TestJitCrashCategorizeRule(TestCase):
 
@@ -5,9 +5,10 @@
 import copy
 import re
 import json
+import threading
 from StringIO import StringIO
 
-from mock import Mock, patch, call
+from mock import Mock, MagicMock, patch
 from nose.tools import eq_, ok_
 
 from configman.dotdict import DotDict as CDotDict
@@ -15,6 +16,7 @@ from configman.dotdict import DotDict as CDotDict
 from socorro.unittest.testbase import TestCase
 from socorro.lib.util import DotDict
 from socorro.lib.datetimeutil import datetimeFromISOdateString
+from socorro.lib.lookup_cache import LookupCache
 from socorro.processor.mozilla_transform_rules import (
     ProductRule,
     UserDataRule,
@@ -1241,6 +1243,8 @@ class TestProductRewrite(TestCase):
                 },
             }
         )
+        # the pool of database connections is released
+        config.database_class.return_value.close.assert_called_once_with()
 
     #--------------------------------------------------------------------------
     def test_everything_we_hoped_for(self):
@@ -1865,6 +1869,8 @@ class TestMissingSymbols(TestCase):
         config = CDotDict()
         config.logger = Mock()
         config.chatty = False
+        config.missing_symbols_batch_size = 500
+        config.missing_symbols_flush_interval = 0
         return config
 
     #--------------------------------------------------------------------------
@@ -1917,41 +1923,170 @@ class TestMissingSymbols(TestCase):
         processor_meta = self.get_basic_processor_meta()
 
         rule = MissingSymbolsRule(config)
-
-        expected_sql = rule.sql % '20141229'
+        transaction = config.transaction_executor_class.return_value
 
         # the call to be tested
         rule.act(raw_crash, raw_dumps, processed_crash, processor_meta)
+        # nothing is written until the buffer is full
+        eq_(transaction.call_count, 0)
 
-        from socorro.external.postgresql.dbapi2_util import execute_no_results
-        eq_(config.transaction_executor_class.return_value.call_count, 2)
-        expected_execute_args = [
-            call(execute_no_results, expected_sql,
-                ('2014-12-31', 'some-file.pdb', 'ABCDEFG', 'debug.py', '123')),
-            call(execute_no_results, expected_sql,
-                ('2014-12-31', 'yet-another-file.pdb', 'CDEFGHI', None, None))
-        ]
-        config.transaction_executor_class.return_value.assert_has_calls(
-                expected_execute_args
+        # make sure it works a second time, the duplicate rows are dropped
+        rule.act(raw_crash, raw_dumps, processed_crash, processor_meta)
+        eq_(transaction.call_count, 0)
+
+        rule.close()
+        eq_(transaction.call_count, 1)
+        expected_sql = (
+            'INSERT INTO missing_symbols_20141229'
+            ' (date_processed, debug_file, debug_id, code_file, code_id)'
+            ' VALUES (%s, %s, %s, %s, %s), (%s, %s, %s, %s, %s)'
+        )
+        transaction.assert_called_once_with(
+            rule._insert_rows,
+            expected_sql,
+            [
+                ('2014-12-31', 'some-file.pdb', 'ABCDEFG', 'debug.py', '123'),
+                ('2014-12-31', 'yet-another-file.pdb', 'CDEFGHI', None, None),
+            ]
         )
 
-        # make sure it works a second time
-        # the call to be tested
-        rule.act(raw_crash, raw_dumps, processed_crash, processor_meta)
-        eq_(config.transaction_executor_class.return_value.call_count, 4)
-        expected_execute_args = [
-            call(execute_no_results, expected_sql,
-                ('2014-12-31', 'some-file.pdb', 'ABCDEFG', 'debug.py', '123')),
-            call(execute_no_results, expected_sql,
-                ('2014-12-31', 'yet-another-file.pdb', 'CDEFGHI', None, None)),
-            call(execute_no_results, expected_sql,
-                ('2014-12-31', 'some-file.pdb', 'ABCDEFG', 'debug.py', '123')),
-            call(execute_no_results, expected_sql,
-                ('2014-12-31', 'yet-another-file.pdb', 'CDEFGHI', None, None)),
-        ]
-        config.transaction_executor_class.return_value.assert_has_calls(
-                expected_execute_args
+        connection = MagicMock()
+        rule._insert_rows(connection, expected_sql, [('a', 'b'), ('c', 'd')])
+        cursor = connection.cursor.return_value.__enter__.return_value
+        cursor.execute.assert_called_once_with(
+            expected_sql,
+            ['a', 'b', 'c', 'd']
+        )
+
+    #--------------------------------------------------------------------------
+    def test_flush_on_batch_size(self):
+        config = self.get_basic_config()
+        config.database_class = Mock()
+        config.transaction_executor_class = Mock()
+        config.missing_symbols_batch_size = 2
+
+        raw_crash = copy.copy(canonical_standard_raw_crash)
+        processor_meta = self.get_basic_processor_meta()
+
+        def processed_crash_with(date_processed, debug_id):
+            processed_crash = DotDict()
+            processed_crash.date_processed = date_processed
+            processed_crash.json_dump = {
+                'modules': [
+                    {
+                        "debug_id": debug_id,
+                        "debug_file": "some-file.pdb",
+                        "missing_symbols": True,
+                    },
+                ]
+            }
+            return processed_crash
+
+        rule = MissingSymbolsRule(config)
+        transaction = config.transaction_executor_class.return_value
+
+        rule.act(
+            raw_crash, {},
+            processed_crash_with('2014-12-31', 'ABC'),
+            processor_meta
+        )
+        eq_(transaction.call_count, 0)
+        rule.act(
+            raw_crash, {},
+            processed_crash_with('2015-01-06', 'ABC'),
+            processor_meta
         )
+        # one insert per weekly partition
+        eq_(transaction.call_count, 2)
+        eq_(
+            [x[0][1].split()[2] for x in transaction.call_args_list],
+            ['missing_symbols_20141229', 'missing_symbols_20150105']
+        )
+
+        rule.close()
+        eq_(transaction.call_count, 2)
+
+    #--------------------------------------------------------------------------
+    def test_flush_on_interval(self):
+        config = self.get_basic_config()
+        config.database_class = Mock()
+        config.transaction_executor_class = Mock()
+        config.missing_symbols_flush_interval = 0.01
+        flushed = threading.Event()
+        transaction = config.transaction_executor_class.return_value
+        transaction.side_effect = lambda *args: flushed.set()
+
+        processed_crash = DotDict()
+        processed_crash.date_processed = '2014-12-31'
+        processed_crash.json_dump = {
+            'modules': [
+                {
+                    "debug_id": "ABC",
+                    "debug_file": "some-file.pdb",
+                    "missing_symbols": True,
+                },
+            ]
+        }
+
+        rule = MissingSymbolsRule(config)
+        try:
+            rule.act(
+                copy.copy(canonical_standard_raw_crash), {},
+                processed_crash,
+                self.get_basic_processor_meta()
+            )
+            ok_(flushed.wait(5))
+        finally:
+            rule.close()
+        eq_(transaction.call_count, 1)
+
+    #--------------------------------------------------------------------------
+    def test_failed_batch_is_written_row_by_row(self):
+        config = self.get_basic_config()
+        config.database_class = Mock()
+        config.database_class.return_value.ProgrammingError = ValueError
+        config.transaction_executor_class = Mock()
+        written = []
+
+        def insert(function, sql, rows):
+            if len(rows) > 1 or rows[0][2] == 'BAD':
+                raise ValueError('bad row')
+            written.append(rows[0][2])
+        transaction = config.transaction_executor_class.return_value
+        transaction.side_effect = insert
+
+        processed_crash = DotDict()
+        processed_crash.date_processed = '2014-12-31'
+        processed_crash.json_dump = {
+            'modules': [
+                {
+                    "debug_id": debug_id,
+                    "debug_file": "some-file.pdb",
+                    "missing_symbols": True,
+                }
+                for debug_id in ('ABC', 'BAD', 'DEF')
+            ]
+        }
+
+        rule = MissingSymbolsRule(config)
+        rule.act(
+            copy.copy(canonical_standard_raw_crash), {},
+            processed_crash,
+            self.get_basic_processor_meta()
+        )
+        rule.close()
+
+        # the batch and then each of its rows
+        eq_(transaction.call_count, 4)
+        eq_(
+            transaction.call_args_list[1][0][1],
+            'INSERT INTO missing_symbols_20141229'
+            ' (date_processed, debug_file, debug_id, code_file, code_id)'
+            ' VALUES (%s, %s, %s, %s, %s)'
+        )
+        eq_(written, ['ABC', 'DEF'])
+        eq_(config.logger.error.call_count, 1)
+        ok_('BAD' in repr(config.logger.error.call_args[0][1]))
 
 
 #==============================================================================
@@ -1962,6 +2097,12 @@ class TestBetaVersion(TestCase):
         config = CDotDict()
         config.logger = Mock()
         config.chatty = False
+        config.lookup_cache_class = LookupCache
+        config.lookup_cache_size = 100
+        config.lookup_cache_ttl = 3600
+        config.lookup_cache_negative_ttl = 300
+        config.lookup_cache_refresh_interval = 0
+        config.preload_build_days = 0
         return config
 
     #--------------------------------------------------------------------------
@@ -2041,6 +2182,46 @@ class TestBetaVersion(TestCase):
         eq_(len(processor_meta.processor_notes), 2)
 
 
+    #--------------------------------------------------------------------------
+    def test_preloaded_and_negatively_cached(self):
+        config = self.get_basic_config()
+        config.database_class = Mock()
+        config.transaction_executor_class = Mock()
+        config.preload_build_days = 7
+        transaction = Mock()
+        config.transaction_executor_class.return_value = transaction
+        transaction.return_value = (
+            ('WaterWolf', '3.0', 'Beta', 20001001101010, '3.0b1'),
+        )
+
+        rule = BetaVersionRule(config)
+        eq_(transaction.call_count, 1)
+
+        raw_crash = copy.copy(canonical_standard_raw_crash)
+        processor_meta = self.get_basic_processor_meta()
+        processed_crash = DotDict()
+        processed_crash.product = 'WaterWolf'
+        processed_crash.version = '3.0'
+        processed_crash.release_channel = 'beta'
+        processed_crash.build = '20001001101010'
+
+        # the preloaded version needs no query
+        rule.act(raw_crash, {}, processed_crash, processor_meta)
+        eq_(processed_crash['version'], '3.0b1')
+        eq_(transaction.call_count, 1)
+
+        # an unknown build is looked up only once
+        transaction.return_value = ()
+        for x in range(2):
+            processed_crash.version = '3.0'
+            processed_crash.build = '20001001101011'
+            rule.act(raw_crash, {}, processed_crash, processor_meta)
+            eq_(processed_crash['version'], '3.0b0')
+        eq_(transaction.call_count, 2)
+
+        rule.close()
+
+
 #==============================================================================
 class TestOsPrettyName(TestCase):
 
@@ -2049,6 +2230,11 @@ class TestOsPrettyName(TestCase):
         config = CDotDict()
         config.logger = Mock()
         config.chatty = False
+        config.lookup_cache_class = LookupCache
+        config.lookup_cache_size = 100
+        config.lookup_cache_ttl = 3600
+        config.lookup_cache_negative_ttl = 300
+        config.lookup_cache_refresh_interval = 0
         return config
 
     #--------------------------------------------------------------------------
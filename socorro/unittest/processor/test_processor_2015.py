@@ -192,3 +192,29 @@ class TestProcessor2015(TestCase):
         )
 
 
+
+    def test_process_crash_with_rule_timings(self):
+        cm = ConfigurationManager(
+            definition_source=Processor2015.get_required_config(),
+            values_source_list=[{
+                'rule_sets': rule_set_01_str,
+                'resource.rule_timing.rule_timer_class':
+                    'socorro.lib.rule_timing.ProcessorMetaRuleTimer',
+            }],
+        )
+        config = cm.get_config()
+        config.logger = Mock()
+        config.processor_name = 'dwight'
+
+        p = Processor2015(config)
+        processed_crash = p.process_crash(SDotDict(), {}, SDotDict())
+
+        ok_(processed_crash.success)
+        eq_(
+            sorted(processed_crash.rule_timings.keys()),
+            [
+                'BitguardClassifier.action',
+                'BitguardClassifier.predicate',
+                'OutOfDateClassifier.predicate',
+            ]
+        )
@@ -2,11 +2,14 @@
 # License, v. 2.0. If a copy of the MPL was not distributed with this
 # file, You can obtain one at http://mozilla.org/MPL/2.0/.
 
+from functools import partial
+
 import mock
 from nose.tools import eq_, assert_raises
 
 from configman.dotdict import DotDict
 
+from socorro.lib.process_pool_task_manager import ProcessPoolTaskManager
 from socorro.processor.processor_app import ProcessorApp
 from socorro.external.crashstorage_base import (
     CrashIDNotFound,
@@ -77,6 +80,9 @@ class TestProcessorApp(TestCase):
         config.sentry = mock.MagicMock()
         config.sentry.dsn = sentry_dsn
 
+        config.pipeline = DotDict()
+        config.pipeline.use_staged_pipeline = False
+
         return config
 
     def test_source_iterator(self):
@@ -329,3 +335,117 @@ class TestProcessorApp(TestCase):
         config.logger.error.assert_called_with(
             'Unable to report error with Raven', exc_info=True
         )
+
+    def test_transform_with_staged_pipeline(self):
+        config = self.get_standard_config()
+        config.pipeline.use_staged_pipeline = True
+        config.pipeline.number_of_fetch_threads = 2
+        config.pipeline.number_of_process_threads = 1
+        config.pipeline.number_of_save_threads = 2
+        config.pipeline.maximum_stage_queue_size = 2
+        mocked_metrics = mock.Mock()
+        config.pipeline.metrics_class = mock.Mock(return_value=mocked_metrics)
+        pa = ProcessorApp(config)
+        pa._setup_source_and_destination()
+
+        pa.source.get_raw_crash.side_effect = (
+            lambda crash_id: DotDict({'crash_id': crash_id})
+        )
+        fake_dump = {'upload_file_minidump': 'fake_dump_TEMPORARY.dump'}
+        pa.source.get_raw_dumps_as_files.return_value = fake_dump
+        pa.source.get_unredacted_processed.return_value = DotDict()
+        pa.processor.process_crash.side_effect = (
+            lambda raw_crash, dumps, processed_crash: raw_crash.crash_id * 2
+        )
+        finished_func = mock.Mock()
+        patch_path = 'socorro.processor.processor_app.os.unlink'
+        with mock.patch(patch_path) as mocked_unlink:
+            for crash_id in range(10):
+                pa.transform(crash_id, finished_func)
+            pa.close()
+
+        eq_(finished_func.call_count, 10)
+        eq_(mocked_unlink.call_count, 10)
+        saved = sorted(
+            (args[3], args[2])
+            for args, kwargs
+            in pa.destination.save_raw_and_processed.call_args_list
+        )
+        eq_(saved, [(x, x * 2) for x in range(10)])
+        captured_names = set()
+        for args, kwargs in mocked_metrics.capture_stats.call_args_list:
+            captured_names.update(args[0].keys())
+        eq_(
+            captured_names,
+            set(
+                'processor.pipeline.%s.%s' % (stage, metric)
+                for stage in ('fetch', 'process', 'save')
+                for metric in ('queue_depth', 'duration_ms')
+            )
+        )
+
+    def test_staged_pipeline_rejects_process_pool(self):
+        config = self.get_standard_config()
+        config.pipeline.use_staged_pipeline = True
+        config.pipeline.metrics_class = mock.Mock()
+        config.producer_consumer = DotDict()
+        config.producer_consumer.producer_consumer_class = \
+            ProcessPoolTaskManager
+        pa = ProcessorApp(config)
+        assert_raises(ValueError, pa._setup_source_and_destination)
+
+    def test_transform_with_staged_pipeline_rejected_crash(self):
+        config = self.get_standard_config()
+        config.pipeline.use_staged_pipeline = True
+        config.pipeline.number_of_fetch_threads = 1
+        config.pipeline.number_of_process_threads = 1
+        config.pipeline.number_of_save_threads = 1
+        config.pipeline.maximum_stage_queue_size = 1
+        config.pipeline.metrics_class = mock.Mock()
+        pa = ProcessorApp(config)
+        pa._setup_source_and_destination()
+        pa.source.get_raw_crash.side_effect = CrashIDNotFound(17)
+
+        finished_func = mock.Mock()
+        pa.transform(17, finished_func)
+        pa.close()
+
+        pa.processor.reject_raw_crash.assert_called_with(
+            17,
+            'this crash cannot be found in raw crash storage'
+        )
+        eq_(pa.processor.process_crash.call_count, 0)
+        eq_(pa.destination.save_raw_and_processed.call_count, 0)
+        eq_(finished_func.call_count, 1)
+
+    def test_staged_pipeline_acks_before_closing_the_source(self):
+        config = self.get_standard_config()
+        config.pipeline.use_staged_pipeline = True
+        config.pipeline.number_of_fetch_threads = 2
+        config.pipeline.number_of_process_threads = 2
+        config.pipeline.number_of_save_threads = 2
+        config.pipeline.maximum_stage_queue_size = 2
+        config.pipeline.metrics_class = mock.Mock()
+        pa = ProcessorApp(config)
+        pa._setup_source_and_destination()
+        pa.source.get_raw_crash.side_effect = (
+            lambda crash_id: DotDict({'crash_id': crash_id})
+        )
+        pa.source.get_raw_dumps_as_files.return_value = {}
+        pa.source.get_unredacted_processed.return_value = DotDict()
+
+        acked = []
+        acked_at_close = []
+        pa.new_crash_source = mock.Mock()
+        pa.new_crash_source.close.side_effect = (
+            lambda: acked_at_close.extend(acked)
+        )
+        for crash_id in range(10):
+            pa.transform(crash_id, partial(acked.append, crash_id))
+        pa.close()
+
+        # every crash that finished was acknowledged before its source closed
+        eq_(sorted(acked_at_close), range(10))
+        eq_(pa.destination.save_raw_and_processed.call_count, 10)
+        pa.source.close.assert_called_once_with()
+        pa.destination.close.assert_called_once_with()
@@ -161,6 +161,122 @@ class TestCSignatureTool(BaseTestClass):
             r = s.normalize_signature(*args)
             self.assert_equal_with_nicer_output(e, r)
 
+    #--------------------------------------------------------------------------
+    def test_normalize_cache(self):
+        s, c = self.setup_config_c_sig_tool()
+        s._normalization_cache.maximum_size = 2
+        eq_(s.normalize_signature('m', 'f<a>(b,c)', 's', '23', '0xF'), 'f<T>')
+        eq_(s.normalize_signature('m', 'f<a>(b,c)', 's', '23', '0xF'), 'f<T>')
+        # the line number must not be cached with the function
+        eq_(
+            s.normalize_signature('m', 'fnNeedNumber(b)', 's', '23', '0xF'),
+            'fnNeedNumber:23'
+        )
+        eq_(
+            s.normalize_signature('m', 'fnNeedNumber(b)', 's', '42', '0xF'),
+            'fnNeedNumber:42'
+        )
+        # this pushes the least recently used entry out of the cache
+        eq_(s.normalize_signature('m', 'g', 's', '23', '0xF'), 'g')
+        eq_(
+            s.normalization_cache_stats(),
+            {
+                'normalization_cache.hits': 2,
+                'normalization_cache.misses': 3,
+                'normalization_cache.size': 2,
+                'classification_cache.hits': 0,
+                'classification_cache.misses': 0,
+                'classification_cache.size': 0,
+            }
+        )
+        ok_('f<a>(b,c)' not in s._normalization_cache)
+
+    #--------------------------------------------------------------------------
+    def test_collapse(self):
+        s, c = self.setup_config_c_sig_tool()
+        eq_(s._collapse('f<a<b>,c>x', '<', '<', '>', 'T>'), 'f<T>x')
+        eq_(s._collapse('f<a>>x', '<', '<', '>', 'T>'), 'f<T>')
+        eq_(
+            s._collapse(
+                '(anonymous namespace)::f(int)',
+                '(',
+                '',
+                ')',
+                '',
+                ('anonymous namespace', 'operator')
+            ),
+            '(anonymous namespace)::f'
+        )
+
+    #--------------------------------------------------------------------------
+    def test_generate_many(self):
+        s, c = self.setup_config_c_sig_tool()
+        frame_lists = [
+            [
+                {'module': 'm', 'function': 'pre1'},
+                {'module': 'm', 'function': 'ignored1'},
+                {'module': 'm', 'function': 'fnNeedNumber', 'line': 7},
+                {'module': 'm', 'function': 'later'},
+            ],
+            ['a', 'b'],
+            [],
+        ]
+        eq_(
+            list(s.generate_many(frame_lists, crashed_thread=0)),
+            [
+                ('pre1 | fnNeedNumber:7', []),
+                ('a', []),
+                (
+                    'EMPTY: no frame data available',
+                    [
+                        'CSignatureTool: No proper signature could be '
+                        'created because no good data for the crashing '
+                        'thread (0) was found'
+                    ]
+                ),
+            ]
+        )
+        eq_(
+            list(
+                s.generate_many(frame_lists[:1], maximum_frames_to_consider=1)
+            ),
+            [('pre1', [])]
+        )
+
+    #--------------------------------------------------------------------------
+    def test_classification_follows_siglist_changes(self):
+        s, c = self.setup_config_c_sig_tool()
+        eq_(s.generate(['ignored1', 'a'])[0], 'a')
+        eq_(s.generate(['ignored1', 'a'])[0], 'a')
+        s.irrelevant_signature_re = re.compile('a')
+        eq_(s.generate(['ignored1', 'a', 'b'])[0], 'ignored1')
+        stats = s.normalization_cache_stats()
+        eq_(stats['classification_cache.hits'], 2)
+
+    #--------------------------------------------------------------------------
+    def test_cache_metrics(self):
+        s, c = self.setup_config_c_sig_tool()
+        # no metrics class is configured
+        ok_(s.metrics is None)
+        s.generate(['a'])
+
+        s.metrics = mock.Mock()
+        c.cache_metrics_interval = 60
+        s._last_cache_metrics_report = 0
+        s.generate(['ignored1', 'a'])
+        s.metrics.capture_stats.assert_called_once_with(
+            s.normalization_cache_stats()
+        )
+        eq_(
+            s.metrics.capture_stats.call_args[0][0][
+                'classification_cache.misses'
+            ],
+            2
+        )
+        # not again until the interval has passed
+        s.generate(['a'])
+        eq_(s.metrics.capture_stats.call_count, 1)
+
     #--------------------------------------------------------------------------
     def test_generate_1(self):
         """test_generate_1: simple"""